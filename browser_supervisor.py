@@ -0,0 +1,416 @@
+'''The BrowserSupervisor Module
+
+Summary
+-------
+This module defines functions to launch, track and clean up the webbrowser (chromedriver and chrome) processes of the crawlers.
+
+The crawlers launch and quit webbrowsers by 'launch_chrome' and 'quit_chrome', so that:
+-- every launched chromedriver process and its chrome processes are tracked, with the owner (crawl job) and a deadline
+-- processes left alive after 'chrome.quit()' (e.g., a crashed chromedriver) are killed immediately
+-- the browser reaper job (see 'reap_browsers') kills the processes of webbrowsers running past their deadline
+    (e.g., a hung page load or a crawl job thread which never reaches its 'finally')
+-- new launches wait (and are finally refused) while the tracked processes use more memory than BROWSER_MEMORY_CEILING_MB
+-- new launches wait while the count of tracked webbrowsers reaches the browser limit set by the worker autoscaler
+So the long-running program stays within a fixed memory footprint.
+'''
+
+import sys
+import time
+import threading
+
+import psutil
+from selenium import webdriver
+
+import config
+import util
+import metrics
+
+
+# The tracked webbrowsers, chromedriver process id as key, each value is a dict with keys:
+# -- owner: the description of the crawl job which launched the webbrowser
+# -- launch_time: the time (time.monotonic) when the webbrowser is launched
+# -- deadline: the time (time.monotonic) after which the webbrowser is killed by the browser reaper
+# -- pids: the ids of the chromedriver process and all its (known) descendant processes
+#    descendants are recorded while the chromedriver process is alive, so they can be killed after it crashes
+_browsers = {}
+# The lock to protect '_browsers'
+_browsers_lock = threading.Lock()
+# The maximum count of concurrently running webbrowsers, None means no limit, see 'set_browser_limit'
+_browser_limit = None
+# The count of webbrowsers being launched, which hold a slot of the browser limit
+_launching_count = 0
+# The condition to wake up launches waiting for a slot of the browser limit
+_browser_slot_condition = threading.Condition()
+
+
+def get_process_tree_pids(pid):
+    '''Get the ids of the process with id 'pid' and all its descendant processes
+
+    Parameters
+    ----------
+    pid: int
+        The id of the (root) process
+
+    Returns
+    -------
+    set
+        The ids of the alive processes, empty if the process does not exist
+    '''
+
+    try:
+        process = psutil.Process(pid)
+        return {pid} | {child.pid for child in process.children(recursive=True)}
+    except psutil.Error:
+        return set()
+
+
+def get_alive_processes(pids):
+    '''Get the alive processes of the process ids 'pids'
+
+    Parameters
+    ----------
+    pids: set
+        The process ids
+
+    Returns
+    -------
+    list
+        The list of alive psutil.Process
+    '''
+
+    processes = []
+    for pid in pids:
+        try:
+            process = psutil.Process(pid)
+            if process.is_running() and process.status() != psutil.STATUS_ZOMBIE:
+                processes.append(process)
+        except psutil.Error:
+            pass
+
+    return processes
+
+
+def kill_processes(pids):
+    '''Terminate the alive processes of the process ids 'pids', and kill those still alive after BROWSER_KILL_WAIT_SECONDS
+
+    Parameters
+    ----------
+    pids: set
+        The process ids
+
+    Returns
+    -------
+    int
+        The count of processes terminated or killed
+    '''
+
+    processes = get_alive_processes(pids)
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.Error:
+            pass
+
+    gone, alive = psutil.wait_procs(processes, timeout=config.BROWSER_KILL_WAIT_SECONDS)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.Error:
+            pass
+
+    return len(processes)
+
+
+def get_tracked_rss_bytes():
+    '''Get the total RSS (resident set size) of all tracked webbrowser processes.
+    The RSS of each process includes its shared memory, so the total is an upper bound of the memory in use.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The total RSS in bytes
+    '''
+
+    with _browsers_lock:
+        pids = set().union(*(browser['pids'] for browser in _browsers.values()))
+
+    rss_bytes = 0
+    for process in get_alive_processes(pids):
+        try:
+            rss_bytes += process.memory_info().rss
+        except psutil.Error:
+            pass
+
+    return rss_bytes
+
+
+def set_browser_limit(browser_limit):
+    '''Set the maximum count of concurrently running webbrowsers, used by the worker autoscaler
+
+    Parameters
+    ----------
+    browser_limit: int
+        The maximum count of concurrently running webbrowsers, None means no limit
+
+    Returns
+    -------
+    None
+    '''
+
+    global _browser_limit
+
+    with _browser_slot_condition:
+        _browser_limit = browser_limit
+        _browser_slot_condition.notify_all()
+
+
+def get_free_browser_slot_count():
+    '''Get the count of webbrowsers which can be launched without waiting for the browser limit
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The count of free slots of the browser limit, None if there is no browser limit
+    '''
+
+    with _browser_slot_condition:
+        if _browser_limit is None:
+            return None
+        return max(_browser_limit - len(_browsers) - _launching_count, 0)
+
+
+def acquire_browser_slot():
+    '''Wait until the count of running (and launching) webbrowsers is below the browser limit, and hold a slot for a launch
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    global _launching_count
+
+    with _browser_slot_condition:
+        # re-check every second, since webbrowsers reaped or quit by other threads also free slots
+        while _browser_limit is not None and len(_browsers) + _launching_count >= _browser_limit:
+            _browser_slot_condition.wait(timeout=1)
+        _launching_count += 1
+
+
+def release_browser_slot():
+    '''Release the slot held by 'acquire_browser_slot' after the launch is finished (or failed)
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    global _launching_count
+
+    with _browser_slot_condition:
+        _launching_count -= 1
+        _browser_slot_condition.notify_all()
+
+
+def launch_chrome(chrome_options, owner, deadline_seconds=None):
+    '''Launch and track a Chrome webbrowser.
+    Wait for a maximum of BROWSER_LAUNCH_WAIT_SECONDS seconds while the tracked processes use more memory than BROWSER_MEMORY_CEILING_MB,
+    then raise a RuntimeError (i.e., refuse the launch) if the memory is still above the ceiling.
+
+    Parameters
+    ----------
+    chrome_options: selenium.webdriver.ChromeOptions
+        The Chrome options
+    owner: str
+        The description of the crawl job which launches the webbrowser, used in logs
+    deadline_seconds: int, optional
+        The seconds after which the webbrowser is killed by the browser reaper (default is BROWSER_DEADLINE_SECONDS)
+
+    Returns
+    -------
+    selenium.webdriver.Chrome
+        The webbrowser
+    '''
+
+    if deadline_seconds is None:
+        deadline_seconds = config.BROWSER_DEADLINE_SECONDS
+
+    # Wait until the tracked processes use less memory than the ceiling
+    memory_ceiling_bytes = config.BROWSER_MEMORY_CEILING_MB * 1024 * 1024
+    wait_until = time.monotonic() + config.BROWSER_LAUNCH_WAIT_SECONDS
+    rss_bytes = get_tracked_rss_bytes()
+    while memory_ceiling_bytes > 0 and rss_bytes >= memory_ceiling_bytes:
+        if time.monotonic() >= wait_until:
+            raise RuntimeError(f'Refuse to launch a webbrowser for \'{owner}\': the webbrowsers use {rss_bytes / 1024 / 1024:.0f} MB, above the memory ceiling {config.BROWSER_MEMORY_CEILING_MB} MB.')
+        time.sleep(1)
+        rss_bytes = get_tracked_rss_bytes()
+
+    # Wait until the count of running webbrowsers is below the browser limit
+    acquire_browser_slot()
+    try:
+        with metrics.timer('browser_launch', 'browser_supervisor'):
+            chrome = webdriver.Chrome(options=chrome_options)
+
+        driver_pid = chrome.service.process.pid
+        launch_time = time.monotonic()
+        with _browsers_lock:
+            _browsers[driver_pid] = {
+                'owner': owner,
+                'launch_time': launch_time,
+                'deadline': launch_time + deadline_seconds,
+                'pids': get_process_tree_pids(driver_pid)
+            }
+    finally:
+        release_browser_slot()
+
+    return chrome
+
+
+def quit_chrome(chrome):
+    '''Quit the tracked Chrome webbrowser 'chrome', kill its processes left alive and stop tracking it
+
+    Parameters
+    ----------
+    chrome: selenium.webdriver.Chrome
+        The webbrowser launched by 'launch_chrome'
+
+    Returns
+    -------
+    None
+    '''
+
+    driver_pid = chrome.service.process.pid
+
+    # record the latest descendants before quitting, in case the chromedriver exits before its chrome processes
+    pids = get_process_tree_pids(driver_pid)
+    with _browsers_lock:
+        browser = _browsers.get(driver_pid)
+        if browser is not None:
+            browser['pids'] |= pids
+
+    try:
+        chrome.quit()
+    finally:
+        with _browsers_lock:
+            browser = _browsers.pop(driver_pid, None)
+        with _browser_slot_condition:
+            _browser_slot_condition.notify_all()
+
+        if browser is not None:
+            killed_count = kill_processes(browser['pids'])
+            if killed_count > 0:
+                msg = f'Kill {killed_count} webbrowser processes left alive after quitting the webbrowser of \'{browser["owner"]}\'.'
+                current_frame = sys._getframe()
+                logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+                util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+                util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+
+
+def reap_browsers():
+    '''Kill the processes of the tracked webbrowsers which run past their deadline or whose chromedriver process is gone,
+    and record the latest descendant processes of the other tracked webbrowsers.
+    This function is scheduled as the browser reaper job, see 'scheduler.schedule_browser_reaper_job'.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The count of webbrowsers reaped
+    '''
+
+    now = time.monotonic()
+
+    reaped_browsers = {}
+    with _browsers_lock:
+        for driver_pid, browser in list(_browsers.items()):
+            pids = get_process_tree_pids(driver_pid)
+            browser['pids'] |= pids
+            if now >= browser['deadline'] or driver_pid not in pids:
+                reaped_browsers[driver_pid] = _browsers.pop(driver_pid)
+
+    for driver_pid, browser in reaped_browsers.items():
+        killed_count = kill_processes(browser['pids'])
+        reason = 'runs past its deadline' if now >= browser['deadline'] else 'lost its chromedriver process'
+        msg = (
+            f'The webbrowser of \'{browser["owner"]}\' (chromedriver process id \'{driver_pid}\') {reason} '
+            f'after {now - browser["launch_time"]:.0f} seconds. Kill {killed_count} webbrowser processes.'
+        )
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+
+    return len(reaped_browsers)
+
+
+def get_browser_metrics():
+    '''Get the gauges of the running webbrowsers, registered as the metrics gauge callbacks'''
+
+    status = get_browser_status()
+    return [({'kind': 'browsers'}, status['browser_count']), ({'kind': 'processes'}, status['process_count']), ({'kind': 'rss_bytes'}, status['rss_bytes'])]
+
+
+def get_browser_status():
+    '''Get the status of the tracked webbrowsers
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- browser_count: the count of tracked webbrowsers
+        -- browser_limit: the maximum count of concurrently running webbrowsers, None means no limit
+        -- process_count: the count of alive tracked processes
+        -- rss_bytes: the total RSS of alive tracked processes
+        -- browsers: the list of dicts of each tracked webbrowser, with keys 'driver_pid', 'owner', 'age_seconds', 'process_count', 'rss_bytes'
+    '''
+
+    now = time.monotonic()
+    with _browsers_lock:
+        browsers = [(driver_pid, browser['owner'], browser['launch_time'], set(browser['pids'])) for driver_pid, browser in _browsers.items()]
+
+    status = {'browser_count': len(browsers), 'browser_limit': _browser_limit, 'process_count': 0, 'rss_bytes': 0, 'browsers': []}
+    for driver_pid, owner, launch_time, pids in browsers:
+        processes = get_alive_processes(pids)
+        rss_bytes = 0
+        for process in processes:
+            try:
+                rss_bytes += process.memory_info().rss
+            except psutil.Error:
+                pass
+
+        status['process_count'] += len(processes)
+        status['rss_bytes'] += rss_bytes
+        status['browsers'].append({
+            'driver_pid': driver_pid,
+            'owner': owner,
+            'age_seconds': now - launch_time,
+            'process_count': len(processes),
+            'rss_bytes': rss_bytes
+        })
+
+    return status
+
+
+metrics.register_gauge_callback('browsers_running', get_browser_metrics)
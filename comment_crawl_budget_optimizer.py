@@ -0,0 +1,264 @@
+'''The CommentCrawlBudgetOptimizer Module
+
+Summary
+-------
+This module defines functions to allocate a global daily comment page-fetch budget to movies,
+i.e., to calculate the comment crawl interval (in days) of each movie.
+
+The allocation model is as follows:
+-- the comment velocity of a movie is the EWMA (exponentially weighted moving average) of its comment increment per day,
+    calculated from the 'last_crawl_total_comment_count' deltas between its comment crawl jobs
+-- a comment crawl job of a movie fetches ALL its comment pages, i.e., 'last_crawl_total_comment_count' / MOVIE_COMMENT_INCR_STEP + 1 pages
+-- a comment is fresh if it is captured within one day after posted,
+    so if a movie is crawled every I days, its expected fresh comments captured per day is velocity / I
+    and its expected pages fetched per day is pages_per_crawl / I
+-- the budget is allocated greedily to movies with the highest expected fresh comments captured per page fetched
+    (i.e., velocity / pages_per_crawl), starting from MAX_COMMENT_CRAWL_INTERVAL for all movies
+
+The comment velocity is updated in memory after each comment crawl job (see 'update_comment_velocity'),
+and saved to COMMENT_VELOCITY_FILE by the daily routine jobs (see 'save_comment_velocity').
+'''
+
+import os
+import sys
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import config
+import util
+
+
+# The lock to protect 'config.comment_velocity_df', which is updated by concurrent comment crawl jobs
+_comment_velocity_lock = threading.Lock()
+# Whether 'config.comment_velocity_df' is updated since it is saved to COMMENT_VELOCITY_FILE
+_comment_velocity_updated = False
+
+
+def read_comment_velocity(csv_file):
+    '''Read the comment velocity of movies from the CSV file
+
+    Parameters
+    ----------
+    csv_file: str
+        The full path of the CSV file storing the comment velocity
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe storing the comment velocity of movies, movie_id as the index, including columns:
+        -- last_crawl_time: the (UTC) time of the latest comment crawl job, in ISO format
+        -- last_total_comment_count: the total comment count crawled by the latest comment crawl job
+        -- velocity: the EWMA of comment increment per day, NaN if not calculated yet
+    '''
+
+    columns = ['last_crawl_time', 'last_total_comment_count', 'velocity']
+
+    if not os.path.isfile(csv_file):
+        return pd.DataFrame(columns=columns).astype({'last_total_comment_count': 'int64', 'velocity': 'float64'})
+
+    df = pd.read_csv(csv_file, index_col=0)
+    df.index = df.index.astype('int64')
+    return df[columns].astype({'last_total_comment_count': 'int64', 'velocity': 'float64'})
+
+
+def update_comment_velocity(movie_id, total_comment_count, crawl_time=None):
+    '''Update the comment velocity of the movie with id 'movie_id' after a comment crawl job in 'config.comment_velocity_df',
+    which is saved to the CSV file 'config.COMMENT_VELOCITY_FILE' by 'save_comment_velocity'
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    total_comment_count: int
+        The total comment count crawled by the comment crawl job
+    crawl_time: datetime.datetime, optional
+        The time of the comment crawl job (default is now)
+
+    Returns
+    -------
+    None
+    '''
+
+    global _comment_velocity_updated
+
+    if crawl_time is None:
+        crawl_time = datetime.now(config.TIME_ZONE)
+
+    with _comment_velocity_lock:
+        if config.comment_velocity_df is None:
+            config.comment_velocity_df = read_comment_velocity(config.COMMENT_VELOCITY_FILE)
+        df = config.comment_velocity_df
+
+        velocity = np.nan
+        if movie_id in df.index:
+            velocity = df.at[movie_id, 'velocity']
+            elapsed_days = (crawl_time - datetime.fromisoformat(df.at[movie_id, 'last_crawl_time'])).total_seconds() / 86400
+            if elapsed_days > 0:
+                comment_increment = max(total_comment_count - df.at[movie_id, 'last_total_comment_count'], 0)
+                current_velocity = comment_increment / elapsed_days
+                # EWMA: the first velocity is used as it is
+                if pd.isna(velocity):
+                    velocity = current_velocity
+                else:
+                    velocity = config.COMMENT_VELOCITY_EWMA_ALPHA * current_velocity + (1 - config.COMMENT_VELOCITY_EWMA_ALPHA) * velocity
+
+        df.loc[movie_id, ['last_crawl_time', 'last_total_comment_count', 'velocity']] = [crawl_time.isoformat(), total_comment_count, velocity]
+        _comment_velocity_updated = True
+
+
+def save_comment_velocity(csv_file):
+    '''Save the comment velocity of movies 'config.comment_velocity_df' to the CSV file 'csv_file', if updated since the latest save
+
+    Parameters
+    ----------
+    csv_file: str
+        The full path of the CSV file storing the comment velocity
+
+    Returns
+    -------
+    bool
+        True if the comment velocity is saved, otherwise False
+    '''
+
+    global _comment_velocity_updated
+
+    # write a copy, so the comment crawl jobs are not blocked by the write
+    with _comment_velocity_lock:
+        if not _comment_velocity_updated or config.comment_velocity_df is None:
+            return False
+        df = config.comment_velocity_df.copy()
+        _comment_velocity_updated = False
+
+    try:
+        df.to_csv(csv_file, index_label='movie_id')
+    except Exception as e:
+        with _comment_velocity_lock:
+            _comment_velocity_updated = True
+        msg = f'Save the comment velocity of {len(df)} movies to file \'{csv_file}\' failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return False
+
+    return True
+
+
+def optimize_comment_crawl_intervals(movie_list_df, comment_velocity_df, daily_page_budget):
+    '''Allocate the daily page-fetch budget 'daily_page_budget' to movies in 'movie_list_df',
+    i.e., calculate the comment crawl interval (in days) of each movie, to maximize the expected fresh comments captured per page fetched.
+    -- movies without a calculated velocity use the median velocity of other movies
+        (or COMMENT_INCREMENT_CRAWL_PER_DAY if no velocity is calculated yet)
+    -- the crawl interval is in the range of [MIN_COMMENT_CRAWL_INTERVAL, MAX_COMMENT_CRAWL_INTERVAL]
+
+    Parameters
+    ----------
+    movie_list_df: pandas.DataFrame
+        The dataframe storing movie list data
+    comment_velocity_df: pandas.DataFrame
+        The dataframe storing the comment velocity of movies, see 'read_comment_velocity'
+    daily_page_budget: int
+        The global daily budget of comment pages to fetch
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe storing the allocation, movie_id as the index, including columns:
+        -- velocity: the (smoothed) comment increment per day
+        -- pages_per_crawl: the pages fetched by each comment crawl job
+        -- crawl_interval_in_days: the allocated comment crawl interval in days
+        -- expected_pages_per_day: pages_per_crawl / crawl_interval_in_days
+        -- expected_fresh_comments_per_day: velocity / crawl_interval_in_days
+        -- expected_fresh_comments_per_page: velocity / pages_per_crawl
+    '''
+
+    min_interval = config.MIN_COMMENT_CRAWL_INTERVAL
+    max_interval = config.MAX_COMMENT_CRAWL_INTERVAL
+
+    # comment velocity of each movie
+    velocity = pd.Series(np.nan, index=movie_list_df.index, dtype='float64')
+    if comment_velocity_df is not None:
+        velocity = comment_velocity_df['velocity'].astype('float64').reindex(movie_list_df.index)
+    default_velocity = velocity.median() if velocity.notna().any() else config.COMMENT_INCREMENT_CRAWL_PER_DAY
+    velocity = velocity.fillna(default_velocity).clip(lower=0)
+
+    # pages fetched by each comment crawl job
+    pages_per_crawl = (movie_list_df['last_crawl_total_comment_count'] // config.MOVIE_COMMENT_INCR_STEP + 1).astype('float64')
+
+    # start from the MAX_COMMENT_CRAWL_INTERVAL for all movies
+    interval = pd.Series(float(max_interval), index=movie_list_df.index)
+    remaining_budget = daily_page_budget - (pages_per_crawl / max_interval).sum()
+
+    # upgrade movies to the MIN_COMMENT_CRAWL_INTERVAL in the order of expected fresh comments per page
+    # -- the upgrade cost of a movie is the extra pages fetched per day
+    # -- movies without comment increment are never upgraded
+    yield_per_page = velocity / pages_per_crawl
+    candidates = yield_per_page[velocity > 0].sort_values(ascending=False, kind='stable').index
+    upgrade_cost = pages_per_crawl[candidates] * (1 / min_interval - 1 / max_interval)
+    cumulative_cost = upgrade_cost.cumsum()
+
+    fully_upgraded = cumulative_cost.index[cumulative_cost <= remaining_budget]
+    interval[fully_upgraded] = min_interval
+
+    # partially upgrade the first movie that does not fit in the remaining budget:
+    # the smallest interval I such that pages_per_crawl * (1 / I - 1 / max_interval) <= remaining budget
+    if len(fully_upgraded) < len(candidates) and remaining_budget > 0:
+        movie_id = candidates[len(fully_upgraded)]
+        remaining_budget -= upgrade_cost[fully_upgraded].sum()
+        partial_interval = math.ceil(1 / (remaining_budget / pages_per_crawl[movie_id] + 1 / max_interval))
+        interval[movie_id] = min(max(partial_interval, min_interval), max_interval)
+
+    allocation_df = pd.DataFrame({
+        'velocity': velocity,
+        'pages_per_crawl': pages_per_crawl.astype('int64'),
+        'crawl_interval_in_days': interval.astype('int64'),
+        'expected_pages_per_day': pages_per_crawl / interval,
+        'expected_fresh_comments_per_day': velocity / interval,
+        'expected_fresh_comments_per_page': yield_per_page
+    })
+
+    # Log the allocation summary
+    total_pages = allocation_df['expected_pages_per_day'].sum()
+    total_fresh_comments = allocation_df['expected_fresh_comments_per_day'].sum()
+    fresh_comments_per_page = total_fresh_comments / total_pages if total_pages > 0 else 0
+    msg = (
+        f'Allocate the daily comment page budget \'{daily_page_budget}\' to {len(allocation_df.index)} movies: '
+        f'expected {total_pages:.0f} pages and {total_fresh_comments:.0f} fresh comments per day '
+        f'({fresh_comments_per_page:.2f} fresh comments per page), '
+        f'{len(fully_upgraded)} movies crawled every {min_interval} day(s).'
+    )
+    log_level = config.LOG_LEVEL_INFO if total_pages <= daily_page_budget else config.LOG_LEVEL_WARNING
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+    util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=log_level)
+
+    return allocation_df
+
+
+def apply_comment_crawl_budget_allocation(allocation_df, comment_crawl_jobs_cron_schedule_df):
+    '''Update the 'day' in the cron schedule of comment crawl jobs with the allocated comment crawl intervals
+
+    Parameters
+    ----------
+    allocation_df: pandas.DataFrame
+        The dataframe storing the allocation, see 'optimize_comment_crawl_intervals'
+    comment_crawl_jobs_cron_schedule_df: pandas.DataFrame
+        The dataframe storing cron schedule to be updated
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe storing the updated cron schedule
+    '''
+
+    movie_ids = allocation_df.index.intersection(comment_crawl_jobs_cron_schedule_df.index)
+    comment_crawl_jobs_cron_schedule_df.loc[movie_ids, 'day'] = '*/' + allocation_df.loc[movie_ids, 'crawl_interval_in_days'].astype(str)
+
+    return comment_crawl_jobs_cron_schedule_df
@@ -6,18 +6,40 @@ This module defines functions to dispatch comment crawl jobs.
 '''
 
 import os
+import sys
+import math
 import time
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 import config
+import util
 import comment_crawler
 import movie_list_manager
+import comment_crawl_budget_optimizer
+import comment_crawl_queue
+import job_profiler
+import job_run_tracker
+import data_preprocess_worker
+import comment_crawl_pipeline
+import browser_supervisor
+
+
+# The token of the run which crawls each movie, movie_id as key, see 'dispatch_crawl_comment'
+_comment_crawl_run_tokens = {}
+# The lock to protect the run tokens
+_comment_crawl_run_tokens_lock = threading.Lock()
 
 
 def update_comment_crawl_job_cron_schedule(movie_id, last_crawl_total_comment_count, total_comment_count, comment_crawl_jobs_cron_schedule_df):
     '''Update the 'day' in the cron schedule for the comment crawl job of the movie with id 'movie_id'.
     -- the cron schedule of crawling comment includes 'day', 'hour', 'minute', 'second'
-    -- the 'day' in the cron schedule is updated based on crawled comment count increment
+    -- the 'day' in the cron schedule is updated based on crawled comment count increment ('increment' comment crawl interval mode),
+        or set to the interval allocated by the crawl budget optimizer ('budget' comment crawl interval mode)
+    -- a failed comment crawl job (no total comment count crawled) is retried after MIN_COMMENT_CRAWL_INTERVAL days
     -- the 'hour', 'minute', 'second' in the cron schedule is calculated by the 'daily_job_dispatcher.calculate_comment_crawl_job_cron_schedule'
         function to evenly distribute all comment crawl jobs in the 24-hour window    
    
@@ -40,10 +62,21 @@ def update_comment_crawl_job_cron_schedule(movie_id, last_crawl_total_comment_co
     '''
 
     comment_increment = total_comment_count - last_crawl_total_comment_count
+    allocation_df = config.comment_crawl_budget_allocation_df
 
-    # The comment crawl interval fomula is ceiling(1 / comment_increment / COMMENT_INCREMENT_CRAWL_PER_DAY),
-    # i.e., ceiling(COMMENT_INCREMENT_CRAWL_PER_DAY / comment_increment)
-    comment_crawl_interval_in_days = config.COMMENT_INCREMENT_CRAWL_PER_DAY // comment_increment + 1
+    if total_comment_count <= 0:
+        # The comment crawl job failed (or the movie has no comment yet), crawl again as soon as possible
+        comment_crawl_interval_in_days = config.MIN_COMMENT_CRAWL_INTERVAL
+    elif config.COMMENT_CRAWL_INTERVAL_MODE == 'budget' and allocation_df is not None and movie_id in allocation_df.index:
+        # The comment crawl interval allocated by the crawl budget optimizer
+        comment_crawl_interval_in_days = int(allocation_df.at[movie_id, 'crawl_interval_in_days'])
+    elif comment_increment > 0:
+        # The comment crawl interval fomula is ceiling(1 / comment_increment / COMMENT_INCREMENT_CRAWL_PER_DAY),
+        # i.e., ceiling(COMMENT_INCREMENT_CRAWL_PER_DAY / comment_increment)
+        comment_crawl_interval_in_days = config.COMMENT_INCREMENT_CRAWL_PER_DAY // comment_increment + 1
+    else:
+        # No comment increment, crawl as less as possible
+        comment_crawl_interval_in_days = config.MAX_COMMENT_CRAWL_INTERVAL
 
     # make sure the comment_crawl_interval is in the range of [MIN_COMMENT_CRAWL_INTERVAL, MAX_COMMENT_CRAWL_INTERVAL]
     # min(comment_crawl_interval, MAX_COMMENT_CRAWL_INTERVAL)
@@ -51,6 +84,10 @@ def update_comment_crawl_job_cron_schedule(movie_id, last_crawl_total_comment_co
     # max(comment_crawl_interval, MIN_COMMENT_CRAWL_INTERVAL)
     comment_crawl_interval_in_days = max(comment_crawl_interval_in_days, config.MIN_COMMENT_CRAWL_INTERVAL)
 
+    # widen the interval if the comment crawl job keeps overrunning (within MAX_COMMENT_CRAWL_INTERVAL)
+    comment_crawl_interval_in_days = job_run_tracker.widen_overrunning_interval(config.COMMENT_CRAWL_JOB_ID(movie_id), comment_crawl_interval_in_days)
+    comment_crawl_interval_in_days = min(comment_crawl_interval_in_days, config.MAX_COMMENT_CRAWL_INTERVAL)
+
     # update the 'day' in the cron schedule for the comment crawl job of the movie with id 'movie_id'
     # movie_id is the index of the row
     comment_crawl_jobs_cron_schedule_df.at[movie_id, 'day'] = f'*/{comment_crawl_interval_in_days}'
@@ -59,18 +96,36 @@ def update_comment_crawl_job_cron_schedule(movie_id, last_crawl_total_comment_co
 
 
 
-def dispatch_crawl_comment(movie_id, last_crawl_total_comment_count):
+@job_profiler.profile_job(lambda movie_id, *args, **kwargs: config.COMMENT_CRAWL_JOB_ID(movie_id))
+def dispatch_crawl_comment(movie_id, last_crawl_total_comment_count, resume=False):
     '''Dispatch the crawl_comment job for movie with id 'movie_id'.
+    -- the crawl job is run in slices, each slice crawls at most COMMENT_CRAWL_SLICE_MAX_PAGES pages
+        or COMMENT_CRAWL_SLICE_MAX_SECONDS seconds (0 means no limit, i.e., crawl until the last page in one slice)
+    -- an unfinished crawl job saves its position in 'config.comment_crawl_progress' and re-enqueues itself
+        (see 'requeue_comment_crawl_slice'), so a movie with a huge count of comments cannot monopolize a worker
+    -- only one run crawls a movie at a time, the scheduled run of an unfinished crawl job is skipped while its slice is pending,
+        and resumes the crawl job if its slice is lost (e.g., dropped by the scheduler)
+    -- a run which raises drops the saved position, so the next scheduled run starts a new crawl job
+    -- if COMMENT_CRAWL_PROBE_ENABLED, the crawl job is skipped or shortened when the comment count does not change,
+        see 'probe_rating_count' and 'probe_total_comment_count'
+    -- in the 'parallel' backfill mode, the first crawl job of a newly added movie crawls page ranges concurrently in one run,
+        see 'backfill_comment'
     
     Parameters
     ----------
     movie_id: int
         The id of the movie/TV-series to crawl comments
-    last_crawl_total_comment_count: str
+    last_crawl_total_comment_count: int
+        The total comment count crawled by the latest comment crawl job
+    resume: bool, optional
+        The flag indicating whether to resume an unfinished crawl job from its saved position (default is False)
+        -- True: called by the re-enqueued slice of an unfinished crawl job
+        -- False: called by the scheduled comment crawl job, skipped if the movie is being crawled or its re-enqueued slice is pending
         
     Returns
     -------
-    None
+    bool
+        True if the crawl job is finished (or nothing to resume), False if the crawl job is unfinished or skipped
 
     Notes: (THE FOLLOWING NOTES IS OUTDATED)
     ------
@@ -91,33 +146,121 @@ def dispatch_crawl_comment(movie_id, last_crawl_total_comment_count):
     -- each page/request can ONLY load 20 comments, which cannot be customized by user/URL
     '''
     
-    # The comment start index of each crawl job
-    comment_start_index = 0
+    # Claim the movie, so a scheduled run and a slice never crawl the movie at the same time
+    token = object()
+    with _comment_crawl_run_tokens_lock:
+        progress = config.comment_crawl_progress.get(movie_id)
+        if resume and progress is None: # nothing to resume
+            return True
 
-    crawl_total_comment_count = False
-    total_comment_count = 0 
-    
-    while True:
-        if comment_start_index == 0:
-            crawl_total_comment_count = True
+        running = movie_id in _comment_crawl_run_tokens
+        # the unfinished crawl job will be resumed by its re-enqueued slice
+        slice_pending = not resume and progress is not None and is_comment_crawl_slice_pending(movie_id)
+        if not running and not slice_pending:
+            _comment_crawl_run_tokens[movie_id] = token
+
+    if running or slice_pending:
+        state = 'running' if running else f'unfinished (next comment start index \'{progress["comment_start_index"]}\')'
+        msg = f'The comment crawl job for movie with id \'{movie_id}\' is {state}. The {"re-enqueued slice" if resume else "scheduled run"} is SKIPPED.'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        return False
+
+    if not resume and progress is not None: # the re-enqueued slice is lost, resume the unfinished crawl job in this run
+        msg = f'The re-enqueued slice of the unfinished comment crawl job for movie with id \'{movie_id}\' is lost. Resume the crawl job from the comment start index \'{progress["comment_start_index"]}\'.'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+
+    try:
+        return run_comment_crawl_job(movie_id, last_crawl_total_comment_count, progress, token)
+    except Exception:
+        # Drop the position, otherwise every scheduled run of the movie waits for a slice that never comes
+        with _comment_crawl_run_tokens_lock:
+            if _comment_crawl_run_tokens.get(movie_id) is token:
+                config.comment_crawl_progress.pop(movie_id, None)
+        raise
+    finally:
+        # Release the claim, unless it is handed over to the re-enqueued slice
+        with _comment_crawl_run_tokens_lock:
+            if _comment_crawl_run_tokens.get(movie_id) is token:
+                del _comment_crawl_run_tokens[movie_id]
+
+
+def run_comment_crawl_job(movie_id, last_crawl_total_comment_count, progress, token):
+    '''Run (a slice of) the comment crawl job of the movie with id 'movie_id', claimed by the run with the token 'token',
+    see 'dispatch_crawl_comment'
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    last_crawl_total_comment_count: int
+        The total comment count crawled by the latest comment crawl job
+    progress: dict
+        The saved position of the unfinished crawl job, None for a new crawl job
+    token: object
+        The token of the run in '_comment_crawl_run_tokens'
+
+    Returns
+    -------
+    bool
+        True if the crawl job is finished, False if the crawl job is unfinished
+    '''
+
+    skipped = False
+    if progress is None: # a new crawl job
+        progress = {
+            'last_crawl_total_comment_count': last_crawl_total_comment_count,
+            'comment_start_index': 0, # the comment start index of the next crawl procedure/sub-job
+            'end_comment_start_index': None, # the comment start index to stop the crawl job, None: crawl until the last page
+            'total_comment_count': 0,
+            'elapsed_seconds': 0.0 # the total duration of all finished slices
+        }
+        # Skip the crawl job without fetching any page, if the movie's rating count does not change
+        skipped = config.COMMENT_CRAWL_PROBE_ENABLED and probe_rating_count(movie_id, progress)
+
+    try:
+        if skipped:
+            finished = True
+        elif config.COMMENT_BACKFILL_MODE == 'parallel' and progress['last_crawl_total_comment_count'] <= 0 and progress['comment_start_index'] == 0:
+            finished = backfill_comment(movie_id, progress)
         else:
-            crawl_total_comment_count = False
+            finished = crawl_comment_slice(movie_id, progress)
+    finally:
+        # Emit the completion event of the crawled pages, to merge them by the data pre-process worker
+        # (also when the crawl raises, the pages crawled before are saved)
+        if not skipped:
+            data_preprocess_worker.emit_comment_crawl_completed(movie_id)
 
-        results = comment_crawler.crawl_comment(movie_id, comment_start_index, crawl_total_comment_count)
-        
-        if crawl_total_comment_count:
-            total_comment_count = results['total_comment_count']
+    # An unfinished crawl job: save the position and re-enqueue
+    if not finished:
+        with _comment_crawl_run_tokens_lock:
+            config.comment_crawl_progress[movie_id] = progress
+            # hand the claim over to the next slice, which may start before this run returns
+            del _comment_crawl_run_tokens[movie_id]
+            if requeue_comment_crawl_slice(movie_id, progress['last_crawl_total_comment_count']):
+                return False
+            _comment_crawl_run_tokens[movie_id] = token
 
-        # No more comment to crawl
-        if results['current_page_comment_count'] == 0:
-            break
-        
-        # Set comment_start_index for the next crawl procedure/sub-job
-        comment_start_index += config.MOVIE_COMMENT_INCR_STEP
-        # Pause several seconds after each crawl procedure to bypass DouBan (D)DoS detect
-        time.sleep(config.SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB)
+        # The crawl job cannot be re-enqueued, crawl the remaining pages in this run
+        crawl_comment_slice(movie_id, progress, max_pages=0, max_seconds=0)
+        data_preprocess_worker.emit_comment_crawl_completed(movie_id)
+
+    config.comment_crawl_progress.pop(movie_id, None)
+    total_comment_count = progress['total_comment_count']
+
+    # Record the movie's rating count (crawled today by the movie info crawler) at this crawl job, used by 'probe_rating_count'
+    if movie_id in config.movie_rating_counts:
+        config.comment_crawl_rating_counts[movie_id] = config.movie_rating_counts[movie_id]['rating_count']
 
     # After the crawl job (all crawl procedures/sub-jobs)
+    # Record the crawl job duration, used by the 'duration' schedule mode of comment crawl jobs
+    config.comment_crawl_job_durations[movie_id] = progress['elapsed_seconds']
+
     # Update the 'last_crawl_total_comment_count' of the movie in both the dataframe and the CSV movie_list file
     movie_list_manager.update_movie_total_comment_count(
         config.movie_list_df,
@@ -126,6 +269,460 @@ def dispatch_crawl_comment(movie_id, last_crawl_total_comment_count):
         total_comment_count
     )
 
+    # Update the comment velocity of the movie, used by the crawl budget optimizer
+    # (a failed crawl job gets no total comment count)
+    if total_comment_count > 0:
+        comment_crawl_budget_optimizer.update_comment_velocity(movie_id, total_comment_count)
+
     # update the 'day' in the cron schedule for the comment crawl job of the movie with id 'movie_id'
-    config.comment_crawl_jobs_cron_schedule_df = update_comment_crawl_job_cron_schedule(movie_id, last_crawl_total_comment_count, total_comment_count, config.comment_crawl_jobs_cron_schedule_df)
+    config.comment_crawl_jobs_cron_schedule_df = update_comment_crawl_job_cron_schedule(movie_id, progress['last_crawl_total_comment_count'], total_comment_count, config.comment_crawl_jobs_cron_schedule_df)
+
+    return True
+
+
+def crawl_comment_slice(movie_id, progress, max_pages=None, max_seconds=None):
+    '''Crawl comment pages of the movie with id 'movie_id' from the saved position in 'progress',
+    until the last page or the slice limit is reached, and update 'progress' in place.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    progress: dict
+        The position of the crawl job, see 'dispatch_crawl_comment'
+    max_pages: int, optional
+        The maximum pages to crawl in this slice, 0 means no limit (default is COMMENT_CRAWL_SLICE_MAX_PAGES)
+    max_seconds: int, optional
+        The maximum seconds to crawl in this slice, 0 means no limit (default is COMMENT_CRAWL_SLICE_MAX_SECONDS)
+
+    Returns
+    -------
+    bool
+        True if the last page is crawled (i.e., the crawl job is finished), otherwise False
+    '''
+
+    if max_pages is None:
+        max_pages = config.COMMENT_CRAWL_SLICE_MAX_PAGES
+    if max_seconds is None:
+        max_seconds = config.COMMENT_CRAWL_SLICE_MAX_SECONDS
+
+    # The start time of the slice, to record the crawl job duration
+    start_time = time.monotonic()
+    page_count = 0
+    finished = False
+    # The pages of the slice are appended to one segment file, in the 'segment' raw output mode
+    segment_writer = comment_crawler.create_comment_segment_writer(movie_id)
+    
+    try:
+        while True:
+            comment_start_index = progress['comment_start_index']
+            crawl_total_comment_count = comment_start_index == 0
+
+            # Wait for the comment page rate limit of the lane, in the 'queue' comment crawl run mode
+            comment_crawl_queue.acquire_comment_page_token()
+            if config.COMMENT_CRAWL_PIPELINE_ENABLED: # only fetch the page, it is parsed and saved by the pipeline
+                results = comment_crawl_pipeline.crawl_comment_page(movie_id, comment_start_index, crawl_total_comment_count, segment_writer=segment_writer)
+            else:
+                results = comment_crawler.crawl_comment(movie_id, comment_start_index, crawl_total_comment_count, segment_writer=segment_writer)
+            page_count += 1
+        
+            if crawl_total_comment_count:
+                progress['total_comment_count'] = results['total_comment_count']
+                # Skip or shorten the rest of the crawl job, if the total comment count does not change (much)
+                if config.COMMENT_CRAWL_PROBE_ENABLED and results['current_page_comment_count'] > 0:
+                    probe_total_comment_count(movie_id, progress)
+
+            # No more comment to crawl
+            if results['current_page_comment_count'] == 0:
+                finished = True
+                break
+        
+            # Set comment_start_index for the next crawl procedure/sub-job
+            progress['comment_start_index'] += config.MOVIE_COMMENT_INCR_STEP
+
+            # No need to crawl more comments, decided by the probe
+            end_comment_start_index = progress.get('end_comment_start_index')
+            if end_comment_start_index is not None and progress['comment_start_index'] >= end_comment_start_index:
+                finished = True
+                break
+
+            # Pause several seconds after each crawl procedure to bypass DouBan (D)DoS detect
+            time.sleep(config.SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB)
+
+            # The slice limit is reached
+            if max_pages and page_count >= max_pages:
+                break
+            if max_seconds and time.monotonic() - start_time >= max_seconds:
+                break
+    finally:
+        # Wait for the fetched pages to be parsed and saved by the pipeline, close the segment file and record the duration,
+        # also when a page crawl raises, so the pages crawled by the slice are kept
+        if config.COMMENT_CRAWL_PIPELINE_ENABLED:
+            comment_crawl_pipeline.wait_for_movie_pages(movie_id)
+
+        if segment_writer is not None:
+            segment_writer.close()
+
+        progress['elapsed_seconds'] += time.monotonic() - start_time
+
+    return finished
+
+
+def backfill_comment(movie_id, progress):
+    '''Crawl the whole comment history of the newly added movie with id 'movie_id' by concurrent page ranges, and update 'progress' in place.
+    -- the total comment count on the first page splits the comment start indexes of the rest of the pages
+        into contiguous page ranges, which are crawled concurrently (see 'crawl_comment_range' and 'get_backfill_range_count')
+    -- every page fetch waits for the comment page rate limit of the lane of the crawler worker (in the 'queue' comment crawl run mode),
+        or the global rate limit (in the 'cron' comment crawl run mode), so the page ranges share the rate of one crawl job
+    -- a failed page range keeps the pages it crawled, and the pages of all page ranges are saved
+    -- each page range crawls COMMENT_BACKFILL_OVERLAP_PAGES extra pages after its end, to cover comments shifted over the range boundary
+        ('sort=new_score' reorders comments while the pages are crawled), and the last page range crawls until an empty page
+    -- the crawled comments are deduplicated (by user and comment timestamp) and saved as json files of MOVIE_COMMENT_INCR_STEP comments,
+        i.e., the same raw output as the page-by-page crawl job
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    progress: dict
+        The position of the new crawl job, see 'dispatch_crawl_comment'
+
+    Returns
+    -------
+    bool
+        True, the crawl job is always finished in one run
+    '''
+
+    start_time = time.monotonic()
+    lane = comment_crawl_queue.get_current_comment_crawl_lane()
+    step = config.MOVIE_COMMENT_INCR_STEP
+
+    comment_crawl_queue.acquire_comment_page_token(lane)
+    results = comment_crawler.crawl_comment(movie_id, 0, True, save_data=False)
+    total_comment_count = results['total_comment_count']
+    progress['total_comment_count'] = total_comment_count
+
+    # the crawled pages, each page is a tuple (comment start index, comments)
+    # the overlapped pages of a page range are also crawled by the next page range, so a comment start index may appear twice
+    pages = [(0, results['comments'])]
+
+    if results['current_page_comment_count'] > 0:
+        # split the comment start indexes of the rest of the pages into contiguous page ranges
+        # -- at least one page range, which crawls until an empty page even if the total comment count is stale
+        page_start_indexes = np.arange(step, max(total_comment_count, step + 1), step)
+        page_ranges = [page_range for page_range in np.array_split(page_start_indexes, get_backfill_range_count(lane)) if len(page_range) > 0]
+
+        with ThreadPoolExecutor(max_workers=len(page_ranges), thread_name_prefix=f'comment_backfill_{movie_id}') as executor:
+            futures = [
+                executor.submit(crawl_comment_range, movie_id, int(page_range[0]), int(page_range[-1]) + step, i == len(page_ranges) - 1, lane)
+                for i, page_range in enumerate(page_ranges)
+            ]
+            for future in futures:
+                # keep the pages of the other page ranges, if a page range fails
+                try:
+                    pages.extend(future.result())
+                except Exception as e:
+                    msg = f'Backfill a comment page range for movie with id \'{movie_id}\' failed. -- Original Exception -- {e}'
+                    current_frame = sys._getframe()
+                    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+                    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+                    util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+                    util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+                    util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+    # remove the duplicated comments of the overlapped pages, in the order of comment start index
+    comments = []
+    comment_keys = set()
+    for comment_start_index, page_comments in sorted(pages, key=lambda page: page[0]):
+        for comment in page_comments:
+            comment_key = (comment['user_url'], comment['comment_timestamp'])
+            if comment_key not in comment_keys:
+                comment_keys.add(comment_key)
+                comments.append(comment)
+
+    # save the comments as the raw output of the page-by-page crawl job, i.e., one json file (or segment page) per MOVIE_COMMENT_INCR_STEP comments
+    segment_writer = comment_crawler.create_comment_segment_writer(movie_id)
+    for i in range(0, len(comments), step):
+        if segment_writer is not None:
+            segment_writer.write_page(comments[i:i + step], config.MOVIE_COMMENT_URL.format(movie_id=movie_id, comment_start_index=i))
+        else:
+            comment_crawler.save_data_as_json(movie_id, comments[i:i + step])
+    if segment_writer is not None:
+        segment_writer.close()
+
+    progress['comment_start_index'] = max(page[0] for page in pages) + step
+    progress['elapsed_seconds'] += time.monotonic() - start_time
+
+    crawled_comment_count = sum(len(page[1]) for page in pages)
+    msg = (
+        f'Backfill {len(comments)} comments ({crawled_comment_count - len(comments)} duplicates removed) '
+        f'of total {total_comment_count} comments from {len(pages)} pages for movie with id \'{movie_id}\' '
+        f'in {progress["elapsed_seconds"]:.0f} seconds.'
+    )
+    # more than one page of comments are missing, e.g., some pages failed or comments shifted more than the overlapped pages
+    log_level = config.LOG_LEVEL_INFO if len(comments) + step >= total_comment_count else config.LOG_LEVEL_WARNING
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+    util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=log_level)
+
+    return True
+
+
+def get_backfill_range_count(lane):
+    '''Get the count of page ranges crawled concurrently by a parallel backfill, i.e., COMMENT_BACKFILL_RANGE_COUNT
+    bounded by the count of active crawler workers of the lane 'lane' (in the 'queue' comment crawl run mode)
+    and the free slots of the browser limit (if set by the worker autoscaler), at least 1
+
+    Parameters
+    ----------
+    lane: str
+        The lane of the crawler worker running the backfill, None if not run by a crawler worker
+
+    Returns
+    -------
+    int
+        The count of page ranges
+    '''
+
+    range_count = config.COMMENT_BACKFILL_RANGE_COUNT
+    if lane is not None:
+        range_count = min(range_count, comment_crawl_queue.get_comment_crawl_queue_status()[lane]['active_worker_count'])
+    free_browser_slot_count = browser_supervisor.get_free_browser_slot_count()
+    if free_browser_slot_count is not None:
+        range_count = min(range_count, free_browser_slot_count)
+
+    return max(range_count, 1)
+
+
+def crawl_comment_range(movie_id, range_start_index, range_end_index, is_last_range, lane):
+    '''Crawl the comment pages of the movie with id 'movie_id' in the page range [range_start_index, range_end_index),
+    plus COMMENT_BACKFILL_OVERLAP_PAGES overlapped pages after the range, used by 'backfill_comment'.
+    A page crawl which raises ends the page range, and the pages crawled before it are returned.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    range_start_index: int
+        The comment start index of the first page of the range
+    range_end_index: int
+        The comment start index after the last page of the range
+    is_last_range: bool
+        The flag indicating whether the range is the last range, which crawls until an empty page
+    lane: str
+        The lane of the crawler worker running the backfill, None if not run by a crawler worker
+
+    Returns
+    -------
+    list
+        The crawled pages, each page is a tuple (comment start index, comments)
+    '''
+
+    stop_index = range_end_index + config.COMMENT_BACKFILL_OVERLAP_PAGES * config.MOVIE_COMMENT_INCR_STEP
+    pages = []
+    comment_start_index = range_start_index
+
+    try:
+        while is_last_range or comment_start_index < stop_index:
+            comment_crawl_queue.acquire_comment_page_token(lane)
+            results = comment_crawler.crawl_comment(movie_id, comment_start_index, False, save_data=False)
+
+            # No more comment to crawl (or the page failed)
+            if results['current_page_comment_count'] == 0:
+                break
+
+            pages.append((comment_start_index, results['comments']))
+            comment_start_index += config.MOVIE_COMMENT_INCR_STEP
+
+            # Pause several seconds after each crawl procedure to bypass DouBan (D)DoS detect
+            time.sleep(config.SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB)
+    except Exception as e:
+        msg = f'Backfill the comment page range [{range_start_index}, {range_end_index}) for movie with id \'{movie_id}\' failed at the comment start index \'{comment_start_index}\', keep {len(pages)} crawled pages. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+    return pages
+
+
+def probe_rating_count(movie_id, progress):
+    '''Probe whether the comments of the movie with id 'movie_id' change without fetching any comment page,
+    by comparing the rating count crawled today by the movie info crawler ('aggregateRating.ratingCount')
+    with the rating count at the latest comment crawl job.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    progress: dict
+        The position of the new crawl job, see 'dispatch_crawl_comment'
+
+    Returns
+    -------
+    bool
+        True if the rating count does not change, i.e., the crawl job can be skipped, otherwise False
+    '''
+
+    if not config.COMMENT_PROBE_USE_RATING_COUNT or progress['last_crawl_total_comment_count'] <= 0:
+        return False
+
+    today = datetime.now(config.TIME_ZONE).strftime("%Y-%m-%d")
+    movie_rating_count = config.movie_rating_counts.get(movie_id)
+    if movie_rating_count is None or movie_rating_count['date'] != today: # no rating count crawled today
+        return False
+
+    if config.comment_crawl_rating_counts.get(movie_id) != movie_rating_count['rating_count']:
+        return False
+
+    progress['total_comment_count'] = progress['last_crawl_total_comment_count']
+    record_comment_crawl_probe_decision(movie_id, 'skipped', progress, 'rating count does not change')
+    return True
+
+
+def probe_total_comment_count(movie_id, progress):
+    '''Decide how many comment pages to crawl after the first page of a new crawl job,
+    by comparing the total comment count on the first page ('h1.title') with the 'last_crawl_total_comment_count'.
+    -- 'unchanged': the total comment count does not change, stop after the first page
+    -- 'shortened': the comments increase and COMMENT_PROBE_SHORTEN_CRAWL is True,
+        only crawl the pages of the comment increment plus COMMENT_PROBE_EXTRA_PAGES pages
+    -- 'changed': crawl until the last page
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    progress: dict
+        The position of the crawl job (with the crawled 'total_comment_count'), updated in place
+
+    Returns
+    -------
+    None
+    '''
+
+    last_crawl_total_comment_count = progress['last_crawl_total_comment_count']
+    comment_increment = progress['total_comment_count'] - last_crawl_total_comment_count
+
+    if last_crawl_total_comment_count <= 0: # never crawled, crawl all comments
+        return
+
+    if comment_increment == 0:
+        progress['end_comment_start_index'] = config.MOVIE_COMMENT_INCR_STEP
+        record_comment_crawl_probe_decision(movie_id, 'unchanged', progress, 'total comment count does not change')
+    elif comment_increment > 0 and config.COMMENT_PROBE_SHORTEN_CRAWL:
+        page_count = math.ceil(comment_increment / config.MOVIE_COMMENT_INCR_STEP) + config.COMMENT_PROBE_EXTRA_PAGES
+        progress['end_comment_start_index'] = page_count * config.MOVIE_COMMENT_INCR_STEP
+        record_comment_crawl_probe_decision(movie_id, 'shortened', progress, f'crawl {page_count} pages for {comment_increment} new comments')
+    else:
+        record_comment_crawl_probe_decision(movie_id, 'changed', progress, f'total comment count changes by {comment_increment}')
+
+
+def record_comment_crawl_probe_decision(movie_id, decision, progress, reason):
+    '''Record the probe decision of the comment crawl job of the movie with id 'movie_id'
+    in 'config.comment_crawl_probe_decisions' and the log files.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    decision: str
+        The probe decision, 'skipped', 'unchanged', 'shortened' or 'changed'
+    progress: dict
+        The position of the crawl job
+    reason: str
+        The reason of the decision
+
+    Returns
+    -------
+    None
+    '''
+
+    config.comment_crawl_probe_decisions[movie_id] = {
+        'time': datetime.now(config.TIME_ZONE).isoformat(),
+        'decision': decision,
+        'last_crawl_total_comment_count': progress['last_crawl_total_comment_count'],
+        'total_comment_count': progress['total_comment_count'],
+        'end_comment_start_index': progress['end_comment_start_index']
+    }
+
+    msg = f'The comment crawl job for movie with id \'{movie_id}\' is {decision.upper()} by the probe: {reason}.'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+
+def is_comment_crawl_slice_pending(movie_id):
+    '''Check whether the re-enqueued slice of the unfinished comment crawl job of the movie with id 'movie_id' is pending, i.e., not run yet.
+    -- 'queue' comment crawl run mode: always False, since the scheduled run of a movie is not queued
+        while a slice of the movie is queued (see 'comment_crawl_queue.enqueue_comment_crawl')
+    -- 'cron' comment crawl run mode: True if the one-off slice job is in the scheduler
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+
+    Returns
+    -------
+    bool
+        True if the slice is pending, otherwise False
+    '''
+
+    if config.COMMENT_CRAWL_RUN_MODE == 'queue' or config.bg_scheduler is None:
+        return False
+
+    return config.bg_scheduler.get_job(config.COMMENT_CRAWL_SLICE_JOB_ID(movie_id)) is not None
+
+
+def requeue_comment_crawl_slice(movie_id, last_crawl_total_comment_count):
+    '''Re-enqueue the next slice of the unfinished comment crawl job of the movie with id 'movie_id'.
+    -- 'queue' comment crawl run mode: put the movie back into the comment crawl queue, behind all due movies
+    -- 'cron' comment crawl run mode: schedule a one-off APScheduler job to run immediately,
+        which may start while the current slice (with the same job id) is returning, and is never dropped as misfired
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    last_crawl_total_comment_count: int
+        The total comment count crawled by the latest (finished) comment crawl job
+
+    Returns
+    -------
+    bool
+        True if the next slice is re-enqueued, otherwise False
+    '''
+
+    if config.COMMENT_CRAWL_RUN_MODE == 'queue':
+        comment_crawl_queue.requeue_comment_crawl(movie_id, last_crawl_total_comment_count)
+        return True
+
+    if config.bg_scheduler is None: # no scheduler to run the next slice
+        return False
+
+    try:
+        config.bg_scheduler.add_job(func=dispatch_crawl_comment,
+                                    kwargs={
+                                        'movie_id': movie_id,
+                                        'last_crawl_total_comment_count': last_crawl_total_comment_count,
+                                        'resume': True
+                                    },
+                                    id=config.COMMENT_CRAWL_SLICE_JOB_ID(movie_id),
+                                    executor='default', replace_existing=True,
+                                    max_instances=2, misfire_grace_time=None,
+                                    trigger='date', run_date=datetime.now(config.TIME_ZONE))
+    except Exception as e:
+        msg = f'Re-enqueue the comment crawl job slice for movie with id \'{movie_id}\' failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return False
 
+    return True
@@ -0,0 +1,234 @@
+'''The CommentCrawlPipeline Module
+
+Summary
+-------
+This module defines the staged pipeline to crawl comment pages, separating fetch, parse and persist:
+-- fetch: the comment crawl job (in its own thread, e.g., a crawler worker) fetches a comment page by the webbrowser
+    and takes the HTML of the comment list, then the webbrowser exits (see 'comment_crawler.fetch_comment')
+-- parse: COMMENT_CRAWL_PIPELINE_PARSE_WORKER_COUNT parse workers parse the HTML into comment data (see 'comment_crawler.parse_html')
+-- persist: COMMENT_CRAWL_PIPELINE_PERSIST_WORKER_COUNT persist workers save the comment data as json files
+    (see 'comment_crawler.save_data_as_json') or append them to the segment file of the crawl job, and log the crawl
+The stages are connected by bounded queues (COMMENT_CRAWL_PIPELINE_QUEUE_SIZE), i.e., backpressure:
+a fetcher waits when the parse workers fall behind, and a parse worker waits when the persist workers fall behind.
+So webbrowsers are never held by parsing or disk latency, and disk and CPU work overlap with network waits.
+
+The comment crawl job waits for its pages to be persisted at the end of each slice (see 'wait_for_movie_pages'),
+so the on-disk outputs (the crawled comment data json files) are the same as 'comment_crawler.crawl_comment'.
+'''
+
+import sys
+import queue
+import threading
+
+import config
+import util
+import metrics
+import comment_crawler
+
+
+# The bounded queues between the stages, each item is a dict of the page (see 'crawl_comment_page')
+_parse_queue = queue.Queue(maxsize=config.COMMENT_CRAWL_PIPELINE_QUEUE_SIZE)
+_persist_queue = queue.Queue(maxsize=config.COMMENT_CRAWL_PIPELINE_QUEUE_SIZE)
+# The count of pages of each movie in the pipeline (fetched but not persisted yet), movie id as key
+_pending_page_counts = {}
+# The condition to wait for the pages of a movie to be persisted
+_pending_pages_condition = threading.Condition()
+# The parse and persist workers (threads)
+_pipeline_workers = []
+# The lock to start the pipeline workers once
+_pipeline_start_lock = threading.Lock()
+
+
+def start_comment_crawl_pipeline():
+    '''Start the parse and persist workers (daemon threads) of the comment crawl pipeline, if not started yet
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    with _pipeline_start_lock:
+        if _pipeline_workers:
+            return
+
+        for stage, target, worker_count in (
+            ('parse', run_parse_worker, config.COMMENT_CRAWL_PIPELINE_PARSE_WORKER_COUNT),
+            ('persist', run_persist_worker, config.COMMENT_CRAWL_PIPELINE_PERSIST_WORKER_COUNT)
+        ):
+            for worker_index in range(worker_count):
+                worker = threading.Thread(target=target, name=f'comment_crawl_pipeline_{stage}_worker_{worker_index}', daemon=True)
+                worker.start()
+                _pipeline_workers.append(worker)
+
+    msg = (
+        f'Start the comment crawl pipeline with {config.COMMENT_CRAWL_PIPELINE_PARSE_WORKER_COUNT} parse workers '
+        f'and {config.COMMENT_CRAWL_PIPELINE_PERSIST_WORKER_COUNT} persist workers (queue size {config.COMMENT_CRAWL_PIPELINE_QUEUE_SIZE}).'
+    )
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+
+def finish_page(movie_id):
+    '''Mark a page of the movie with id 'movie_id' as done (persisted or failed), and wake up the waiting comment crawl job'''
+
+    with _pending_pages_condition:
+        _pending_page_counts[movie_id] -= 1
+        if _pending_page_counts[movie_id] <= 0:
+            del _pending_page_counts[movie_id]
+            _pending_pages_condition.notify_all()
+
+
+def log_pipeline_error(page, stage, e):
+    '''Log the failure of the stage 'stage' of the page 'page' '''
+
+    msg = f'Crawl comments from \'{page["url"]}\' failed in the \'{stage}\' stage. The comments of the page are LOST! -- Original Exception -- {e}'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+    util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+    util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+    util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+
+def crawl_comment_page(movie_id, comment_start_index, crawl_total_comment_count, segment_writer=None):
+    '''Fetch a comment page and put it into the pipeline to be parsed and persisted, i.e., the fetch stage.
+    It has the same parameters and returns the same counts as 'comment_crawler.crawl_comment'.
+    It waits (backpressure) if the parse queue is full.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    comment_start_index: int
+        The start index of movie/TV-series comment to be crawled
+    crawl_total_comment_count: bool
+        The flag indicating whether to crawl the total comment count of the movie
+    segment_writer: CommentSegmentWriter, optional
+        The segment writer of the comment crawl job, in the 'segment' raw output mode (default is None)
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- total_comment_count (the total comment count of the movie, only crawled if 'crawl_total_comment_count' is True)
+        -- current_page_comment_count (the comment count on the webpage)
+    '''
+
+    start_comment_crawl_pipeline()
+
+    page = comment_crawler.fetch_comment(movie_id, comment_start_index, crawl_total_comment_count)
+    page['movie_id'] = movie_id
+    page['segment_writer'] = segment_writer
+
+    if page['comment_list_html'] is not None:
+        with _pending_pages_condition:
+            _pending_page_counts[movie_id] = _pending_page_counts.get(movie_id, 0) + 1
+        with metrics.timer('pipeline_backpressure', 'comment_crawl_pipeline'):
+            _parse_queue.put(page)
+    elif page['fetched']: # No comments on the requested webpage (a failed fetch is logged by the fetcher)
+        msg = f'Crawl 0 comments from \'{page["url"]}\' successfully. There is no more comment to crawl. The comment crawl job for movie with id \'{movie_id}\' stopped.'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+    return {
+        'total_comment_count': page['total_comment_count'],
+        'current_page_comment_count': page['current_page_comment_count']
+    }
+
+
+def run_parse_worker():
+    '''The parse worker loop: pull a fetched page from the parse queue, parse its comments and put it into the persist queue.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    while True:
+        page = _parse_queue.get()
+        try:
+            with metrics.timer('parse', 'comment_crawler'):
+                comments = comment_crawler.parse_html(page['movie_id'], page['comment_list_html'], page['url'])
+            for comment in comments:
+                comment['crawl_timestamp'] = page['crawl_timestamp']
+            page['comments'] = comments
+            page['comment_list_html'] = None # release the HTML
+            _persist_queue.put(page)
+        except Exception as e:
+            log_pipeline_error(page, 'parse', e)
+            finish_page(page['movie_id'])
+        finally:
+            _parse_queue.task_done()
+
+
+def run_persist_worker():
+    '''The persist worker loop: pull a parsed page from the persist queue, save its comments as a json file and log the crawl.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    while True:
+        page = _persist_queue.get()
+        try:
+            if page['segment_writer'] is not None:
+                json_file = page['segment_writer'].write_page(page['comments'], page['url'])
+            else:
+                json_file = comment_crawler.save_data_as_json(page['movie_id'], page['comments'])
+        except Exception as e:
+            log_pipeline_error(page, 'persist', e)
+        else:
+            msg = f'Crawl {len(page["comments"])} comments from \'{page["url"]}\' successfully. Data saved in \'{json_file}\' file.'
+            current_frame = sys._getframe()
+            logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+            util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+            util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+        finally:
+            finish_page(page['movie_id'])
+            _persist_queue.task_done()
+
+
+def wait_for_movie_pages(movie_id, timeout=None):
+    '''Wait until all fetched pages of the movie with id 'movie_id' are persisted (or failed)
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    timeout: float, optional
+        The maximum seconds to wait (default is no limit)
+
+    Returns
+    -------
+    bool
+        True if all pages are done, False if the timeout is reached
+    '''
+
+    with _pending_pages_condition:
+        return _pending_pages_condition.wait_for(lambda: movie_id not in _pending_page_counts, timeout=timeout)
+
+
+def get_comment_crawl_pipeline_metrics():
+    '''Get the gauges of the pages waiting in the queues of the pipeline, registered as the metrics gauge callback'''
+
+    return [({'stage': 'parse'}, _parse_queue.qsize()), ({'stage': 'persist'}, _persist_queue.qsize())]
+
+
+metrics.register_gauge_callback('comment_crawl_pipeline_pages', get_comment_crawl_pipeline_metrics)
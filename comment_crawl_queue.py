@@ -0,0 +1,498 @@
+'''The CommentCrawlQueue Module
+
+Summary
+-------
+This module defines functions to run comment crawl jobs by fixed pools of crawler workers pulling from priority queues.
+
+In the 'queue' comment crawl run mode (see 'config.COMMENT_CRAWL_RUN_MODE'):
+-- the APScheduler cron job of a movie only puts the (due) movie into the priority queue of a lane
+-- each lane (see 'config.COMMENT_CRAWL_LANES') has its own crawler workers (threads), which pull movies from the queue of the lane
+    in the order of priority (see 'config.COMMENT_CRAWL_QUEUE_PRIORITY') and run the comment crawl jobs
+-- each lane fetches comment pages within its share of the global rate limit (see 'config.COMMENT_CRAWL_PAGES_PER_SECOND')
+-- the comment crawl job reports its results back to the movie list (see 'comment_crawl_dispatcher.dispatch_crawl_comment')
+So the count of concurrently running comment crawl jobs (i.e., webbrowsers) is bounded by the worker counts,
+and the most valuable comment crawl jobs run first when the workers fall behind.
+
+The lanes are:
+-- 'backfill': the first-time (full-history) comment crawl jobs of newly added movies, i.e., 'last_crawl_total_comment_count' is 0
+-- 'refresh': the incremental comment crawl jobs of crawled movies
+So a big backfill never delays the refresh of the rest of the movies.
+'''
+
+import sys
+import time
+import queue
+import itertools
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+import config
+import util
+import metrics
+import comment_crawl_dispatcher
+import job_run_tracker
+
+
+# The state of each lane, lane name as key, each value is a dict with keys:
+# -- queue: the priority queue of due movies, each item is a tuple (tier, priority, sequence, movie_id, last_crawl_total_comment_count, resume)
+#    -- tier 0: new comment crawl jobs, tier 1: re-enqueued slices of unfinished comment crawl jobs
+# -- workers: the crawler worker threads
+# -- active_worker_count: the count of crawler workers allowed to run comment crawl jobs (the rest wait idle),
+#    adjusted by the worker autoscaler, see 'set_active_worker_count'
+# -- rate_limiter: the comment page rate limiter, see 'create_rate_limiter'
+_comment_crawl_lanes = {
+    lane: {'queue': queue.PriorityQueue(), 'workers': [], 'active_worker_count': 0, 'rate_limiter': None}
+    for lane in config.COMMENT_CRAWL_LANES
+}
+# The condition to wake up idle crawler workers when the active worker count of a lane changes
+_active_workers_condition = threading.Condition()
+# The sequence number of queue items, to keep FIFO order for items with the same priority
+_comment_crawl_sequence = itertools.count()
+# The count of queue items (queued or being crawled) of each movie, movie_id as key
+# A movie with pending items is not queued again, to avoid crawling the same movie concurrently
+_pending_movie_counts = {}
+# The lane of each movie with pending items, movie_id as key
+_pending_movie_lanes = {}
+# The movies which are being crawled
+_running_movie_ids = set()
+# The lock to protect '_pending_movie_counts', '_pending_movie_lanes' and '_running_movie_ids'
+_pending_movie_ids_lock = threading.Lock()
+# The lane of the current crawler worker thread, see 'acquire_comment_page_token'
+_worker_context = threading.local()
+# The comment page rate limiter of the threads without a lane (e.g., in the 'cron' comment crawl run mode),
+# created at the first page fetch, see 'acquire_comment_page_token'
+_global_rate_limiter = None
+# The lock to create '_global_rate_limiter'
+_global_rate_limiter_lock = threading.Lock()
+
+
+def create_rate_limiter(pages_per_second):
+    '''Create a rate limiter which spaces page fetches evenly at 'pages_per_second'
+
+    Parameters
+    ----------
+    pages_per_second: float
+        The maximum pages to fetch per second, 0 means no limit
+
+    Returns
+    -------
+    dict
+        The rate limiter, a dict with keys:
+        -- pages_per_second: the maximum pages to fetch per second
+        -- next_time: the earliest time (time.monotonic) to fetch the next page
+        -- lock: the lock to protect 'next_time'
+    '''
+
+    return {
+        'pages_per_second': pages_per_second,
+        'next_time': time.monotonic(),
+        'lock': threading.Lock()
+    }
+
+
+def acquire_rate_limiter(rate_limiter):
+    '''Wait (block the calling thread) until a page can be fetched within the rate limiter 'rate_limiter'
+
+    Parameters
+    ----------
+    rate_limiter: dict
+        The rate limiter, see 'create_rate_limiter'
+
+    Returns
+    -------
+    None
+    '''
+
+    if rate_limiter is None or rate_limiter['pages_per_second'] <= 0:
+        return
+
+    with rate_limiter['lock']:
+        now = time.monotonic()
+        fetch_time = max(now, rate_limiter['next_time'])
+        rate_limiter['next_time'] = fetch_time + 1 / rate_limiter['pages_per_second']
+
+    if fetch_time > now:
+        time.sleep(fetch_time - now)
+
+
+def get_current_comment_crawl_lane():
+    '''Get the lane of the current crawler worker thread
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    str
+        The name of the lane, None if the current thread is not a crawler worker
+    '''
+
+    return getattr(_worker_context, 'lane', None)
+
+
+def acquire_comment_page_token(lane=None):
+    '''Wait until a comment page can be fetched within the rate limit of the lane 'lane'.
+    If there is no lane (e.g., in the 'cron' comment crawl run mode), wait for the global rate limit COMMENT_CRAWL_PAGES_PER_SECOND
+    shared by all threads without a lane.
+
+    Parameters
+    ----------
+    lane: str, optional
+        The name of the lane (default is the lane of the current crawler worker thread)
+        Threads started by a crawler worker (e.g., the page range threads of a parallel backfill) pass the lane of the worker
+
+    Returns
+    -------
+    None
+    '''
+
+    global _global_rate_limiter
+
+    if lane is None:
+        lane = get_current_comment_crawl_lane()
+    if lane is not None:
+        acquire_rate_limiter(_comment_crawl_lanes[lane]['rate_limiter'])
+        return
+
+    with _global_rate_limiter_lock:
+        if _global_rate_limiter is None:
+            _global_rate_limiter = create_rate_limiter(config.COMMENT_CRAWL_PAGES_PER_SECOND)
+    acquire_rate_limiter(_global_rate_limiter)
+
+
+def select_comment_crawl_lane(movie_id, last_crawl_total_comment_count):
+    '''Select the lane of the comment crawl job of the movie with id 'movie_id'
+    -- 'backfill': the movie has never been crawled, i.e., its 'last_crawl_total_comment_count' is 0
+    -- 'refresh': otherwise
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    last_crawl_total_comment_count: int
+        The total comment count crawled by the latest comment crawl job (when the job is scheduled)
+
+    Returns
+    -------
+    str
+        The name of the lane
+    '''
+
+    # use the latest 'last_crawl_total_comment_count' in the movie list, which may be updated after the job is scheduled
+    if config.movie_list_df is not None and movie_id in config.movie_list_df.index:
+        last_crawl_total_comment_count = config.movie_list_df.at[movie_id, 'last_crawl_total_comment_count']
+
+    return 'backfill' if last_crawl_total_comment_count <= 0 else 'refresh'
+
+
+def calculate_comment_crawl_priority(movie_id):
+    '''Calculate the priority of the comment crawl job of the movie with id 'movie_id', the smaller the value, the higher the priority.
+    -- 'deadline': the due time, i.e., the earliest due movie first
+    -- 'staleness': the negative seconds since the latest comment crawl job, i.e., the most stale movie first
+    -- 'velocity': the negative comment velocity, i.e., the fastest growing movie first
+    Movies never crawled (no comment velocity data) have the highest priority in the 'staleness' and 'velocity' modes.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+
+    Returns
+    -------
+    float
+        The priority of the comment crawl job
+    '''
+
+    now = datetime.now(config.TIME_ZONE)
+
+    if config.COMMENT_CRAWL_QUEUE_PRIORITY == 'deadline':
+        return now.timestamp()
+
+    velocity_df = config.comment_velocity_df
+    if velocity_df is None or movie_id not in velocity_df.index:
+        return float('-inf')
+
+    if config.COMMENT_CRAWL_QUEUE_PRIORITY == 'staleness':
+        last_crawl_time = datetime.fromisoformat(velocity_df.at[movie_id, 'last_crawl_time'])
+        return -(now - last_crawl_time).total_seconds()
+
+    # 'velocity'
+    velocity = velocity_df.at[movie_id, 'velocity']
+    return float('-inf') if pd.isna(velocity) else -velocity
+
+
+def enqueue_comment_crawl(movie_id, last_crawl_total_comment_count):
+    '''Put the due movie with id 'movie_id' into the comment crawl queue of its lane.
+    This function is scheduled as the cron job of the movie in the 'queue' comment crawl run mode,
+    it has the same parameters as 'comment_crawl_dispatcher.dispatch_crawl_comment'.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    last_crawl_total_comment_count: int
+        The total comment count crawled by the latest comment crawl job (when the job is scheduled)
+
+    Returns
+    -------
+    bool
+        True if the movie is queued, False if the movie is already queued or being crawled
+    '''
+
+    lane = select_comment_crawl_lane(movie_id, last_crawl_total_comment_count)
+
+    with _pending_movie_ids_lock:
+        if _pending_movie_counts.get(movie_id, 0) > 0:
+            queued = False
+        else:
+            _pending_movie_counts[movie_id] = 1
+            _pending_movie_lanes[movie_id] = lane
+            queued = True
+
+    if queued:
+        priority = calculate_comment_crawl_priority(movie_id)
+        _comment_crawl_lanes[lane]['queue'].put((0, priority, next(_comment_crawl_sequence), movie_id, last_crawl_total_comment_count, False))
+        msg = f'Queue the comment crawl job for movie with id \'{movie_id}\' in the \'{lane}\' lane with priority \'{priority}\'.'
+    else:
+        msg = f'The comment crawl job for movie with id \'{movie_id}\' is already queued or running. The due run is SKIPPED.'
+        # the same as a run dropped by 'max_instances' in the 'cron' comment crawl run mode
+        job_run_tracker.record_job_run(config.COMMENT_CRAWL_JOB_ID(movie_id), 'max_instances')
+
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+    return queued
+
+
+def requeue_comment_crawl(movie_id, last_crawl_total_comment_count):
+    '''Put the next slice of the unfinished comment crawl job of the movie with id 'movie_id' back into the queue of its lane.
+    The slice is queued behind all new comment crawl jobs of the lane, ordered by the time it is re-enqueued,
+    so small movies never wait behind the remaining pages of large movies.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    last_crawl_total_comment_count: int
+        The total comment count crawled by the latest (finished) comment crawl job
+
+    Returns
+    -------
+    None
+    '''
+
+    with _pending_movie_ids_lock:
+        _pending_movie_counts[movie_id] = _pending_movie_counts.get(movie_id, 0) + 1
+        # the slice stays in the lane of its crawl job
+        lane = _pending_movie_lanes.get(movie_id)
+        if lane is None:
+            lane = 'backfill' if last_crawl_total_comment_count <= 0 else 'refresh'
+            _pending_movie_lanes[movie_id] = lane
+
+    priority = datetime.now(config.TIME_ZONE).timestamp()
+    _comment_crawl_lanes[lane]['queue'].put((1, priority, next(_comment_crawl_sequence), movie_id, last_crawl_total_comment_count, True))
+
+
+def run_comment_crawl_worker(lane, worker_index):
+    '''The crawler worker loop: pull the highest-priority movie from the queue of the lane 'lane' and run its comment crawl job.
+    The worker waits idle while its index is not less than the active worker count of the lane.
+
+    Parameters
+    ----------
+    lane: str
+        The name of the lane
+    worker_index: int
+        The index of the crawler worker in the lane
+
+    Returns
+    -------
+    None
+    '''
+
+    _worker_context.lane = lane
+    lane_state = _comment_crawl_lanes[lane]
+    lane_queue = lane_state['queue']
+
+    while True:
+        with _active_workers_condition:
+            _active_workers_condition.wait_for(lambda: worker_index < lane_state['active_worker_count'])
+
+        item = lane_queue.get()
+
+        # the active worker count may decrease while waiting for the item, put the item back for an active worker
+        if worker_index >= lane_state['active_worker_count']:
+            lane_queue.put(item)
+            lane_queue.task_done()
+            continue
+
+        tier, priority, sequence, movie_id, last_crawl_total_comment_count, resume = item
+
+        with _pending_movie_ids_lock:
+            _running_movie_ids.add(movie_id)
+
+        # record the run under the id of the scheduled job, which only puts the movie into the queue
+        job_id = config.COMMENT_CRAWL_SLICE_JOB_ID(movie_id) if resume else config.COMMENT_CRAWL_JOB_ID(movie_id)
+        start_time = time.perf_counter()
+        outcome = 'executed'
+        try:
+            # use the latest 'last_crawl_total_comment_count' in the movie list, which may be updated after the job is queued
+            if config.movie_list_df is not None and movie_id in config.movie_list_df.index:
+                last_crawl_total_comment_count = config.movie_list_df.at[movie_id, 'last_crawl_total_comment_count']
+
+            comment_crawl_dispatcher.dispatch_crawl_comment(movie_id, last_crawl_total_comment_count, resume=resume)
+        except Exception as e:
+            outcome = 'error'
+            msg = f'The comment crawl job for movie with id \'{movie_id}\' failed in the crawler worker \'{threading.current_thread().name}\'. -- Original Exception -- {e}'
+            current_frame = sys._getframe()
+            logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+            util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        finally:
+            job_run_tracker.record_job_run(job_id, outcome, time.perf_counter() - start_time)
+            with _pending_movie_ids_lock:
+                _running_movie_ids.discard(movie_id)
+                _pending_movie_counts[movie_id] -= 1
+                if _pending_movie_counts[movie_id] <= 0:
+                    del _pending_movie_counts[movie_id]
+                    _pending_movie_lanes.pop(movie_id, None)
+            lane_queue.task_done()
+
+
+def get_lane_worker_count(lane, concurrency):
+    '''Get the count of crawler workers of the lane 'lane' for the total crawl concurrency 'concurrency',
+    i.e., the share of 'concurrency' proportional to the 'worker_count' of the lane in 'config.COMMENT_CRAWL_LANES' (at least 1)
+
+    Parameters
+    ----------
+    lane: str
+        The name of the lane
+    concurrency: int
+        The total count of crawler workers of all lanes
+
+    Returns
+    -------
+    int
+        The count of crawler workers of the lane
+    '''
+
+    total_worker_count = sum(lane_config['worker_count'] for lane_config in config.COMMENT_CRAWL_LANES.values())
+    return max(1, round(concurrency * config.COMMENT_CRAWL_LANES[lane]['worker_count'] / total_worker_count))
+
+
+def set_active_worker_count(lane, active_worker_count):
+    '''Set the count of crawler workers of the lane 'lane' allowed to run comment crawl jobs.
+    The count is bounded by the count of started crawler workers; workers above the count finish their current job and wait idle.
+
+    Parameters
+    ----------
+    lane: str
+        The name of the lane
+    active_worker_count: int
+        The count of active crawler workers
+
+    Returns
+    -------
+    int
+        The (bounded) count of active crawler workers
+    '''
+
+    lane_state = _comment_crawl_lanes[lane]
+    with _active_workers_condition:
+        lane_state['active_worker_count'] = max(0, min(active_worker_count, len(lane_state['workers'])))
+        _active_workers_condition.notify_all()
+
+    return lane_state['active_worker_count']
+
+
+def start_comment_crawl_workers():
+    '''Start the crawler workers (daemon threads) of each lane in 'config.COMMENT_CRAWL_LANES'
+    -- the count of active crawler workers of a lane is its 'worker_count'
+    -- if WORKER_AUTOSCALE_ENABLED, the lane's share of WORKER_AUTOSCALE_MAX_CONCURRENCY workers are started,
+        so the worker autoscaler can activate more workers than 'worker_count' (see 'worker_autoscaler.py')
+    -- the comment page rate limit of a lane is its 'rate_share' of COMMENT_CRAWL_PAGES_PER_SECOND
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    for lane, lane_config in config.COMMENT_CRAWL_LANES.items():
+        lane_state = _comment_crawl_lanes[lane]
+        pages_per_second = config.COMMENT_CRAWL_PAGES_PER_SECOND * lane_config['rate_share']
+        lane_state['rate_limiter'] = create_rate_limiter(pages_per_second)
+
+        worker_count = lane_config['worker_count']
+        if config.WORKER_AUTOSCALE_ENABLED:
+            worker_count = max(worker_count, get_lane_worker_count(lane, config.WORKER_AUTOSCALE_MAX_CONCURRENCY))
+
+        for _ in range(worker_count):
+            worker_index = len(lane_state['workers'])
+            worker = threading.Thread(target=run_comment_crawl_worker, args=(lane, worker_index), name=f'comment_crawl_{lane}_worker_{worker_index}', daemon=True)
+            worker.start()
+            lane_state['workers'].append(worker)
+        set_active_worker_count(lane, lane_config['worker_count'])
+
+        msg = f'Start {worker_count} comment crawl workers ({lane_state["active_worker_count"]} active) in the \'{lane}\' lane, limited to {pages_per_second:.2f} pages per second (0 means no limit).'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+
+def get_comment_crawl_queue_status():
+    '''Get the status of the comment crawl queue and crawler workers of each lane
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    dict
+        A dict with lane name as key, each value is a dict with keys:
+        -- worker_count: the count of crawler workers
+        -- active_worker_count: the count of crawler workers allowed to run comment crawl jobs
+        -- queued_count: the count of movies waiting in the queue
+        -- running_count: the count of movies being crawled
+        -- running_movie_ids: the list of movies being crawled
+    '''
+
+    with _pending_movie_ids_lock:
+        running_movie_lanes = {movie_id: _pending_movie_lanes.get(movie_id) for movie_id in _running_movie_ids}
+
+    status = {}
+    for lane, lane_state in _comment_crawl_lanes.items():
+        running_movie_ids = sorted(movie_id for movie_id, running_lane in running_movie_lanes.items() if running_lane == lane)
+        status[lane] = {
+            'worker_count': len(lane_state['workers']),
+            'active_worker_count': lane_state['active_worker_count'],
+            'queued_count': lane_state['queue'].qsize(),
+            'running_count': len(running_movie_ids),
+            'running_movie_ids': running_movie_ids
+        }
+
+    return status
+
+
+def get_comment_crawl_queue_metrics():
+    '''Get the gauges of the queued and running comment crawl jobs of each lane, registered as the metrics gauge callbacks'''
+
+    return [
+        ({'lane': lane, 'state': state}, lane_status[f'{state}_count'])
+        for lane, lane_status in get_comment_crawl_queue_status().items()
+        for state in ('queued', 'running')
+    ]
+
+
+metrics.register_gauge_callback('comment_crawl_jobs', get_comment_crawl_queue_metrics)
@@ -3,22 +3,35 @@
 Summary
 -------
 This module defines functions to crawl and parse short review comments (短評) of a movie/TV-series.
+
+A comment page is crawled in stages: the webbrowser fetches the webpage and takes the HTML of the comment list ('fetch_comment'),
+then the comments are parsed from the HTML ('parse_html', without the webbrowser) and saved,
+either in the calling thread ('crawl_comment') or by the comment crawl pipeline (see 'comment_crawl_pipeline.py').
+The comments can also be parsed from the live webpage ('parse', in the webbrowser).
+
+The crawled comments are saved by the raw output mode COMMENT_CRAWLED_OUTPUT_MODE:
+one json file per page ('save_data_as_json'), or one JSONL segment file per comment crawl job ('CommentSegmentWriter').
 '''
 
 import os
 import sys
 import json
+import threading
 from datetime import datetime
+from urllib.parse import urljoin
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as ExpectedConditions
-from selenium.webdriver.support.wait import WebDriverWait
 #from selenium.webdriver.chrome.service import Service as ChromeService
 #from webdriver_manager.chrome import ChromeDriverManager
 
 import config
 import util
+import page_load_profile
+import browser_supervisor
+import metrics
+import freshness_tracker
+import html_tree
+import http_cache
 
 
 def parse(movie_id, comment_elems):
@@ -88,6 +101,61 @@ def parse(movie_id, comment_elems):
     return comments
 
 
+def parse_html(movie_id, comment_list_html, page_url):
+    '''Parse comment data from the HTML of the (expanded) comment list <ul> element, or of the whole rendered comment page
+    (e.g., served from the HTTP cache), without the webbrowser.
+    The comment data are the same as parsed by 'parse' from the live webpage.
+
+    Parameters
+    ----------
+    movie_id: str
+        The id of the movie/TV-series of the comments
+    comment_list_html: str
+        The HTML of the comment list <ul> element, or of the whole comment page
+    page_url: str
+        The URL of the comment page, to resolve the relative URLs of the users' pages
+
+    Returns
+    -------
+    list
+        A list of dicts containing comment data, see 'parse'
+    '''
+
+    comment_list_elem = html_tree.build_tree(comment_list_html)
+    # the comment list of a whole comment page: <div id="comment-list"> ... <ul class="list comment-list"> ... </ul> </div>
+    comment_block_elems = html_tree.find_elements(comment_list_elem, tag='div', attrs={'id': 'comment-list'})
+    if comment_block_elems:
+        comment_list_elem = html_tree.find_element(comment_block_elems[0], tag='ul')
+
+    comments = []
+    for comment_elem in html_tree.find_elements(comment_list_elem, tag='li'):
+        desc_elem = html_tree.find_element(comment_elem, class_name='desc')
+        user_url = urljoin(page_url, html_tree.find_element(desc_elem, tag='a')['attrs']['href'].strip())
+        user_name = html_tree.get_element_text(html_tree.find_element(desc_elem, class_name='user-name'))
+        rating_stars = int(html_tree.find_element(desc_elem, class_name='rating-stars')['attrs']['data-rating'].strip())
+        comment_timestamp = html_tree.get_element_text(html_tree.find_element(desc_elem, class_name='date'))
+
+        # skip the '... 展开' of a long comment, if it is not expanded
+        comment_content_elem = html_tree.find_element(comment_elem, class_name='comment-content')
+        comment_content = html_tree.get_element_text(html_tree.find_element(comment_content_elem, tag='p'), skip_class_names=('LinesEllipsis-ellipsis', 'LinesEllipsis-readmore'))
+
+        btn_info_elem = html_tree.find_element(comment_elem, class_name='btn-info')
+        comment_like_ct = int(html_tree.get_element_text(html_tree.find_element(btn_info_elem, class_name='text')))
+
+        comment = {
+            'movie_id': movie_id,
+            'user_url': user_url,
+            'user_name': user_name,
+            'rating_stars': rating_stars,
+            'comment_timestamp': comment_timestamp,
+            'comment_content': comment_content,
+            'comment_like_ct': comment_like_ct
+        }
+        comments.append(comment)
+
+    return comments
+
+
 def save_data_as_json(movie_id, comments):
     '''Save comment data as a json file
 
@@ -104,6 +172,7 @@ def save_data_as_json(movie_id, comments):
         -- comment_timestamp
         -- comment_content
         -- comment_like_ct
+        -- crawl_timestamp (the crawl time of the comment page, see 'freshness_tracker.py')
     
     Returns
     -------
@@ -117,14 +186,118 @@ def save_data_as_json(movie_id, comments):
 
     output_file = config.COMMENT_CRAWLED_FILE.format(movie_id=movie_id, date_str=date_str, timestamp_str=timestamp_str)
 
-    with open(output_file, mode='w', encoding='utf-8') as file:
+    with metrics.timer('json_write', 'comment_crawler'), open(output_file, mode='w', encoding='utf-8') as file:
         json.dump(comments, file, indent=4, ensure_ascii=False)
     
     return output_file
 
 
-def crawl_comment(movie_id, comment_start_index, crawl_total_comment_count):
-    '''Crawl data of a movie/TV-series comment webpage
+class CommentSegmentWriter:
+    '''The writer to append all comment pages crawled by a comment crawl job (or a slice of it) into one JSONL segment file,
+    in the 'segment' raw output mode (see 'config.COMMENT_CRAWLED_OUTPUT_MODE').
+
+    The segment file (COMMENT_CRAWLED_SEGMENT_FILE) is created at the first page, each page is written as a page marker line
+    ({COMMENT_CRAWLED_SEGMENT_PAGE_MARKER: {page_index, url, comment_count}}) followed by one line per comment.
+    The file keeps the '.part' suffix until 'close' (fsync and rename), so readers never take a segment still being written,
+    while the complete lines of a segment left by a crash are still readable (see 'data_preprocessor.read_comment_crawled_file').
+    '''
+
+    def __init__(self, movie_id):
+        self.movie_id = movie_id
+        self.segment_file = None # the full path of the segment file, None before the first page
+        self.file = None
+        self.page_count = 0
+        self.comment_count = 0
+        # pages can be written by several threads, e.g., the persist workers of the comment crawl pipeline
+        self.lock = threading.Lock()
+
+    def write_page(self, comments, page_url):
+        '''Append a comment page to the segment file
+
+        Parameters
+        ----------
+        comments: list
+            The list of comment dicts of the page, see 'save_data_as_json'
+        page_url: str
+            The URL of the comment page
+
+        Returns
+        -------
+        str
+            The full path of the segment file
+        '''
+
+        with self.lock:
+            if self.file is None:
+                now = datetime.now(config.TIME_ZONE)
+                self.segment_file = config.COMMENT_CRAWLED_SEGMENT_FILE.format(
+                    movie_id=self.movie_id, date_str=now.strftime("%Y-%m-%d"), timestamp_str=now.strftime("%H.%M.%S.%f")
+                )
+                self.file = open(self.segment_file + '.part', mode='w', encoding='utf-8')
+
+            page_marker = {'page_index': self.page_count, 'url': page_url, 'comment_count': len(comments)}
+            lines = [json.dumps({config.COMMENT_CRAWLED_SEGMENT_PAGE_MARKER: page_marker}, ensure_ascii=False)]
+            lines.extend(json.dumps(comment, ensure_ascii=False) for comment in comments)
+            with metrics.timer('json_write', 'comment_crawler'):
+                self.file.write('\n'.join(lines) + '\n')
+                self.file.flush()
+
+            self.page_count += 1
+            self.comment_count += len(comments)
+            return self.segment_file
+
+    def close(self):
+        '''Flush the segment file to disk (fsync) and rename it without the '.part' suffix, at the end of the comment crawl job
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        str
+            The full path of the segment file, None if no page is written
+        '''
+
+        with self.lock:
+            if self.file is None:
+                return None
+
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+            os.replace(self.segment_file + '.part', self.segment_file)
+
+        msg = f'Save {self.comment_count} comments of {self.page_count} pages for movie with id \'{self.movie_id}\' in the segment file \'{self.segment_file}\'.'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+        return self.segment_file
+
+
+def create_comment_segment_writer(movie_id):
+    '''Create the segment writer of a comment crawl job of the movie with id 'movie_id', in the 'segment' raw output mode
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+
+    Returns
+    -------
+    CommentSegmentWriter
+        The segment writer, None in the 'page' raw output mode
+    '''
+
+    if config.COMMENT_CRAWLED_OUTPUT_MODE != 'segment':
+        return None
+    return CommentSegmentWriter(movie_id)
+
+
+def crawl_comment(movie_id, comment_start_index, crawl_total_comment_count, save_data=True, segment_writer=None):
+    '''Crawl data of a movie/TV-series comment webpage, i.e., fetch the webpage ('fetch_comment'),
+    then parse the comments ('parse_html') and save them, in the calling thread
 
     Parameters
     ----------
@@ -133,84 +306,171 @@ def crawl_comment(movie_id, comment_start_index, crawl_total_comment_count):
     comment_start_index: int
         The start index of movie/TV-series comment to be crawled
     crawl_total_comment_count: bool
-        ???
+        The flag indicating whether to crawl the total comment count of the movie
+    save_data: bool, optional
+        The flag indicating whether to save the crawled comments as a json file (default is True)
+        -- False: the caller saves the crawled comments in 'results['comments']', e.g., after removing duplicates
+    segment_writer: CommentSegmentWriter, optional
+        The segment writer of the comment crawl job to append the crawled comments to, in the 'segment' raw output mode
+        (default is None, i.e., save the crawled comments as a json file)
     
     Returns
     -------
     dict
-        A dict with two keys:
-        -- latest_comment_timestamp (the latest timestamp of comments crawled by this job)
-        -- comment_count (the comment count crawled by this job)
-        -- initial values: results = {'latest_comment_timestamp': None, 'comment_count': 0}
+        A dict with keys:
+        -- total_comment_count (the total comment count of the movie, only crawled if 'crawl_total_comment_count' is True)
+        -- current_page_comment_count (the comment count crawled from the webpage)
+        -- comments (the list of comment dicts crawled from the webpage)
+        -- initial values: results = {'total_comment_count': 0, 'current_page_comment_count': 0, 'comments': []}
+    '''
+
+    # Fetch the webpage (from the HTTP cache, or by the webbrowser), a failed fetch is logged by 'fetch_comment'
+    page = fetch_comment(movie_id, comment_start_index, crawl_total_comment_count)
+
+    # Initialize the return dict
+    results = {
+        'total_comment_count': page['total_comment_count'],
+        'current_page_comment_count': 0,
+        'comments': []
+    }
+    if not page['fetched']:
+        return results
+
+    url = page['url']
+    source = ' (cached)' if page['cached'] else ''
+    comments = [] # Initialize the list of dicts containing comment data
+    try:
+        # Parse and save comment data (if any)
+        if page['comment_list_html'] is not None:
+            with metrics.timer('parse', 'comment_crawler'):
+                comments = parse_html(movie_id, page['comment_list_html'], url)
+            for comment in comments:
+                comment['crawl_timestamp'] = page['crawl_timestamp']
+            if save_data and segment_writer is not None:
+                json_file = segment_writer.write_page(comments, url)
+            elif save_data:
+                json_file = save_data_as_json(movie_id, comments)
+
+    except Exception as e:
+        # Log the exception and error msg
+        msg = f'Crawl comments from \'{url}\'{source} failed. The comment crawl job for movie with id \'{movie_id}\' was CANCELLED! -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return results
+
+    results['current_page_comment_count'] = len(comments)
+    results['comments'] = comments
+
+    # Log the sucessful crawl information
+    if len(comments) > 0 and save_data: # There are comments on the requested webpage
+        msg = f'Crawl {len(comments)} comments from \'{url}\'{source} successfully. Data saved in \'{json_file}\' file.'
+    elif len(comments) > 0: # There are comments on the requested webpage, saved by the caller
+        msg = f'Crawl {len(comments)} comments from \'{url}\'{source} successfully.'
+    else: # No comments on the requested webpage
+        msg = f'Crawl {len(comments)} comments from \'{url}\'{source} successfully. There is no more comment to crawl. The comment crawl job for movie with id \'{movie_id}\' stopped.'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+    return results
+
+
+def fetch_comment(movie_id, comment_start_index, crawl_total_comment_count):
+    '''Fetch a movie/TV-series comment webpage, i.e., the fetch stage of 'crawl_comment' and of the comment crawl pipeline (see 'comment_crawl_pipeline.py').
+    The webbrowser only loads the page, expands all long comments and takes the HTML of the comment list,
+    the comments are parsed and saved (by 'parse_html' and 'save_data_as_json') after the webbrowser exits.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    comment_start_index: int
+        The start index of movie/TV-series comment to be crawled
+    crawl_total_comment_count: bool
+        The flag indicating whether to crawl the total comment count of the movie
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- total_comment_count (the total comment count of the movie, only crawled if 'crawl_total_comment_count' is True)
+        -- current_page_comment_count (the count of comment <li> elements on the webpage)
+        -- url (the URL of the webpage)
+        -- comment_list_html (the HTML of the comment list <ul> element, None if there is no comment or the fetch failed)
+        -- crawl_timestamp (the crawl time of the webpage)
+        -- fetched (True if the webpage is fetched successfully, otherwise False)
+        -- cached (True if the webpage is served from the HTTP cache, see 'fetch_comment_from_cache')
     '''
 
     # Initialize the return dict
     results = {
         'total_comment_count': 0,
-        'current_page_comment_count': 0
+        'current_page_comment_count': 0,
+        'url': config.MOVIE_COMMENT_URL.format(movie_id=movie_id, comment_start_index=comment_start_index),
+        'comment_list_html': None,
+        'crawl_timestamp': None,
+        'fetched': False,
+        'cached': False
     }
-    
+    url = results['url']
+
+    # Serve the webpage from the HTTP cache (within the TTL, or in the 'replay' cache mode) without the webbrowser
+    cached_results = fetch_comment_from_cache(movie_id, comment_start_index, crawl_total_comment_count)
+    if cached_results is not None:
+        return cached_results
+
+    chrome_options = page_load_profile.create_chrome_options('comment', config.CHROME_ANDROID_USER_AGENT)
+    try:
+        chrome = browser_supervisor.launch_chrome(chrome_options, f'comment crawl job for movie with id \'{movie_id}\' (comment start index \'{comment_start_index}\')')
+    except Exception as e:
+        msg = f'Crawl comments from \'{url}\' failed. The comment crawl job for movie with id \'{movie_id}\' was CANCELLED! -- Launch webbrowser failed -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return results
 
-    # Set up Chrome options
-    chrome_options = webdriver.ChromeOptions()
-    # headless mode: no webbrowser GUI
-    chrome_options.add_argument('--headless')
-    # log-level=3: less Selenium log information (to be displayed in the terminal/console)
-    chrome_options.add_argument('--log-level=3')
-    # mobile browser user-agent: to access m.douban.com
-    chrome_options.add_argument(f'--user-agent={config.CHROME_ANDROID_USER_AGENT}')
-
-    # Get URL of the comment page to be crawled
-    url = config.MOVIE_COMMENT_URL.format(movie_id=movie_id, comment_start_index = comment_start_index)
-    #print(url)
-
-    # Start to crawl comments, the crawl procedure is as follows:
-    # (1) Open the comment webpage to be crawled
-    # (2) Wait until all comments are dynamically loaded by JavaScript
-    # (3) Expand all long comments, i.e., simulate clicking the '展开' on the webpage 
-    # (4) Crawl and parse all comment data
-    # (5) Exit the webbrowser
-    # (6) Log the sucessful crawl information or any raised exception
-
-    # Open a Chrome webbrowser instance
-    #chrome = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=chrome_options)
-    chrome = webdriver.Chrome(options=chrome_options)
-    
     try:
         # Open the webpage to crawl comments
-        chrome.get(url)
-        # Wait for a maximum of CHROME_WAIT_SECONDS_COMMENT seconds to load the comment block
+        # Wait for a maximum of CHROME_WAIT_SECONDS_COMMENT seconds (or the 'wait_seconds' of the page-load profile) to load the comment block
         # Raise a TimeoutException, if no element is found in that time (i.e., load comments FAIL)
         # The comment block is <div id="comment-list"> ... <ul class="list comment-list"> <li>...</li> ... </ul> </div>
         #     Refer to file './webpage_sample/comments-page-sample-SIMPLIFIED.html'
         # Note: For successfully loaded comment block with ZERO comment (ex: when comment_start_index is large)
         #       the <ul> exist, but NO <li> inside the <ul>.
         #       Refer to file './webpage_sample/comments-page-EMPTY-sample-SIMPLIFIED.html'
-        chrome_wait = WebDriverWait(chrome, config.CHROME_WAIT_SECONDS_COMMENT)
-        comment_ul_elem = chrome_wait.until(ExpectedConditions.presence_of_element_located((By.CSS_SELECTOR, '#comment-list ul')))
+        comment_ul_elem = page_load_profile.load_page(chrome, 'comment', url, '#comment-list ul', config.CHROME_WAIT_SECONDS_COMMENT)
+        crawl_timestamp = freshness_tracker.get_current_timestamp()
 
         # crawl the total count of comments
         if crawl_total_comment_count:
             total_comment_count_elem = chrome.find_element(By.CSS_SELECTOR, value='h1[class="title"]')
-            total_comment_count = int(total_comment_count_elem.text.replace('(', '').replace(')', '').split()[1])
-            results['total_comment_count'] = total_comment_count
+            results['total_comment_count'] = int(total_comment_count_elem.text.replace('(', '').replace(')', '').split()[1])
 
         # Expand all long comments, i.e., simulate clicking the '展开' on the webpage
         expand_link_elems = comment_ul_elem.find_elements(By.CLASS_NAME, value='LinesEllipsis-readmore')
         for expand_link in expand_link_elems:
             expand_link.click()
-        
-        # Find all comment <li> elements and parse/store comment data (if any)
-        comment_li_elems = comment_ul_elem.find_elements(By.TAG_NAME, value='li')
-        comments = [] # Initialize the list of dicts containing comment data
-        
-        if len(comment_li_elems) > 0:
-            comments = parse(movie_id, comment_li_elems)
-            json_file = save_data_as_json(movie_id, comments)
-            results['current_page_comment_count'] = len(comments)   
+
+        # Take the HTML of the comment list (if any comment), to be parsed without the webbrowser
+        comment_count = len(comment_ul_elem.find_elements(By.TAG_NAME, value='li'))
+        if comment_count > 0:
+            results['comment_list_html'] = comment_ul_elem.get_attribute('outerHTML')
+            results['crawl_timestamp'] = crawl_timestamp
+        results['current_page_comment_count'] = comment_count
+        results['fetched'] = True
+
+        # record the rendered (expanded) webpage in the HTTP cache after the comment list is taken
+        http_cache.store_browser_page(url, 'comment', lambda: chrome.page_source)
 
     except Exception as e:
-        # Log the exception and error msg
         msg = f'Crawl comments from \'{url}\' failed. The comment crawl job for movie with id \'{movie_id}\' was CANCELLED! -- Original Exception -- {e}'
         current_frame = sys._getframe()
         logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
@@ -218,21 +478,87 @@ def crawl_comment(movie_id, comment_start_index, crawl_total_comment_count):
         util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
         util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
         util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
-        #print(f'ERROR: --Comment Crawler-- Crawl comments from \'{url}\' failed. See log for details.\n')
-    else:
-        # Log the sucessful crawl information
-        if len(comments) > 0: # There are comments on the requested webpage
-            msg = f'Crawl {len(comments)} comments from \'{url}\' successfully. Data saved in \'{json_file}\' file.'
-        else: # No comments on the requested webpage
-            msg = f'Crawl {len(comments)} comments from \'{url}\' successfully. There is no more comment to crawl. The comment crawl job for movie with id \'{movie_id}\' stopped.'
+    finally:
+        browser_supervisor.quit_chrome(chrome) # Exit the webbrowser
+
+    return results
+
+
+def fetch_comment_from_cache(movie_id, comment_start_index, crawl_total_comment_count):
+    '''Fetch a movie/TV-series comment webpage from the HTTP cache, i.e., the rendered webpage recorded by an earlier crawl
+    (see 'http_cache.py'), if it is within the TTL of comment pages or in the 'replay' cache mode
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl comments
+    comment_start_index: int
+        The start index of movie/TV-series comment to be crawled
+    crawl_total_comment_count: bool
+        The flag indicating whether to crawl the total comment count of the movie
+
+    Returns
+    -------
+    dict
+        The results of 'fetch_comment', with the whole cached webpage as 'comment_list_html' (see 'parse_html')
+        and its fetch time as 'crawl_timestamp'
+        None if the webpage should be fetched by the webbrowser
+    '''
+
+    if config.HTTP_CACHE_MODE == 'off':
+        return None
+
+    url = config.MOVIE_COMMENT_URL.format(movie_id=movie_id, comment_start_index=comment_start_index)
+    results = {
+        'total_comment_count': 0,
+        'current_page_comment_count': 0,
+        'url': url,
+        'comment_list_html': None,
+        'crawl_timestamp': None,
+        'fetched': False,
+        'cached': True
+    }
+
+    cached_response = http_cache.get_fresh_response(url, 'comment')
+    if cached_response is None:
+        if config.HTTP_CACHE_MODE != 'replay':
+            return None
+        metrics.inc_counter('http_cache_requests_total', labels={'page_type': 'comment', 'result': 'replay_miss'})
+        msg = f'Crawl comments from \'{url}\' failed. The comment crawl job for movie with id \'{movie_id}\' was CANCELLED! -- No cached webpage to replay.'
         current_frame = sys._getframe()
         logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
-        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
-        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
-        #print(f'INFO: --Comment Crawler-- Crawl {len(comments)} comments from \'{url}\' successfully. See log for details.\n')
-    finally:
-        chrome.quit() # Exit the webbrowser
-    
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return results
+    metrics.inc_counter('http_cache_requests_total', labels={'page_type': 'comment', 'result': 'replay' if config.HTTP_CACHE_MODE == 'replay' else 'hit'})
+
+    try:
+        # a cached captcha or error webpage has no comment block or title, i.e., 'html_tree.find_element' raises a ValueError
+        page_elem = html_tree.build_tree(cached_response['body'])
+        comment_block_elems = html_tree.find_elements(page_elem, tag='div', attrs={'id': 'comment-list'})
+        comment_count = len(html_tree.find_elements(html_tree.find_element(comment_block_elems[0], tag='ul'), tag='li')) if comment_block_elems else 0
+
+        # the total count of comments, e.g., <h1 class="title">全部短评 (109258)</h1>
+        if crawl_total_comment_count:
+            total_comment_count_elem = html_tree.find_element(page_elem, tag='h1', class_name='title')
+            results['total_comment_count'] = int(html_tree.get_element_text(total_comment_count_elem).replace('(', '').replace(')', '').split()[1])
+
+        if comment_count > 0:
+            results['comment_list_html'] = cached_response['body']
+            results['crawl_timestamp'] = cached_response['fetched_at'].astimezone(config.TIME_ZONE).isoformat(timespec='seconds')
+        results['current_page_comment_count'] = comment_count
+        results['fetched'] = True
+
+    except Exception as e:
+        msg = f'Crawl comments from \'{url}\' failed. The comment crawl job for movie with id \'{movie_id}\' was CANCELLED! -- Parse cached webpage failed -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.COMMENT_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
     return results
 
 
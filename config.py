@@ -20,6 +20,8 @@ from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
 # --- General Constants ---
 # The time zone used in the program
 TIME_ZONE = pytz.utc
+# The time zone of the timestamps on Douban webpages, e.g., the 'comment_timestamp' of comments
+DOUBAN_TIME_ZONE = pytz.timezone('Asia/Shanghai')
 
 # The log level
 LOG_LEVEL_DEBUG = 1
@@ -90,6 +92,11 @@ COMMENT_MERGED_DIRECTORY = os.path.join(DATA_DIRECTORY, 'comment_data_merged')
 
 # The file to store crawled comment data
 COMMENT_CRAWLED_FILE = os.path.join(COMMENT_CRAWLED_DIRECTORY, 'comment_{movie_id}_{date_str}_{timestamp_str}.json')
+# The file to store crawled comment data of a comment crawl job (or a slice of it), in the 'segment' raw output mode
+# (one JSON line per comment, each page preceded by a page marker line, see 'comment_crawler.CommentSegmentWriter')
+COMMENT_CRAWLED_SEGMENT_FILE = os.path.join(COMMENT_CRAWLED_DIRECTORY, 'comment_{movie_id}_{date_str}_{timestamp_str}.jsonl')
+# The key of the page marker lines in a segment file
+COMMENT_CRAWLED_SEGMENT_PAGE_MARKER = '_page'
 # The file to store daily(-crawled) comment data
 COMMENT_DAILY_FILE = os.path.join(COMMENT_DAILY_DIRECTORY, 'comment_{movie_id}_{date_str}.json')
 # The file to store merged comment data
@@ -97,6 +104,8 @@ COMMENT_MERGED_FILE = os.path.join(COMMENT_MERGED_DIRECTORY, 'comment_{movie_id}
 
 # The directory to store crawled movie info data
 MOVIE_INFO_DIRECTORY = os.path.join(DATA_DIRECTORY, 'movie_info_data')
+# The directory to store the daily rating history of a movie, as one fixed-width binary file per column (see 'rating_store.py')
+MOVIE_RATING_STORE_DIRECTORY = os.path.join(MOVIE_INFO_DIRECTORY, '{movie_id}_movie_rating')
 
 # The directory to store movie list files
 MOVIE_LIST_DIRECTORY = os.path.join(CURRENT_WORKING_DIRECTORY, 'movie_list')
@@ -111,6 +120,24 @@ SCHEDULING_DIRECTORY = os.path.join(CURRENT_WORKING_DIRECTORY, 'scheduling')
 COMMENT_CRAWL_JOBS_CRON_SCHEDULE_FILE = None
 # The daily CSV file to store scheduled jobs information
 SCHEDULED_JOBS_FILE = None
+# The daily CSV file to store the comment crawl budget allocation, see 'comment_crawl_budget_optimizer.py'
+COMMENT_CRAWL_BUDGET_ALLOCATION_FILE = None
+# The CSV file to store the comment velocity (comment increment per day) of movies
+COMMENT_VELOCITY_FILE = os.path.join(SCHEDULING_DIRECTORY, 'comment_velocity.csv')
+
+# The daily CSV file to store the comment freshness report (lag between posting and crawling/merging comments), see 'freshness_tracker.py'
+COMMENT_FRESHNESS_REPORT_FILE = None
+# The daily CSV file to store the run summary (p50/p95 duration, overrun rate, ...) of each job, see 'job_run_tracker.py'
+JOB_RUN_SUMMARY_FILE = None
+
+# The daily CSV file to store the transferred bytes and latency of each page fetch, see 'page_load_profile.py'
+PAGE_LOAD_STATS_FILE = None
+# The json file to store the periodic snapshot of the metrics, see 'metrics.py'
+METRICS_SNAPSHOT_FILE = os.path.join(LOG_DIRECTORY, 'metrics_snapshot.json')
+# The directory to store the per-job profile artifacts, see 'job_profiler.py'
+JOB_PROFILE_DIRECTORY = os.path.join(LOG_DIRECTORY, 'profile')
+# The json file to switch job profiling at runtime, e.g., {"job_ids": ["comment_crawl_35633650"], "sample_rate": 0.01}
+JOB_PROFILE_CONTROL_FILE = os.path.join(LOG_DIRECTORY, 'job_profile_control.json')
 
 
 
@@ -122,23 +149,54 @@ CHROME_ANDROID_USER_AGENT = 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.
 CHROME_DESKTOP_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36'
 
 
-# The base URL of m.douban.com
-M_DOUBAN_BASE_URL = 'https://m.douban.com'
+# The base URL of a local Douban stand-in server to crawl instead of Douban, e.g., 'http://127.0.0.1:8765'
+# (see 'test_code/douban_stand_in_server.py', for end-to-end throughput benchmarks without hitting douban.com)
+# None: crawl Douban
+DOUBAN_STAND_IN_BASE_URL = None
+
 # The base URL of douban.com
 DOUBAN_BASE_URL = 'https://www.douban.com'
-# The base URL of Douban Movie
-DOUBAN_MOVIE_BASE_URL = 'https://movie.douban.com'
 
-# The URL pattern of a movie/TV-series (info) page to be crawled
+# The URL path pattern of a movie/TV-series (info) page to be crawled, on DOUBAN_MOVIE_BASE_URL
 # movie_id: the id of the movie/TV-series
 # https://movie.douban.com/subject/<movie_id>
-MOVIE_INFO_URL = DOUBAN_MOVIE_BASE_URL + '/subject/{movie_id}'
+MOVIE_INFO_URL_PATH = '/subject/{movie_id}'
 
-# The URL pattern of a movie/TV-series comment page to be crawled
+# The URL path pattern of a movie/TV-series comment page to be crawled, on M_DOUBAN_BASE_URL
 # movie_id: the id of the movie/TV-series
 # comment_start_index: the start index of movie/TV-series comment to be crawled
 # https://m.douban.com/movie/subject/<movie_id>/comments?sort=time&start=<comment_start_index>
-MOVIE_COMMENT_URL = M_DOUBAN_BASE_URL + '/movie/subject/{movie_id}/comments?sort=new_score&start={comment_start_index}'
+MOVIE_COMMENT_URL_PATH = '/movie/subject/{movie_id}/comments?sort=new_score&start={comment_start_index}'
+
+
+def set_douban_base_url(base_url):
+    '''Point both crawlers at the Douban stand-in server at 'base_url', or at Douban if 'base_url' is None,
+    i.e., set DOUBAN_STAND_IN_BASE_URL and rebuild the base URLs and the URL patterns of the crawled pages from it:
+    -- M_DOUBAN_BASE_URL: the base URL of m.douban.com
+    -- DOUBAN_MOVIE_BASE_URL: the base URL of Douban Movie
+    -- MOVIE_INFO_URL: the URL pattern of a movie/TV-series (info) page to be crawled (see MOVIE_INFO_URL_PATH)
+    -- MOVIE_COMMENT_URL: the URL pattern of a movie/TV-series comment page to be crawled (see MOVIE_COMMENT_URL_PATH)
+
+    Parameters
+    ----------
+    base_url: str
+        The base URL of the Douban stand-in server, e.g., 'http://127.0.0.1:8765', None for Douban
+
+    Returns
+    -------
+    None
+    '''
+
+    global DOUBAN_STAND_IN_BASE_URL, M_DOUBAN_BASE_URL, DOUBAN_MOVIE_BASE_URL, MOVIE_INFO_URL, MOVIE_COMMENT_URL
+
+    DOUBAN_STAND_IN_BASE_URL = base_url
+    M_DOUBAN_BASE_URL = base_url or 'https://m.douban.com'
+    DOUBAN_MOVIE_BASE_URL = base_url or 'https://movie.douban.com'
+    MOVIE_INFO_URL = DOUBAN_MOVIE_BASE_URL + MOVIE_INFO_URL_PATH
+    MOVIE_COMMENT_URL = M_DOUBAN_BASE_URL + MOVIE_COMMENT_URL_PATH
+
+
+set_douban_base_url(DOUBAN_STAND_IN_BASE_URL)
 
 # The increment step of movie/TV-series comments for each crawl process
 # The m.douban.com displays 20 comments each webpage, which cannot be customized by user
@@ -149,6 +207,106 @@ CHROME_WAIT_SECONDS_COMMENT = 30
 # The maximum seconds to wait for the webbrowser to load the movie page before crawling movie info
 CHROME_WAIT_SECONDS_MOVIE_INFO = 30
 
+# The fetch mode of movie pages by the movie info crawler (see 'movie_info_crawler.py')
+# -- 'browser': load and parse the movie page in the webbrowser
+# -- 'conditional': fetch the movie page by a conditional HTTP request (ETag/If-Modified-Since) and parse it without the webbrowser,
+#    falling back to the webbrowser if the fetch or the parse fails
+MOVIE_INFO_FETCH_MODE = 'conditional'
+# The maximum seconds to wait for the response of an HTTP request without the webbrowser (see 'http_fetcher.py')
+HTTP_FETCH_TIMEOUT_SECONDS = 30
+
+# The directory of the on-disk HTTP cache of fetched webpages (see 'http_cache.py')
+HTTP_CACHE_DIRECTORY = os.path.join(DATA_DIRECTORY, 'http_cache')
+# The mode of the HTTP cache
+# -- 'on': serve a webpage from the cache within the TTL of its page type, revalidate stale webpages and record every fetch
+#    (the webpages loaded by the webbrowser are recorded as rendered HTML)
+# -- 'replay': serve every webpage from the cache and never use the network or the webbrowser, e.g., to re-run changed parsers
+# -- 'off': no cache
+HTTP_CACHE_MODE = 'on'
+# The TTL in seconds of the cached webpages of each page type, 0 to always fetch the webpages
+# -- 'movie_info': the rating probe and the full movie info crawl of a movie within an hour share one fetch
+# -- 'comment': comment pages change with every new comment, always fetched
+HTTP_CACHE_TTL_SECONDS = {
+    'movie_info': 3600,
+    'comment': 0
+}
+# Whether to record the fetched webpages of each page type in the 'on' cache mode
+# -- 'movie_info': recorded, served within the TTL and revalidated
+# -- 'comment': not recorded by default, since comment pages are never served within the TTL 0 and are most of the fetches,
+#     set to True to record them for the 'replay' cache mode (e.g., to re-run changed parsers over historical pages)
+HTTP_CACHE_RECORD_PAGE_TYPES = {
+    'movie_info': True,
+    'comment': False
+}
+# The maximum total size in bytes of the HTTP cache, the least recently used entries are evicted when exceeded
+HTTP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# The ratio of HTTP_CACHE_MAX_BYTES to evict the HTTP cache down to, i.e., evict in batches rather than at every fetch
+HTTP_CACHE_EVICT_TO_RATIO = 0.9
+# The time (ISO format, in TIME_ZONE if no offset) to replay the cached webpages as of in the 'replay' cache mode,
+# e.g., '2024-03-01T00:00:00' (None: replay the latest cached webpages)
+HTTP_CACHE_REPLAY_AS_OF = None
+
+# Whether to load pages with the page-load profiles in PAGE_LOAD_PROFILES (see 'page_load_profile.py')
+# -- False: load full pages (the 'normal' page load strategy, no blocked requests) and wait for the default readiness elements
+PAGE_LOAD_PROFILE_ENABLED = False
+# Whether to record the transferred bytes and latency of each page fetch in PAGE_LOAD_STATS_FILE
+# Record with PAGE_LOAD_PROFILE_ENABLED both False and True to compare the page fetches before/after the page-load profiles
+PAGE_LOAD_STATS_ENABLED = False
+
+# The URL patterns of non-essential resource types blocked by the page-load profiles (via DevTools 'Network.setBlockedURLs')
+PAGE_LOAD_BLOCKED_RESOURCE_URL_PATTERNS = {
+    'image': ['*.jpg*', '*.jpeg*', '*.png*', '*.gif*', '*.webp*', '*.svg*', '*.ico*'],
+    'font': ['*.woff*', '*.ttf*', '*.otf*', '*.eot*'],
+    'stylesheet': ['*.css*'],
+    'media': ['*.mp4*', '*.webm*', '*.mp3*', '*.m3u8*']
+}
+# The third-party (ads/analytics/tracking) hosts blocked by the page-load profiles
+# Refer to the hosts in './webpage_sample/*-UNSIMPLIFIED.html'
+PAGE_LOAD_BLOCKED_HOSTS = [
+    'ad.doubanio.com', 'erebor.douban.com',
+    'cdn.taboola.com', 'popup.taboola.com', 'trace.mediago.io', 't.adx.opera.com', 'insight.adsrvr.org',
+    'metrics.getrockerbox.com', 'tracking.fecfj.com', 'stat.onemob.mobi', 'stats.onemob.mobi', 'web.nextword.me',
+    'www.googletagmanager.com', 'www.google-analytics.com', 'ssl.google-analytics.com', 'hm.baidu.com'
+]
+
+# The seconds after which a webbrowser is killed by the browser reaper, see 'browser_supervisor.py'
+# A crawl job opens one page per webbrowser, so a webbrowser alive for this long is hung or leaked
+BROWSER_DEADLINE_SECONDS = 300
+# The memory ceiling (total RSS) of all webbrowser processes in MB, 0 means no limit
+# New webbrowser launches wait (and are finally refused) while the webbrowsers use more memory
+BROWSER_MEMORY_CEILING_MB = 4096
+# The maximum seconds a new webbrowser launch waits for the memory to drop below BROWSER_MEMORY_CEILING_MB
+BROWSER_LAUNCH_WAIT_SECONDS = 60
+# The seconds to wait for terminated webbrowser processes to exit before killing them
+BROWSER_KILL_WAIT_SECONDS = 3
+
+# The page-load profile of each page type, page type as key
+# -- page_load_strategy: the webdriver page load strategy, 'eager' returns from 'get' when the DOM is ready (without subresources)
+# -- blocked_resource_types: the keys of PAGE_LOAD_BLOCKED_RESOURCE_URL_PATTERNS to block
+# -- block_third_party_hosts: whether to block PAGE_LOAD_BLOCKED_HOSTS
+# -- ready_css_selectors: the page is ready when ALL the elements are present, the element of the first selector is returned
+# -- wait_seconds: the maximum seconds to wait for the page to be ready
+# -- poll_seconds: the seconds between readiness checks
+# The comment page loads comments by JavaScript, so scripts of m.douban.com and doubanio.com are NOT blocked
+PAGE_LOAD_PROFILES = {
+    'comment': {
+        'page_load_strategy': 'eager',
+        'blocked_resource_types': ['image', 'font', 'stylesheet', 'media'],
+        'block_third_party_hosts': True,
+        'ready_css_selectors': ['#comment-list ul'],
+        'wait_seconds': 15,
+        'poll_seconds': 0.1
+    },
+    'movie_info': {
+        'page_load_strategy': 'eager',
+        'blocked_resource_types': ['image', 'font', 'stylesheet', 'media'],
+        'block_third_party_hosts': True,
+        'ready_css_selectors': ['#content', 'script[type="application/ld+json"]'],
+        'wait_seconds': 15,
+        'poll_seconds': 0.1
+    }
+}
+
 
 # --- APScheduler Configuration Constants ---
 '''
@@ -177,9 +335,133 @@ JOB_DEFAULTS = {
 
 
 # --- Job Configuration Constants ---
+# The raw output mode of crawled comment pages
+# -- 'page': one json file per comment page (COMMENT_CRAWLED_FILE)
+# -- 'segment': one JSONL segment file per comment crawl job (or slice) (COMMENT_CRAWLED_SEGMENT_FILE), fsync-ed at the end of the job
+# The data pre-processor reads both layouts, so the mode can be switched at any time
+COMMENT_CRAWLED_OUTPUT_MODE = 'segment'
+
+# Whether to crawl comment pages by the staged pipeline (fetch -> parse -> persist), see 'comment_crawl_pipeline.py'
+# -- True: the webbrowser only fetches the page, the comments are parsed and saved by the parse/persist workers after it exits
+# -- False: the webbrowser parses and saves the comments before it exits, see 'comment_crawler.crawl_comment'
+COMMENT_CRAWL_PIPELINE_ENABLED = False
+# The counts of parse workers and persist workers of the pipeline
+COMMENT_CRAWL_PIPELINE_PARSE_WORKER_COUNT = 2
+COMMENT_CRAWL_PIPELINE_PERSIST_WORKER_COUNT = 2
+# The maximum count of pages in the queue before each of the parse and persist stages, a fetcher waits when the queue is full
+COMMENT_CRAWL_PIPELINE_QUEUE_SIZE = 16
+
+# The mode to pre-process (merge) crawled comment data, see 'data_preprocess_worker.py'
+# -- 'daily': the daily data pre-process jobs merge the comment data crawled on the previous day
+# -- 'event': in addition, the data pre-process worker merges the newly crawled comment data of a movie when its comment crawl job finishes,
+#     and the daily data pre-process jobs run as the reconciliation sweep
+#     (each merge reads and rewrites the whole merged comment data json file of the movie, so it is not the default)
+DATA_PREPROCESS_MODE = 'daily'
+# The seconds since the last modification for a crawled comment data file to be merged by the data pre-process worker
+DATA_PREPROCESS_FILE_SETTLE_SECONDS = 2
+# The data pre-process worker merges each movie at most once in DATA_PREPROCESS_COALESCE_SECONDS seconds,
+# the completion events of the movie within the window are coalesced into one merge at the end of the window
+DATA_PREPROCESS_COALESCE_SECONDS = 600
+
+# The mode to run comment crawl jobs
+# -- 'cron': each comment crawl job runs as an APScheduler cron job in the 'default' executor (ThreadPoolExecutor)
+# -- 'queue': the APScheduler cron job of a movie only puts the due movie into a priority queue,
+#    fixed pools of crawler workers in COMMENT_CRAWL_LANES run the comment crawl jobs (see 'comment_crawl_queue.py')
+COMMENT_CRAWL_RUN_MODE = 'cron'
+
+# The lanes of the comment crawl queue in the 'queue' comment crawl run mode, lane name as key
+# -- 'backfill': the first-time (full-history) comment crawl jobs of newly added movies
+# -- 'refresh': the incremental comment crawl jobs of crawled movies
+# Each lane has its own queue and crawler workers, so a big backfill never delays the refresh of the rest of the movies
+# -- worker_count: the count of crawler workers of the lane,
+#    i.e., the maximum count of concurrently running comment crawl jobs (webbrowsers) of the lane
+# -- rate_share: the share of COMMENT_CRAWL_PAGES_PER_SECOND of the lane
+COMMENT_CRAWL_LANES = {
+    'backfill': {'worker_count': 2, 'rate_share': 0.4},
+    'refresh': {'worker_count': 6, 'rate_share': 0.6}
+}
+
+# The global rate limit of comment page fetches (pages per second), 0 means no limit
+# -- 'queue' comment crawl run mode: shared among COMMENT_CRAWL_LANES by their 'rate_share'
+# -- 'cron' comment crawl run mode: shared by all comment crawl jobs (including the page ranges of parallel backfills)
+COMMENT_CRAWL_PAGES_PER_SECOND = 2
+
+# The priority of due movies in the comment crawl queue, in the 'queue' comment crawl run mode
+# -- 'deadline': the earliest due movie first
+# -- 'staleness': the movie with the longest time since its latest comment crawl job first
+# -- 'velocity': the movie with the highest comment velocity (comment increment per day) first
+COMMENT_CRAWL_QUEUE_PRIORITY = 'deadline'
+
+# The seconds between two runs of the browser reaper job, which kills hung or leaked webbrowser processes
+BROWSER_REAP_INTERVAL_SECONDS = 60
+
+# Whether to adjust the crawl concurrency (active crawl workers and webbrowsers) from the host load, see 'worker_autoscaler.py'
+# NOTE: the threads of EXECUTORS are not resized; in the 'cron' comment crawl run mode, the concurrency bounds the webbrowsers only
+WORKER_AUTOSCALE_ENABLED = False
+# The bounds of the crawl concurrency
+WORKER_AUTOSCALE_MIN_CONCURRENCY = 2
+WORKER_AUTOSCALE_MAX_CONCURRENCY = 32
+# The seconds between two runs of the worker autoscaler job
+WORKER_AUTOSCALE_INTERVAL_SECONDS = 30
+# Decrease the concurrency if the host CPU usage (percent) is at least WORKER_AUTOSCALE_CPU_HIGH_PERCENT,
+# increase the concurrency only if it is below WORKER_AUTOSCALE_CPU_LOW_PERCENT
+WORKER_AUTOSCALE_CPU_HIGH_PERCENT = 85
+WORKER_AUTOSCALE_CPU_LOW_PERCENT = 60
+# Decrease the concurrency if the host memory usage (percent) is at least WORKER_AUTOSCALE_MEMORY_HIGH_PERCENT,
+# increase the concurrency only if it is below WORKER_AUTOSCALE_MEMORY_LOW_PERCENT
+WORKER_AUTOSCALE_MEMORY_HIGH_PERCENT = 85
+WORKER_AUTOSCALE_MEMORY_LOW_PERCENT = 70
+# Decrease the concurrency if the median page fetch latency (seconds) is above WORKER_AUTOSCALE_LATENCY_HIGH_SECONDS
+WORKER_AUTOSCALE_LATENCY_HIGH_SECONDS = 20
+# The factor to multiply the concurrency by when decreasing, and the step to add to the concurrency when increasing
+WORKER_AUTOSCALE_DECREASE_FACTOR = 0.75
+WORKER_AUTOSCALE_INCREASE_STEP = 1
+
+# Whether to expose the metrics through the Prometheus-format HTTP endpoint 'http://METRICS_HTTP_HOST:METRICS_HTTP_PORT/metrics'
+METRICS_HTTP_ENABLED = True
+METRICS_HTTP_HOST = '127.0.0.1'
+METRICS_HTTP_PORT = 9108
+# The prefix of the metric names in the Prometheus format
+METRICS_PREFIX = 'douban_crawler_'
+# The upper bounds (seconds) of the histogram buckets
+METRICS_HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+# The seconds between two runs of the metrics snapshot job, which writes METRICS_SNAPSHOT_FILE
+METRICS_SNAPSHOT_INTERVAL_SECONDS = 60
+
+# The ids of jobs to profile by cProfile and tracemalloc, e.g., {'comment_crawl_35633650', 'data_preprocess_job'},
+# and the probability to profile any other job run (0 means no sampling), see 'job_profiler.py'
+# They can be changed at runtime by JOB_PROFILE_CONTROL_FILE
+JOB_PROFILE_JOB_IDS = set()
+JOB_PROFILE_SAMPLE_RATE = 0.0
+# The seconds between two checks of JOB_PROFILE_CONTROL_FILE
+JOB_PROFILE_CONTROL_POLL_SECONDS = 10
+# The count of top functions (by cumulative time) and top allocations in the profile summary
+JOB_PROFILE_TOP_N = 30
+# The count of frames tracemalloc stores for each allocation
+JOB_PROFILE_TRACEMALLOC_FRAMES = 1
+
+# Exclude the comments posted more than COMMENT_FRESHNESS_MAX_AGE_DAYS days before they were crawled (e.g., backfilled history)
+# from the comment freshness (lag) distributions, see 'freshness_tracker.py'
+COMMENT_FRESHNESS_MAX_AGE_DAYS = 7
+
+# The count of the latest runs recorded for each job, see 'job_run_tracker.py'
+JOB_RUN_HISTORY_SIZE = 50
+# Whether to widen the comment crawl interval of the movie whose comment crawl job keeps overrunning,
+# i.e., its due runs are dropped ('max_instances'), missed or coalesced since the previous run is still running or late
+JOB_OVERRUN_WIDEN_ENABLED = True
+# Adjust the interval multiplier of a job after at least JOB_OVERRUN_MIN_RUNS runs since its latest adjustment:
+# multiply by JOB_OVERRUN_WIDEN_FACTOR if the overrun rate is at least JOB_OVERRUN_RATE_THRESHOLD,
+# divide by JOB_OVERRUN_WIDEN_FACTOR (at least 1) if no run overran
+JOB_OVERRUN_MIN_RUNS = 4
+JOB_OVERRUN_RATE_THRESHOLD = 0.5
+JOB_OVERRUN_WIDEN_FACTOR = 2
+
 # The id of comment crawl job for movie with id 'movie_id'
 COMMENT_CRAWL_JOB_ID = lambda movie_id: f'comment_crawl_{movie_id}'
 
+# The id of the one-off job to run the next slice of an unfinished comment crawl job for movie with id 'movie_id'
+COMMENT_CRAWL_SLICE_JOB_ID = lambda movie_id: f'comment_crawl_slice_{movie_id}'
+
 # The id of movie_info crawl job for movie with id 'movie_id'
 MOVIE_INFO_CRAWL_JOB_ID = lambda movie_id: f'movie_info_crawl_{movie_id}'
 
@@ -190,6 +472,16 @@ MOVIE_INFO_CRAWL_JOB_ID = lambda movie_id: f'movie_info_crawl_{movie_id}'
 # Prevent interference between comment crawl jobs and daily routine jobs
 COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE = 30
 
+# The mode to distribute comment crawl jobs in the 24-hour window
+# -- 'even': evenly distribute the start times of all comment crawl jobs, i.e., each job gets the same time slot
+# -- 'duration': each job gets a time slot proportional to its expected daily crawl load (crawl duration / crawl interval in days),
+#    so that the expected count of concurrently running comment crawl jobs stays flat across the day
+COMMENT_CRAWL_SCHEDULE_MODE = 'even'
+
+# The estimated seconds to crawl one comment page, excluding SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB
+# Used by the 'duration' schedule mode to estimate the crawl duration of a movie without a recorded crawl duration
+COMMENT_CRAWL_ESTIMATED_SECOND_PER_PAGE = 5
+
 # The comment increment to crawl each day
 # If the comment increment is less than COMMENT_INCREMENT_CRAWL_PER_DAY, then linearly increase comment crawl interval (in days)
 # The comment crawl interval fomula is ceiling(1 / comment_increment / COMMENT_INCREMENT_CRAWL_PER_DAY), i.e., ceiling(COMMENT_INCREMENT_CRAWL_PER_DAY / comment_increment)
@@ -202,10 +494,56 @@ MAX_COMMENT_CRAWL_INTERVAL = 10
 # The comment crawl interval is max(comment_crawl_interval, MIN_COMMENT_CRAWL_INTERVAL)
 MIN_COMMENT_CRAWL_INTERVAL = 1
 
+# The mode to calculate the comment crawl interval in days (i.e., the 'day' in the cron schedule)
+# -- 'increment': the comment crawl interval fomula based on COMMENT_INCREMENT_CRAWL_PER_DAY
+# -- 'budget': the comment crawl interval allocated by the crawl budget optimizer (see 'comment_crawl_budget_optimizer.py')
+#    to maximize the expected fresh comments captured per page fetched within COMMENT_CRAWL_DAILY_PAGE_BUDGET
+COMMENT_CRAWL_INTERVAL_MODE = 'increment'
+
+# The global daily budget of comment pages to fetch for all movies, used by the 'budget' comment crawl interval mode
+COMMENT_CRAWL_DAILY_PAGE_BUDGET = 20000
+
+# The smoothing factor of the EWMA (exponentially weighted moving average) of the comment velocity (comment increment per day)
+# The larger the factor, the more weight on the latest comment increment
+COMMENT_VELOCITY_EWMA_ALPHA = 0.3
+
 # The seconds to pause after each comment crawl procedure/subjob
 # To bypass DouBan (D)DoS detect
 SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB = 3
 
+# Whether to probe the comment count before crawling all comment pages of a movie
+# -- skip the comment crawl job if the movie's rating count (crawled today by the movie info crawler) does not change
+#    since the latest comment crawl job (only if COMMENT_PROBE_USE_RATING_COUNT is True)
+# -- stop after the first comment page if the total comment count on it does not change
+COMMENT_CRAWL_PROBE_ENABLED = False
+# Whether to use the rating count crawled by the movie info crawler to skip comment crawl jobs
+COMMENT_PROBE_USE_RATING_COUNT = True
+# Whether to only crawl the pages of the comment increment (plus COMMENT_PROBE_EXTRA_PAGES pages) if the comments increase
+# ONLY valid if the comments are sorted by time (i.e., 'sort=time' in MOVIE_COMMENT_URL), new comments are on the first pages
+COMMENT_PROBE_SHORTEN_CRAWL = False
+# The extra pages to crawl for a shortened comment crawl job, to cover comments deleted/shifted since the latest crawl
+COMMENT_PROBE_EXTRA_PAGES = 1
+
+# The maximum pages to crawl in one slice of a comment crawl job, 0 means no limit
+# An unfinished comment crawl job saves its position and re-enqueues itself after each slice,
+# so a movie with a huge count of comments cannot monopolize a worker
+COMMENT_CRAWL_SLICE_MAX_PAGES = 0
+# The maximum seconds to crawl in one slice of a comment crawl job, 0 means no limit
+COMMENT_CRAWL_SLICE_MAX_SECONDS = 0
+
+# The mode to crawl the whole comment history of a newly added movie (i.e., its 'last_crawl_total_comment_count' is 0)
+# -- 'sequential': crawl page by page, the same as other comment crawl jobs
+# -- 'parallel': split the comment start indexes into COMMENT_BACKFILL_RANGE_COUNT page ranges by the total comment count on the first page,
+#    and crawl the page ranges concurrently (see 'comment_crawl_dispatcher.backfill_comment')
+COMMENT_BACKFILL_MODE = 'sequential'
+# The maximum count of page ranges crawled concurrently in the 'parallel' backfill mode,
+# bounded by the active crawler workers of the lane and the free slots of the browser limit
+COMMENT_BACKFILL_RANGE_COUNT = 4
+# The extra pages to crawl after the end of each page range in the 'parallel' backfill mode
+# With 'sort=new_score' in MOVIE_COMMENT_URL, comments shift across pages while the page ranges are crawled,
+# the overlapped pages cover the comments shifted over the range boundaries (duplicates are removed)
+COMMENT_BACKFILL_OVERLAP_PAGES = 1
+
 
 
 # --- Global Variables ---
@@ -224,3 +562,37 @@ movie_list_df = None
 # Each row uses the movie_id of the corresponding comment crawl job as its index
 # The cron schedule information are auto-calculated so that all comment crawl jobs (of different movies) are evenly distributed in the 24-hour window
 comment_crawl_jobs_cron_schedule_df = None
+
+# The dict to store the duration (in seconds) of the latest comment crawl job of each movie, movie_id as key
+# Used by the 'duration' schedule mode (see COMMENT_CRAWL_SCHEDULE_MODE) to calculate the cron schedule of comment crawl jobs
+comment_crawl_job_durations = {}
+
+# The dict to store the position of unfinished (sliced) comment crawl jobs, movie_id as key
+# See 'comment_crawl_dispatcher.dispatch_crawl_comment' for the position dict
+comment_crawl_progress = {}
+
+# The dict to store the latest rating count of each movie crawled by the movie info crawler, movie_id as key
+# Each value is a dict {'date': the crawl date, 'rating_count': the rating count}
+movie_rating_counts = {}
+
+# The dict to store the rating count of each movie at its latest comment crawl job, movie_id as key
+comment_crawl_rating_counts = {}
+
+# The dict to store the content hash of the saved movie info of each movie, movie_id as key, see 'movie_info_crawler.save_movie_info'
+movie_info_hashes = {}
+
+# The dict to store the validators of the latest fetched movie page of each movie, movie_id as key
+# Each value is a dict {'etag': the ETag header, 'last_modified': the Last-Modified header}, see 'movie_info_crawler.crawl_movie_info_browserless'
+movie_page_validators = {}
+
+# The dict to store the latest probe decision of the comment crawl job of each movie, movie_id as key
+# See 'comment_crawl_dispatcher.record_comment_crawl_probe_decision'
+comment_crawl_probe_decisions = {}
+
+# The pandas.DataFrame to store the comment velocity (comment increment per day) of movies, movie_id as the index
+# Read from / saved to the COMMENT_VELOCITY_FILE, see 'comment_crawl_budget_optimizer.py'
+comment_velocity_df = None
+
+# The pandas.DataFrame to store the latest comment crawl budget allocation, movie_id as the index
+# Calculated daily in the 'budget' comment crawl interval mode, see 'comment_crawl_budget_optimizer.py'
+comment_crawl_budget_allocation_df = None
@@ -5,11 +5,14 @@ Summary
 This module defines functions to dispatch daily routine jobs.
 '''
 
+import numpy as np
 import pandas as pd
 
 import config
 import util
 import movie_list_manager
+import comment_crawl_budget_optimizer
+import job_run_tracker
 import scheduler
 
 
@@ -18,7 +21,9 @@ def calculate_comment_crawl_job_cron_schedule(movie_list_df, comment_crawl_jobs_
     in 'movie_list_df' and store the updated cron schedule in 'comment_crawl_jobs_cron_schedule_df'.
     -- the cron schedule of crawling comment includes 'day', 'hour', 'minute', 'second'
     -- this function only calculates 'hour', 'minute', 'second' in the cron schedule
-        so that all comment crawl jobs are evenly distributed in the 24-hour window
+        so that all comment crawl jobs are distributed in the 24-hour window, see 'config.COMMENT_CRAWL_SCHEDULE_MODE'
+        -- 'even': all comment crawl jobs are evenly distributed
+        -- 'duration': each comment crawl job gets a time slot proportional to its expected daily crawl load
     -- the 'day' in the cron schedule is updated by the 'comment_crawl_dispatcher.update_comment_crawl_job_cron_schedule'
         function based on crawled comment count increment
    
@@ -44,56 +49,172 @@ def calculate_comment_crawl_job_cron_schedule(movie_list_df, comment_crawl_jobs_
         comment_crawl_jobs_cron_schedule_df = pd.DataFrame(columns=['day', 'hour', 'minute', 'second'])
 
     job_count = len(movie_list_df.index)
-    seconds_per_day = 86400 # 24 * 60 * 60
+    if job_count == 0: # no comment crawl job to schedule
+        return comment_crawl_jobs_cron_schedule_df
+
+    if config.COMMENT_CRAWL_SCHEDULE_MODE == 'duration':
+        schedule_in_second = calculate_duration_aware_schedule(movie_list_df, comment_crawl_jobs_cron_schedule_df)
+    else:
+        seconds_per_day = 86400 # 24 * 60 * 60
+        # The time interval (in seconds) between two adjacent jobs
+        job_interval = seconds_per_day // job_count
+
+        # The schedule/time (in second) to run each job, relative to 00:00:00
+        # -- the i-th job (1st job, 2nd job, 3rd job, etc.) is scheduled at i * job_interval
+        # -- all jobs are calculated at once (vectorized), movie_id as the index
+        schedule_in_second = np.arange(job_count, dtype='int64') * job_interval
+
+    cron_schedule_df = convert_seconds_to_cron_schedule(schedule_in_second, movie_list_df.index)
+
+    return merge_comment_crawl_job_cron_schedule(cron_schedule_df, comment_crawl_jobs_cron_schedule_df)
+
+
+def estimate_comment_crawl_job_durations(movie_list_df):
+    '''Estimate the duration (in seconds) of the comment crawl job of each movie in 'movie_list_df'.
+    -- use the duration of the latest comment crawl job, if recorded in 'config.comment_crawl_job_durations'
+    -- otherwise, estimate the duration from the page count, i.e., 'last_crawl_total_comment_count' / MOVIE_COMMENT_INCR_STEP + 1 pages
+
+    Parameters
+    ----------
+    movie_list_df: pandas.DataFrame
+        The dataframe storing movie list data
+
+    Returns
+    -------
+    pandas.Series
+        The estimated duration (in seconds) of each comment crawl job, movie_id as the index
+    '''
+
+    page_count = movie_list_df['last_crawl_total_comment_count'] // config.MOVIE_COMMENT_INCR_STEP + 1
+    seconds_per_page = config.COMMENT_CRAWL_ESTIMATED_SECOND_PER_PAGE + config.SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB
+    estimated_durations = (page_count * seconds_per_page).astype('float64')
+
+    recorded_durations = pd.Series(config.comment_crawl_job_durations, dtype='float64')
+    recorded_durations = recorded_durations.reindex(movie_list_df.index)
+
+    return recorded_durations.fillna(estimated_durations)
+
+
+def calculate_duration_aware_schedule(movie_list_df, comment_crawl_jobs_cron_schedule_df):
+    '''Calculate the schedule/time (in second, relative to 00:00:00) to run the comment crawl job of each movie
+    so that the expected count of concurrently running comment crawl jobs stays flat across the day.
+    -- the expected daily crawl load of a job is its estimated crawl duration divided by its crawl interval in days (the 'day' in the cron schedule)
+    -- each job gets a time slot proportional to its expected daily crawl load, slots are placed back-to-back
+        in the [00:00:00: + GRACE_MINUTE,  24:00:00 - GRACE_MINUTE] time window
+    -- jobs with larger load are scheduled earlier, so that long crawls do not run into the daily routine jobs at 00:00:00
+
+    Parameters
+    ----------
+    movie_list_df: pandas.DataFrame
+        The dataframe storing movie list data
+    comment_crawl_jobs_cron_schedule_df: pandas.DataFrame
+        The dataframe storing the current cron schedule, to get the crawl interval in days of each job
+
+    Returns
+    -------
+    numpy.ndarray
+        The schedule/time (in second) to run each job, in the same order as 'movie_list_df'
+    '''
+
+    # crawl interval in days: 'day' is '*' (everyday) or '*/N' (every N days), new jobs run everyday
+    day = comment_crawl_jobs_cron_schedule_df['day'].reindex(movie_list_df.index).fillna('*').astype(str)
+    interval_in_days = day.str.extract(r'\*/(\d+)', expand=False).astype('float64').fillna(1)
+
+    # expected daily crawl load (in seconds) of each job, at least 1 second
+    durations = estimate_comment_crawl_job_durations(movie_list_df)
+    loads = np.maximum((durations / interval_in_days).to_numpy(), 1.0)
+
+    window_start = config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE * 60
+    window_end = 86400 - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE * 60
+
+    # place the time slots back-to-back, the job with the largest load first
+    order = np.argsort(-loads, kind='stable')
+    sorted_loads = loads[order]
+    load_before = np.cumsum(sorted_loads) - sorted_loads
+    sorted_schedule = window_start + load_before / sorted_loads.sum() * (window_end - window_start)
+
+    schedule_in_second = np.empty(len(loads), dtype='int64')
+    schedule_in_second[order] = sorted_schedule.astype('int64')
+
+    return schedule_in_second
+
+
+def convert_seconds_to_cron_schedule(schedule_in_second, index):
+    '''Convert job schedules (in seconds, relative to 00:00:00) into cron schedules including 'hour', 'minute', 'second'.
+    All schedules are converted at once (vectorized) and graced (nearly) from 00:00:00 and 24:00:00.
+
+    Parameters
+    ----------
+    schedule_in_second: numpy.ndarray
+        The schedules/times (in seconds) to run jobs, relative to 00:00:00
+    index: pandas.Index
+        The index of the returned dataframe, i.e., the movie_id of each job
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe storing the cron schedule, inculding 'hour', 'minute', 'second'
+        -- Each row uses the movie_id of the corresponding crawl job as its index
+    '''
+
     seconds_per_hour = 3600 # 60 * 60
     seconds_per_minute = 60
-    # The time interval (in seconds) between two adjacent jobs
-    job_interval = seconds_per_day // job_count    
-    
-    i = 0 # job number (1st job, 2nd job, 3rd job, etc.)
-    for movie_id in movie_list_df.index: # movie_id as the index
-        # The schedule/time (in second) to run a job, relative to 00:00:00
-        schedule_in_second = i * job_interval
-
-        # Convert schedule_in_second to cron schedule including 'hour', 'minute', 'second'
-        hour, remainning_minute = divmod(schedule_in_second, seconds_per_hour)
-        minute, second = divmod(remainning_minute, seconds_per_minute)
-
-        # Grace crawl jobs schedule (nearly) from 00:00:00 and 24:00:00
-        # Schedule crawl jobs in the [00:00:00: + GRACE_MINUTE,  24:00:00 - GRACE_MINUTE] time window
-        # There are some daily routine jobs scheduled to run at 00:00:00 each day
-        # Prevent interference between comment crawl jobs and daily routine jobs
-        if hour == 0:
-            minute = max(minute, config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE)
-        if hour == 23:
-            minute = min(minute, seconds_per_minute - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE)
-        if hour == 24:
-            hour = 23
-            minute = max(minute, seconds_per_minute - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE)
-
-        
-        # the cron schedule for the comment crawl job of the movie with id 'movie_id' exist:
-        # -- update the 'hour', 'minute', 'second' in the cron schedule
-        if movie_id in comment_crawl_jobs_cron_schedule_df.index:
-            comment_crawl_jobs_cron_schedule_df.at[movie_id, 'hour'] = hour
-            comment_crawl_jobs_cron_schedule_df.at[movie_id, 'minute'] = minute
-            comment_crawl_jobs_cron_schedule_df.at[movie_id, 'second'] = second
-        # the cron schedule for the comment crawl job of the movie with id 'movie_id' does not exist:
-        # -- create a new cron schedule and append it to the dataframe
-        else:
-            cron_schedule_dict = {
-                'day': '*', # default: everyday
-                'hour':hour,
-                'minute': minute,
-                'second': second
-            }
-            # Append the cron schedule into the dataframe with index of corresponding comment crawl job (i.e. movie_id) as index
-            cron_schedule_series = pd.Series(cron_schedule_dict, name=movie_id)
-            comment_crawl_jobs_cron_schedule_df = comment_crawl_jobs_cron_schedule_df._append(cron_schedule_series)
-
-        i += 1 # prepare for the next movie
-    
-    return comment_crawl_jobs_cron_schedule_df
+
+    # Convert schedule_in_second to cron schedule including 'hour', 'minute', 'second'
+    hour, remainning_minute = np.divmod(schedule_in_second, seconds_per_hour)
+    minute, second = np.divmod(remainning_minute, seconds_per_minute)
+
+    # Grace crawl jobs schedule (nearly) from 00:00:00 and 24:00:00
+    # Schedule crawl jobs in the [00:00:00: + GRACE_MINUTE,  24:00:00 - GRACE_MINUTE] time window
+    # There are some daily routine jobs scheduled to run at 00:00:00 each day
+    # Prevent interference between comment crawl jobs and daily routine jobs
+    minute = np.where(hour == 0, np.maximum(minute, config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE), minute)
+    minute = np.where(hour == 23, np.minimum(minute, seconds_per_minute - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE), minute)
+    minute = np.where(hour == 24, np.maximum(minute, seconds_per_minute - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE), minute)
+    hour = np.where(hour == 24, 23, hour)
+
+    return pd.DataFrame({'hour': hour, 'minute': minute, 'second': second}, index=index)
+
+
+def merge_comment_crawl_job_cron_schedule(cron_schedule_df, comment_crawl_jobs_cron_schedule_df):
+    '''Merge the newly calculated 'hour', 'minute', 'second' of comment crawl jobs into 'comment_crawl_jobs_cron_schedule_df'.
+    -- the cron schedule of a job exists: update the 'hour', 'minute', 'second' and keep the 'day'
+    -- the cron schedule of a job does not exist: append a new cron schedule with 'day' of '*' (everyday)
+
+    Parameters
+    ----------
+    cron_schedule_df: pandas.DataFrame
+        The dataframe storing the newly calculated 'hour', 'minute', 'second' of each comment crawl job
+    comment_crawl_jobs_cron_schedule_df: pandas.DataFrame
+        The dataframe storing cron schedule to be updated
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe storing the updated cron schedule
+        -- Each row describes the cron schedule of a comment crawl job, inculding 'day', 'hour', 'minute', 'second'
+        -- Each row uses the movie_id of the corresponding crawl job as its index
+    '''
+
+    time_columns = ['hour', 'minute', 'second']
+    is_existing = cron_schedule_df.index.isin(comment_crawl_jobs_cron_schedule_df.index)
+
+    # the cron schedule for the comment crawl job exist:
+    # -- update the 'hour', 'minute', 'second' in the cron schedule
+    updated_df = comment_crawl_jobs_cron_schedule_df.copy()
+    existing_df = cron_schedule_df[is_existing]
+    updated_df.loc[existing_df.index, time_columns] = existing_df[time_columns]
+
+    # the cron schedule for the comment crawl job does not exist:
+    # -- create new cron schedules and append them to the dataframe
+    new_df = cron_schedule_df[~is_existing].copy()
+    new_df.insert(0, 'day', '*') # default: everyday
+
+    if len(updated_df.index) == 0:
+        return new_df
+    if len(new_df.index) == 0:
+        return updated_df
+    return pd.concat([updated_df, new_df])
 
 
 def dispatch_daily_routine_jobs(bg_scheduler, startup):
@@ -101,6 +222,8 @@ def dispatch_daily_routine_jobs(bg_scheduler, startup):
     -- update log file
     -- update movie list information
     -- calculate comment crawl jobs cron schedule
+    -- save the comment velocity of movies updated by the comment crawl jobs
+    -- allocate the daily comment page budget to comment crawl jobs, if in the 'budget' comment crawl interval mode
     -- update/re-schedule comment crawl jobs in the scheduler, if 'startup' is False
     
     
@@ -131,8 +254,32 @@ def dispatch_daily_routine_jobs(bg_scheduler, startup):
 
     # calculate comment crawl jobs cron schedule
     config.comment_crawl_jobs_cron_schedule_df = calculate_comment_crawl_job_cron_schedule(config.movie_list_df, config.comment_crawl_jobs_cron_schedule_df)
+
+    # read the comment velocity of movies (once), used by the crawl budget optimizer and the comment crawl queue
+    if config.comment_velocity_df is None:
+        config.comment_velocity_df = comment_crawl_budget_optimizer.read_comment_velocity(config.COMMENT_VELOCITY_FILE)
+    # save the comment velocity updated by the comment crawl jobs of the previous day
+    comment_crawl_budget_optimizer.save_comment_velocity(config.COMMENT_VELOCITY_FILE)
+
+    # allocate the daily comment page budget, i.e., update the 'day' in the comment crawl jobs cron schedule
+    if config.COMMENT_CRAWL_INTERVAL_MODE == 'budget':
+        config.comment_crawl_budget_allocation_df = comment_crawl_budget_optimizer.optimize_comment_crawl_intervals(
+            config.movie_list_df,
+            config.comment_velocity_df,
+            config.COMMENT_CRAWL_DAILY_PAGE_BUDGET
+        )
+        # save the allocation to a csv file for inspection
+        config.comment_crawl_budget_allocation_df.to_csv(config.COMMENT_CRAWL_BUDGET_ALLOCATION_FILE, index_label='movie_id')
+        config.comment_crawl_jobs_cron_schedule_df = comment_crawl_budget_optimizer.apply_comment_crawl_budget_allocation(
+            config.comment_crawl_budget_allocation_df,
+            config.comment_crawl_jobs_cron_schedule_df
+        )
+
     # save the calculated comment crawl jobs cron schedule to a csv file
     config.comment_crawl_jobs_cron_schedule_df.to_csv(config.COMMENT_CRAWL_JOBS_CRON_SCHEDULE_FILE, index_label='movie_id')
+
+    # save the run summary of the jobs (p50/p95 duration, overrun rate, ...) to a csv file for inspection
+    job_run_tracker.save_job_run_summary(config.JOB_RUN_SUMMARY_FILE)
     
     # update/re-schedule comment crawl jobs in the scheduler, if 'startup' is False
     if not startup:
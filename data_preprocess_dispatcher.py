@@ -14,10 +14,15 @@ from datetime import datetime, timedelta
 import config
 
 import data_preprocessor
+import job_profiler
+import freshness_tracker
 
 
+@job_profiler.profile_job(lambda startup: 'data_preprocess_job')
 def dispatch_data_preprocess_jobs(startup):
     '''Dispatch data pre-process jobs.
+    In the 'event' data pre-process mode, the newly crawled comment data are already merged by the data pre-process worker
+    (see 'data_preprocess_worker.py'), and the daily data pre-process jobs run as the reconciliation sweep.
     
     Parameters
     ----------
@@ -58,6 +63,9 @@ def dispatch_data_preprocess_jobs(startup):
             data_preprocessor.combine_daily_comment_data(movie_id, date_previous_day)
             data_preprocessor.merge_all_comment_data(movie_id, date_previous_day) 
 
+        # report the freshness of the comments merged in the last 24 hours
+        freshness_tracker.report_comment_freshness(config.movie_list_df['movie_id'], now_previous_day, config.COMMENT_FRESHNESS_REPORT_FILE)
+
 
 
 def gather_dates_for_all_movies():
@@ -111,10 +119,11 @@ def retrieve_dates_from_files(movie_id, daily_combined):
     path_pattern = ''
     if daily_combined:
         path_pattern = config.COMMENT_DAILY_FILE.format(movie_id=movie_id, date_str='*')
+        files = glob(path_pattern)
     else:
-        path_pattern = config.COMMENT_CRAWLED_FILE.format(movie_id=movie_id, date_str='*', timestamp_str='*')
+        # both per-page json files and segment files
+        files = data_preprocessor.find_comment_crawled_files(movie_id, '*', include_unfinished=True)
 
-    files = glob(path_pattern)
     for file in files:
         # extract file name from the full file path
         file_name = os.path.basename(file)
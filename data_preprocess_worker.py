@@ -0,0 +1,232 @@
+'''The DataPreprocessWorker Module
+
+Summary
+-------
+This module defines the event-driven data pre-process worker.
+
+In the 'event' data pre-process mode (see 'config.DATA_PREPROCESS_MODE'):
+-- when a comment crawl job (or a slice of it) of a movie finishes, 'comment_crawl_dispatcher.dispatch_crawl_comment'
+    emits a completion event (see 'emit_comment_crawl_completed'), i.e., puts the movie into the data pre-process queue
+-- the data pre-process worker (a daemon thread) pulls the movie from the queue and merges just its newly crawled comment data files
+    (crawled today or yesterday, and not merged by the worker yet) into the merged comment data json file
+-- each merge reads and rewrites the whole merged comment data json file of the movie, so the events of a movie are coalesced:
+    a movie merged within the latest DATA_PREPROCESS_COALESCE_SECONDS is queued when the window ends,
+    and the slices of its comment crawl job finished until then are merged at once
+So the merge I/O is spread over the day, and the merged comment data is only minutes behind the crawl.
+The daily data pre-process jobs still run as the reconciliation sweep (combine the daily files and merge them),
+which is idempotent since the merge removes duplicates.
+'''
+
+import os
+import sys
+import queue
+import threading
+from datetime import datetime, timedelta
+
+import config
+import util
+import metrics
+import data_preprocessor
+
+
+# The queue of the ids of movies with newly crawled comment data
+_data_preprocess_queue = queue.Queue()
+# The ids of movies in the queue, a movie is queued at most once since the worker merges all its new files
+_queued_movie_ids = set()
+# The crawled comment data files merged by the worker, movie id as key, each value is a set of file paths
+_merged_crawled_files = {}
+# The timestamp of the latest merge by the worker of each movie, movie id as key, to coalesce the completion events
+_last_merge_timestamps = {}
+# The lock to protect '_queued_movie_ids', '_merged_crawled_files' and '_last_merge_timestamps'
+_data_preprocess_lock = threading.Lock()
+# The data pre-process worker (thread)
+_data_preprocess_worker = None
+
+
+def emit_comment_crawl_completed(movie_id):
+    '''Emit the completion event of the comment crawl job of the movie with id 'movie_id',
+    i.e., put the movie into the data pre-process queue (if not queued yet), in the 'event' data pre-process mode.
+    If the movie is merged within the latest DATA_PREPROCESS_COALESCE_SECONDS, it is queued when the window ends.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie whose comment crawl job (or a slice of it) finished
+
+    Returns
+    -------
+    bool
+        True if the movie is queued, otherwise False
+    '''
+
+    if config.DATA_PREPROCESS_MODE != 'event' or _data_preprocess_worker is None:
+        return False
+
+    with _data_preprocess_lock:
+        if movie_id in _queued_movie_ids:
+            return False
+        _queued_movie_ids.add(movie_id)
+        last_merge_timestamp = _last_merge_timestamps.get(movie_id, float('-inf'))
+
+    # the events until the movie is pulled from the queue are coalesced, since the movie stays in '_queued_movie_ids'
+    delay = last_merge_timestamp + config.DATA_PREPROCESS_COALESCE_SECONDS - datetime.now(config.TIME_ZONE).timestamp()
+    if delay > 0:
+        timer = threading.Timer(delay, _data_preprocess_queue.put, args=(movie_id,))
+        timer.daemon = True
+        timer.start()
+    else:
+        _data_preprocess_queue.put(movie_id)
+    return True
+
+
+def find_new_crawled_files(movie_id, now):
+    '''Find the crawled comment data files of the movie with id 'movie_id' that are not merged by the worker yet,
+    among the files crawled on the date of 'now' and the previous day (a crawl job may run across midnight)
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    now: datetime
+        The current time
+
+    Returns
+    -------
+    tuple
+        (the full paths of the new crawled comment data files sorted by file name (i.e., crawl time),
+        the count of the new files which may still be being written)
+    '''
+
+    crawled_files = set()
+    for date in (now - timedelta(days=1), now):
+        # the segment files being written (with the '.part' suffix) are merged after the comment crawl job closes them
+        crawled_files.update(data_preprocessor.find_comment_crawled_files(movie_id, date.strftime('%Y-%m-%d')))
+
+    with _data_preprocess_lock:
+        merged_files = _merged_crawled_files.get(movie_id, set())
+        # forget the files of earlier dates, which are not globbed anymore
+        merged_files &= crawled_files
+        _merged_crawled_files[movie_id] = merged_files
+        new_files = crawled_files - merged_files
+
+    # skip the files which may still be being written (e.g., by the next slice of the crawl job)
+    settled_timestamp = now.timestamp() - config.DATA_PREPROCESS_FILE_SETTLE_SECONDS
+    settled_files = sorted(file for file in new_files if os.path.getmtime(file) <= settled_timestamp)
+    return settled_files, len(new_files) - len(settled_files)
+
+
+def preprocess_new_comment_data(movie_id):
+    '''Merge the newly crawled comment data files of the movie with id 'movie_id' into the merged comment data json file
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+
+    Returns
+    -------
+    int
+        The count of merged crawled comment data files
+    '''
+
+    now = datetime.now(config.TIME_ZONE)
+    new_files, unsettled_count = find_new_crawled_files(movie_id, now)
+    # emit the event again to merge the skipped files after they settle
+    if unsettled_count > 0:
+        timer = threading.Timer(config.DATA_PREPROCESS_FILE_SETTLE_SECONDS, emit_comment_crawl_completed, args=(movie_id,))
+        timer.daemon = True
+        timer.start()
+
+    if not data_preprocessor.merge_crawled_comment_data(movie_id, new_files):
+        return 0
+
+    with _data_preprocess_lock:
+        _merged_crawled_files.setdefault(movie_id, set()).update(new_files)
+        if len(new_files) > 0:
+            _last_merge_timestamps[movie_id] = now.timestamp()
+
+    return len(new_files)
+
+
+def run_data_preprocess_worker():
+    '''The data pre-process worker loop: pull a movie from the data pre-process queue and merge its newly crawled comment data.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    while True:
+        movie_id = _data_preprocess_queue.get()
+        # new completion events of the movie during the merge re-queue it
+        with _data_preprocess_lock:
+            _queued_movie_ids.discard(movie_id)
+
+        try:
+            preprocess_new_comment_data(movie_id)
+        except Exception as e:
+            msg = f'Pre-process the newly crawled comment data of the movie with id \'{movie_id}\' failed. -- Original Exception -- {e}'
+            current_frame = sys._getframe()
+            logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+            util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.DATA_PREPROCESSOR_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        finally:
+            _data_preprocess_queue.task_done()
+
+
+def start_data_preprocess_worker():
+    '''Start the data pre-process worker (daemon thread), in the 'event' data pre-process mode
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    global _data_preprocess_worker
+
+    if config.DATA_PREPROCESS_MODE != 'event' or _data_preprocess_worker is not None:
+        return
+
+    _data_preprocess_worker = threading.Thread(target=run_data_preprocess_worker, name='data_preprocess_worker', daemon=True)
+    _data_preprocess_worker.start()
+
+    msg = 'Start the data pre-process worker to merge newly crawled comment data when comment crawl jobs finish.'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+
+def get_data_preprocess_queue_status():
+    '''Get the count of movies waiting in the data pre-process queue
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The count of queued movies
+    '''
+
+    return _data_preprocess_queue.qsize()
+
+
+def get_data_preprocess_queue_metrics():
+    '''Get the gauge of the movies waiting in the data pre-process queue, registered as the metrics gauge callback'''
+
+    return [({}, get_data_preprocess_queue_status())]
+
+
+metrics.register_gauge_callback('data_preprocess_queue', get_data_preprocess_queue_metrics)
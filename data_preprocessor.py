@@ -3,16 +3,31 @@
 Summary
 -------
 This module defines functions to pre-process crawled comment data of a movie.
+
+The crawled comment data files are in either layout (see 'config.COMMENT_CRAWLED_OUTPUT_MODE'):
+-- per-page json files (COMMENT_CRAWLED_FILE)
+-- JSONL segment files of comment crawl jobs (COMMENT_CRAWLED_SEGMENT_FILE), with the '.part' suffix while being written
+Use 'find_comment_crawled_files' and 'read_comment_crawled_file' to read both layouts.
 '''
 
 import os
 import sys
 from glob import glob
 import json
+import threading
+from io import StringIO
+from datetime import datetime
 import pandas as pd
 
 import config
 import util
+import metrics
+import freshness_tracker
+
+
+# The lock of the merged comment data json file of each movie, movie id as key, see 'get_merged_file_lock'
+_merged_file_locks = {}
+_merged_file_locks_lock = threading.Lock()
 
 
 def save_dataframe_as_json(df, json_file_path):
@@ -35,10 +50,74 @@ def save_dataframe_as_json(df, json_file_path):
     json_object = json.loads(json_str)
 
     # write json object into file
-    with open(json_file_path, mode='w', encoding='utf-8') as file:
+    with metrics.timer('json_write', 'data_preprocessor'), open(json_file_path, mode='w', encoding='utf-8') as file:
         json.dump(json_object, file, indent=4, ensure_ascii=False)
 
 
+def find_comment_crawled_files(movie_id, date_str, include_unfinished=False):
+    '''Find the crawled comment data files (both per-page json files and segment files) of the movie with id 'movie_id'
+    that are crawled on the date 'date_str'
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    date_str: str
+        The date of crawled comment data, '*' for all dates
+    include_unfinished: bool, optional
+        The flag indicating whether to include the segment files with the '.part' suffix (default is False)
+        -- True: e.g., for the daily data pre-process, the segments left by a crashed comment crawl job
+        -- False: e.g., for the data pre-process worker, which may run while a comment crawl job is writing a segment
+
+    Returns
+    -------
+    list
+        The full paths of the crawled comment data files
+    '''
+
+    comment_crawled_files = glob(config.COMMENT_CRAWLED_FILE.format(movie_id=movie_id, date_str=date_str, timestamp_str='*'))
+    segment_path_pattern = config.COMMENT_CRAWLED_SEGMENT_FILE.format(movie_id=movie_id, date_str=date_str, timestamp_str='*')
+    comment_crawled_files.extend(glob(segment_path_pattern))
+    if include_unfinished:
+        comment_crawled_files.extend(glob(segment_path_pattern + '.part'))
+
+    return comment_crawled_files
+
+
+def read_comment_crawled_file(comment_crawled_file):
+    '''Read a crawled comment data file (a per-page json file or a segment file) into a dataframe
+
+    Parameters
+    ----------
+    comment_crawled_file: str
+        The full path of the crawled comment data file
+
+    Returns
+    -------
+    pandas.DataFrame
+        The comment records in the file
+    '''
+
+    if comment_crawled_file.endswith('.json'):
+        return pd.read_json(comment_crawled_file)
+
+    # A segment file: skip the page marker lines, and the incomplete last line of a segment left by a crashed comment crawl job
+    comment_lines = []
+    with metrics.timer('json_read', 'data_preprocessor'), open(comment_crawled_file, mode='r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if config.COMMENT_CRAWLED_SEGMENT_PAGE_MARKER not in record:
+                comment_lines.append(line)
+
+    if len(comment_lines) == 0:
+        return pd.DataFrame()
+    # read the comment lines by pandas, to infer the same dtypes as the per-page json files
+    return pd.read_json(StringIO(''.join(comment_lines)), lines=True)
+
+
 def combine_daily_comment_data(movie_id, date_str):
     '''Combine the crawled comment data of the movie with id 'movid_id'
     on the date 'date_str' into one json file.
@@ -61,9 +140,8 @@ def combine_daily_comment_data(movie_id, date_str):
     '''
 
     try:
-        # Find all comment json files of movie 'movid_id' that are crawled on 'date_str'
-        path_pattern = config.COMMENT_CRAWLED_FILE.format(movie_id=movie_id, date_str=date_str, timestamp_str='*')     
-        comment_crawled_files = glob(path_pattern)
+        # Find all comment json/segment files of movie 'movid_id' that are crawled on 'date_str'
+        comment_crawled_files = find_comment_crawled_files(movie_id, date_str, include_unfinished=True)
 
         if len(comment_crawled_files) == 0: # no need to combine
             return
@@ -71,7 +149,7 @@ def combine_daily_comment_data(movie_id, date_str):
         # Read each json file into a dataframe and concatenate them
         df_daily = None
         for file in comment_crawled_files:
-            df = pd.read_json(file)
+            df = read_comment_crawled_file(file)
             df_daily = pd.concat([df_daily, df], ignore_index=True)
 
         # Write the concatenated dataframe into a json file
@@ -97,6 +175,72 @@ def combine_daily_comment_data(movie_id, date_str):
         util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=log_level)
 
 
+def get_merged_file_lock(movie_id):
+    '''Get the lock of the merged comment data json file of the movie with id 'movie_id',
+    which serializes the merges by the data pre-process worker and the daily data pre-process jobs
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+
+    Returns
+    -------
+    threading.Lock
+        The lock of the merged comment data json file
+    '''
+
+    with _merged_file_locks_lock:
+        return _merged_file_locks.setdefault(movie_id, threading.Lock())
+
+
+def merge_comment_data(movie_id, df_new):
+    '''Merge the comment data 'df_new' of the movie with id 'movid_id' into the merged json file and remove duplicates.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie to merge comment data
+    df_new: pandas.DataFrame
+        The comment data to be merged
+
+    Returns
+    -------
+    str
+        The full path of the merged json file
+    '''
+
+    comment_merged_file = config.COMMENT_MERGED_FILE.format(movie_id=movie_id)
+
+    with get_merged_file_lock(movie_id):
+        # Read the merged comment data json file into a dataframe
+        df_merged = None
+        if os.path.isfile(comment_merged_file):
+            df_merged = pd.read_json(comment_merged_file)
+            # the records merged before freshness tracking were merged at the latest when the merged file was written
+            if 'merge_timestamp' not in df_merged.columns:
+                df_merged['merge_timestamp'] = datetime.fromtimestamp(os.path.getmtime(comment_merged_file), config.TIME_ZONE).isoformat(timespec='seconds')
+
+        # Merge dataframes and remove duplicates
+        merge_timestamp = freshness_tracker.get_current_timestamp()
+        df_new = df_new.assign(merge_timestamp=merge_timestamp)
+        with metrics.timer('merge', 'data_preprocessor'):
+            df_merged = pd.concat([df_merged, df_new], ignore_index=True)
+            # keep the earliest crawl/merge timestamps of duplicate records, i.e., when the comment first appeared
+            # only the records sharing a key with the new records may change
+            df_merged = freshness_tracker.keep_first_timestamps(df_merged, ['user_name', 'comment_timestamp'], df_new)
+            # keep='last': keep the latest copy of duplicate records
+            df_merged = df_merged.drop_duplicates(subset=['user_name', 'comment_timestamp'], keep='last', ignore_index=True)
+
+        # Write the merged dataframe into a json file
+        save_dataframe_as_json(df_merged, comment_merged_file)
+
+    # Update the freshness metrics from the comments first merged by this merge
+    freshness_tracker.record_merge_freshness(movie_id, df_merged[df_merged['merge_timestamp'] == merge_timestamp])
+
+    return comment_merged_file
+
+
 def merge_all_comment_data(movie_id, date_str):
     '''Merge the comment data of the movie with id 'movid_id'
     that are crawled on the date 'date_str' into the merged json file
@@ -118,25 +262,15 @@ def merge_all_comment_data(movie_id, date_str):
         # Read the daily comment data json file of the date 'date_str' into a dataframe
         df_daily = None
         comment_daily_file = config.COMMENT_DAILY_FILE.format(movie_id=movie_id, date_str=date_str)
+        comment_merged_file = config.COMMENT_MERGED_FILE.format(movie_id=movie_id)
         if os.path.isfile(comment_daily_file):
             df_daily = pd.read_json(comment_daily_file)
         
         if df_daily is None: # no need to merge
             return
-        
-        # Read the merged comment data json file into a dataframe
-        df_merged = None
-        comment_merged_file = config.COMMENT_MERGED_FILE.format(movie_id=movie_id)        
-        if os.path.isfile(comment_merged_file):
-            df_merged = pd.read_json(comment_merged_file)
-        
-        # Merge dataframes and remove duplicates
-        df_merged = pd.concat([df_merged, df_daily], ignore_index=True)
-        # keep='last': keep the latest copy of duplicate records
-        df_merged = df_merged.drop_duplicates(subset=['user_name', 'comment_timestamp'], keep='last', ignore_index=True)
 
-        # Write the merged dataframe into a json file
-        save_dataframe_as_json(df_merged, comment_merged_file)        
+        # Merge the daily comment data into the merged json file and remove duplicates
+        merge_comment_data(movie_id, df_daily)
 
     except Exception as e:
         msg = f'Merge \'{comment_daily_file}\' into \'{comment_merged_file}\' failed. -- Original Exception -- {e}'
@@ -154,3 +288,53 @@ def merge_all_comment_data(movie_id, date_str):
         logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
         util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
         util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+
+
+def merge_crawled_comment_data(movie_id, comment_crawled_files):
+    '''Merge the crawled comment data json files 'comment_crawled_files' of the movie with id 'movid_id'
+    into the merged json file and remove duplicates, i.e., incrementally pre-process the newly crawled pages without the daily combined file.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie to merge crawled comment data
+    comment_crawled_files: list
+        The full paths of the crawled comment data json files to be merged
+
+    Returns
+    -------
+    bool
+        True if the files are merged successfully (or nothing to merge), otherwise False
+    '''
+
+    comment_merged_file = config.COMMENT_MERGED_FILE.format(movie_id=movie_id)
+    if len(comment_crawled_files) == 0: # no need to merge
+        return True
+
+    try:
+        # Combine the crawled comment data json files into a dataframe
+        df_new = pd.concat([read_comment_crawled_file(file) for file in comment_crawled_files], ignore_index=True)
+        if df_new.empty:
+            return True
+
+        # Merge the crawled comment data into the merged json file and remove duplicates
+        merge_comment_data(movie_id, df_new)
+
+    except Exception as e:
+        msg = f'Merge {len(comment_crawled_files)} crawled comment data files of the movie with id \'{movie_id}\' into \'{comment_merged_file}\' failed. -- Original Exception -- {e}'
+        log_level = config.LOG_LEVEL_ERROR
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.DATA_PREPROCESSOR_ERROR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        return False
+    else:
+        msg = f'Merge {len(comment_crawled_files)} crawled comment data files ({len(df_new)} comments) of the movie with id \'{movie_id}\' into \'{comment_merged_file}\' successfully.'
+        log_level = config.LOG_LEVEL_INFO
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        return True
@@ -0,0 +1,258 @@
+'''The FreshnessTracker Module
+
+Summary
+-------
+This module defines functions to track the freshness of comment data, i.e., the lag between a user posting a comment on Douban
+('comment_timestamp', in DOUBAN_TIME_ZONE) and the comment appearing in the crawled data and in COMMENT_MERGED_FILE.
+
+Each comment record carries:
+-- crawl_timestamp: the time (in TIME_ZONE) its raw comment page was crawled, set by 'comment_crawler.crawl_comment'
+-- merge_timestamp: the time (in TIME_ZONE) it first appeared in COMMENT_MERGED_FILE, set by 'data_preprocessor.merge_all_comment_data'
+The earliest crawl/merge timestamp is kept for the duplicate copies of a comment (crawled again later).
+
+The lags of each movie are:
+-- crawl lag: crawl_timestamp - comment_timestamp
+-- merge lag: merge_timestamp - comment_timestamp, i.e., the end-to-end lag
+Comments posted more than COMMENT_FRESHNESS_MAX_AGE_DAYS days before they were crawled (e.g., backfilled history) are excluded,
+since their lag measures the coverage of the history rather than the freshness.
+
+The lag distributions are exposed as the 'comment_freshness_lag_seconds' gauges of the metrics (after each merge),
+and reported daily in COMMENT_FRESHNESS_REPORT_FILE (see 'report_comment_freshness').
+'''
+
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import config
+import util
+import metrics
+
+
+# The quantiles of the lag distributions
+LAG_QUANTILES = {'p50': 0.5, 'p95': 0.95}
+
+
+def get_current_timestamp():
+    '''Get the current time as a crawl/merge timestamp string (ISO format in TIME_ZONE, second resolution)
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    str
+        The current timestamp
+    '''
+
+    return datetime.now(config.TIME_ZONE).isoformat(timespec='seconds')
+
+
+def keep_first_timestamps(comments_df, keys, new_comments_df=None):
+    '''Set the crawl/merge timestamps of the duplicate copies of each comment in 'comments_df' to the earliest ones
+
+    Parameters
+    ----------
+    comments_df: pandas.DataFrame
+        The comment records, with (optional) 'crawl_timestamp', 'merge_timestamp' columns
+    keys: list
+        The columns identifying a comment, e.g., ['user_name', 'comment_timestamp']
+    new_comments_df: pandas.DataFrame, optional
+        The new comment records merged into 'comments_df' (default is None, i.e., all records are updated)
+        -- only the records sharing a key with the new records are updated, the others keep their stored timestamps
+
+    Returns
+    -------
+    pandas.DataFrame
+        The comment records with the earliest crawl/merge timestamps
+    '''
+
+    # all copies of a comment share its key, so the earliest timestamps of the other comments are unchanged
+    if new_comments_df is None:
+        is_updated = np.ones(len(comments_df), dtype=bool)
+    else:
+        is_updated = pd.MultiIndex.from_frame(comments_df[keys]).isin(pd.MultiIndex.from_frame(new_comments_df[keys]))
+    if not is_updated.any():
+        return comments_df
+    updated_df = comments_df.loc[is_updated]
+
+    for column in ('crawl_timestamp', 'merge_timestamp'):
+        if column not in comments_df.columns:
+            continue
+        timestamps = pd.to_datetime(updated_df[column], errors='coerce', utc=True)
+        first_timestamps = timestamps.groupby([updated_df[key] for key in keys]).transform('min')
+        # the records with a missing key keep their own timestamps
+        first_timestamps = first_timestamps.fillna(timestamps).dt.tz_convert(config.TIME_ZONE)
+        # e.g., a column of the records saved before freshness tracking, all missing
+        comments_df[column] = comments_df[column].astype(object)
+        comments_df.loc[is_updated, column] = [timestamp.isoformat() if pd.notna(timestamp) else None for timestamp in first_timestamps]
+
+    return comments_df
+
+
+def calculate_comment_lags(comments_df):
+    '''Calculate the crawl lag and merge lag of each comment record in 'comments_df'
+
+    Parameters
+    ----------
+    comments_df: pandas.DataFrame
+        The comment records, with the 'comment_timestamp' column and (optional) 'crawl_timestamp', 'merge_timestamp' columns
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe with the same index as 'comments_df' and columns:
+        -- crawl_lag_seconds
+        -- merge_lag_seconds
+        The lag is NaN if a timestamp is missing (e.g., records saved before freshness tracking) or the comment is too old
+    '''
+
+    comment_time = pd.to_datetime(comments_df['comment_timestamp'], errors='coerce')
+    comment_time = comment_time.dt.tz_localize(config.DOUBAN_TIME_ZONE, ambiguous='NaT', nonexistent='NaT')
+
+    lags_df = pd.DataFrame(index=comments_df.index)
+    for stage in ('crawl', 'merge'):
+        if f'{stage}_timestamp' in comments_df.columns:
+            stage_time = pd.to_datetime(comments_df[f'{stage}_timestamp'], errors='coerce', utc=True)
+            lags_df[f'{stage}_lag_seconds'] = (stage_time - comment_time).dt.total_seconds()
+        else:
+            lags_df[f'{stage}_lag_seconds'] = np.nan
+
+    # exclude the comments too old when crawled, e.g., backfilled history
+    is_old = lags_df['crawl_lag_seconds'] > config.COMMENT_FRESHNESS_MAX_AGE_DAYS * 86400
+    lags_df.loc[is_old, :] = np.nan
+
+    return lags_df
+
+
+def summarize_lags(lags):
+    '''Summarize the lag distribution 'lags'
+
+    Parameters
+    ----------
+    lags: pandas.Series
+        The lags in seconds (NaN is ignored)
+
+    Returns
+    -------
+    dict
+        The count and the p50/p95/max lag in seconds (NaN if no lag)
+    '''
+
+    lags = lags.dropna()
+    summary = {'count': len(lags)}
+    for quantile_name, quantile in LAG_QUANTILES.items():
+        summary[quantile_name] = float(lags.quantile(quantile)) if len(lags) > 0 else np.nan
+    summary['max'] = float(lags.max()) if len(lags) > 0 else np.nan
+
+    return summary
+
+
+def record_merge_freshness(movie_id, merged_comments_df):
+    '''Update the freshness metrics of the movie with id 'movie_id' from the comments newly merged into COMMENT_MERGED_FILE
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    merged_comments_df: pandas.DataFrame
+        The comment records first merged into COMMENT_MERGED_FILE by the latest merge
+
+    Returns
+    -------
+    None
+    '''
+
+    if merged_comments_df.empty:
+        return
+
+    lags_df = calculate_comment_lags(merged_comments_df)
+    metrics.inc_counter('comments_merged_total', len(merged_comments_df), labels={'movie_id': movie_id})
+    for stage in ('crawl', 'merge'):
+        summary = summarize_lags(lags_df[f'{stage}_lag_seconds'])
+        if summary['count'] == 0:
+            continue
+        for quantile_name in list(LAG_QUANTILES) + ['max']:
+            metrics.set_gauge('comment_freshness_lag_seconds', summary[quantile_name], labels={'movie_id': movie_id, 'stage': stage, 'quantile': quantile_name})
+
+
+def report_comment_freshness(movie_ids, since, csv_file):
+    '''Report the lag distributions of the comments merged into COMMENT_MERGED_FILE since 'since', for each movie in 'movie_ids',
+    save the report to the CSV file 'csv_file' and log the overall lags.
+
+    Parameters
+    ----------
+    movie_ids: iterable
+        The ids of the movies
+    since: datetime
+        The start of the report window, i.e., comments with 'merge_timestamp' at or after it are reported
+    csv_file: str
+        The full path of the CSV file
+
+    Returns
+    -------
+    pandas.DataFrame
+        The report, movie_id as index, with columns:
+        -- merged_count (the count of comments merged in the window)
+        -- crawl_lag_count, crawl_lag_p50, crawl_lag_p95, crawl_lag_max (in hours)
+        -- merge_lag_count, merge_lag_p50, merge_lag_p95, merge_lag_max (in hours)
+    '''
+
+    report = {}
+    all_lags_df = []
+    try:
+        for movie_id in movie_ids:
+            comment_merged_file = config.COMMENT_MERGED_FILE.format(movie_id=movie_id)
+            if not os.path.isfile(comment_merged_file):
+                continue
+            df_merged = pd.read_json(comment_merged_file)
+            if df_merged.empty or 'merge_timestamp' not in df_merged.columns:
+                continue
+
+            merge_time = pd.to_datetime(df_merged['merge_timestamp'], errors='coerce', utc=True)
+            df_window = df_merged[merge_time >= since]
+            lags_df = calculate_comment_lags(df_window)
+            all_lags_df.append(lags_df)
+
+            row = {'merged_count': len(df_window)}
+            for stage in ('crawl', 'merge'):
+                summary = summarize_lags(lags_df[f'{stage}_lag_seconds'])
+                row[f'{stage}_lag_count'] = summary.pop('count')
+                row.update({f'{stage}_lag_{name}': value / 3600 for name, value in summary.items()})
+            report[movie_id] = row
+
+        report_df = pd.DataFrame.from_dict(report, orient='index')
+        report_df.index.name = 'movie_id'
+        report_df.to_csv(csv_file)
+
+    except Exception as e:
+        msg = f'Report the comment freshness since \'{since}\' failed. -- Original Exception -- {e}'
+        log_level = config.LOG_LEVEL_ERROR
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.DATA_PREPROCESSOR_ERROR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        return None
+
+    else:
+        all_lags_df = pd.concat(all_lags_df) if all_lags_df else pd.DataFrame(columns=['crawl_lag_seconds', 'merge_lag_seconds'])
+        crawl_summary = summarize_lags(all_lags_df['crawl_lag_seconds'])
+        merge_summary = summarize_lags(all_lags_df['merge_lag_seconds'])
+        msg = (
+            f'Comment freshness since \'{since}\' of {len(report_df)} movies: '
+            f'crawl lag p50 {crawl_summary["p50"] / 3600:.1f}h, p95 {crawl_summary["p95"] / 3600:.1f}h; '
+            f'merge (end-to-end) lag p50 {merge_summary["p50"] / 3600:.1f}h, p95 {merge_summary["p95"] / 3600:.1f}h '
+            f'({merge_summary["count"]} comments). Report saved in \'{csv_file}\' file.'
+        )
+        log_level = config.LOG_LEVEL_INFO
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+        util.log(msg, config.DATA_PREPROCESSOR_LOG_FILE, logger_name=logger_name, log_level=log_level)
+        return report_df
@@ -0,0 +1,151 @@
+'''The HTMLTree Module
+
+Summary
+-------
+This module defines a light-weight HTML element tree (built by the standard library 'html.parser') and functions to query it,
+used to parse webpages without the webbrowser (e.g., 'comment_crawler.parse_html', 'movie_info_crawler.parse_movie_page_html').
+
+Each element is a dict with keys:
+-- tag: the tag name
+-- attrs: the dict of attributes
+-- children: the list of child elements and text strings
+'''
+
+from html.parser import HTMLParser
+
+
+class HTMLTreeBuilder(HTMLParser):
+    '''The HTML parser to build the element tree, see the module summary'''
+
+    # The elements without end tags
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = {'tag': None, 'attrs': {}, 'children': []}
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        elem = {'tag': tag, 'attrs': dict(attrs), 'children': []}
+        self.stack[-1]['children'].append(elem)
+        if tag not in self.VOID_TAGS:
+            self.stack.append(elem)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1]['children'].append({'tag': tag, 'attrs': dict(attrs), 'children': []})
+
+    def handle_endtag(self, tag):
+        # close the latest open element with the tag (and any unclosed elements inside it)
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index]['tag'] == tag:
+                del self.stack[index:]
+                break
+
+    def handle_data(self, data):
+        self.stack[-1]['children'].append(data)
+
+
+def build_tree(html):
+    '''Build the element tree of the HTML 'html'
+
+    Parameters
+    ----------
+    html: str
+        The HTML of a webpage or a part of it
+
+    Returns
+    -------
+    dict
+        The root element (with tag None), whose children are the top-level elements of the HTML
+    '''
+
+    tree_builder = HTMLTreeBuilder()
+    tree_builder.feed(html)
+    tree_builder.close()
+
+    return tree_builder.root
+
+
+def find_elements(elem, tag=None, class_name=None, attrs=None):
+    '''Find the descendant elements of the element 'elem' with the tag 'tag', the class 'class_name' and the attributes 'attrs', in document order
+
+    Parameters
+    ----------
+    elem: dict
+        The element
+    tag: str, optional
+        The tag name (default is any tag)
+    class_name: str, optional
+        The class name (default is any class)
+    attrs: dict, optional
+        The attribute values, e.g., {'property': 'v:genre'} (default is any attributes)
+
+    Returns
+    -------
+    list
+        The matched elements
+    '''
+
+    matched_elems = []
+    for child in elem['children']:
+        if isinstance(child, str):
+            continue
+        if (
+            (tag is None or child['tag'] == tag)
+            and (class_name is None or class_name in (child['attrs'].get('class') or '').split())
+            and (attrs is None or all(child['attrs'].get(name) == value for name, value in attrs.items()))
+        ):
+            matched_elems.append(child)
+        matched_elems.extend(find_elements(child, tag, class_name, attrs))
+
+    return matched_elems
+
+
+def find_element(elem, tag=None, class_name=None, attrs=None):
+    '''Find the first descendant element of the element 'elem' with the tag 'tag', the class 'class_name' and the attributes 'attrs'.
+    Raise a ValueError, if no element is found (like 'find_element' of selenium).
+    '''
+
+    matched_elems = find_elements(elem, tag, class_name, attrs)
+    if not matched_elems:
+        raise ValueError(f'No element with tag \'{tag}\', class \'{class_name}\' and attributes {attrs} is found.')
+
+    return matched_elems[0]
+
+
+def get_element_text(elem, skip_class_names=()):
+    '''Get the text of the element 'elem' as rendered by the webbrowser, i.e., whitespace collapsed and '<br>' as line break
+
+    Parameters
+    ----------
+    elem: dict
+        The element
+    skip_class_names: tuple, optional
+        The class names of the descendant elements to skip (default is none)
+
+    Returns
+    -------
+    str
+        The text of the element
+    '''
+
+    def collect_text(elem, texts):
+        for child in elem['children']:
+            if isinstance(child, str):
+                texts.append(child)
+            elif child['tag'] == 'br':
+                texts.append('\n')
+            elif not set((child['attrs'].get('class') or '').split()) & set(skip_class_names):
+                collect_text(child, texts)
+
+    texts = []
+    collect_text(elem, texts)
+    lines = ''.join(texts).split('\n')
+
+    return '\n'.join(' '.join(line.split()) for line in lines).strip()
+
+
+def get_element_raw_text(elem):
+    '''Get the raw text of the element 'elem' (e.g., the content of a <script> element), like 'innerHTML' of a text-only element'''
+
+    return ''.join(child for child in elem['children'] if isinstance(child, str))
@@ -0,0 +1,378 @@
+'''The HTTPCache Module
+
+Summary
+-------
+This module defines the on-disk cache of fetched webpages, used by both crawlers (see 'http_fetcher.fetch_url',
+'comment_crawler.fetch_comment' and 'movie_info_crawler.crawl_movie_info'):
+-- bodies: HTTP_CACHE_DIRECTORY/bodies/<sha256[:2]>/<sha256>, the raw HTML/JSON content-addressed by its sha256,
+    so identical pages fetched many times are stored once
+-- entries: HTTP_CACHE_DIRECTORY/entries/<url hash[:2]>/<url hash>/<fetch time>.json, one entry per fetch of a URL,
+    with the URL, fetch time, status, headers, validators (ETag/Last-Modified), body hash and source ('http' or 'browser')
+
+The cache mode HTTP_CACHE_MODE:
+-- 'on': a fetch within the TTL of its page type (HTTP_CACHE_TTL_SECONDS) is served from the cache without the network,
+    a stale entry is revalidated by a conditional request, and every fetch of the page types in HTTP_CACHE_RECORD_PAGE_TYPES is recorded
+-- 'replay': every fetch is served from the cache (the latest entry, or the latest one at HTTP_CACHE_REPLAY_AS_OF), never the network,
+    e.g., to re-run changed parsers over historical pages (see also 'iter_cached_responses')
+-- 'off': no cache
+The cache is bounded by HTTP_CACHE_MAX_BYTES: when exceeded, the least recently used entries (and the bodies not referenced anymore)
+are evicted until HTTP_CACHE_EVICT_TO_RATIO of the bound, in a background thread (see 'start_http_cache_eviction').
+Recording a page is best-effort: a failed record is logged as a warning and never fails the crawl (see 'store_browser_page').
+'''
+
+import os
+import sys
+import json
+import hashlib
+import threading
+from glob import glob
+from fnmatch import fnmatch
+from datetime import datetime
+
+import config
+import util
+
+
+# The total size in bytes of the cache files, None before the first scan of HTTP_CACHE_DIRECTORY
+_cache_size_bytes = None
+# The lock to protect '_cache_size_bytes' and '_eviction_thread'
+_cache_lock = threading.Lock()
+# The background thread evicting the cache, see 'start_http_cache_eviction'
+_eviction_thread = None
+# The lock to run one eviction at a time
+_eviction_lock = threading.Lock()
+
+
+def get_body_file(body_hash):
+    '''Get the full path of the body file with the sha256 'body_hash' '''
+
+    return os.path.join(config.HTTP_CACHE_DIRECTORY, 'bodies', body_hash[:2], body_hash)
+
+
+def get_entry_directory(url):
+    '''Get the full path of the directory of the entries of the URL 'url' '''
+
+    url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(config.HTTP_CACHE_DIRECTORY, 'entries', url_hash[:2], url_hash)
+
+
+def write_file_atomically(file_path, content):
+    '''Write the bytes 'content' to the file 'file_path' by replacing it with a temporary file'''
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_file = f'{file_path}.{threading.get_ident()}.tmp'
+    with open(temp_file, mode='wb') as file:
+        file.write(content)
+    os.replace(temp_file, file_path)
+
+
+def store_response(url, response, source='http', fetched_at=None):
+    '''Record a fetched response of the URL 'url' as a new entry of the cache
+
+    Parameters
+    ----------
+    url: str
+        The URL of the webpage
+    response: dict
+        The response, with keys 'status', 'headers', 'body' (str) and 'validators' (see 'http_fetcher.fetch_url')
+    source: str, optional
+        How the webpage is fetched, 'http' (default) or 'browser' (the rendered HTML of the webbrowser)
+    fetched_at: datetime, optional
+        The fetch time (default is now)
+
+    Returns
+    -------
+    dict
+        The entry
+    '''
+
+    global _cache_size_bytes
+
+    fetched_at = fetched_at or datetime.now(config.TIME_ZONE)
+    content = response['body'].encode('utf-8')
+    body_hash = hashlib.sha256(content).hexdigest()
+    written_bytes = 0
+
+    body_file = get_body_file(body_hash)
+    if not os.path.isfile(body_file):
+        write_file_atomically(body_file, content)
+        written_bytes += len(content)
+
+    entry = {
+        'url': url,
+        'fetched_at': fetched_at.isoformat(),
+        'status': response['status'],
+        'headers': response.get('headers', {}),
+        'validators': response.get('validators', {}),
+        'body_hash': body_hash,
+        'body_size': len(content),
+        'source': source
+    }
+    entry_content = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+    entry_file = os.path.join(get_entry_directory(url), fetched_at.strftime('%Y-%m-%dT%H.%M.%S.%f') + '.json')
+    write_file_atomically(entry_file, entry_content)
+    written_bytes += len(entry_content)
+
+    with _cache_lock:
+        if _cache_size_bytes is not None:
+            _cache_size_bytes += written_bytes
+    if get_cache_size_bytes() > config.HTTP_CACHE_MAX_BYTES:
+        start_http_cache_eviction()
+
+    return entry
+
+
+def read_entry(entry_file):
+    '''Read the cache entry file 'entry_file' and its body into a response dict, None if the body is evicted'''
+
+    with open(entry_file, mode='r', encoding='utf-8') as file:
+        entry = json.load(file)
+    try:
+        with open(get_body_file(entry['body_hash']), mode='rb') as file:
+            entry['body'] = file.read().decode('utf-8')
+    except FileNotFoundError:
+        return None
+
+    entry['fetched_at'] = datetime.fromisoformat(entry['fetched_at'])
+    return entry
+
+
+def get_cached_response(url, as_of=None):
+    '''Get the latest cached response of the URL 'url' (fetched at or before 'as_of'), and mark it as recently used
+
+    Parameters
+    ----------
+    url: str
+        The URL of the webpage
+    as_of: datetime, optional
+        The latest fetch time of the response (default is no limit)
+
+    Returns
+    -------
+    dict
+        The response, with keys: url, fetched_at (datetime), age_seconds, status, headers, validators, body, body_hash, body_size, source
+        None if no response is cached
+    '''
+
+    entry_files = sorted(glob(os.path.join(get_entry_directory(url), '*.json')), reverse=True)
+    for entry_file in entry_files:
+        try:
+            entry = read_entry(entry_file)
+            if entry is None or (as_of is not None and entry['fetched_at'] > as_of):
+                continue
+            # the modification time of an entry file is its last use, for the LRU eviction
+            os.utime(entry_file)
+        except FileNotFoundError:
+            # evicted by the background eviction
+            continue
+        entry['age_seconds'] = (datetime.now(config.TIME_ZONE) - entry['fetched_at']).total_seconds()
+        return entry
+
+    return None
+
+
+def iter_cached_responses(url_pattern='*', since=None, until=None):
+    '''Iterate the cached responses of the URLs matching 'url_pattern' fetched in [since, until], e.g., to re-run parsers over historical pages
+
+    Parameters
+    ----------
+    url_pattern: str, optional
+        The shell-style pattern of URLs, e.g., 'https://m.douban.com/movie/subject/35633650/comments*' (default is all URLs)
+    since: datetime, optional
+        The earliest fetch time (default is no limit)
+    until: datetime, optional
+        The latest fetch time (default is no limit)
+
+    Yields
+    ------
+    dict
+        The response, see 'get_cached_response'
+    '''
+
+    for entry_file in sorted(glob(os.path.join(config.HTTP_CACHE_DIRECTORY, 'entries', '*', '*', '*.json'))):
+        entry = read_entry(entry_file)
+        if entry is None or not fnmatch(entry['url'], url_pattern):
+            continue
+        if (since is not None and entry['fetched_at'] < since) or (until is not None and entry['fetched_at'] > until):
+            continue
+        yield entry
+
+
+def get_cache_size_bytes():
+    '''Get the total size in bytes of the cache files (scanned at the first call)'''
+
+    global _cache_size_bytes
+
+    with _cache_lock:
+        if _cache_size_bytes is None:
+            _cache_size_bytes = sum(
+                os.path.getsize(os.path.join(directory, file_name))
+                for directory, _, file_names in os.walk(config.HTTP_CACHE_DIRECTORY) for file_name in file_names
+            )
+        return _cache_size_bytes
+
+
+def start_http_cache_eviction():
+    '''Start evicting the cache (see 'evict_http_cache') in a background (daemon) thread, if no eviction is running,
+    so the crawl thread recording a page does not wait for the scan of all entries
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    bool
+        True if an eviction is started, otherwise False
+    '''
+
+    global _eviction_thread
+
+    with _cache_lock:
+        if _eviction_thread is not None and _eviction_thread.is_alive():
+            return False
+        _eviction_thread = threading.Thread(target=evict_http_cache, name='http_cache_eviction', daemon=True)
+        _eviction_thread.start()
+    return True
+
+
+def evict_http_cache():
+    '''Evict the least recently used entries, and the bodies not referenced by the remaining entries,
+    until the cache size is below HTTP_CACHE_EVICT_TO_RATIO of HTTP_CACHE_MAX_BYTES.
+    The entries are scanned without '_cache_lock', so the pages are still recorded during the eviction.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The count of evicted entries
+    '''
+
+    global _cache_size_bytes
+
+    get_cache_size_bytes()
+    with _eviction_lock:
+        entry_files = glob(os.path.join(config.HTTP_CACHE_DIRECTORY, 'entries', '*', '*', '*.json'))
+        entries = []
+        body_references = {}
+        for entry_file in entry_files:
+            try:
+                with open(entry_file, mode='r', encoding='utf-8') as file:
+                    entry = json.load(file)
+                entries.append((os.path.getmtime(entry_file), entry_file, entry['body_hash']))
+            except (OSError, ValueError, KeyError):
+                continue
+            body_references[entry['body_hash']] = body_references.get(entry['body_hash'], 0) + 1
+
+        target_bytes = config.HTTP_CACHE_MAX_BYTES * config.HTTP_CACHE_EVICT_TO_RATIO
+        evicted_count = 0
+        for _, entry_file, body_hash in sorted(entries):
+            with _cache_lock:
+                if _cache_size_bytes <= target_bytes:
+                    break
+            evicted_bytes = 0
+            try:
+                entry_size = os.path.getsize(entry_file)
+                os.remove(entry_file)
+                evicted_bytes += entry_size
+                body_references[body_hash] -= 1
+                if body_references[body_hash] == 0:
+                    body_file = get_body_file(body_hash)
+                    body_size = os.path.getsize(body_file)
+                    os.remove(body_file)
+                    evicted_bytes += body_size
+            except OSError:
+                continue
+            finally:
+                with _cache_lock:
+                    _cache_size_bytes -= evicted_bytes
+            evicted_count += 1
+
+    msg = f'Evict {evicted_count} least recently used entries from the HTTP cache, {_cache_size_bytes} bytes left.'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    return evicted_count
+
+
+def get_replay_as_of():
+    '''Get the replay time HTTP_CACHE_REPLAY_AS_OF as a datetime (in TIME_ZONE), None to replay the latest responses'''
+
+    if config.HTTP_CACHE_REPLAY_AS_OF is None:
+        return None
+    as_of = datetime.fromisoformat(config.HTTP_CACHE_REPLAY_AS_OF)
+    return as_of if as_of.tzinfo is not None else config.TIME_ZONE.localize(as_of)
+
+
+def get_fresh_response(url, page_type):
+    '''Get the cached response of the URL 'url' to serve without the network:
+    -- 'replay' cache mode: the latest response (at HTTP_CACHE_REPLAY_AS_OF)
+    -- 'on' cache mode: the latest response, if it is within the TTL of the page type 'page_type'
+
+    Parameters
+    ----------
+    url: str
+        The URL of the webpage
+    page_type: str
+        The page type, i.e., a key of HTTP_CACHE_TTL_SECONDS
+
+    Returns
+    -------
+    dict
+        The response (see 'get_cached_response'), None if the webpage should be fetched from the network
+    '''
+
+    if config.HTTP_CACHE_MODE == 'replay':
+        return get_cached_response(url, as_of=get_replay_as_of())
+
+    if config.HTTP_CACHE_MODE != 'on' or config.HTTP_CACHE_TTL_SECONDS.get(page_type, 0) <= 0:
+        return None
+
+    cached_response = get_cached_response(url)
+    if cached_response is not None and cached_response['age_seconds'] <= config.HTTP_CACHE_TTL_SECONDS[page_type]:
+        return cached_response
+
+    return None
+
+
+def is_page_type_recorded(page_type):
+    '''Whether the fetched webpages of the page type 'page_type' are recorded, i.e., in the 'on' cache mode and in HTTP_CACHE_RECORD_PAGE_TYPES'''
+
+    return config.HTTP_CACHE_MODE == 'on' and config.HTTP_CACHE_RECORD_PAGE_TYPES.get(page_type, False)
+
+
+def store_browser_page(url, page_type, get_page_source):
+    '''Record the rendered HTML of the URL 'url' loaded by the webbrowser, if its page type 'page_type' is recorded.
+    A failed record is logged as a warning, since the page is already crawled.
+
+    Parameters
+    ----------
+    url: str
+        The URL of the webpage
+    page_type: str
+        The page type, i.e., a key of HTTP_CACHE_RECORD_PAGE_TYPES
+    get_page_source: callable
+        The function to get the rendered HTML, e.g., 'lambda: chrome.page_source', only called if the page is recorded
+
+    Returns
+    -------
+    bool
+        True if the page is recorded, otherwise False
+    '''
+
+    if not is_page_type_recorded(page_type):
+        return False
+
+    try:
+        store_response(url, {'status': 200, 'headers': {'content-type': 'text/html; charset=utf-8'}, 'body': get_page_source(), 'validators': {}}, source='browser')
+    except Exception as e:
+        msg = f'Record \'{url}\' in the HTTP cache failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        return False
+
+    return True
@@ -0,0 +1,163 @@
+'''The HTTPFetcher Module
+
+Summary
+-------
+This module defines functions to fetch webpages by plain HTTP requests, i.e., the browserless path of the crawlers.
+
+A fetch can be conditional: with the validators (ETag/Last-Modified) of the previous response of the URL,
+the request carries 'If-None-Match'/'If-Modified-Since', and the server answers '304 Not Modified' without the body
+if the webpage is unchanged.
+
+A fetch with a page type goes through the on-disk HTTP cache (see 'http_cache.py'): it may be served from the cache
+(within the TTL, or in the 'replay' cache mode), a stale cached response is revalidated by a conditional request,
+and the response is recorded.
+'''
+
+import gzip
+import urllib.request
+import urllib.error
+
+import config
+import metrics
+import http_cache
+
+
+def fetch_url(url, user_agent, validators=None, component='http_fetcher', page_type=None):
+    '''Fetch the webpage at the URL 'url' by an HTTP GET request
+
+    Parameters
+    ----------
+    url: str
+        The URL of the webpage
+    user_agent: str
+        The User-Agent header, e.g., CHROME_DESKTOP_USER_AGENT
+    validators: dict, optional
+        The validators of the previous response of the URL, with (optional) keys 'etag' and 'last_modified'
+        (default is None, i.e., an unconditional request)
+    component: str, optional
+        The component fetching the webpage, to label the 'http_fetch' stage metrics (default is 'http_fetcher')
+    page_type: str, optional
+        The page type (a key of HTTP_CACHE_TTL_SECONDS) to fetch through the HTTP cache (default is None, i.e., not cached)
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- status (200, or 304 if the webpage is not modified since the validators)
+        -- url (the final URL after redirects)
+        -- headers (the dict of response headers, with lower-case names)
+        -- body (the decoded body, None if the status is 304)
+        -- validators (the validators of the response, to send with the next request of the URL)
+
+    Raises
+    ------
+    urllib.error.URLError
+        The request failed, or the response status is neither 200 nor 304 (urllib.error.HTTPError),
+        or no cached response to replay in the 'replay' cache mode
+    '''
+
+    validators = validators or {}
+    if page_type is None or config.HTTP_CACHE_MODE == 'off':
+        return request_url(url, user_agent, validators, component)
+
+    # Served from the cache without the network
+    cached_response = http_cache.get_fresh_response(url, page_type)
+    if cached_response is None and config.HTTP_CACHE_MODE == 'replay':
+        metrics.inc_counter('http_cache_requests_total', labels={'page_type': page_type, 'result': 'replay_miss'})
+        raise urllib.error.URLError(f'No cached response of \'{url}\' to replay.')
+    if cached_response is not None:
+        metrics.inc_counter('http_cache_requests_total', labels={'page_type': page_type, 'result': 'replay' if config.HTTP_CACHE_MODE == 'replay' else 'hit'})
+        return to_caller_response(cached_response, validators)
+
+    # Revalidate the stale cached response, if the caller has no validators
+    cached_response = http_cache.get_cached_response(url)
+    revalidated = not validators.get('etag') and not validators.get('last_modified') and cached_response is not None
+    response = request_url(url, user_agent, cached_response['validators'] if revalidated else validators, component)
+
+    if response['status'] == 304 and revalidated:
+        # the cached body is still valid, record the revalidation as a new fetch (the body is stored once)
+        cached_response['validators'] = response['validators']
+        if http_cache.is_page_type_recorded(page_type):
+            http_cache.store_response(url, cached_response)
+        metrics.inc_counter('http_cache_requests_total', labels={'page_type': page_type, 'result': 'revalidated'})
+        return to_caller_response(cached_response, validators)
+
+    if response['status'] == 200 and http_cache.is_page_type_recorded(page_type):
+        http_cache.store_response(url, response)
+    metrics.inc_counter('http_cache_requests_total', labels={'page_type': page_type, 'result': 'miss'})
+    return response
+
+
+def to_caller_response(cached_response, validators):
+    '''Convert the cached response 'cached_response' to the response of 'fetch_url' for the caller with the validators 'validators',
+    i.e., '304 Not Modified' if the caller's validators match the cached response
+    '''
+
+    not_modified = (
+        (validators.get('etag') and validators['etag'] == cached_response['validators'].get('etag'))
+        or (validators.get('last_modified') and validators['last_modified'] == cached_response['validators'].get('last_modified'))
+    )
+
+    return {
+        'status': 304 if not_modified else 200,
+        'url': cached_response['url'],
+        'headers': cached_response['headers'],
+        'body': None if not_modified else cached_response['body'],
+        'validators': cached_response['validators']
+    }
+
+
+def request_url(url, user_agent, validators, component):
+    '''Fetch the webpage at the URL 'url' by an HTTP GET request over the network, see 'fetch_url' '''
+
+    headers = {
+        'User-Agent': user_agent,
+        'Accept': 'text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9',
+        'Accept-Encoding': 'gzip'
+    }
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    request = urllib.request.Request(url, headers=headers, method='GET')
+    with metrics.timer('http_fetch', component):
+        try:
+            with urllib.request.urlopen(request, timeout=config.HTTP_FETCH_TIMEOUT_SECONDS) as response:
+                status = response.status
+                final_url = response.geturl()
+                response_headers = {name.lower(): value for name, value in response.getheaders()}
+                content = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            status = 304
+            final_url = url
+            response_headers = {name.lower(): value for name, value in e.headers.items()}
+            content = None
+
+    body = None
+    if content is not None:
+        if response_headers.get('content-encoding') == 'gzip':
+            content = gzip.decompress(content)
+        charset = 'utf-8'
+        for param in response_headers.get('content-type', '').split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'charset' and value:
+                charset = value.strip('"')
+        body = content.decode(charset, errors='replace')
+
+    # a 304 response may omit the validators, keep the previous ones
+    response_validators = {
+        'etag': response_headers.get('etag', validators.get('etag') if status == 304 else None),
+        'last_modified': response_headers.get('last-modified', validators.get('last_modified') if status == 304 else None)
+    }
+
+    return {
+        'status': status,
+        'url': final_url,
+        'headers': response_headers,
+        'body': body,
+        'validators': response_validators
+    }
@@ -0,0 +1,303 @@
+'''The JobProfiler Module
+
+Summary
+-------
+This module defines an opt-in profiling surface for jobs, which can be switched on at runtime.
+
+A job function decorated with 'profile_job' is profiled (by cProfile and tracemalloc) if:
+-- its job id is in 'config.JOB_PROFILE_JOB_IDS', e.g., 'comment_crawl_{movie_id}' (see 'config.COMMENT_CRAWL_JOB_ID'), or
+-- it is sampled at the rate 'config.JOB_PROFILE_SAMPLE_RATE'
+The job ids and the sample rate can be changed at runtime by 'enable_job_profiling'/'disable_job_profiling',
+or by editing the control file JOB_PROFILE_CONTROL_FILE, e.g., {"job_ids": ["comment_crawl_35633650"], "sample_rate": 0.01},
+which is checked at most every JOB_PROFILE_CONTROL_POLL_SECONDS seconds.
+
+The profile artifacts of a job are written into JOB_PROFILE_DIRECTORY (next to the log files):
+-- '<date>_<job_id>_<time>.prof': the cProfile stats, readable by 'pstats' or 'snakeviz'
+-- '<date>_<job_id>_<time>.txt': the duration, the top functions by cumulative time and the top allocations
+When profiling is disabled, a decorated job only pays a check of two config values (and a rare stat of the control file).
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+from io import StringIO
+from datetime import datetime
+
+import config
+import util
+
+
+# The modification time of the control file when it was last read, and the time (time.monotonic) of the last check
+_control_file_mtime = None
+_control_file_checked_time = 0.0
+# The count of running profiled jobs using tracemalloc, tracemalloc is stopped when the last one finishes
+_tracemalloc_users = 0
+# The lock to protect '_tracemalloc_users' and the control file state
+_profiler_lock = threading.Lock()
+
+
+def enable_job_profiling(job_ids=None, sample_rate=None):
+    '''Switch on profiling for the jobs with ids in 'job_ids' and/or at the sample rate 'sample_rate'
+
+    Parameters
+    ----------
+    job_ids: iterable, optional
+        The ids of jobs to profile, added to 'config.JOB_PROFILE_JOB_IDS' (default is no change)
+    sample_rate: float, optional
+        The probability to profile any job run, in [0, 1] (default is no change)
+
+    Returns
+    -------
+    None
+    '''
+
+    if job_ids is not None:
+        config.JOB_PROFILE_JOB_IDS = set(config.JOB_PROFILE_JOB_IDS) | set(job_ids)
+    if sample_rate is not None:
+        config.JOB_PROFILE_SAMPLE_RATE = sample_rate
+
+
+def disable_job_profiling():
+    '''Switch off profiling for all jobs
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    config.JOB_PROFILE_JOB_IDS = set()
+    config.JOB_PROFILE_SAMPLE_RATE = 0.0
+
+
+def check_control_file():
+    '''Apply the job ids and sample rate in the control file JOB_PROFILE_CONTROL_FILE, if it is changed since the last check.
+    The file is checked at most every JOB_PROFILE_CONTROL_POLL_SECONDS seconds.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    global _control_file_mtime, _control_file_checked_time
+
+    now = time.monotonic()
+    if now - _control_file_checked_time < config.JOB_PROFILE_CONTROL_POLL_SECONDS:
+        return
+
+    with _profiler_lock:
+        _control_file_checked_time = now
+        try:
+            mtime = os.stat(config.JOB_PROFILE_CONTROL_FILE).st_mtime
+        except OSError:
+            return
+        if mtime == _control_file_mtime:
+            return
+        _control_file_mtime = mtime
+
+        try:
+            with open(config.JOB_PROFILE_CONTROL_FILE, mode='r', encoding='utf-8') as file:
+                control = json.load(file)
+            config.JOB_PROFILE_JOB_IDS = set(control.get('job_ids', []))
+            config.JOB_PROFILE_SAMPLE_RATE = float(control.get('sample_rate', 0.0))
+        except Exception as e:
+            msg = f'Read the job profile control file \'{config.JOB_PROFILE_CONTROL_FILE}\' failed. -- Original Exception -- {e}'
+            log_level = config.LOG_LEVEL_WARNING
+        else:
+            msg = f'Apply the job profile control file: profile jobs {sorted(config.JOB_PROFILE_JOB_IDS)} and sample rate {config.JOB_PROFILE_SAMPLE_RATE}.'
+            log_level = config.LOG_LEVEL_INFO
+
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+
+
+def should_profile(job_id):
+    '''Check whether to profile the run of the job with id 'job_id'
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+
+    Returns
+    -------
+    bool
+        True if the job id is selected or the run is sampled, otherwise False
+    '''
+
+    return job_id in config.JOB_PROFILE_JOB_IDS or (config.JOB_PROFILE_SAMPLE_RATE > 0 and random.random() < config.JOB_PROFILE_SAMPLE_RATE)
+
+
+def profile_job(get_job_id):
+    '''The decorator to profile the runs of a job function when profiling is switched on for the job
+
+    Parameters
+    ----------
+    get_job_id: function
+        The function with the same parameters as the job function, which returns the job id of a run
+
+    Returns
+    -------
+    function
+        The decorator
+    '''
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            check_control_file()
+            # Fast path: profiling is switched off
+            if not config.JOB_PROFILE_JOB_IDS and config.JOB_PROFILE_SAMPLE_RATE <= 0:
+                return func(*args, **kwargs)
+
+            job_id = get_job_id(*args, **kwargs)
+            if not should_profile(job_id):
+                return func(*args, **kwargs)
+
+            return run_profiled(job_id, func, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_tracemalloc():
+    '''Start tracemalloc for a profiled job (shared by concurrently running profiled jobs)'''
+
+    global _tracemalloc_users
+
+    with _profiler_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(config.JOB_PROFILE_TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def stop_tracemalloc():
+    '''Stop tracemalloc after the last running profiled job finishes'''
+
+    global _tracemalloc_users
+
+    with _profiler_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def run_profiled(job_id, func, args, kwargs):
+    '''Run the job function 'func' with cProfile and tracemalloc, and write the profile artifacts of the run
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+    func: function
+        The job function
+    args: tuple
+        The positional arguments of the job function
+    kwargs: dict
+        The keyword arguments of the job function
+
+    Returns
+    -------
+    object
+        The return value of the job function
+    '''
+
+    profiler = cProfile.Profile()
+    start_tracemalloc()
+    snapshot_before = tracemalloc.take_snapshot()
+    start_time = time.perf_counter()
+
+    try:
+        # cProfile only profiles the current thread, i.e., the job run
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already active (only one is allowed since Python 3.12), so only trace memory allocations
+            profiler = None
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        elapsed_seconds = time.perf_counter() - start_time
+        snapshot_after = tracemalloc.take_snapshot()
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        stop_tracemalloc()
+        write_profile_artifacts(job_id, profiler, snapshot_before, snapshot_after, elapsed_seconds, peak_bytes)
+
+
+def write_profile_artifacts(job_id, profiler, snapshot_before, snapshot_after, elapsed_seconds, peak_bytes):
+    '''Write the profile artifacts of a job run into JOB_PROFILE_DIRECTORY
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+    profiler: cProfile.Profile
+        The profiler of the job run, None if the job run is not profiled by cProfile
+    snapshot_before: tracemalloc.Snapshot
+        The tracemalloc snapshot before the job run
+    snapshot_after: tracemalloc.Snapshot
+        The tracemalloc snapshot after the job run
+    elapsed_seconds: float
+        The duration of the job run
+    peak_bytes: int
+        The peak traced memory (of the program) during the job run
+
+    Returns
+    -------
+    None
+    '''
+
+    now = datetime.now(config.TIME_ZONE)
+    file_prefix = os.path.join(config.JOB_PROFILE_DIRECTORY, f'{now.strftime("%Y-%m-%d")}_{job_id}_{now.strftime("%H.%M.%S.%f")}')
+
+    try:
+        os.makedirs(config.JOB_PROFILE_DIRECTORY, exist_ok=True)
+
+        stats_stream = StringIO()
+        if profiler is not None:
+            profiler.dump_stats(file_prefix + '.prof')
+            pstats.Stats(profiler, stream=stats_stream).sort_stats('cumulative').print_stats(config.JOB_PROFILE_TOP_N)
+        else:
+            stats_stream.write('Not profiled by cProfile, since another profiler was active.\n')
+
+        allocation_stats = snapshot_after.compare_to(snapshot_before, 'lineno')[:config.JOB_PROFILE_TOP_N]
+
+        with open(file_prefix + '.txt', mode='w', encoding='utf-8') as file:
+            file.write(f'job_id: {job_id}\n')
+            file.write(f'time: {now.isoformat()}\n')
+            file.write(f'elapsed_seconds: {elapsed_seconds:.3f}\n')
+            file.write(f'peak_traced_memory_bytes: {peak_bytes}\n\n')
+            file.write(f'--- Top {config.JOB_PROFILE_TOP_N} functions by cumulative time ---\n')
+            file.write(stats_stream.getvalue())
+            file.write(f'\n--- Top {config.JOB_PROFILE_TOP_N} allocations (memory growth by line) ---\n')
+            for allocation_stat in allocation_stats:
+                file.write(f'{allocation_stat}\n')
+    except Exception as e:
+        msg = f'Write the profile artifacts of the job with id \'{job_id}\' failed. -- Original Exception -- {e}'
+        log_level = config.LOG_LEVEL_WARNING
+    else:
+        msg = f'Profile the job with id \'{job_id}\' ({elapsed_seconds:.1f} seconds). Profile artifacts saved in \'{file_prefix}.prof/.txt\'.'
+        log_level = config.LOG_LEVEL_INFO
+
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
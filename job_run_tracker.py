@@ -0,0 +1,378 @@
+'''The JobRunTracker Module
+
+Summary
+-------
+This module defines the listener of APScheduler job events, which records the recent runs of each job in a compact rolling store,
+and the summaries of the recorded runs.
+
+For each job id, the latest JOB_RUN_HISTORY_SIZE records are kept, each record is a tuple (end timestamp, outcome, duration in seconds):
+-- 'executed': the run finished
+-- 'error': the run raised an exception
+-- 'missed': the run was not started within the misfire grace time
+-- 'max_instances': the due run was dropped, since the previous run was still running ('max_instances' = 1)
+-- 'coalesced': the due run was silently merged into a later run ('coalesce' = True), since the scheduler or the previous run was late
+The duration is NaN for the runs that did not run.
+The 'max_instances', 'missed' and 'coalesced' runs are overruns, i.e., the job cannot keep up with its schedule.
+
+In the 'queue' comment crawl run mode, the comment crawl queue records the runs of comment crawl jobs in its crawler workers
+under the same job ids, since the scheduled job only puts the movie into the queue, so the listener does not record the enqueue calls
+as their runs, see 'is_run_recorded_by_crawler_worker'.
+
+The coalesced runs are counted between the scheduled run times of two consecutive submitted runs of a job with its current trigger,
+so the latest scheduled run time of a job is forgotten once the job is added (replaced), modified or removed, i.e., its trigger changed.
+
+The overrun rate is fed back to the comment crawl interval, see 'widen_overrunning_interval'.
+'''
+
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from apscheduler.events import (
+    EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_ADDED, EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED
+)
+
+import config
+import util
+
+
+# The outcomes of the runs that are overruns
+OVERRUN_OUTCOMES = ('missed', 'max_instances', 'coalesced')
+
+# The recent run records of each job, job id as key, see the module summary
+_job_runs = {}
+# The start time of each submitted (running) run, (job id, scheduled run time) as key
+_running_job_starts = {}
+# The scheduled run time of the latest submitted run of each job, job id as key, to detect coalesced runs
+_last_scheduled_run_times = {}
+# The (timestamp of the latest adjustment, interval multiplier) of each job, job id as key, see 'widen_overrunning_interval'
+_interval_multipliers = {}
+# The lock to protect the rolling store
+_job_runs_lock = threading.Lock()
+
+
+def record_job_run(job_id, outcome, duration_seconds=float('nan'), end_time=None):
+    '''Record a run of the job with id 'job_id' in the rolling store
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+    outcome: str
+        The outcome of the run, see the module summary
+    duration_seconds: float, optional
+        The duration of the run (default is NaN, i.e., not run)
+    end_time: datetime, optional
+        The time the run ended or was dropped (default is now)
+
+    Returns
+    -------
+    None
+    '''
+
+    end_time = end_time or datetime.now(config.TIME_ZONE)
+    with _job_runs_lock:
+        runs = _job_runs.get(job_id)
+        if runs is None:
+            runs = _job_runs[job_id] = deque(maxlen=config.JOB_RUN_HISTORY_SIZE)
+        runs.append((end_time.timestamp(), outcome, duration_seconds))
+
+
+def count_coalesced_run_times(job, previous_run_time, run_time):
+    '''Count the fire times of the job 'job' strictly between two submitted run times, i.e., the runs silently merged by 'coalesce'
+
+    Parameters
+    ----------
+    job: apscheduler.job.Job
+        The job
+    previous_run_time: datetime
+        The scheduled run time of the previous submitted run
+    run_time: datetime
+        The scheduled run time of the current submitted run
+
+    Returns
+    -------
+    int
+        The count of coalesced runs (at most JOB_RUN_HISTORY_SIZE)
+    '''
+
+    # the scheduled run times include the jitter of the trigger
+    margin = timedelta(seconds=getattr(job.trigger, 'jitter', None) or 0)
+    count = 0
+    fire_time = job.trigger.get_next_fire_time(previous_run_time, previous_run_time + margin + timedelta(microseconds=1))
+    while fire_time is not None and fire_time < run_time - margin and count < config.JOB_RUN_HISTORY_SIZE:
+        count += 1
+        fire_time = job.trigger.get_next_fire_time(fire_time, fire_time + margin + timedelta(microseconds=1))
+
+    return count
+
+
+def is_run_recorded_by_crawler_worker(job_id):
+    '''Whether the runs of the job with id 'job_id' are recorded by the crawler workers instead of the job event listener,
+    i.e., the comment crawl jobs in the 'queue' comment crawl run mode, which only put the movie into the comment crawl queue
+    (see 'comment_crawl_queue.run_comment_crawl_worker')
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+
+    Returns
+    -------
+    bool
+        Whether the runs of the job are recorded by the crawler workers
+    '''
+
+    # e.g., 'comment_crawl_35633650' and 'comment_crawl_slice_35633650'
+    return config.COMMENT_CRAWL_RUN_MODE == 'queue' and job_id.startswith(config.COMMENT_CRAWL_JOB_ID(''))
+
+
+def handle_job_event(bg_scheduler, event):
+    '''Record the run of a job from the APScheduler job event 'event', see 'add_job_run_listener'
+
+    Parameters
+    ----------
+    bg_scheduler: apscheduler.Scheduler
+        The scheduler
+    event: apscheduler.events.JobEvent
+        The job event
+
+    Returns
+    -------
+    None
+    '''
+
+    now = datetime.now(config.TIME_ZONE)
+    # the enqueue call of a comment crawl job in the 'queue' run mode is not its run, which the crawler worker records
+    recorded_by_worker = is_run_recorded_by_crawler_worker(event.job_id)
+
+    if event.code in (EVENT_JOB_SUBMITTED, EVENT_JOB_MAX_INSTANCES):
+        run_time = event.scheduled_run_times[-1]
+        with _job_runs_lock:
+            if event.code == EVENT_JOB_SUBMITTED and not recorded_by_worker:
+                key = (event.job_id, run_time)
+                # the run may already be finished (and recorded) before the submission event is dispatched
+                if _running_job_starts.get(key) is not False:
+                    _running_job_starts[key] = now
+                else:
+                    del _running_job_starts[key]
+            previous_run_time = _last_scheduled_run_times.get(event.job_id)
+            _last_scheduled_run_times[event.job_id] = run_time
+
+        job = bg_scheduler.get_job(event.job_id)
+        if previous_run_time is not None and job is not None:
+            for _ in range(count_coalesced_run_times(job, previous_run_time, run_time)):
+                record_job_run(event.job_id, 'coalesced', end_time=now)
+
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            record_job_run(event.job_id, 'max_instances', end_time=now)
+            msg = f'The due run of the job with id \'{event.job_id}\' is DROPPED, since its previous run is still running.'
+            current_frame = sys._getframe()
+            logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+            util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+            util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+
+    elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+        if recorded_by_worker:
+            return
+
+        with _job_runs_lock:
+            key = (event.job_id, event.scheduled_run_time)
+            start_time = _running_job_starts.pop(key, None)
+            if start_time is None:
+                # mark the run as finished for its (late) submission event
+                _running_job_starts[key] = False
+                start_time = event.scheduled_run_time
+        outcome = 'executed' if event.code == EVENT_JOB_EXECUTED else 'error'
+        record_job_run(event.job_id, outcome, (now - start_time).total_seconds(), end_time=now)
+
+    elif event.code == EVENT_JOB_MISSED:
+        record_job_run(event.job_id, 'missed', end_time=now)
+
+    elif event.code in (EVENT_JOB_ADDED, EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED):
+        # the fire times of the new trigger between the previous scheduled run time and the next one were never due,
+        # e.g., the comment crawl jobs rescheduled by the daily dispatch
+        with _job_runs_lock:
+            _last_scheduled_run_times.pop(event.job_id, None)
+
+
+def add_job_run_listener(bg_scheduler):
+    '''Add the listener of job events to the scheduler 'bg_scheduler', to record the runs of jobs
+
+    Parameters
+    ----------
+    bg_scheduler: apscheduler.Scheduler
+        The scheduler
+
+    Returns
+    -------
+    None
+    '''
+
+    bg_scheduler.add_listener(
+        lambda event: handle_job_event(bg_scheduler, event),
+        EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES |
+        EVENT_JOB_ADDED | EVENT_JOB_MODIFIED | EVENT_JOB_REMOVED
+    )
+
+
+def get_job_runs(job_id):
+    '''Get the recorded runs of the job with id 'job_id'
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+
+    Returns
+    -------
+    list
+        The run records (end timestamp, outcome, duration in seconds), oldest first
+    '''
+
+    with _job_runs_lock:
+        return list(_job_runs.get(job_id, ()))
+
+
+def summarize_runs(runs):
+    '''Summarize the run records 'runs' of a job
+
+    Parameters
+    ----------
+    runs: list
+        The run records (end timestamp, outcome, duration in seconds)
+
+    Returns
+    -------
+    dict
+        The counts of each outcome, the p50/p95/max duration (NaN if no finished run) and the overrun rate (NaN if no run)
+    '''
+
+    outcomes = [outcome for _, outcome, _ in runs]
+    durations = np.array([duration for _, outcome, duration in runs if outcome in ('executed', 'error')], dtype=float)
+    overrun_count = sum(outcome in OVERRUN_OUTCOMES for outcome in outcomes)
+
+    summary = {outcome: outcomes.count(outcome) for outcome in ('executed', 'error') + OVERRUN_OUTCOMES}
+    summary['duration_p50'] = float(np.percentile(durations, 50)) if len(durations) > 0 else float('nan')
+    summary['duration_p95'] = float(np.percentile(durations, 95)) if len(durations) > 0 else float('nan')
+    summary['duration_max'] = float(durations.max()) if len(durations) > 0 else float('nan')
+    summary['overrun_rate'] = overrun_count / len(runs) if runs else float('nan')
+
+    return summary
+
+
+def summarize_job_runs():
+    '''Summarize the recorded runs of all jobs
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    pandas.DataFrame
+        The run summary of each job (see 'summarize_runs'), job id as index,
+        with the 'movie_id' column for the comment crawl (slice) jobs and the movie info crawl jobs
+    '''
+
+    with _job_runs_lock:
+        job_runs = {job_id: list(runs) for job_id, runs in _job_runs.items()}
+
+    summary_df = pd.DataFrame.from_dict({job_id: summarize_runs(runs) for job_id, runs in job_runs.items()}, orient='index')
+    summary_df.index.name = 'job_id'
+    if summary_df.empty:
+        return summary_df
+
+    # e.g., 'comment_crawl_35633650' and 'comment_crawl_slice_35633650'
+    movie_id = summary_df.index.to_series().str.extract(r'^(?:comment_crawl|comment_crawl_slice|movie_info_crawl)_(\d+)$', expand=False)
+    summary_df.insert(0, 'movie_id', pd.to_numeric(movie_id).astype('Int64'))
+
+    return summary_df.sort_index()
+
+
+def save_job_run_summary(csv_file):
+    '''Save the run summary of all jobs to the CSV file 'csv_file'
+
+    Parameters
+    ----------
+    csv_file: str
+        The full path of the CSV file
+
+    Returns
+    -------
+    None
+    '''
+
+    try:
+        summary_df = summarize_job_runs()
+        summary_df.to_csv(csv_file)
+    except Exception as e:
+        msg = f'Save the job run summary to \'{csv_file}\' failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+
+def widen_overrunning_interval(job_id, interval_in_days):
+    '''Widen the crawl interval of the job with id 'job_id' if it keeps overrunning.
+    Each job has an interval multiplier (1 at first), which is adjusted when at least JOB_OVERRUN_MIN_RUNS runs are recorded since its latest adjustment:
+    -- multiplied by JOB_OVERRUN_WIDEN_FACTOR if the overrun rate of the runs is at least JOB_OVERRUN_RATE_THRESHOLD
+    -- divided by JOB_OVERRUN_WIDEN_FACTOR (at least 1) if none of the runs overran, i.e., the job keeps up with its schedule again
+    The multiplier is at most ceiling(MAX_COMMENT_CRAWL_INTERVAL / interval_in_days), since a wider interval is clamped anyway,
+    so a job that overran for a long time narrows back as soon as it keeps up with its schedule.
+
+    Parameters
+    ----------
+    job_id: str
+        The id of the job
+    interval_in_days: int
+        The crawl interval (in days) of the job
+
+    Returns
+    -------
+    int
+        The crawl interval multiplied by the interval multiplier of the job (rounded up)
+    '''
+
+    if not config.JOB_OVERRUN_WIDEN_ENABLED:
+        return interval_in_days
+
+    max_multiplier = max(int(np.ceil(config.MAX_COMMENT_CRAWL_INTERVAL / interval_in_days)), 1)
+    with _job_runs_lock:
+        adjusted_timestamp, multiplier = _interval_multipliers.get(job_id, (float('-inf'), 1))
+        runs = [run for run in _job_runs.get(job_id, ()) if run[0] > adjusted_timestamp]
+    multiplier = min(multiplier, max_multiplier)
+
+    if len(runs) >= config.JOB_OVERRUN_MIN_RUNS:
+        overrun_rate = summarize_runs(runs)['overrun_rate']
+        if overrun_rate >= config.JOB_OVERRUN_RATE_THRESHOLD:
+            next_multiplier = multiplier * config.JOB_OVERRUN_WIDEN_FACTOR
+        elif overrun_rate == 0:
+            next_multiplier = max(multiplier / config.JOB_OVERRUN_WIDEN_FACTOR, 1)
+        else:
+            next_multiplier = multiplier
+        next_multiplier = min(next_multiplier, max_multiplier)
+
+        if next_multiplier != multiplier:
+            with _job_runs_lock:
+                _interval_multipliers[job_id] = (datetime.now(config.TIME_ZONE).timestamp(), next_multiplier)
+
+            msg = (
+                f'{"Widen" if next_multiplier > multiplier else "Narrow"} the interval of the job with id \'{job_id}\' '
+                f'from {int(np.ceil(interval_in_days * multiplier))} to {int(np.ceil(interval_in_days * next_multiplier))} days '
+                f'(overrun rate {overrun_rate:.0%} of the latest {len(runs)} runs).'
+            )
+            current_frame = sys._getframe()
+            logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+            util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+            util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+            multiplier = next_multiplier
+
+    return int(np.ceil(interval_in_days * multiplier))
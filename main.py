@@ -11,13 +11,26 @@ import time
 import config
 import util
 import scheduler
+import comment_crawl_queue
+import data_preprocess_worker
+import comment_crawl_pipeline
+import metrics
+import rating_store
 
 
 def main():
     '''The program start point, containing the following procedures:
     -- startup configuration for program environment
+    -- migrate the legacy rating files into the rating store
     -- configure and start APSchedulers
+    -- start the metrics endpoint, if METRICS_HTTP_ENABLED
+    -- start the data pre-process worker, if in the 'event' data pre-process mode
+    -- start the parse and persist workers of the comment crawl pipeline, if COMMENT_CRAWL_PIPELINE_ENABLED
+    -- start comment crawl workers of each lane, if in the 'queue' comment crawl run mode
     -- schedule daily routine jobs
+    -- schedule the browser reaper job
+    -- schedule the worker autoscaler job, if WORKER_AUTOSCALE_ENABLED
+    -- schedule the metrics snapshot job
     -- schedule data pre-process jobs
     -- schedule movie info crawl jobs
     -- schedule comment crawl jobs
@@ -35,6 +48,9 @@ def main():
     # Program startup configuration
     util.startup_config()
 
+    # Migrate the legacy rating files into the rating store
+    rating_store.migrate_movie_rating_files()
+
     # Configure scheduler
     try:
         config.bg_scheduler = scheduler.start_scheduler()
@@ -47,6 +63,22 @@ def main():
         util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_CRITICAL)
         util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_CRITICAL)
         exit()
+
+    # Start the Prometheus-format metrics endpoint
+    if config.METRICS_HTTP_ENABLED:
+        metrics.start_metrics_server()
+
+    # Start the data pre-process worker to merge newly crawled comment data when comment crawl jobs finish
+    if config.DATA_PREPROCESS_MODE == 'event':
+        data_preprocess_worker.start_data_preprocess_worker()
+
+    # Start the parse and persist workers of the comment crawl pipeline
+    if config.COMMENT_CRAWL_PIPELINE_ENABLED:
+        comment_crawl_pipeline.start_comment_crawl_pipeline()
+
+    # Start comment crawl workers to run comment crawl jobs from the comment crawl queue
+    if config.COMMENT_CRAWL_RUN_MODE == 'queue':
+        comment_crawl_queue.start_comment_crawl_workers()
     
     # Jobs scheduled to run each day in the following order:
     # (1) daily routine jobs: daily maintainance jobs including update log file, update movie list, update comment crawl jobs schedule
@@ -57,6 +89,16 @@ def main():
     # schedule daily routine jobs
     scheduler.schedule_daily_routine_jobs(config.bg_scheduler)
 
+    # schedule the browser reaper job: kill hung or leaked webbrowser processes
+    scheduler.schedule_browser_reaper_job(config.bg_scheduler)
+
+    # schedule the worker autoscaler job: adjust the crawl concurrency from the host load
+    if config.WORKER_AUTOSCALE_ENABLED:
+        scheduler.schedule_worker_autoscaler_job(config.bg_scheduler)
+
+    # schedule the metrics snapshot job: write the metrics snapshot file
+    scheduler.schedule_metrics_snapshot_job(config.bg_scheduler)
+
     # schedule data pre-process jobs
     scheduler.schedule_data_preprocess_jobs(config.bg_scheduler) 
 
@@ -0,0 +1,451 @@
+'''The Metrics Module
+
+Summary
+-------
+This module defines an in-process metrics registry of counters, gauges and histograms,
+exposed through a local Prometheus-format HTTP endpoint and a periodic json snapshot file.
+
+The registered metrics include:
+-- stage_seconds (histogram): the duration of each stage of the crawl pipeline, labeled by 'stage' and 'component'
+    -- stages: browser_launch, page_load, wait_for_element, parse, json_write, json_read, rating_write, http_fetch, merge, csv_update, pipeline_backpressure
+-- jobs_running (gauge), jobs_submitted_total, jobs_failed_total, jobs_misfired_total, jobs_max_instances_total (counters):
+    the APScheduler jobs, see 'add_scheduler_metrics_listener'
+-- comments_merged_total (counter), comment_freshness_lag_seconds (gauge): the comment freshness, see 'freshness_tracker.py'
+-- the gauges registered by other modules with 'register_gauge_callback', e.g., the queued comment crawl jobs and the running webbrowsers
+All metric names are prefixed with METRICS_PREFIX in the Prometheus format.
+'''
+
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from apscheduler.events import (
+    EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+)
+
+import config
+import util
+
+
+# The help text and type of known metrics, metric name as key
+METRIC_DESCRIPTIONS = {
+    'stage_seconds': ('histogram', 'The duration in seconds of each stage of the crawl pipeline'),
+    'pages_fetched_total': ('counter', 'The count of webpages fetched'),
+    'jobs_running': ('gauge', 'The count of running APScheduler jobs'),
+    'jobs_submitted_total': ('counter', 'The count of APScheduler job runs submitted to executors'),
+    'jobs_failed_total': ('counter', 'The count of APScheduler job runs raising an exception'),
+    'jobs_misfired_total': ('counter', 'The count of APScheduler job runs missed (misfired)'),
+    'jobs_max_instances_total': ('counter', 'The count of APScheduler job runs skipped by the maximum running instances'),
+    'comment_crawl_jobs': ('gauge', 'The count of queued and running comment crawl jobs of each lane of the comment crawl queue'),
+    'browsers_running': ('gauge', 'The count and RSS of the running webbrowsers tracked by the browser supervisor'),
+    'comment_crawl_pipeline_pages': ('gauge', 'The count of comment pages waiting in the parse and persist queues of the comment crawl pipeline'),
+    'data_preprocess_queue': ('gauge', 'The count of movies waiting in the data pre-process queue to merge their newly crawled comment data'),
+    'comments_merged_total': ('counter', 'The count of comments first merged into the merged comment data of each movie'),
+    'comment_freshness_lag_seconds': ('gauge', 'The lag in seconds between posting and crawling/merging the comments of each movie in the latest merge'),
+    'http_cache_requests_total': ('counter', 'The count of webpage fetches through the HTTP cache, by page type and result (hit, miss, revalidated, replay, replay_miss)')
+}
+
+# The counters and gauges, metric name as key, each value is a dict with the labels (a sorted tuple of (key, value)) as key
+_counters = {}
+_gauges = {}
+# The histograms, metric name as key, each value is a dict with the labels as key and a dict as value with keys:
+# -- bucket_counts: the count of observations in each bucket of METRICS_HISTOGRAM_BUCKETS (not cumulative), plus the '+Inf' bucket
+# -- sum: the sum of observations
+# -- count: the count of observations
+_histograms = {}
+# The gauge callbacks, metric name as key, each callback returns a list of (labels dict, value)
+_gauge_callbacks = {}
+# The lock to protect the metrics
+_metrics_lock = threading.Lock()
+# The HTTP server of the Prometheus-format endpoint
+_metrics_server = None
+
+
+def to_label_key(labels):
+    '''Convert the labels dict 'labels' to a hashable key, i.e., a sorted tuple of (key, value)'''
+
+    return tuple(sorted((labels or {}).items()))
+
+
+def inc_counter(name, value=1, labels=None):
+    '''Increase the counter 'name' with labels 'labels' by 'value'
+
+    Parameters
+    ----------
+    name: str
+        The metric name
+    value: float, optional
+        The increment (default is 1)
+    labels: dict, optional
+        The labels of the metric (default is no label)
+
+    Returns
+    -------
+    None
+    '''
+
+    label_key = to_label_key(labels)
+    with _metrics_lock:
+        counter = _counters.setdefault(name, {})
+        counter[label_key] = counter.get(label_key, 0) + value
+
+
+def set_gauge(name, value, labels=None):
+    '''Set the gauge 'name' with labels 'labels' to 'value'
+
+    Parameters
+    ----------
+    name: str
+        The metric name
+    value: float
+        The value
+    labels: dict, optional
+        The labels of the metric (default is no label)
+
+    Returns
+    -------
+    None
+    '''
+
+    with _metrics_lock:
+        _gauges.setdefault(name, {})[to_label_key(labels)] = value
+
+
+def inc_gauge(name, value=1, labels=None):
+    '''Increase (or decrease with a negative 'value') the gauge 'name' with labels 'labels' by 'value'
+
+    Parameters
+    ----------
+    name: str
+        The metric name
+    value: float, optional
+        The increment (default is 1)
+    labels: dict, optional
+        The labels of the metric (default is no label)
+
+    Returns
+    -------
+    None
+    '''
+
+    label_key = to_label_key(labels)
+    with _metrics_lock:
+        gauge = _gauges.setdefault(name, {})
+        gauge[label_key] = gauge.get(label_key, 0) + value
+
+
+def observe(name, value, labels=None):
+    '''Observe the value 'value' in the histogram 'name' with labels 'labels'
+
+    Parameters
+    ----------
+    name: str
+        The metric name
+    value: float
+        The observed value
+    labels: dict, optional
+        The labels of the metric (default is no label)
+
+    Returns
+    -------
+    None
+    '''
+
+    label_key = to_label_key(labels)
+    # the index of the first bucket with upper bound >= value, len(buckets) means the '+Inf' bucket
+    bucket_index = bisect.bisect_left(config.METRICS_HISTOGRAM_BUCKETS, value)
+    with _metrics_lock:
+        histogram = _histograms.setdefault(name, {})
+        if label_key not in histogram:
+            histogram[label_key] = {'bucket_counts': [0] * (len(config.METRICS_HISTOGRAM_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+        series = histogram[label_key]
+        series['bucket_counts'][bucket_index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+
+@contextmanager
+def timer(stage, component):
+    '''Measure the duration of the 'with' block as an observation of the histogram 'stage_seconds', also if the block raises
+
+    Parameters
+    ----------
+    stage: str
+        The stage of the crawl pipeline, e.g., 'page_load'
+    component: str
+        The component running the stage, e.g., 'comment_crawler'
+    '''
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_seconds', time.perf_counter() - start_time, {'stage': stage, 'component': component})
+
+
+def register_gauge_callback(name, callback):
+    '''Register the callback 'callback' to get the values of the gauge 'name' when the metrics are collected
+
+    Parameters
+    ----------
+    name: str
+        The metric name
+    callback: function
+        The callback without parameters, which returns a list of (labels dict, value)
+
+    Returns
+    -------
+    None
+    '''
+
+    with _metrics_lock:
+        _gauge_callbacks[name] = callback
+
+
+def collect_metrics():
+    '''Collect a copy of all metrics, including the gauges of the registered callbacks
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    dict
+        A dict with keys 'counters', 'gauges' and 'histograms', each value is a dict with metric name as key
+        and a dict with the labels (a sorted tuple of (key, value)) as key
+    '''
+
+    with _metrics_lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        gauges = {name: dict(series) for name, series in _gauges.items()}
+        histograms = {
+            name: {label_key: {'bucket_counts': list(s['bucket_counts']), 'sum': s['sum'], 'count': s['count']} for label_key, s in series.items()}
+            for name, series in _histograms.items()
+        }
+        gauge_callbacks = dict(_gauge_callbacks)
+
+    for name, callback in gauge_callbacks.items():
+        try:
+            gauges[name] = {to_label_key(labels): value for labels, value in callback()}
+        except Exception:
+            # a failing callback must not break the metrics endpoint
+            pass
+
+    return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+def format_labels(label_key, extra_labels=()):
+    '''Format the labels (a sorted tuple of (key, value)) in the Prometheus format, e.g., '{stage="parse"}' '''
+
+    labels = list(label_key) + list(extra_labels)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value)}"' for key, value in labels) + '}'
+
+
+def render_prometheus():
+    '''Render all metrics in the Prometheus text exposition format
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    str
+        The metrics text
+    '''
+
+    metrics = collect_metrics()
+    lines = []
+
+    def add_header(name, metric_type):
+        full_name = config.METRICS_PREFIX + name
+        help_text = METRIC_DESCRIPTIONS.get(name, (metric_type, name))[1]
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {metric_type}')
+        return full_name
+
+    for metric_type, series_by_name in (('counter', metrics['counters']), ('gauge', metrics['gauges'])):
+        for name, series in sorted(series_by_name.items()):
+            full_name = add_header(name, metric_type)
+            for label_key, value in sorted(series.items()):
+                lines.append(f'{full_name}{format_labels(label_key)} {value}')
+
+    for name, series in sorted(metrics['histograms'].items()):
+        full_name = add_header(name, 'histogram')
+        for label_key, s in sorted(series.items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(config.METRICS_HISTOGRAM_BUCKETS + ['+Inf'], s['bucket_counts']):
+                cumulative_count += bucket_count
+                lines.append(f'{full_name}_bucket{format_labels(label_key, [("le", upper_bound)])} {cumulative_count}')
+            lines.append(f'{full_name}_sum{format_labels(label_key)} {s["sum"]}')
+            lines.append(f'{full_name}_count{format_labels(label_key)} {s["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def get_metrics_snapshot():
+    '''Get a json-serializable snapshot of all metrics, with the mean of each histogram
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- time: the (UTC) time of the snapshot, in ISO format
+        -- counters, gauges: a dict with metric name as key, each value is a list of dicts with keys 'labels' and 'value'
+        -- histograms: a dict with metric name as key, each value is a list of dicts with keys 'labels', 'count', 'sum', 'mean' and 'buckets'
+    '''
+
+    metrics = collect_metrics()
+
+    snapshot = {'time': datetime.now(config.TIME_ZONE).isoformat(), 'counters': {}, 'gauges': {}, 'histograms': {}}
+    for kind in ('counters', 'gauges'):
+        for name, series in metrics[kind].items():
+            snapshot[kind][name] = [{'labels': dict(label_key), 'value': value} for label_key, value in series.items()]
+    for name, series in metrics['histograms'].items():
+        snapshot['histograms'][name] = [
+            {
+                'labels': dict(label_key),
+                'count': s['count'],
+                'sum': s['sum'],
+                'mean': s['sum'] / s['count'] if s['count'] > 0 else None,
+                'buckets': dict(zip([str(upper_bound) for upper_bound in config.METRICS_HISTOGRAM_BUCKETS] + ['+Inf'], s['bucket_counts']))
+            }
+            for label_key, s in series.items()
+        ]
+
+    return snapshot
+
+
+def write_metrics_snapshot():
+    '''Write the snapshot of all metrics into the json file 'config.METRICS_SNAPSHOT_FILE' (replaced atomically).
+    This function is scheduled as the metrics snapshot job, see 'scheduler.schedule_metrics_snapshot_job'.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    '''
+
+    temp_file = config.METRICS_SNAPSHOT_FILE + '.tmp'
+    try:
+        with open(temp_file, mode='w', encoding='utf-8') as file:
+            json.dump(get_metrics_snapshot(), file, indent=4, ensure_ascii=False)
+        os.replace(temp_file, config.METRICS_SNAPSHOT_FILE)
+    except Exception as e:
+        msg = f'Write the metrics snapshot file \'{config.METRICS_SNAPSHOT_FILE}\' failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    '''The HTTP request handler of the Prometheus-format endpoint, serving GET /metrics'''
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # no access log in the terminal/console
+        pass
+
+
+def start_metrics_server(host=None, port=None):
+    '''Start the Prometheus-format HTTP endpoint 'http://host:port/metrics' in a daemon thread
+
+    Parameters
+    ----------
+    host: str, optional
+        The host to listen on (default is METRICS_HTTP_HOST)
+    port: int, optional
+        The port to listen on (default is METRICS_HTTP_PORT)
+
+    Returns
+    -------
+    http.server.ThreadingHTTPServer
+        The HTTP server, None if the server cannot be started
+    '''
+
+    global _metrics_server
+
+    host = config.METRICS_HTTP_HOST if host is None else host
+    port = config.METRICS_HTTP_PORT if port is None else port
+
+    try:
+        _metrics_server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except Exception as e:
+        msg = f'Start the metrics endpoint on \'{host}:{port}\' failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return None
+
+    threading.Thread(target=_metrics_server.serve_forever, name='metrics_server', daemon=True).start()
+
+    msg = f'Start the metrics endpoint \'http://{host}:{_metrics_server.server_address[1]}/metrics\'.'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+    return _metrics_server
+
+
+def handle_scheduler_event(event):
+    '''Update the job metrics from the APScheduler job event 'event', see 'add_scheduler_metrics_listener' '''
+
+    if event.code == EVENT_JOB_SUBMITTED:
+        inc_counter('jobs_submitted_total')
+        inc_gauge('jobs_running')
+    elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+        inc_gauge('jobs_running', -1)
+        if event.code == EVENT_JOB_ERROR:
+            inc_counter('jobs_failed_total')
+    elif event.code == EVENT_JOB_MISSED:
+        inc_counter('jobs_misfired_total')
+    elif event.code == EVENT_JOB_MAX_INSTANCES:
+        inc_counter('jobs_max_instances_total')
+
+
+def add_scheduler_metrics_listener(bg_scheduler):
+    '''Add the listener of job events to the scheduler 'bg_scheduler', to update the job metrics
+
+    Parameters
+    ----------
+    bg_scheduler: apscheduler.Scheduler
+        The scheduler
+
+    Returns
+    -------
+    None
+    '''
+
+    set_gauge('jobs_running', 0)
+    bg_scheduler.add_listener(
+        handle_scheduler_event,
+        EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+    )
@@ -12,8 +12,10 @@ from datetime import datetime
 import config
 import movie_info_crawler
 import movie_list_manager
+import job_profiler
 
 
+@job_profiler.profile_job(lambda: 'movie_info_crawl_job')
 def dispatch_crawl_movie_info():
     '''Dispatch the crawl_movie_info job for all movies.    
     
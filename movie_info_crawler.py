@@ -3,17 +3,22 @@
 Summary
 -------
 This module defines functions to crawl and parse basic information and aggregate rating of a movie/TV-series.
+
+The movie webpage is fetched by the movie info fetch mode MOVIE_INFO_FETCH_MODE:
+-- 'browser': loaded and parsed in the webbrowser
+-- 'conditional': fetched by a conditional HTTP request (with the ETag/Last-Modified of the previous fetch) and parsed without the webbrowser
+    (see 'crawl_movie_info_browserless'), falling back to the webbrowser if the fetch or the parse fails
+The movie info is only written if its content hash changes (see 'save_movie_info'),
+and the rating history is run-length encoded (see 'rating_store.append_movie_rating').
 '''
 
 import os
 import sys
 import json
+import hashlib
 from datetime import datetime
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as ExpectedConditions
-from selenium.webdriver.support.wait import WebDriverWait
 #from selenium.webdriver.chrome.service import Service as ChromeService
 #from webdriver_manager.chrome import ChromeDriverManager
 #from selenium.common.exceptions import TimeoutException
@@ -22,6 +27,219 @@ from selenium.webdriver.support.wait import WebDriverWait
 
 import config
 import util
+import page_load_profile
+import browser_supervisor
+import metrics
+import rating_store
+import html_tree
+import http_fetcher
+import http_cache
+
+
+def hash_movie_info(movie_info):
+    '''Get the content hash of the movie info dict 'movie_info' (independent of the key order)'''
+
+    content = json.dumps(movie_info, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def save_movie_info(movie_id, movie_info):
+    '''Save the movie info dict 'movie_info' of the movie with id 'movie_id' as a json file, if its content changes
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    movie_info: dict
+        The crawled movie info
+
+    Returns
+    -------
+    bool
+        True if the json file is written, False if the content is unchanged
+    '''
+
+    file_name = f'{movie_id}_movie_info.json'
+    output_file = os.path.join(config.MOVIE_INFO_DIRECTORY, file_name)
+
+    # the hash of the saved movie info, from the json file at the first save of the program run
+    content_hash = hash_movie_info(movie_info)
+    if movie_id not in config.movie_info_hashes and os.path.isfile(output_file):
+        with open(output_file, mode='r', encoding='utf-8') as file:
+            config.movie_info_hashes[movie_id] = hash_movie_info(json.load(file))
+    if config.movie_info_hashes.get(movie_id) == content_hash:
+        return False
+
+    with metrics.timer('json_write', 'movie_info_crawler'), open(output_file, mode='w', encoding='utf-8') as file:
+        json.dump(movie_info, file, indent=4, ensure_ascii=False)
+    config.movie_info_hashes[movie_id] = content_hash
+
+    return True
+
+
+def save_movie_rating(movie_id, rating):
+    '''Record the crawled rating of the movie with id 'movie_id' (of today) and append it to the rating store
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    rating: dict
+        The crawled rating, see 'rating_store.to_rating_record'
+
+    Returns
+    -------
+    bool
+        True if the rating store is written, False if the rating of today is already stored
+    '''
+
+    date = datetime.now(config.TIME_ZONE).strftime("%Y-%m-%d")
+    # record the rating count, used by the comment crawl probe
+    config.movie_rating_counts[movie_id] = {
+        'date': date,
+        'rating_count': int(rating['count'] or 0)
+    }
+
+    # append the rating of today to the rating history of the movie
+    with metrics.timer('rating_write', 'movie_info_crawler'):
+        return rating_store.append_movie_rating(movie_id, date, rating)
+
+
+def parse_movie_page_html(movie_id, html, crawl_rating_only):
+    '''Parse the movie info and rating from the HTML of the movie webpage, without the webbrowser.
+    The data are the same as crawled by 'crawl_movie_info' from the live webpage.
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series
+    html: str
+        The HTML of the movie webpage
+    crawl_rating_only: bool
+        The flag indecating whether to parse rating only
+
+    Returns
+    -------
+    tuple
+        (the movie info dict, None if 'crawl_rating_only' is True, the rating dict)
+    '''
+
+    root = html_tree.build_tree(html)
+    content_elem = html_tree.find_element(root, tag='div', attrs={'id': 'content'})
+
+    elem = html_tree.find_element(root, tag='script', attrs={'type': 'application/ld+json'})
+    # allow control characters (e.g., tabs) in the strings of the description
+    json_data = json.loads(html_tree.get_element_raw_text(elem).replace('\n', ''), strict=False)
+
+    movie_info = None
+    if not crawl_rating_only:
+        movie_info = {
+            'id': movie_id,
+            'url': config.MOVIE_INFO_URL.format(movie_id=movie_id),
+            'title': json_data['name'],
+            'type': json_data['@type'],
+            'year': html_tree.get_element_text(html_tree.find_element(content_elem, tag='span', class_name='year')),
+            'release_date': [html_tree.get_element_text(e) for e in html_tree.find_elements(content_elem, tag='span', attrs={'property': 'v:initialReleaseDate'})],
+            'genre': [html_tree.get_element_text(e) for e in html_tree.find_elements(content_elem, tag='span', attrs={'property': 'v:genre'})]
+        }
+        rating_start_date = None
+        if int(json_data['aggregateRating']['ratingCount']) > 0:
+            rating_start_date = datetime.now(config.TIME_ZONE).strftime("%Y-%m-%d")
+        movie_info['rating_start_date'] = rating_start_date
+        movie_info['summary'] = html_tree.get_element_text(html_tree.find_element(content_elem, tag='span', attrs={'property': 'v:summary'}))
+        for key, json_key in (('director', 'director'), ('writer', 'author'), ('cast', 'actor')):
+            movie_info[key] = [{'name': item['name'], 'url': config.DOUBAN_MOVIE_BASE_URL + item['url']} for item in json_data[json_key]]
+
+    rating = {
+        'avg': json_data['aggregateRating']['ratingValue'],
+        'count': json_data['aggregateRating']['ratingCount']
+    }
+    if int(rating['count']) > 0:
+        weight_elem = html_tree.find_element(content_elem, tag='div', class_name='ratings-on-weight')
+        item_elems = [e for e in html_tree.find_elements(weight_elem, tag='div', class_name='item')]
+        item_elems.reverse()
+        rating['rating_weight'] = {
+            f'{i}_star': html_tree.get_element_text(html_tree.find_element(item_elems[i - 1], tag='span', class_name='rating_per'))
+            for i in range(1, 6)
+        }
+
+    return movie_info, rating
+
+
+def crawl_movie_info_browserless(movie_id, crawl_rating_only):
+    '''Crawl movie information and aggregate rating of a movie/TV-series webpage without the webbrowser, in the 'conditional' fetch mode:
+    -- fetch the webpage by a conditional HTTP request with the validators (ETag/Last-Modified) of the previous fetch
+    -- the webpage is not modified (304): the movie info is unchanged, and the last stored rating is stored again for today
+    -- otherwise: parse the movie info and rating from the HTML, and save them
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie/TV-series to crawl info
+    crawl_rating_only: bool
+        The flag indecating whether to crawl rating only
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- rating_start_date (see 'crawl_movie_info')
+        -- not_modified (True if the webpage is not modified since the previous fetch)
+        None if the fetch or the parse failed, i.e., the webbrowser should crawl the webpage
+    '''
+
+    url = config.MOVIE_INFO_URL.format(movie_id=movie_id)
+    # only the rating probe is conditional for the caller: the full crawl needs the body to save the movie info,
+    # which is still revalidated by the HTTP cache without downloading an unchanged webpage
+    validators = config.movie_page_validators.get(movie_id) if crawl_rating_only else None
+
+    try:
+        response = http_fetcher.fetch_url(url, config.CHROME_DESKTOP_USER_AGENT, validators, component='movie_info_crawler', page_type='movie_info')
+
+        last_rating = rating_store.get_last_movie_rating(movie_id) if response['status'] == 304 else None
+        if response['status'] == 304 and last_rating is not None:
+            # unchanged, extend the rating run to today
+            rating = {
+                'avg': '' if last_rating['avg'] != last_rating['avg'] else f'{last_rating["avg"]:.1f}',
+                'count': str(last_rating['count'])
+            }
+            if last_rating['count'] > 0:
+                rating['rating_weight'] = {column: f'{last_rating[column]:.1f}%' for column in rating_store.RATING_WEIGHT_COLUMNS}
+            movie_info = None
+        elif response['status'] == 304: # no stored rating to repeat, fetch unconditionally
+            response = http_fetcher.fetch_url(url, config.CHROME_DESKTOP_USER_AGENT, component='movie_info_crawler', page_type='movie_info')
+
+        if response['status'] == 200:
+            with metrics.timer('parse', 'movie_info_crawler'):
+                movie_info, rating = parse_movie_page_html(movie_id, response['body'], crawl_rating_only)
+
+        info_written = save_movie_info(movie_id, movie_info) if movie_info is not None else False
+        save_movie_rating(movie_id, rating)
+        config.movie_page_validators[movie_id] = response['validators']
+
+    except Exception as e:
+        fallback = 'no fallback in the replay cache mode' if config.HTTP_CACHE_MODE == 'replay' else 'fall back to the webbrowser'
+        msg = f'Crawl movie info from \'{url}\' without the webbrowser failed, {fallback}. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        util.log(msg, config.MOVIE_INFO_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+        return None
+
+    not_modified = response['status'] == 304
+    if not_modified:
+        msg = f'Crawl movie info from \'{url}\' successfully (not modified).'
+    else:
+        msg = f'Crawl movie info from \'{url}\' successfully (without the webbrowser{"" if info_written or crawl_rating_only else ", movie info unchanged"}).'
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+    util.log(msg, config.MOVIE_INFO_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+    rating_start_date = None
+    if not crawl_rating_only and int(rating['count'] or 0) > 0:
+        rating_start_date = datetime.now(config.TIME_ZONE).strftime("%Y-%m-%d")
+    return {'rating_start_date': rating_start_date, 'not_modified': not_modified}
 
 
 def crawl_movie_info(movie_id, crawl_rating_only):
@@ -44,19 +262,25 @@ def crawl_movie_info(movie_id, crawl_rating_only):
     movie_info = {
         'id': movie_id
     }
-    movie_rating = {}  
 
     # Initialize the return dict
     rating_start_date = None
+
+    # Crawl without the webbrowser first, in the 'conditional' fetch mode or if the webpage can be served from the HTTP cache
+    # (only from the HTTP cache in the 'replay' cache mode)
+    if (
+        config.MOVIE_INFO_FETCH_MODE == 'conditional' or config.HTTP_CACHE_MODE == 'replay'
+        or http_cache.get_fresh_response(config.MOVIE_INFO_URL.format(movie_id=movie_id), 'movie_info') is not None
+    ):
+        results = crawl_movie_info_browserless(movie_id, crawl_rating_only)
+        if results is not None:
+            return results['rating_start_date']
+        if config.HTTP_CACHE_MODE == 'replay':
+            return rating_start_date
     
-    # Set up Chrome options
-    chrome_options = webdriver.ChromeOptions()
-    # headless mode: no webbrowser GUI
-    chrome_options.add_argument('--headless')
-    # log-level=3: less Selenium log information (to be displayed in the terminal/console)
-    chrome_options.add_argument('--log-level=3')
+    # Set up Chrome options with the page-load profile of movie pages
     # desktop browser user-agent: to access douban.com
-    chrome_options.add_argument(f'--user-agent={config.CHROME_DESKTOP_USER_AGENT}')
+    chrome_options = page_load_profile.create_chrome_options('movie_info', config.CHROME_DESKTOP_USER_AGENT)
 
     # Get URL of the comment page to be crawled
     url = config.MOVIE_INFO_URL.format(movie_id=movie_id)
@@ -77,12 +301,22 @@ def crawl_movie_info(movie_id, crawl_rating_only):
 
     # Open a Chrome webbrowser instance
     #chrome = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=chrome_options)
-    chrome = webdriver.Chrome(options=chrome_options)
+    # The webbrowser is tracked by the browser supervisor, which kills it if it hangs or leaks
+    try:
+        chrome = browser_supervisor.launch_chrome(chrome_options, f'movie info crawl job for movie with id \'{movie_id}\'')
+    except Exception as e:
+        msg = f'Crawl movie info from \'{url}\' failed. The movie info crawl job for movie with id \'{movie_id}\' was CANCELLED! -- Launch webbrowser failed -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.MOVIE_INFO_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.MOVIE_INFO_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        return rating_start_date
 
     try:        
-        # Open the webpage to crawl movie data        
-        chrome.get(url)    
-        # Wait for a maximum of CHROME_WAIT_SECONDS_MOVIE_INFO seconds to load the movie info block
+        # Open the webpage to crawl movie data
+        # Wait for a maximum of CHROME_WAIT_SECONDS_MOVIE_INFO seconds (or the 'wait_seconds' of the page-load profile) to load the movie info block
         # Raise a TimeoutException, if no element is found in that time (i.e., load movie info FAIL)
         # The movid info block is <div id="content"> ... </div>
         #     Refer to the following files:
@@ -91,8 +325,7 @@ def crawl_movie_info(movie_id, crawl_rating_only):
         #         './webpage_sample/TVseries-page-WITH-rating-sample-SIMPLIFIED.html'
         #         './webpage_sample/TVseries-page-WITHOUT-rating-sample-SIMPLIFIED.html'
         
-        chrome_wait = WebDriverWait(chrome, config.CHROME_WAIT_SECONDS_MOVIE_INFO)        
-        chrome_wait.until(ExpectedConditions.presence_of_element_located((By.ID, 'content')))        
+        page_load_profile.load_page(chrome, 'movie_info', url, '#content', config.CHROME_WAIT_SECONDS_MOVIE_INFO)
 
 
         #???   
@@ -164,10 +397,8 @@ def crawl_movie_info(movie_id, crawl_rating_only):
                 cast_list.append(cast)
             movie_info['cast'] = cast_list
 
-            file_name = f'{movie_id}_movie_info.json'
-            output_file = os.path.join(config.MOVIE_INFO_DIRECTORY, file_name)
-            with open(output_file, mode='w', encoding='utf-8') as file:
-                json.dump(movie_info, file, indent=4, ensure_ascii=False)
+            # only written if the movie info changes
+            save_movie_info(movie_id, movie_info)
         
         # crawl rating
         rating_count = json_data['aggregateRating']['ratingCount']
@@ -189,12 +420,10 @@ def crawl_movie_info(movie_id, crawl_rating_only):
                 i += 1           
             rating['rating_weight'] = rating_weight
 
-        date = datetime.now(config.TIME_ZONE).strftime("%Y-%m-%d")
-        movie_rating[date] = rating
-        file_name = f'{movie_id}_movie_rating.json'
-        output_file = os.path.join(config.MOVIE_INFO_DIRECTORY, file_name)
-        with open(output_file, mode='a', encoding='utf-8') as file:
-            json.dump(movie_rating, file, indent=4, ensure_ascii=False)       
+        save_movie_rating(movie_id, rating)
+
+        # record the rendered webpage in the HTTP cache after the data is saved, e.g., for the next fetch within the TTL and the replay
+        http_cache.store_browser_page(url, 'movie_info', lambda: chrome.page_source)
  
     except Exception as e:
         # Log the exception and error msg
@@ -215,7 +444,7 @@ def crawl_movie_info(movie_id, crawl_rating_only):
         util.log(msg, config.MOVIE_INFO_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
         #print(e)
     finally:
-        chrome.quit() # Exit the webbrowser
+        browser_supervisor.quit_chrome(chrome) # Exit the webbrowser
     
     return rating_start_date
 
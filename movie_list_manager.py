@@ -12,6 +12,7 @@ import pandas as pd
 
 import config
 import util
+import metrics
 
 
 def normalize_movie_list_df(df, update=False):
@@ -167,7 +168,8 @@ def update_movie_list(df, csv_file, update_csv_file):
 
     # save updates to the original file
     try:
-        update_df.to_csv(csv_file)
+        with metrics.timer('csv_update', 'movie_list_manager'):
+            update_df.to_csv(csv_file)
     except Exception as e:
         msg = f'Save updates to movie list file \'{csv_file}\' failed. The updates are DISCARDED! -- Original Exception -- {e}'
         current_frame = sys._getframe()
@@ -224,7 +226,8 @@ def update_movie_total_comment_count(df, csv_file, movie_id, total_comment_count
 
     # Save the update to the CSV movie_list file
     try:
-        df.to_csv(csv_file)
+        with metrics.timer('csv_update', 'movie_list_manager'):
+            df.to_csv(csv_file)
     except Exception as e:
         # ?????
         msg = f'Save the updated \'last_crawl_total_comment_count\' with value \'{total_comment_count}\' of movie with id \'{movie_id}\' to movie list file \'{csv_file}\' failed. The update is DISCARDED! -- Original Exception -- {e}'
@@ -267,7 +270,8 @@ def update_movie_rating_start_info(df, csv_file, movie_id, rating_start_date):
 
     # Save the update to the CSV movie_list file
     try:
-        df.to_csv(csv_file)
+        with metrics.timer('csv_update', 'movie_list_manager'):
+            df.to_csv(csv_file)
     except Exception as e:
         # ?????
         msg = f'Save the updated \'rating_start_date\' and \'have_rates\' of movie with id \'{movie_id}\' to movie list file \'{csv_file}\' failed. The update is DISCARDED! -- Original Exception -- {e}'
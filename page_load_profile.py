@@ -0,0 +1,267 @@
+'''The PageLoadProfile Module
+
+Summary
+-------
+This module defines functions to load webpages with lightweight page-load profiles, one profile per page type
+(see 'config.PAGE_LOAD_PROFILES'), and to record the transferred bytes and latency of each page fetch.
+
+A page-load profile:
+-- uses the 'eager' page load strategy, i.e., 'get' returns when the DOM is ready instead of waiting for all subresources
+-- blocks non-essential resource types (images, fonts, stylesheets, media) and third-party (ads/analytics/tracking) hosts
+    via DevTools request blocking ('Network.setBlockedURLs')
+-- waits for the readiness predicate of the page type, i.e., the elements the crawler parses, with a short poll interval
+If PAGE_LOAD_PROFILE_ENABLED is False, pages are loaded in full and the crawlers wait for their default readiness elements.
+'''
+
+import os
+import csv
+import sys
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.wait import WebDriverWait
+
+import config
+import util
+import metrics
+
+
+# The columns of the page load stats CSV file
+PAGE_LOAD_STATS_COLUMNS = ['time', 'page_type', 'profile_enabled', 'url', 'latency_seconds', 'transfer_bytes', 'resource_count']
+
+# The JavaScript to sum the transferred bytes of the document and all its (loaded) subresources
+_MEASURE_TRANSFER_SCRIPT = '''
+const navigation = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+let transferBytes = navigation ? navigation.transferSize : 0;
+for (const resource of resources) {
+    transferBytes += resource.transferSize || 0;
+}
+return [transferBytes, resources.length];
+'''
+
+# The lock to protect the page load stats CSV file, which is appended by concurrent crawl jobs
+_page_load_stats_lock = threading.Lock()
+# The latency (seconds) of the recent page fetches, used by the worker autoscaler, see 'pop_recent_page_load_latencies'
+_recent_page_load_latencies = deque(maxlen=1000)
+
+
+def create_chrome_options(page_type, user_agent):
+    '''Create the Chrome options to load pages of the page type 'page_type'
+
+    Parameters
+    ----------
+    page_type: str
+        The page type, i.e., a key of 'config.PAGE_LOAD_PROFILES'
+    user_agent: str
+        The User-Agent of the webbrowser
+
+    Returns
+    -------
+    selenium.webdriver.ChromeOptions
+        The Chrome options
+    '''
+
+    chrome_options = webdriver.ChromeOptions()
+    # headless mode: no webbrowser GUI
+    chrome_options.add_argument('--headless')
+    # log-level=3: less Selenium log information (to be displayed in the terminal/console)
+    chrome_options.add_argument('--log-level=3')
+    chrome_options.add_argument(f'--user-agent={user_agent}')
+
+    if config.PAGE_LOAD_PROFILE_ENABLED:
+        chrome_options.page_load_strategy = config.PAGE_LOAD_PROFILES[page_type]['page_load_strategy']
+
+    return chrome_options
+
+
+def get_blocked_url_patterns(page_type):
+    '''Get the URL patterns blocked by the page-load profile of the page type 'page_type'
+
+    Parameters
+    ----------
+    page_type: str
+        The page type, i.e., a key of 'config.PAGE_LOAD_PROFILES'
+
+    Returns
+    -------
+    list
+        The list of URL patterns (with wildcard '*')
+    '''
+
+    profile = config.PAGE_LOAD_PROFILES[page_type]
+
+    url_patterns = []
+    for resource_type in profile['blocked_resource_types']:
+        url_patterns.extend(config.PAGE_LOAD_BLOCKED_RESOURCE_URL_PATTERNS[resource_type])
+    if profile['block_third_party_hosts']:
+        url_patterns.extend(f'*://{host}/*' for host in config.PAGE_LOAD_BLOCKED_HOSTS)
+
+    return url_patterns
+
+
+def elements_present(css_selectors):
+    '''Create the readiness predicate (for 'WebDriverWait.until') which is True when ALL elements of 'css_selectors' are present
+
+    Parameters
+    ----------
+    css_selectors: list
+        The CSS selectors of the elements
+
+    Returns
+    -------
+    function
+        The readiness predicate, which returns the element of the first CSS selector if all elements are present, otherwise False
+    '''
+
+    def predicate(driver):
+        elems = [driver.find_elements(By.CSS_SELECTOR, value=css_selector) for css_selector in css_selectors]
+        return elems[0][0] if all(elems) else False
+
+    return predicate
+
+
+def load_page(chrome, page_type, url, default_css_selector, default_wait_seconds):
+    '''Open the webpage 'url' of the page type 'page_type' and wait until it is ready.
+    Raise a TimeoutException, if the page is not ready in time.
+
+    Parameters
+    ----------
+    chrome: selenium.webdriver.Chrome
+        The webbrowser, created with 'create_chrome_options'
+    page_type: str
+        The page type, i.e., a key of 'config.PAGE_LOAD_PROFILES'
+    url: str
+        The URL of the webpage
+    default_css_selector: str
+        The CSS selector of the readiness element, if PAGE_LOAD_PROFILE_ENABLED is False
+    default_wait_seconds: int
+        The maximum seconds to wait for the readiness element, if PAGE_LOAD_PROFILE_ENABLED is False
+
+    Returns
+    -------
+    selenium.webdriver.remote.webelement.WebElement
+        The readiness element, i.e., the element of the first readiness CSS selector
+    '''
+
+    start_time = time.monotonic()
+
+    if config.PAGE_LOAD_PROFILE_ENABLED:
+        profile = config.PAGE_LOAD_PROFILES[page_type]
+        chrome.execute_cdp_cmd('Network.enable', {})
+        chrome.execute_cdp_cmd('Network.setBlockedURLs', {'urls': get_blocked_url_patterns(page_type)})
+        chrome_wait = WebDriverWait(chrome, profile['wait_seconds'], poll_frequency=profile['poll_seconds'])
+        ready_css_selectors = profile['ready_css_selectors']
+    else:
+        chrome_wait = WebDriverWait(chrome, default_wait_seconds)
+        ready_css_selectors = [default_css_selector]
+
+    with metrics.timer('page_load', page_type):
+        chrome.get(url)
+    with metrics.timer('wait_for_element', page_type):
+        ready_elem = chrome_wait.until(elements_present(ready_css_selectors))
+    metrics.inc_counter('pages_fetched_total', labels={'page_type': page_type})
+
+    latency_seconds = time.monotonic() - start_time
+    _recent_page_load_latencies.append(latency_seconds)
+    if config.PAGE_LOAD_STATS_ENABLED:
+        record_page_load(chrome, page_type, url, latency_seconds)
+
+    return ready_elem
+
+
+def pop_recent_page_load_latencies():
+    '''Get and clear the latency of the page fetches since the last call
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    list
+        The latency (seconds) of the recent page fetches
+    '''
+
+    latencies = []
+    while _recent_page_load_latencies:
+        latencies.append(_recent_page_load_latencies.popleft())
+
+    return latencies
+
+
+def record_page_load(chrome, page_type, url, latency_seconds):
+    '''Record the transferred bytes and latency of the page fetch in the CSV file 'config.PAGE_LOAD_STATS_FILE'.
+    The transferred bytes include the document and the subresources loaded until the page is ready.
+
+    Parameters
+    ----------
+    chrome: selenium.webdriver.Chrome
+        The webbrowser which loaded the page
+    page_type: str
+        The page type, i.e., a key of 'config.PAGE_LOAD_PROFILES'
+    url: str
+        The URL of the webpage
+    latency_seconds: float
+        The seconds from opening the webpage until it is ready
+
+    Returns
+    -------
+    None
+    '''
+
+    try:
+        transfer_bytes, resource_count = chrome.execute_script(_MEASURE_TRANSFER_SCRIPT)
+
+        with _page_load_stats_lock:
+            write_header = not os.path.isfile(config.PAGE_LOAD_STATS_FILE)
+            with open(config.PAGE_LOAD_STATS_FILE, mode='a', encoding='utf-8', newline='') as file:
+                writer = csv.writer(file)
+                if write_header:
+                    writer.writerow(PAGE_LOAD_STATS_COLUMNS)
+                writer.writerow([
+                    datetime.now(config.TIME_ZONE).isoformat(), page_type, config.PAGE_LOAD_PROFILE_ENABLED, url,
+                    f'{latency_seconds:.3f}', int(transfer_bytes), int(resource_count)
+                ])
+    except Exception as e:
+        msg = f'Record the page load stats of \'{url}\' failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_WARNING)
+
+
+def summarize_page_load_stats(csv_files):
+    '''Summarize the page load stats of each page type before/after the page-load profiles
+
+    Parameters
+    ----------
+    csv_files: list
+        The full paths of the page load stats CSV files
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe indexed by (page_type, profile_enabled), including columns:
+        -- fetch_count: the count of page fetches
+        -- median_latency_seconds, p95_latency_seconds: the median and 95th percentile latency
+        -- mean_transfer_bytes: the mean transferred bytes per page fetch
+        -- mean_resource_count: the mean count of loaded subresources per page fetch
+    '''
+
+    stats_dfs = [pd.read_csv(csv_file) for csv_file in csv_files if os.path.isfile(csv_file)]
+    stats_df = pd.concat(stats_dfs, ignore_index=True) if stats_dfs else pd.DataFrame(columns=PAGE_LOAD_STATS_COLUMNS)
+    stats_df = stats_df.astype({'latency_seconds': 'float64', 'transfer_bytes': 'int64', 'resource_count': 'int64'})
+    grouped = stats_df.groupby(['page_type', 'profile_enabled'])
+
+    return pd.DataFrame({
+        'fetch_count': grouped.size(),
+        'median_latency_seconds': grouped['latency_seconds'].median(),
+        'p95_latency_seconds': grouped['latency_seconds'].quantile(0.95),
+        'mean_transfer_bytes': grouped['transfer_bytes'].mean(),
+        'mean_resource_count': grouped['resource_count'].mean()
+    })
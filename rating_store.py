@@ -0,0 +1,464 @@
+'''The RatingStore Module
+
+Summary
+-------
+This module defines the columnar time-series store of the daily aggregate ratings of movies.
+
+The rating history of a movie is stored in the directory MOVIE_RATING_STORE_DIRECTORY, one binary file per column
+('{column}.bin', a fixed-width array, see 'RATING_COLUMN_DTYPES'), run-length encoded,
+i.e., one row per run of consecutive dates with the same rating, in the order of dates:
+-- date: the first date of the run, in days since 1970-01-01
+-- last_date: the last date of the run, in days since 1970-01-01
+-- avg: the average rating, NaN if the movie has no rating yet
+-- count: the rating count
+-- 1_star, ..., 5_star: the rating weights in percent, NaN if the movie has no rating yet
+The 'date' and 'last_date' columns are the date index shared by the value columns.
+A new day with a changed rating is appended as one row (one value per column file), a new day with an unchanged rating
+only extends the 'last_date' of the last run in place, and the rows of all column files are complete up to the shortest one,
+so a row left partial by an interrupted write is ignored and overwritten by the next append.
+A range query (see 'read_movie_ratings') binary-searches the date index, and only reads the rows of the runs in the range
+from the requested value columns, e.g., the rating counts of thousands of movies (see 'read_all_movie_ratings') are read without the weights.
+In memory, the runs are numpy structured arrays with the date index and the loaded value columns (see 'get_record_dtype').
+
+The legacy rating files ('{movie_id}_movie_rating.json', concatenated pretty-printed {date: rating} json objects appended by
+'movie_info_crawler.crawl_movie_info') are migrated into the store at the program startup (see 'migrate_movie_rating_files').
+'''
+
+import os
+import sys
+import json
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+import config
+import util
+
+
+# The columns of the rating of a movie on a run of dates, and their types in the column files
+RATING_WEIGHT_COLUMNS = [f'{i}_star' for i in range(1, 6)]
+RATING_VALUE_COLUMNS = ['avg', 'count'] + RATING_WEIGHT_COLUMNS
+RATING_INDEX_COLUMNS = ['date', 'last_date']
+RATING_COLUMN_DTYPES = {
+    'date': np.dtype('<i4'),
+    'last_date': np.dtype('<i4'),
+    'avg': np.dtype('<f4'),
+    'count': np.dtype('<i8'),
+    **{column: np.dtype('<f4') for column in RATING_WEIGHT_COLUMNS}
+}
+# The record of the rating of a movie on a run of dates, with all columns
+RATING_RECORD_DTYPE = np.dtype(list(RATING_COLUMN_DTYPES.items()))
+# The legacy rating file of a movie, and its name after migrated into the store
+LEGACY_MOVIE_RATING_FILE = os.path.join(config.MOVIE_INFO_DIRECTORY, '{movie_id}_movie_rating.json')
+MIGRATED_LEGACY_FILE_SUFFIX = '.migrated'
+
+
+def date_to_days(date_str):
+    '''Convert the date string 'date_str' (e.g., '2024-04-18') to the days since 1970-01-01'''
+
+    return int(np.datetime64(date_str, 'D').astype(np.int64))
+
+
+def get_record_dtype(columns=None):
+    '''Get the dtype of the rating records with the date index and the value columns 'columns' (default is all)'''
+
+    if columns is None:
+        return RATING_RECORD_DTYPE
+    return np.dtype([(column, RATING_COLUMN_DTYPES[column]) for column in RATING_INDEX_COLUMNS + list(columns)])
+
+
+def get_value_columns(records):
+    '''Get the value columns of the rating records 'records' '''
+
+    return [column for column in records.dtype.names if column not in RATING_INDEX_COLUMNS]
+
+
+def get_column_file(movie_id, column):
+    '''Get the full path of the file of the column 'column' in the store of the movie with id 'movie_id' '''
+
+    return os.path.join(config.MOVIE_RATING_STORE_DIRECTORY.format(movie_id=movie_id), f'{column}.bin')
+
+
+def to_rating_record(date_str, rating):
+    '''Convert the crawled rating 'rating' of the date 'date_str' to a rating record
+
+    Parameters
+    ----------
+    date_str: str
+        The crawl date of the rating, e.g., '2024-04-18'
+    rating: dict
+        The crawled rating, with keys:
+        -- avg (str, e.g., '7.9', '' if no rating yet)
+        -- count (str, e.g., '1024')
+        -- rating_weight (optional, dict with keys '1_star', ..., '5_star', e.g., '12.3%')
+
+    Returns
+    -------
+    numpy.ndarray
+        The rating record (with shape (1,) and dtype RATING_RECORD_DTYPE)
+    '''
+
+    record = np.zeros(1, dtype=RATING_RECORD_DTYPE)
+    record['date'] = date_to_days(date_str)
+    record['last_date'] = record['date']
+    record['avg'] = float(rating['avg']) if str(rating.get('avg', '')).strip() else np.nan
+    record['count'] = int(rating.get('count') or 0)
+    rating_weight = rating.get('rating_weight', {})
+    for column in RATING_WEIGHT_COLUMNS:
+        weight = str(rating_weight.get(column, '')).strip().rstrip('%')
+        record[column] = float(weight) if weight else np.nan
+
+    return record
+
+
+def get_record_count(movie_id):
+    '''Get the count of complete rating records (rows) in the store of the movie with id 'movie_id', i.e., the length of the shortest column'''
+
+    record_count = None
+    for column, dtype in RATING_COLUMN_DTYPES.items():
+        column_file = get_column_file(movie_id, column)
+        if not os.path.isfile(column_file):
+            return 0
+        column_length = os.path.getsize(column_file) // dtype.itemsize
+        record_count = column_length if record_count is None else min(record_count, column_length)
+
+    return record_count
+
+
+def read_rating_records(movie_id, columns=None, start_index=0, end_index=None):
+    '''Read the rating records (runs) [start_index, end_index) of the movie with id 'movie_id' from the store
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    columns: list, optional
+        The value columns to read besides the date index (default is all), the files of the other columns are not read
+    start_index: int, optional
+        The index of the first run to read (default is 0)
+    end_index: int, optional
+        The index after the last run to read (default is the count of complete records)
+
+    Returns
+    -------
+    numpy.ndarray
+        The rating records with dtype 'get_record_dtype(columns)', an empty array if no record
+    '''
+
+    record_count = get_record_count(movie_id)
+    end_index = record_count if end_index is None else min(end_index, record_count)
+    records = np.zeros(max(end_index - start_index, 0), dtype=get_record_dtype(columns))
+    if len(records) == 0:
+        return records
+
+    for column in records.dtype.names:
+        dtype = RATING_COLUMN_DTYPES[column]
+        records[column] = np.fromfile(get_column_file(movie_id, column), dtype=dtype, count=len(records), offset=start_index * dtype.itemsize)
+    return records
+
+
+def write_rating_records(movie_id, records, start_index=0, columns=None):
+    '''Write the rating records 'records' (with all columns) into the store of the movie with id 'movie_id' from the row 'start_index',
+    and drop the rows after them in all column files
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    records: numpy.ndarray
+        The rating records (runs sorted by date, not overlapped) with dtype RATING_RECORD_DTYPE
+    start_index: int, optional
+        The row to write the first record at (default is 0, i.e., replace the whole store)
+    columns: list, optional
+        The columns to write (default is all), the rows of the other columns are kept, e.g., to extend the 'last_date' of the last run
+
+    Returns
+    -------
+    None
+    '''
+
+    os.makedirs(config.MOVIE_RATING_STORE_DIRECTORY.format(movie_id=movie_id), exist_ok=True)
+    for column, dtype in RATING_COLUMN_DTYPES.items():
+        column_file = get_column_file(movie_id, column)
+        with open(column_file, mode='r+b' if os.path.isfile(column_file) else 'wb') as file:
+            if columns is None or column in columns:
+                file.seek(start_index * dtype.itemsize)
+                file.write(records[column].astype(dtype).tobytes())
+            file.truncate((start_index + len(records)) * dtype.itemsize)
+
+
+def is_same_rating(record, other_record):
+    '''Check whether the rating records 'record' and 'other_record' have the same rating (NaN equals NaN)'''
+
+    return all(
+        record[column] == other_record[column] or (np.isnan(record[column]) and np.isnan(other_record[column]))
+        for column in get_value_columns(record)
+    )
+
+
+def expand_runs(records):
+    '''Expand the runs 'records' into daily rating records (one record per date)'''
+
+    run_lengths = records['last_date'] - records['date'] + 1
+    daily_records = np.repeat(records, run_lengths)
+    # the offset of each date in its run
+    run_starts = np.repeat(np.cumsum(run_lengths) - run_lengths, run_lengths)
+    daily_records['date'] += np.arange(len(daily_records), dtype='<i4') - run_starts.astype('<i4')
+    daily_records['last_date'] = daily_records['date']
+    return daily_records
+
+
+def encode_runs(daily_records):
+    '''Encode the daily rating records 'daily_records' (sorted by date, unique dates) into runs of consecutive dates with the same rating'''
+
+    runs = []
+    for record in daily_records:
+        if runs and record['date'] == runs[-1]['last_date'] + 1 and is_same_rating(record, runs[-1]):
+            runs[-1]['last_date'] = record['date']
+        else:
+            runs.append(record.copy())
+
+    return np.array(runs, dtype=daily_records.dtype)
+
+
+def deduplicate_rating_records(daily_records):
+    '''Sort the daily rating records 'daily_records' by date and keep the last record of each date'''
+
+    # reverse the records to keep the last record of each date by 'np.unique' (which returns the first occurrences)
+    reversed_records = daily_records[::-1]
+    _, indexes = np.unique(reversed_records['date'], return_index=True)
+    return reversed_records[indexes]
+
+
+def merge_rating_records(movie_id, daily_records):
+    '''Merge the daily rating records 'daily_records' into the store of the movie with id 'movie_id' (the records in 'daily_records' win)'''
+
+    daily_records = np.concatenate([expand_runs(read_rating_records(movie_id)), daily_records])
+    write_rating_records(movie_id, encode_runs(deduplicate_rating_records(daily_records)))
+
+
+def append_movie_rating(movie_id, date_str, rating):
+    '''Append the crawled rating of the movie with id 'movie_id' on the date 'date_str' to the store:
+    -- the rating is unchanged since the previous date: extend the last run to the date (in place, only the 'last_date' column)
+    -- the rating is changed: append a new run
+    -- otherwise (e.g., crawled again on the same day with a changed rating): merge the rating into the store (the rating wins)
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    date_str: str
+        The crawl date of the rating, e.g., '2024-04-18'
+    rating: dict
+        The crawled rating, see 'to_rating_record'
+
+    Returns
+    -------
+    bool
+        True if the store is written, False if the rating of the date is already stored
+    '''
+
+    record = to_rating_record(date_str, rating)
+    date = record['date'][0]
+
+    record_count = get_record_count(movie_id)
+    last_record = read_rating_records(movie_id, start_index=record_count - 1) if record_count > 0 else None
+
+    if last_record is not None and is_same_rating(record[0], last_record[0]) and last_record['date'][0] <= date <= last_record['last_date'][0] + 1:
+        if date <= last_record['last_date'][0]: # already stored
+            return False
+        # extend the last run (and drop a partial row left by an interrupted write)
+        last_record['last_date'] = date
+        write_rating_records(movie_id, last_record, start_index=record_count - 1, columns=['last_date'])
+    elif last_record is not None and date <= last_record['last_date'][0]:
+        merge_rating_records(movie_id, record)
+    else:
+        write_rating_records(movie_id, record, start_index=record_count)
+
+    return True
+
+
+def get_last_movie_rating(movie_id):
+    '''Get the last stored rating of the movie with id 'movie_id'
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+
+    Returns
+    -------
+    dict
+        The rating with keys: date (the last date of the last run), avg, count, 1_star, ..., 5_star, None if no rating is stored
+    '''
+
+    record_count = get_record_count(movie_id)
+    if record_count == 0:
+        return None
+
+    last_record = read_rating_records(movie_id, start_index=record_count - 1)[0]
+    rating = {column: last_record[column].item() for column in RATING_VALUE_COLUMNS}
+    rating['date'] = str(np.datetime64(int(last_record['last_date']), 'D'))
+    return rating
+
+
+def records_to_dataframe(records):
+    '''Convert the daily rating records 'records' to a dataframe with the date index (DatetimeIndex named 'date')'''
+
+    df = pd.DataFrame({column: records[column] for column in get_value_columns(records)})
+    df.index = pd.DatetimeIndex(records['date'].astype('datetime64[D]'), name='date')
+    return df
+
+
+def read_date_range(movie_id, start_date=None, end_date=None, columns=None):
+    '''Read the daily rating records of the movie with id 'movie_id' in the date range [start_date, end_date]
+    with the value columns 'columns' (default is all)
+    '''
+
+    # find the runs overlapping the range by binary search in the date index, then read, expand them and cut the dates outside the range
+    index_records = read_rating_records(movie_id, columns=[])
+    start_index = 0 if start_date is None else np.searchsorted(index_records['last_date'], date_to_days(start_date), side='left')
+    end_index = len(index_records) if end_date is None else np.searchsorted(index_records['date'], date_to_days(end_date), side='right')
+    daily_records = expand_runs(read_rating_records(movie_id, columns, start_index, max(end_index, start_index)))
+
+    if start_date is not None:
+        daily_records = daily_records[daily_records['date'] >= date_to_days(start_date)]
+    if end_date is not None:
+        daily_records = daily_records[daily_records['date'] <= date_to_days(end_date)]
+    return daily_records
+
+
+def read_movie_ratings(movie_id, start_date=None, end_date=None, columns=None):
+    '''Read the daily ratings of the movie with id 'movie_id' in the date range [start_date, end_date]
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    start_date: str, optional
+        The first date of the range, e.g., '2024-04-01' (default is the first date in the store)
+    end_date: str, optional
+        The last date of the range, e.g., '2024-04-30' (default is the last date in the store)
+    columns: list, optional
+        The value columns to read, e.g., ['count'] (default is all)
+
+    Returns
+    -------
+    pandas.DataFrame
+        The daily ratings, with the date index and the value columns (avg, count, 1_star, ..., 5_star by default)
+    '''
+
+    return records_to_dataframe(read_date_range(movie_id, start_date, end_date, columns))
+
+
+def read_all_movie_ratings(movie_ids, start_date=None, end_date=None, columns=None):
+    '''Read the daily ratings of the movies with ids in 'movie_ids' in the date range [start_date, end_date], see 'read_movie_ratings'
+
+    Parameters
+    ----------
+    movie_ids: iterable
+        The ids of the movies
+    start_date: str, optional
+        The first date of the range (default is no limit)
+    end_date: str, optional
+        The last date of the range (default is no limit)
+    columns: list, optional
+        The value columns to read (default is all)
+
+    Returns
+    -------
+    pandas.DataFrame
+        The daily ratings, with the (movie_id, date) index and the value columns
+    '''
+
+    # build one dataframe from the concatenated records, instead of concatenating a dataframe per movie
+    movie_ids = list(movie_ids)
+    movie_records = [read_date_range(movie_id, start_date, end_date, columns) for movie_id in movie_ids]
+    records = np.concatenate(movie_records) if movie_records else np.zeros(0, dtype=get_record_dtype(columns))
+
+    df = records_to_dataframe(records)
+    df.index = pd.MultiIndex.from_arrays(
+        [np.repeat(movie_ids, [len(records) for records in movie_records]), df.index],
+        names=['movie_id', 'date']
+    )
+    return df
+
+
+def read_legacy_rating_file(legacy_file):
+    '''Read the concatenated {date: rating} json objects in the legacy rating file 'legacy_file'
+
+    Parameters
+    ----------
+    legacy_file: str
+        The full path of the legacy rating file
+
+    Returns
+    -------
+    numpy.ndarray
+        The daily rating records (in the order of the file)
+    '''
+
+    with open(legacy_file, mode='r', encoding='utf-8') as file:
+        content = file.read()
+
+    decoder = json.JSONDecoder()
+    records = []
+    index = 0
+    while True:
+        # skip the whitespaces between the json objects
+        while index < len(content) and content[index].isspace():
+            index += 1
+        if index >= len(content):
+            break
+        movie_rating, index = decoder.raw_decode(content, index)
+        for date_str, rating in movie_rating.items():
+            records.append(to_rating_record(date_str, rating))
+
+    if len(records) == 0:
+        return np.zeros(0, dtype=RATING_RECORD_DTYPE)
+    return np.concatenate(records)
+
+
+def migrate_movie_rating_files():
+    '''Migrate the legacy rating files in MOVIE_INFO_DIRECTORY into the store,
+    each migrated legacy file is renamed with the MIGRATED_LEGACY_FILE_SUFFIX suffix (kept as a backup)
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The count of migrated legacy rating files
+    '''
+
+    migrated_count = 0
+    for legacy_file in glob(LEGACY_MOVIE_RATING_FILE.format(movie_id='*')):
+        movie_id = os.path.basename(legacy_file).split('_')[0]
+        try:
+            legacy_records = read_legacy_rating_file(legacy_file)
+            # the records already in the store (e.g., appended before the migration) win
+            daily_records = np.concatenate([legacy_records, expand_runs(read_rating_records(movie_id))])
+            write_rating_records(movie_id, encode_runs(deduplicate_rating_records(daily_records)))
+            os.replace(legacy_file, legacy_file + MIGRATED_LEGACY_FILE_SUFFIX)
+        except Exception as e:
+            msg = f'Migrate the legacy rating file \'{legacy_file}\' into the rating store failed. -- Original Exception -- {e}'
+            current_frame = sys._getframe()
+            logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+            util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.MOVIE_INFO_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+            util.log(msg, config.MOVIE_INFO_CRAWLER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        else:
+            migrated_count += 1
+
+    if migrated_count > 0:
+        msg = f'Migrate {migrated_count} legacy rating files into the rating store successfully.'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+        util.log(msg, config.MOVIE_INFO_CRAWLER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_INFO)
+
+    return migrated_count
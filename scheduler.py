@@ -17,6 +17,11 @@ import daily_job_dispatcher
 import data_preprocess_dispatcher
 import movie_info_crawl_dispatcher
 import comment_crawl_dispatcher
+import comment_crawl_queue
+import browser_supervisor
+import worker_autoscaler
+import metrics
+import job_run_tracker
 
 
 
@@ -38,9 +43,12 @@ def start_scheduler():
                                     timezone=config.TIME_ZONE)
     bg_scheduler.start()
 
-    # ??? TO IMPLEMENT
-    # add listeners to the scheduler
-    
+    # update the job metrics (running, misfired, ...) from job events
+    metrics.add_scheduler_metrics_listener(bg_scheduler)
+
+    # record the start, end, duration, error, missed and dropped (max_instances/coalesced) runs of each job
+    job_run_tracker.add_job_run_listener(bg_scheduler)
+
     return bg_scheduler
 
 
@@ -90,6 +98,96 @@ def schedule_daily_routine_jobs(bg_scheduler):
 
 
 
+def schedule_browser_reaper_job(bg_scheduler):
+    '''Schedule the browser reaper job which is run every BROWSER_REAP_INTERVAL_SECONDS seconds
+    
+    Parameters
+    ----------
+    bg_scheduler: apscheduler.Scheduler
+        The background_scheduler to schedule the browser reaper job
+    
+    Returns
+    -------
+    None
+    '''
+    
+    try:
+        # Schedule browser_supervisor.reap_browsers() to kill hung or leaked webbrowser processes
+        # executor='default': use the ThreadPoolExecutor
+        bg_scheduler.add_job(func=browser_supervisor.reap_browsers, id='browser_reaper_job',
+                          executor='default', replace_existing=True,
+                          trigger='interval', seconds=config.BROWSER_REAP_INTERVAL_SECONDS)
+    except Exception as e:
+        msg = f'Schedule browser reaper job failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+
+
+def schedule_worker_autoscaler_job(bg_scheduler):
+    '''Schedule the worker autoscaler job which is run every WORKER_AUTOSCALE_INTERVAL_SECONDS seconds
+    
+    Parameters
+    ----------
+    bg_scheduler: apscheduler.Scheduler
+        The background_scheduler to schedule the worker autoscaler job
+    
+    Returns
+    -------
+    None
+    '''
+    
+    try:
+        # Schedule worker_autoscaler.autoscale_workers() to adjust the crawl concurrency from the host load
+        # executor='default': use the ThreadPoolExecutor
+        bg_scheduler.add_job(func=worker_autoscaler.autoscale_workers, id='worker_autoscaler_job',
+                          executor='default', replace_existing=True,
+                          trigger='interval', seconds=config.WORKER_AUTOSCALE_INTERVAL_SECONDS)
+    except Exception as e:
+        msg = f'Schedule worker autoscaler job failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+
+
+def schedule_metrics_snapshot_job(bg_scheduler):
+    '''Schedule the metrics snapshot job which is run every METRICS_SNAPSHOT_INTERVAL_SECONDS seconds
+    
+    Parameters
+    ----------
+    bg_scheduler: apscheduler.Scheduler
+        The background_scheduler to schedule the metrics snapshot job
+    
+    Returns
+    -------
+    None
+    '''
+    
+    try:
+        # Schedule metrics.write_metrics_snapshot() to write the metrics snapshot file
+        # executor='default': use the ThreadPoolExecutor
+        bg_scheduler.add_job(func=metrics.write_metrics_snapshot, id='metrics_snapshot_job',
+                          executor='default', replace_existing=True,
+                          trigger='interval', seconds=config.METRICS_SNAPSHOT_INTERVAL_SECONDS)
+    except Exception as e:
+        msg = f'Schedule metrics snapshot job failed. -- Original Exception -- {e}'
+        current_frame = sys._getframe()
+        logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+        util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+        util.log(msg, config.SCHEDULER_ERROR_LOG_FILE, logger_name=logger_name, log_level=config.LOG_LEVEL_ERROR)
+
+
+
 def schedule_data_preprocess_jobs(bg_scheduler):
     '''Schedule data pre-process job which are run daily at 00:05:00
     
@@ -202,7 +300,11 @@ def schedule_comment_crawl_jobs(bg_scheduler):
             # --NO NEED: next_run_time=now: run the job immediately (with jitter) after scheduled regardless of the trigger
             # jitter=10: delay the job execution by x seconds, where x is a random int in [0, jitter]            
             # with jitter: avoid accessing 'douban.com' simultaneous to prevent network bottleneck and may bypass DouBan DoS detect
-            func = comment_crawl_dispatcher.dispatch_crawl_comment
+            # in the 'queue' comment crawl run mode, the job only puts the due movie into the comment crawl queue
+            if config.COMMENT_CRAWL_RUN_MODE == 'queue':
+                func = comment_crawl_queue.enqueue_comment_crawl
+            else:
+                func = comment_crawl_dispatcher.dispatch_crawl_comment
             kwargs = {
                 'movie_id': movie_id,
                 'last_crawl_total_comment_count': movie['last_crawl_total_comment_count']
@@ -0,0 +1,71 @@
+'''The CronScheduleBenchmark Script
+
+Summary
+-------
+This script benchmarks 'daily_job_dispatcher.calculate_comment_crawl_job_cron_schedule'
+at 1k, 10k and 100k movies, for both the first-time calculation (no existing cron schedule)
+and the midnight re-calculation (update an existing cron schedule with some newly added movies).
+
+Usage
+-----
+python test_code/benchmark_cron_schedule.py [movie_count ...]
+'''
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Make the modules of the program importable when running this script from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import daily_job_dispatcher
+
+
+# The movie counts to benchmark
+MOVIE_COUNTS = [1000, 10000, 100000]
+# The count of repeated runs of each benchmark, the best run is reported
+REPEAT = 5
+# The ratio of newly added movies in the midnight re-calculation benchmark
+NEW_MOVIE_RATIO = 0.01
+
+
+def create_movie_list_df(movie_count, first_movie_id=1000000):
+    '''Create a movie list dataframe with 'movie_count' movies (movie_id as the index)'''
+
+    movie_ids = np.arange(first_movie_id, first_movie_id + movie_count, dtype='int64')
+    return pd.DataFrame({'movie_id': movie_ids, 'last_crawl_total_comment_count': 0}, index=movie_ids)
+
+
+def best_of(func, *args):
+    '''Run func(*args) REPEAT times and return the best elapsed seconds'''
+
+    elapsed_seconds = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        elapsed_seconds.append(time.perf_counter() - start)
+    return min(elapsed_seconds)
+
+
+def run_benchmark(movie_count):
+    '''Benchmark the cron schedule calculation with 'movie_count' movies'''
+
+    movie_list_df = create_movie_list_df(movie_count)
+    first_seconds = best_of(daily_job_dispatcher.calculate_comment_crawl_job_cron_schedule, movie_list_df, None)
+
+    # midnight re-calculation: all existing movies plus NEW_MOVIE_RATIO newly added movies
+    cron_schedule_df = daily_job_dispatcher.calculate_comment_crawl_job_cron_schedule(movie_list_df, None)
+    new_movie_count = max(1, int(movie_count * NEW_MOVIE_RATIO))
+    updated_movie_list_df = create_movie_list_df(movie_count + new_movie_count)
+    update_seconds = best_of(daily_job_dispatcher.calculate_comment_crawl_job_cron_schedule, updated_movie_list_df, cron_schedule_df)
+
+    print(f'{movie_count:>8} movies: first calculation {first_seconds * 1000:9.2f} ms, re-calculation {update_seconds * 1000:9.2f} ms')
+
+
+if __name__ == '__main__':
+    movie_counts = [int(arg) for arg in sys.argv[1:]] or MOVIE_COUNTS
+    for movie_count in movie_counts:
+        run_benchmark(movie_count)
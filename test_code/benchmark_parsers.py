@@ -0,0 +1,265 @@
+'''The ParserBenchmark Script
+
+Summary
+-------
+This script benchmarks the parse throughput and the allocation per page of every parse path without the webbrowser
+over the webpage samples in './webpage_sample' (both SIMPLIFIED and UNSIMPLIFIED versions):
+-- comment: 'comment_crawler.parse_html' of the whole comment page (full and EMPTY),
+    and of the comment list <ul> element only (as taken by 'comment_crawler.fetch_comment')
+-- movie_info: 'movie_info_crawler.parse_movie_page_html' of the movie and TV-series pages with and without rating,
+    both the full movie info crawl and the rating-only crawl
+-- html_tree: 'html_tree.build_tree' of every sample, the tree building cost shared by all parse paths
+('comment_crawler.parse' and the webbrowser path of 'movie_info_crawler.crawl_movie_info' need a live webbrowser, not benchmarked)
+
+The results (pages/sec, peak and retained allocation per page by tracemalloc, and a fingerprint of the parsed data)
+are written as JSON and compared with the stored baseline BASELINE_FILE.
+As the machine speed varies between runs (e.g., shared CPUs), each timed batch is interleaved with a batch of a fixed
+calibration workload (the standard library 'html.parser' over a fixed document), and the throughput is compared as
+'relative_throughput', i.e., pages/sec divided by the calibration pages/sec.
+The script exits with status 1 if any case:
+-- is slower than (1 - threshold) of its baseline relative throughput
+-- allocates more than (1 + threshold) of its baseline peak bytes per page
+-- parses different data than the baseline (fingerprint changed), i.e., a correctness regression
+Re-record the baseline with '--update-baseline' after an intended parser change, on the machine that runs the benchmark.
+
+Usage
+-----
+python test_code/benchmark_parsers.py [--output results.json] [--threshold 0.25] [--update-baseline] [--case <name substring> ...]
+'''
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import statistics
+import tracemalloc
+from html.parser import HTMLParser
+
+# Make the modules of the program importable when running this script from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import html_tree
+import comment_crawler
+import movie_info_crawler
+
+
+# The directory of the webpage samples
+WEBPAGE_SAMPLE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'webpage_sample')
+# The stored baseline results
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_parsers_baseline.json')
+# The default ratio of throughput (or allocation) regression against the baseline to fail
+REGRESSION_THRESHOLD = 0.25
+# The minimum seconds of each timed batch, and the count of batches of each case
+# (the best batch is reported as pages/sec, the median ratio to the calibration batches as the relative throughput)
+BATCH_SECONDS = 0.2
+REPEAT = 7
+# The document of the calibration workload, a fixed comment-list-like HTML not depending on any webpage sample
+CALIBRATION_HTML = '<ul class="list">' + ''.join(
+    f'<li class="item"><div class="desc"><a href="/people/{i}/">user {i}</a><span class="date">2024-04-17</span></div>'
+    f'<p class="content">comment {i} &amp; text<br>second line</p></li>'
+    for i in range(200)
+) + '</ul>'
+
+
+def read_sample(file_name):
+    '''Read the webpage sample 'file_name' in WEBPAGE_SAMPLE_DIRECTORY'''
+
+    with open(os.path.join(WEBPAGE_SAMPLE_DIRECTORY, file_name), mode='r', encoding='utf-8') as file:
+        return file.read()
+
+
+def extract_comment_list_html(html):
+    '''Extract the HTML of the comment list <ul> element from the comment page 'html', like 'outerHTML' in 'fetch_comment' '''
+
+    ul_start = html.index('<ul class="list comment-list">')
+    return html[ul_start:html.index('</ul>', ul_start) + len('</ul>')]
+
+
+def fingerprint(data):
+    '''Get the fingerprint (sha256) of the parsed data 'data', ignoring the crawl date 'rating_start_date' '''
+
+    def normalize(value):
+        if isinstance(value, dict):
+            return {key: (item is not None) if key == 'rating_start_date' else normalize(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(item) for item in value]
+        return value
+
+    return hashlib.sha256(json.dumps(normalize(data), sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+def create_cases():
+    '''Create the benchmark cases, a dict with the case name as key and a parse function (without arguments) as value'''
+
+    cases = {}
+    page_url = config.MOVIE_COMMENT_URL.format(movie_id=35633650, comment_start_index=0)
+
+    comment_samples = ['comments-page-sample-SIMPLIFIED.html', 'comments-page-sample-UNSIMPLIFIED.html', 'comments-page-EMPTY-sample-SIMPLIFIED.html']
+    for file_name in comment_samples:
+        html = read_sample(file_name)
+        sample_name = file_name.replace('.html', '')
+        cases[f'comment/page/{sample_name}'] = lambda html=html: comment_crawler.parse_html(35633650, html, page_url)
+        cases[f'comment/list/{sample_name}'] = lambda html=extract_comment_list_html(html): comment_crawler.parse_html(35633650, html, page_url)
+
+    movie_samples = [
+        f'{page_type}-page-{rating}-sample-{version}.html'
+        for page_type in ('movie', 'TVseries') for rating in ('WITH-rating', 'WITHOUT-rating') for version in ('SIMPLIFIED', 'UNSIMPLIFIED')
+    ]
+    for file_name in movie_samples:
+        html = read_sample(file_name)
+        sample_name = file_name.replace('.html', '')
+        cases[f'movie_info/full/{sample_name}'] = lambda html=html: movie_info_crawler.parse_movie_page_html(1, html, False)
+        cases[f'movie_info/rating_only/{sample_name}'] = lambda html=html: movie_info_crawler.parse_movie_page_html(1, html, True)
+
+    for file_name in comment_samples + movie_samples:
+        html = read_sample(file_name)
+        cases[f'html_tree/build_tree/{file_name.replace(".html", "")}'] = lambda html=html: html_tree.build_tree(html)
+
+    return cases
+
+
+def parse_calibration_html():
+    '''The calibration workload, see the module summary'''
+
+    html_parser = HTMLParser(convert_charrefs=True)
+    html_parser.feed(CALIBRATION_HTML)
+    html_parser.close()
+
+
+def get_batch_page_count(parse_func):
+    '''Get the page count of 'parse_func' to run in a batch of about BATCH_SECONDS'''
+
+    page_count = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(page_count):
+            parse_func()
+        elapsed_seconds = time.perf_counter() - start
+        if elapsed_seconds >= BATCH_SECONDS / 4:
+            break
+        page_count *= 2
+
+    return max(1, int(page_count * BATCH_SECONDS / elapsed_seconds))
+
+
+def time_batch(parse_func, page_count):
+    '''Get the seconds to run 'parse_func' 'page_count' times'''
+
+    start = time.perf_counter()
+    for _ in range(page_count):
+        parse_func()
+    return time.perf_counter() - start
+
+
+def run_case(parse_func):
+    '''Benchmark the parse function 'parse_func'
+
+    Returns
+    -------
+    dict
+        A dict with keys: pages_per_second, relative_throughput (see the module summary), peak_alloc_bytes (peak allocation per page),
+        retained_alloc_bytes (allocation still held after a page, e.g., the parsed data), fingerprint (of the parsed data or element tree)
+    '''
+
+    parsed_data = parse_func() # warm up, e.g., the imports and caches of the parser
+
+    page_count = get_batch_page_count(parse_func)
+    calibration_page_count = get_batch_page_count(parse_calibration_html)
+
+    best_seconds = float('inf')
+    relative_throughputs = []
+    for _ in range(REPEAT):
+        calibration_seconds = time_batch(parse_calibration_html, calibration_page_count)
+        elapsed_seconds = time_batch(parse_func, page_count)
+        best_seconds = min(best_seconds, elapsed_seconds)
+        relative_throughputs.append((page_count / elapsed_seconds) / (calibration_page_count / calibration_seconds))
+
+    tracemalloc.start()
+    try:
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = parse_func()
+        end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'pages_per_second': page_count / best_seconds,
+        'relative_throughput': statistics.median(relative_throughputs),
+        'peak_alloc_bytes': peak_bytes - start_bytes,
+        'retained_alloc_bytes': end_bytes - start_bytes,
+        'fingerprint': fingerprint(parsed_data)
+    }
+
+
+def compare_with_baseline(results, baseline, threshold):
+    '''Compare the results 'results' with the baseline 'baseline', return the list of regression messages'''
+
+    regressions = []
+    for name, result in results['cases'].items():
+        baseline_result = baseline['cases'].get(name)
+        if baseline_result is None:
+            continue
+        if result['relative_throughput'] < baseline_result['relative_throughput'] * (1 - threshold):
+            regressions.append(
+                f'{name}: relative throughput {result["relative_throughput"]:.4f} < baseline {baseline_result["relative_throughput"]:.4f} '
+                f'({result["pages_per_second"]:.1f} pages/sec, baseline {baseline_result["pages_per_second"]:.1f} pages/sec)'
+            )
+        if result['peak_alloc_bytes'] > baseline_result['peak_alloc_bytes'] * (1 + threshold):
+            regressions.append(f'{name}: peak allocation {result["peak_alloc_bytes"]} bytes/page > baseline {baseline_result["peak_alloc_bytes"]} bytes/page')
+        if result['fingerprint'] != baseline_result['fingerprint']:
+            regressions.append(f'{name}: parsed data changed (fingerprint {result["fingerprint"]} != baseline {baseline_result["fingerprint"]})')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parsers over the webpage samples and compare with the stored baseline.')
+    parser.add_argument('--output', help='write the results as a JSON file (default is printing them)')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='the ratio of regression against the baseline to fail')
+    parser.add_argument('--update-baseline', action='store_true', help=f'store the results as the baseline \'{BASELINE_FILE}\'')
+    parser.add_argument('--case', nargs='*', default=[], help='only run the cases whose name contains any of the substrings')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': {}
+    }
+    for name, parse_func in create_cases().items():
+        if args.case and not any(substring in name for substring in args.case):
+            continue
+        result = run_case(parse_func)
+        results['cases'][name] = result
+        print(
+            f'{name:<70} {result["pages_per_second"]:>10.1f} pages/sec {result["relative_throughput"]:>9.4f} relative '
+            f'{result["peak_alloc_bytes"] / 1024:>8.1f} KiB peak/page',
+            file=sys.stderr
+        )
+
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, mode='w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+        print(f'Baseline stored in \'{BASELINE_FILE}\'.', file=sys.stderr)
+        sys.exit(0)
+
+    if not os.path.isfile(BASELINE_FILE):
+        print(f'No baseline \'{BASELINE_FILE}\' to compare with, run with \'--update-baseline\' to store one.', file=sys.stderr)
+        sys.exit(0)
+    with open(BASELINE_FILE, mode='r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION: {regression}', file=sys.stderr)
+    sys.exit(1 if regressions else 0)
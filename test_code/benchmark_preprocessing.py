@@ -0,0 +1,224 @@
+'''The PreprocessingBenchmark Script
+
+Summary
+-------
+This script benchmarks the stages of the data pre-processing pipeline over synthetic comment data
+(see 'test_code/generate_synthetic_comment_data.py'), fully offline, at the scales in SCALES:
+-- combine_daily_comment_data: combine the raw comment pages crawled today into the daily file of each movie
+-- merge_all_comment_data: merge the daily file into the merged history of each movie (the daily data pre-process job)
+-- merge_crawled_comment_data: merge the raw comment pages directly into the merged history of each movie
+    (the data pre-process worker), on a fresh copy of the generated merged histories
+
+Each stage runs in a fresh Python process, which reports:
+-- seconds (wall-clock) and cpu_seconds
+-- peak_rss_bytes (the peak RSS of the process), and rss_before_bytes (the RSS after the imports, before the stage)
+-- write_bytes (the bytes passed to write() by the process, i.e., including rewritten files) and output_bytes (the size of the output files)
+
+The report is written as JSON (with the generation summary of each scale), and printed as a table;
+'--compare <previous report>' prints the ratio of each number to the previous report, e.g., to judge a storage or merge change.
+
+Usage
+-----
+python test_code/benchmark_preprocessing.py [--scale 10k ...] [--output-mode segment] [--output report.json]
+    [--compare previous_report.json] [--data-directory <directory>] [--keep-data]
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+# Make the modules of the program importable when running this script from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import data_preprocessor
+import generate_synthetic_comment_data
+
+
+# The scales of the synthetic data, the scale name as key, each value is a dict of the arguments of 'generate_synthetic_comment_data.generate'
+# (note the merged histories take about 560 bytes per comment, e.g., 5.6 GB for the '10M' scale)
+SCALES = {
+    '10k': {'movie_count': 1, 'history_comment_count': 10000, 'daily_comment_count': 1000},
+    '1M': {'movie_count': 1, 'history_comment_count': 1000000, 'daily_comment_count': 1000},
+    '10M': {'movie_count': 1, 'history_comment_count': 10000000, 'daily_comment_count': 1000},
+    '1k_movies': {'movie_count': 1000, 'history_comment_count': 10000, 'daily_comment_count': 1000}
+}
+# The scales to benchmark by default
+DEFAULT_SCALES = ['10k']
+# The ratio of the crawled comments already in the merged history
+DUPLICATE_RATIO = 0.3
+# The stages to benchmark, in order
+STAGES = ['combine_daily_comment_data', 'merge_all_comment_data', 'merge_crawled_comment_data']
+
+
+def get_directory_size(directory):
+    '''Get the total size in bytes of the files in 'directory' '''
+
+    return sum(os.path.getsize(os.path.join(path, file_name)) for path, _, file_names in os.walk(directory) for file_name in file_names)
+
+
+def get_process_stats():
+    '''Get the current RSS, the peak RSS, the cpu seconds and the written bytes of the current process (Linux)
+    Note the peak RSS is 'VmHWM' of the address space of the process, not 'ru_maxrss' which keeps the peak of the parent process across fork/exec.
+    '''
+
+    stats = {}
+    with open('/proc/self/status', mode='r') as file:
+        for line in file:
+            name, _, value = line.partition(':')
+            if name in ('VmRSS', 'VmHWM'):
+                stats[name] = int(value.split()[0]) * 1024 # in kB
+    with open('/proc/self/io', mode='r') as file:
+        for line in file:
+            name, _, value = line.partition(':')
+            if name == 'wchar':
+                stats['wchar'] = int(value)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return {
+        'rss_bytes': stats['VmRSS'],
+        'peak_rss_bytes': stats['VmHWM'],
+        'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        'write_bytes': stats['wchar']
+    }
+
+
+def run_stage(stage, data_directory, movie_ids, date_str):
+    '''Run the stage 'stage' for the movies 'movie_ids' over the synthetic data in 'data_directory', in the current process
+
+    Returns
+    -------
+    dict
+        The stage results, see the module summary
+    '''
+
+    generate_synthetic_comment_data.configure_data_directory(data_directory)
+
+    output_directory = config.COMMENT_DAILY_DIRECTORY if stage == 'combine_daily_comment_data' else config.COMMENT_MERGED_DIRECTORY
+    before = get_process_stats()
+    start = time.perf_counter()
+
+    for movie_id in movie_ids:
+        if stage == 'combine_daily_comment_data':
+            data_preprocessor.combine_daily_comment_data(movie_id, date_str)
+        elif stage == 'merge_all_comment_data':
+            data_preprocessor.merge_all_comment_data(movie_id, date_str)
+        else:
+            data_preprocessor.merge_crawled_comment_data(movie_id, data_preprocessor.find_comment_crawled_files(movie_id, date_str))
+
+    seconds = time.perf_counter() - start
+    after = get_process_stats()
+
+    return {
+        'seconds': seconds,
+        'cpu_seconds': after['cpu_seconds'] - before['cpu_seconds'],
+        'peak_rss_bytes': after['peak_rss_bytes'],
+        'rss_before_bytes': before['rss_bytes'],
+        'write_bytes': after['write_bytes'] - before['write_bytes'],
+        'output_bytes': get_directory_size(output_directory)
+    }
+
+
+def run_stage_process(stage, data_directory, movie_ids, date_str):
+    '''Run the stage 'stage' in a fresh Python process (see 'run_stage'), so its peak RSS is not inherited from earlier stages'''
+
+    stage_args = json.dumps({'stage': stage, 'data_directory': data_directory, 'movie_ids': movie_ids, 'date_str': date_str})
+    completed_process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-stage', stage_args],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(completed_process.stdout.strip().splitlines()[-1])
+
+
+def run_scale(scale, data_directory, output_mode):
+    '''Generate the synthetic data of the scale 'scale' in 'data_directory' and benchmark every stage
+
+    Returns
+    -------
+    dict
+        A dict with keys: generate (the generation summary), stages (the results of each stage)
+    '''
+
+    summary = generate_synthetic_comment_data.generate(data_directory, duplicate_ratio=DUPLICATE_RATIO, output_mode=output_mode, **SCALES[scale])
+    movie_ids = summary.pop('movie_ids')
+    date_str = summary['date_str']
+
+    # keep a copy of the generated merged histories, to merge the raw pages into the same histories in the last stage
+    history_backup_directory = os.path.join(data_directory, 'comment_data_merged_generated')
+    shutil.copytree(config.COMMENT_MERGED_DIRECTORY, history_backup_directory)
+
+    results = {'generate': {**SCALES[scale], 'output_mode': output_mode, 'duplicate_ratio': DUPLICATE_RATIO, **summary}, 'stages': {}}
+    for stage in STAGES:
+        if stage == 'merge_crawled_comment_data':
+            shutil.rmtree(config.COMMENT_MERGED_DIRECTORY)
+            shutil.copytree(history_backup_directory, config.COMMENT_MERGED_DIRECTORY)
+        results['stages'][stage] = run_stage_process(stage, data_directory, movie_ids, date_str)
+
+    return results
+
+
+def format_report(report, previous_report=None):
+    '''Format the report 'report' as a table, with the ratio to the previous report 'previous_report' (if any) of each number'''
+
+    columns = ['seconds', 'cpu_seconds', 'peak_rss_bytes', 'write_bytes', 'output_bytes']
+    lines = [f'{"scale":<10} {"stage":<28} ' + ' '.join(f'{column:>22}' for column in columns)]
+    for scale, scale_results in report['scales'].items():
+        for stage, stage_results in scale_results['stages'].items():
+            previous_results = ((previous_report or {}).get('scales', {}).get(scale, {}).get('stages', {})).get(stage)
+            cells = []
+            for column in columns:
+                value = stage_results[column]
+                cell = f'{value:.2f}' if isinstance(value, float) else f'{value / 1024 ** 2:.1f}MiB'
+                if previous_results and previous_results.get(column):
+                    cell += f' ({value / previous_results[column]:.2f}x)'
+                cells.append(f'{cell:>22}')
+            lines.append(f'{scale:<10} {stage:<28} ' + ' '.join(cells))
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data pre-processing stages over synthetic comment data.')
+    parser.add_argument('--scale', nargs='*', choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument('--output-mode', choices=('page', 'segment'), default=config.COMMENT_CRAWLED_OUTPUT_MODE, help='the layout of the raw comment pages')
+    parser.add_argument('--output', help='write the report as a JSON file (default is printing it)')
+    parser.add_argument('--compare', help='a previous report to compare with')
+    parser.add_argument('--data-directory', help='the directory of the synthetic data (default is a temporary directory)')
+    parser.add_argument('--keep-data', action='store_true', help='keep the synthetic data after the benchmark')
+    parser.add_argument('--run-stage', help=argparse.SUPPRESS) # internal: run a stage in this process, see 'run_stage_process'
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print(json.dumps(run_stage(**json.loads(args.run_stage))))
+        sys.exit(0)
+
+    report = {'scales': {}}
+    for scale in args.scale:
+        data_directory = os.path.join(args.data_directory, scale) if args.data_directory else tempfile.mkdtemp(prefix=f'benchmark_preprocessing_{scale}_')
+        if os.path.exists(data_directory) and os.listdir(data_directory):
+            sys.exit(f'The data directory \'{data_directory}\' is not empty.')
+        try:
+            report['scales'][scale] = run_scale(scale, data_directory, args.output_mode)
+        finally:
+            if not args.keep_data:
+                shutil.rmtree(data_directory, ignore_errors=True)
+        print(f'Scale \'{scale}\' done.', file=sys.stderr)
+
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    previous_report = None
+    if args.compare:
+        with open(args.compare, mode='r', encoding='utf-8') as file:
+            previous_report = json.load(file)
+    print(format_report(report, previous_report), file=sys.stderr)
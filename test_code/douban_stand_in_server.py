@@ -0,0 +1,398 @@
+'''The DoubanStandInServer Script
+
+Summary
+-------
+This script runs a local HTTP stand-in of Douban, to measure the crawl throughput (pages/sec, CPU/page, RSS)
+end to end without hitting douban.com. It serves the routes of both crawlers:
+-- MOVIE_INFO_URL: '/subject/<movie_id>', the movie page templated from
+    './webpage_sample/movie-page-WITH-rating-sample-SIMPLIFIED.html' (or the WITHOUT-rating sample for unrated movies),
+    with an ETag so the conditional fetch of 'movie_info_crawler.crawl_movie_info_browserless' gets '304 Not Modified'
+-- MOVIE_COMMENT_URL: '/movie/subject/<movie_id>/comments?start=<comment_start_index>', the comment page templated from
+    './webpage_sample/comments-page-sample-SIMPLIFIED.html', 20 comments per page (the EMPTY page past the last comment)
+-- '/_stats': the JSON counts of served requests by route and status, bytes sent and pages/sec since the start
+
+The movies are 'movie_count' consecutive ids from 'first_movie_id', other ids get '404 Not Found'.
+Each movie has a deterministic (seeded) total comment count in 'comment_count_range', growing by 'comment_growth_per_hour'
+after the server starts (new comments are on the first pages), and its rating count follows the comment count.
+Every response is delayed by 'latency_ms' (plus a uniform jitter of 'latency_jitter_ms'),
+'error_rate' of the requests get '503 Service Unavailable' and 'hang_rate' of the requests hang for 'hang_seconds' before the response.
+
+To point both crawlers at the server, set DOUBAN_STAND_IN_BASE_URL in 'config.py' to the printed base URL,
+or call 'apply_config_override' in a benchmark script running the crawlers in the same process.
+Note the HTTP cache (HTTP_CACHE_MODE, see 'http_cache.py') serves repeated movie pages within the TTL without any request.
+
+Usage
+-----
+python test_code/douban_stand_in_server.py [--port 8765] [--movie-count 100] [--comment-count-range 0 2000]
+    [--comment-growth-per-hour 0] [--latency-ms 0] [--latency-jitter-ms 0] [--error-rate 0] [--hang-rate 0]
+    [--movie-list-file movie_list/movie_list.csv]
+'''
+
+import os
+import sys
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+# Make the modules of the program importable when running this script from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import comment_crawler
+
+
+# The directory of the webpage samples to template the served pages from
+WEBPAGE_SAMPLE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'webpage_sample')
+
+# The default settings of the stand-in server, see the module summary
+DEFAULT_SETTINGS = {
+    'host': '127.0.0.1',
+    'port': 8765,
+    'first_movie_id': 1000000,
+    'movie_count': 100,
+    # the fraction of movies without rating (served from the WITHOUT-rating sample)
+    'unrated_ratio': 0.1,
+    # the [min, max] total comment count of a movie at the server start
+    'comment_count_range': (0, 2000),
+    'comment_growth_per_hour': 0.0,
+    'latency_ms': 0.0,
+    'latency_jitter_ms': 0.0,
+    'error_rate': 0.0,
+    'hang_rate': 0.0,
+    'hang_seconds': 60.0,
+    'seed': 0
+}
+
+# The comment count of each comment page, the same as MOVIE_COMMENT_INCR_STEP
+COMMENTS_PER_PAGE = 20
+
+# The HTML of a comment <li> element, the same markup as './webpage_sample/comments-page-sample-SIMPLIFIED.html'
+COMMENT_LI_TEMPLATE = (
+    '<li class=""><div class="desc"><a href="/people/{user_id}/"></a><div class="user-info"><div class="user-name">{user_name}</div>'
+    '<span class="rating-stars" data-rating="{rating_stars}"></span><span class="date">{comment_timestamp}</span></div></div>'
+    '<div class="comment-content"><p class="LinesEllipsis  ">{comment_content}<wbr></p></div>'
+    '<div class="btn-info"><div class="ic-btn ic-btn-like  left "><span class="text">{comment_like_ct}</span></div>'
+    '<div class="ic-btn ic-btn-more   right"></div></div></li>\n'
+)
+
+
+def read_sample(file_name):
+    '''Read the webpage sample 'file_name' in WEBPAGE_SAMPLE_DIRECTORY'''
+
+    with open(os.path.join(WEBPAGE_SAMPLE_DIRECTORY, file_name), mode='r', encoding='utf-8') as file:
+        return file.read()
+
+
+def replace_once(text, old, new):
+    '''Replace the only occurrence of 'old' in 'text' by 'new', raise a ValueError if 'old' does not occur exactly once'''
+
+    if text.count(old) != 1:
+        raise ValueError(f'\'{old}\' does not occur exactly once in the webpage sample.')
+    return text.replace(old, new)
+
+
+def load_templates():
+    '''Load the page templates from the webpage samples, with str.format placeholders for the templated values
+
+    Returns
+    -------
+    dict
+        A dict with keys:
+        -- rated_movie: the movie page with rating (placeholders: movie_id, rating_count, rating_avg, rating_per_1 ... rating_per_5)
+        -- unrated_movie: the movie page without rating (placeholder: movie_id)
+        -- comment_head, comment_tail: the comment page before/after the comment <li> elements (placeholders: movie_id, total_comment_count)
+        -- comment_contents: the (user name, comment content) pairs of the comment sample, to generate comments from
+    '''
+
+    # escape the braces of the HTML (e.g., in the JSON-LD) before adding the placeholders
+    rated_movie = read_sample('movie-page-WITH-rating-sample-SIMPLIFIED.html').replace('{', '{{').replace('}', '}}')
+    rated_movie = rated_movie.replace('35268614', '{movie_id}')
+    rated_movie = replace_once(rated_movie, '"ratingCount": "21094"', '"ratingCount": "{rating_count}"')
+    rated_movie = replace_once(rated_movie, '"ratingValue": "7.0"', '"ratingValue": "{rating_avg}"')
+    rated_movie = replace_once(rated_movie, 'property="v:average">7.0<', 'property="v:average">{rating_avg}<')
+    rated_movie = replace_once(rated_movie, '<span property="v:votes">21095</span>', '<span property="v:votes">{rating_count}</span>')
+    # the rating weights are listed from 5 stars to 1 star
+    stars = iter(range(5, 0, -1))
+    rated_movie = re.sub(r'<span class="rating_per">[0-9.]+%</span>', lambda match: f'<span class="rating_per">{{rating_per_{next(stars)}}}%</span>', rated_movie)
+
+    unrated_movie = read_sample('movie-page-WITHOUT-rating-sample-SIMPLIFIED.html').replace('{', '{{').replace('}', '}}')
+    unrated_movie = unrated_movie.replace('35749842', '{movie_id}')
+
+    comment_page = read_sample('comments-page-sample-SIMPLIFIED.html')
+    comment_contents = [
+        (comment['user_name'], comment['comment_content'])
+        for comment in comment_crawler.parse_html(0, comment_page, config.MOVIE_COMMENT_URL)
+    ]
+    comment_page = comment_page.replace('{', '{{').replace('}', '}}')
+    comment_page = replace_once(comment_page, '/movie/subject/35633650/', '/movie/subject/{movie_id}/')
+    comment_page = replace_once(comment_page, '全部短评 (104938)', '全部短评 ({total_comment_count})')
+    ul_start = comment_page.index('<ul class="list comment-list">') + len('<ul class="list comment-list">')
+    ul_end = comment_page.index('</ul>', ul_start)
+
+    return {
+        'rated_movie': rated_movie,
+        'unrated_movie': unrated_movie,
+        'comment_head': comment_page[:ul_start] + '\n',
+        'comment_tail': comment_page[ul_end:],
+        'comment_contents': comment_contents
+    }
+
+
+class DoubanStandIn:
+    '''The deterministic data of the stand-in movies and comments, and the rendering of their pages'''
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.templates = load_templates()
+        self.start_time = datetime.now(config.TIME_ZONE).replace(microsecond=0)
+        # the served request counts by (route, status), and the bytes sent
+        self.request_counts = {}
+        self.bytes_sent = 0
+        self.stats_lock = threading.Lock()
+
+    def get_random(self, *keys):
+        '''Get a random generator seeded by the server seed and 'keys', i.e., the same values at every request'''
+
+        return random.Random(hashlib.sha256(repr((self.settings['seed'],) + keys).encode('utf-8')).digest())
+
+    def has_movie(self, movie_id):
+        first_movie_id = self.settings['first_movie_id']
+        return first_movie_id <= movie_id < first_movie_id + self.settings['movie_count']
+
+    def get_base_comment_count(self, movie_id):
+        '''Get the total comment count of the movie 'movie_id' at the server start'''
+
+        min_count, max_count = self.settings['comment_count_range']
+        return self.get_random('comment_count', movie_id).randint(min_count, max_count)
+
+    def get_total_comment_count(self, movie_id):
+        '''Get the current total comment count of the movie 'movie_id', growing by 'comment_growth_per_hour' '''
+
+        elapsed_hours = (datetime.now(config.TIME_ZONE) - self.start_time).total_seconds() / 3600
+        return self.get_base_comment_count(movie_id) + int(elapsed_hours * self.settings['comment_growth_per_hour'])
+
+    def get_comment_post_time(self, movie_id, serial_number):
+        '''Get the post time of the 'serial_number'-th comment (from 0, the oldest) of the movie 'movie_id':
+        one comment per minute before the server start, then 'comment_growth_per_hour' comments per hour
+        '''
+
+        base_comment_count = self.get_base_comment_count(movie_id)
+        if serial_number < base_comment_count:
+            return self.start_time - timedelta(minutes=base_comment_count - serial_number)
+        return self.start_time + timedelta(hours=(serial_number - base_comment_count + 1) / self.settings['comment_growth_per_hour'])
+
+    def render_movie_page(self, movie_id):
+        '''Render the movie page of the movie 'movie_id', its rating follows the current total comment count'''
+
+        rng = self.get_random('movie', movie_id)
+        if rng.random() < self.settings['unrated_ratio']:
+            return self.templates['unrated_movie'].format(movie_id=movie_id)
+
+        weights = [rng.random() for _ in range(5)]
+        rating_pers = [round(weight / sum(weights) * 100, 1) for weight in weights]
+        rating_avg = sum(stars * rating_per for stars, rating_per in zip(range(1, 6), rating_pers)) / 50
+        return self.templates['rated_movie'].format(
+            movie_id=movie_id,
+            rating_count=self.get_total_comment_count(movie_id) * 3 + 1,
+            rating_avg=f'{rating_avg:.1f}',
+            **{f'rating_per_{stars}': f'{rating_per:.1f}' for stars, rating_per in zip(range(1, 6), rating_pers)}
+        )
+
+    def render_comment_page(self, movie_id, comment_start_index):
+        '''Render the comment page of the movie 'movie_id' from the comment index 'comment_start_index' (0 is the newest comment)'''
+
+        total_comment_count = self.get_total_comment_count(movie_id)
+        comment_lis = []
+        for comment_index in range(comment_start_index, min(comment_start_index + COMMENTS_PER_PAGE, total_comment_count)):
+            serial_number = total_comment_count - 1 - comment_index
+            rng = self.get_random('comment', movie_id, serial_number)
+            user_name, comment_content = rng.choice(self.templates['comment_contents'])
+            comment_lis.append(COMMENT_LI_TEMPLATE.format(
+                user_id=f'{movie_id}{serial_number:07d}',
+                user_name=user_name,
+                rating_stars=rng.randint(1, 5),
+                comment_timestamp=self.get_comment_post_time(movie_id, serial_number).strftime('%Y-%m-%d %H:%M:%S'),
+                comment_content=comment_content,
+                comment_like_ct=rng.choice([0, 0, 0, 1, 2, 5, 17])
+            ))
+
+        return (
+            self.templates['comment_head'].format(movie_id=movie_id, total_comment_count=total_comment_count)
+            + ''.join(comment_lis)
+            + self.templates['comment_tail'].format(movie_id=movie_id, total_comment_count=total_comment_count)
+        )
+
+    def count_request(self, route, status, sent_bytes):
+        with self.stats_lock:
+            self.request_counts[(route, status)] = self.request_counts.get((route, status), 0) + 1
+            self.bytes_sent += sent_bytes
+
+    def get_stats(self):
+        '''Get the served request counts by route and status, bytes sent and pages/sec since the server start'''
+
+        with self.stats_lock:
+            elapsed_seconds = (datetime.now(config.TIME_ZONE) - self.start_time).total_seconds()
+            page_count = sum(count for (route, status), count in self.request_counts.items() if route != 'stats' and status in (200, 304))
+            return {
+                'start_time': self.start_time.isoformat(),
+                'elapsed_seconds': elapsed_seconds,
+                'requests': [
+                    {'route': route, 'status': status, 'count': count}
+                    for (route, status), count in sorted(self.request_counts.items())
+                ],
+                'bytes_sent': self.bytes_sent,
+                'pages_per_second': page_count / elapsed_seconds if elapsed_seconds > 0 else 0.0
+            }
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    '''The HTTP request handler of the stand-in server, see the module summary'''
+
+    # the DoubanStandIn of the server, set by 'start_stand_in_server'
+    stand_in = None
+
+    def do_GET(self):
+        stand_in = self.stand_in
+        settings = stand_in.settings
+        url_parts = urlsplit(self.path)
+
+        if url_parts.path == '/_stats':
+            self.send_body('stats', 200, json.dumps(stand_in.get_stats(), indent=4), 'application/json; charset=utf-8')
+            return
+
+        movie_match = re.fullmatch(r'/subject/(\d+)/?', url_parts.path)
+        comment_match = re.fullmatch(r'/movie/subject/(\d+)/comments/?', url_parts.path)
+        route = 'movie_info' if movie_match else 'comment' if comment_match else 'unknown'
+        movie_id = int((movie_match or comment_match).group(1)) if route != 'unknown' else None
+
+        # latency and error injection
+        delay_seconds = (settings['latency_ms'] + random.uniform(0, settings['latency_jitter_ms'])) / 1000
+        if random.random() < settings['hang_rate']:
+            delay_seconds += settings['hang_seconds']
+        if delay_seconds > 0:
+            time.sleep(delay_seconds)
+        if random.random() < settings['error_rate']:
+            self.send_body(route, 503, 'Service Unavailable (injected error)', 'text/plain; charset=utf-8')
+            return
+        if movie_id is None or not stand_in.has_movie(movie_id):
+            self.send_body(route, 404, 'Not Found', 'text/plain; charset=utf-8')
+            return
+
+        if route == 'movie_info':
+            body = stand_in.render_movie_page(movie_id)
+        else:
+            comment_start_index = int(parse_qs(url_parts.query).get('start', ['0'])[0])
+            body = stand_in.render_comment_page(movie_id, comment_start_index)
+        self.send_body(route, 200, body, 'text/html; charset=utf-8')
+
+    def send_body(self, route, status, body, content_type):
+        '''Send the response with the body 'body', or '304 Not Modified' if the request's If-None-Match is the ETag of the body'''
+
+        content = body.encode('utf-8')
+        etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, content = 304, b''
+
+        self.send_response(status)
+        if status in (200, 304):
+            self.send_header('ETag', etag)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.stand_in.count_request(route, status, len(content))
+
+    def log_message(self, format, *args):
+        # no access log in the terminal/console, see '/_stats'
+        pass
+
+
+def start_stand_in_server(**settings):
+    '''Start the stand-in server in a daemon thread
+
+    Parameters
+    ----------
+    **settings
+        The settings to override DEFAULT_SETTINGS, e.g., port=0 to listen on a free port
+
+    Returns
+    -------
+    http.server.ThreadingHTTPServer
+        The HTTP server, with the attributes 'stand_in' (the DoubanStandIn) and 'base_url'
+    '''
+
+    stand_in = DoubanStandIn({**DEFAULT_SETTINGS, **settings})
+    request_handler = type('BoundStandInRequestHandler', (StandInRequestHandler,), {'stand_in': stand_in})
+    server = ThreadingHTTPServer((stand_in.settings['host'], stand_in.settings['port']), request_handler)
+    server.daemon_threads = True
+    server.stand_in = stand_in
+    server.base_url = f'http://{stand_in.settings["host"]}:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, name='douban_stand_in_server', daemon=True).start()
+
+    return server
+
+
+def apply_config_override(base_url):
+    '''Point both crawlers at the stand-in server at 'base_url' in the current process,
+    i.e., the same as setting DOUBAN_STAND_IN_BASE_URL in 'config.py' (see 'config.set_douban_base_url')
+    '''
+
+    config.set_douban_base_url(base_url)
+
+
+def write_movie_list(csv_file, first_movie_id, movie_count):
+    '''Write the stand-in movies as a movie list CSV file (see 'movie_list_manager.read_movie_list'), e.g., MOVIE_LIST_FILE'''
+
+    movie_ids = range(first_movie_id, first_movie_id + movie_count)
+    df = pd.DataFrame({
+        'movie_id': movie_ids,
+        'last_crawl_total_comment_count': 0,
+        'rating_start_date': None,
+        'have_rates': None,
+        'note': 'douban stand-in'
+    }, index=movie_ids)
+    os.makedirs(os.path.dirname(os.path.abspath(csv_file)), exist_ok=True)
+    df.to_csv(csv_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local HTTP stand-in of Douban for end-to-end crawl benchmarks.')
+    parser.add_argument('--host', default=DEFAULT_SETTINGS['host'])
+    parser.add_argument('--port', type=int, default=DEFAULT_SETTINGS['port'])
+    parser.add_argument('--first-movie-id', type=int, default=DEFAULT_SETTINGS['first_movie_id'])
+    parser.add_argument('--movie-count', type=int, default=DEFAULT_SETTINGS['movie_count'])
+    parser.add_argument('--unrated-ratio', type=float, default=DEFAULT_SETTINGS['unrated_ratio'])
+    parser.add_argument('--comment-count-range', type=int, nargs=2, default=DEFAULT_SETTINGS['comment_count_range'], metavar=('MIN', 'MAX'))
+    parser.add_argument('--comment-growth-per-hour', type=float, default=DEFAULT_SETTINGS['comment_growth_per_hour'])
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_SETTINGS['latency_ms'])
+    parser.add_argument('--latency-jitter-ms', type=float, default=DEFAULT_SETTINGS['latency_jitter_ms'])
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_SETTINGS['error_rate'])
+    parser.add_argument('--hang-rate', type=float, default=DEFAULT_SETTINGS['hang_rate'])
+    parser.add_argument('--hang-seconds', type=float, default=DEFAULT_SETTINGS['hang_seconds'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_SETTINGS['seed'])
+    parser.add_argument('--movie-list-file', help='write the stand-in movies as a movie list CSV file, e.g., movie_list/movie_list.csv')
+    args = vars(parser.parse_args())
+
+    movie_list_file = args.pop('movie_list_file')
+    if movie_list_file:
+        write_movie_list(movie_list_file, args['first_movie_id'], args['movie_count'])
+        print(f'Movie list of {args["movie_count"]} stand-in movies written to \'{movie_list_file}\'.')
+
+    server = start_stand_in_server(**args)
+    print(f'Douban stand-in serving {args["movie_count"]} movies at {server.base_url} (stats: {server.base_url}/_stats).')
+    print(f'Set DOUBAN_STAND_IN_BASE_URL = \'{server.base_url}\' in \'config.py\' to crawl it.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
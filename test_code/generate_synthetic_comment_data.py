@@ -0,0 +1,249 @@
+'''The SyntheticCommentDataGenerator Script
+
+Summary
+-------
+This script generates synthetic comment data in the same file layouts as the crawlers and the data pre-processor,
+to benchmark the pre-processing pipeline offline at any scale (see 'test_code/benchmark_preprocessing.py'):
+-- the merged history of each movie (COMMENT_MERGED_FILE), 'history_comment_count' comments,
+    byte-identical to the output of 'data_preprocessor.save_dataframe_as_json' but written in chunks (no full dataframe in memory)
+-- the raw comment pages of each movie crawled on a date, 'daily_comment_count' comments in pages of MOVIE_COMMENT_INCR_STEP,
+    as per-page json files (COMMENT_CRAWLED_FILE) or one JSONL segment file (COMMENT_CRAWLED_SEGMENT_FILE)
+    depending on 'output_mode' (see COMMENT_CRAWLED_OUTPUT_MODE), where 'duplicate_ratio' of the crawled comments
+    are already in the merged history (e.g., re-crawled pages), the others are new
+
+The comments are deterministic: the content is drawn from the comments of './webpage_sample/comments-page-sample-SIMPLIFIED.html',
+and each comment has a unique (user_name, comment_timestamp), i.e., the duplicate key of 'data_preprocessor.merge_comment_data'.
+
+Usage
+-----
+python test_code/generate_synthetic_comment_data.py <data directory> [--movie-count 1] [--history-comment-count 10000]
+    [--daily-comment-count 1000] [--duplicate-ratio 0.3] [--output-mode segment]
+'''
+
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+# Make the modules of the program importable when running this script from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import util
+import comment_crawler
+
+
+# The directory of the webpage samples, to draw the comment contents from
+WEBPAGE_SAMPLE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'webpage_sample')
+# The id of the first synthetic movie, the movies are consecutive ids
+FIRST_MOVIE_ID = 1000000
+# The post time of the first (oldest) comment of each movie, and the seconds between consecutive comments
+FIRST_COMMENT_TIME = datetime(2020, 1, 1)
+COMMENT_INTERVAL_SECONDS = 7
+# The count of comments to generate and write at a time
+CHUNK_SIZE = 100000
+
+# The (user name, comment content) pairs of the comment page sample, read at the first use
+_sample_comments = None
+
+
+def configure_data_directory(data_directory):
+    '''Point the data and log directories and files of 'config' at 'data_directory', and create the directories
+
+    Parameters
+    ----------
+    data_directory: str
+        The directory of the synthetic data
+
+    Returns
+    -------
+    None
+    '''
+
+    config.DATA_DIRECTORY = data_directory
+    config.COMMENT_CRAWLED_DIRECTORY = os.path.join(data_directory, 'comment_data_crawled')
+    config.COMMENT_DAILY_DIRECTORY = os.path.join(data_directory, 'comment_data_daily')
+    config.COMMENT_MERGED_DIRECTORY = os.path.join(data_directory, 'comment_data_merged')
+    config.COMMENT_CRAWLED_FILE = os.path.join(config.COMMENT_CRAWLED_DIRECTORY, 'comment_{movie_id}_{date_str}_{timestamp_str}.json')
+    config.COMMENT_CRAWLED_SEGMENT_FILE = os.path.join(config.COMMENT_CRAWLED_DIRECTORY, 'comment_{movie_id}_{date_str}_{timestamp_str}.jsonl')
+    config.COMMENT_DAILY_FILE = os.path.join(config.COMMENT_DAILY_DIRECTORY, 'comment_{movie_id}_{date_str}.json')
+    config.COMMENT_MERGED_FILE = os.path.join(config.COMMENT_MERGED_DIRECTORY, 'comment_{movie_id}.json')
+    config.LOG_DIRECTORY = os.path.join(data_directory, 'log')
+    config.SCHEDULING_DIRECTORY = os.path.join(data_directory, 'scheduling')
+
+    for directory in (config.COMMENT_CRAWLED_DIRECTORY, config.COMMENT_DAILY_DIRECTORY, config.COMMENT_MERGED_DIRECTORY, config.LOG_DIRECTORY, config.SCHEDULING_DIRECTORY):
+        os.makedirs(directory, exist_ok=True)
+    util.update_log_and_daily_file()
+
+
+def get_sample_comments():
+    '''Get the (user name, comment content) pairs of the comment page sample'''
+
+    global _sample_comments
+
+    if _sample_comments is None:
+        with open(os.path.join(WEBPAGE_SAMPLE_DIRECTORY, 'comments-page-sample-SIMPLIFIED.html'), mode='r', encoding='utf-8') as file:
+            html = file.read()
+        _sample_comments = [(comment['user_name'], comment['comment_content']) for comment in comment_crawler.parse_html(0, html, config.MOVIE_COMMENT_URL)]
+    return _sample_comments
+
+
+def create_comments(movie_id, serial_numbers, crawl_timestamp, merge_timestamp=None):
+    '''Create the comments with the serial numbers 'serial_numbers' (from 0, the oldest) of the movie 'movie_id'
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    serial_numbers: iterable
+        The serial numbers of the comments, the same serial number is the same comment
+    crawl_timestamp: str
+        The crawl timestamp of the comments (see 'freshness_tracker.get_current_timestamp')
+    merge_timestamp: str, optional
+        The merge timestamp of the comments, only for the merged history (default is None, i.e., no 'merge_timestamp' key)
+
+    Returns
+    -------
+    list
+        The comment dicts, with the same keys as crawled by 'comment_crawler.crawl_comment'
+    '''
+
+    sample_comments = get_sample_comments()
+    comments = []
+    for serial_number in serial_numbers:
+        rng = random.Random(movie_id * 1000003 + serial_number)
+        user_name, comment_content = sample_comments[rng.randrange(len(sample_comments))]
+        comment = {
+            'movie_id': movie_id,
+            'user_url': f'https://m.douban.com/people/{movie_id}{serial_number:08d}/',
+            'user_name': f'{user_name}{serial_number}',
+            'rating_stars': rng.randint(1, 5),
+            'comment_timestamp': (FIRST_COMMENT_TIME + timedelta(seconds=serial_number * COMMENT_INTERVAL_SECONDS)).strftime('%Y-%m-%d %H:%M:%S'),
+            'comment_content': comment_content,
+            'comment_like_ct': rng.choice((0, 0, 0, 1, 2, 5, 17)),
+            'crawl_timestamp': crawl_timestamp
+        }
+        if merge_timestamp is not None:
+            comment['merge_timestamp'] = merge_timestamp
+        comments.append(comment)
+
+    return comments
+
+
+def write_merged_history(movie_id, history_comment_count):
+    '''Write the merged history of 'history_comment_count' comments of the movie 'movie_id' into COMMENT_MERGED_FILE,
+    in the layout of 'data_preprocessor.save_dataframe_as_json' (a json array with indent 4)
+
+    Returns
+    -------
+    int
+        The bytes written
+    '''
+
+    comment_merged_file = config.COMMENT_MERGED_FILE.format(movie_id=movie_id)
+    crawl_timestamp = merge_timestamp = datetime.now(config.TIME_ZONE).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    with open(comment_merged_file, mode='w', encoding='utf-8') as file:
+        file.write('[')
+        for chunk_start in range(0, history_comment_count, CHUNK_SIZE):
+            serial_numbers = range(chunk_start, min(chunk_start + CHUNK_SIZE, history_comment_count))
+            chunk_json = json.dumps(create_comments(movie_id, serial_numbers, crawl_timestamp, merge_timestamp), indent=4, ensure_ascii=False)
+            # the records of the chunk without the enclosing '[' and '\n]' of the chunk array
+            file.write((',' if chunk_start > 0 else '') + chunk_json[1:-2])
+        file.write('\n]' if history_comment_count > 0 else ']')
+
+    return os.path.getsize(comment_merged_file)
+
+
+def write_crawled_pages(movie_id, history_comment_count, daily_comment_count, duplicate_ratio, output_mode, date_str):
+    '''Write the raw comment pages of the movie 'movie_id' crawled on the date 'date_str'
+
+    Parameters
+    ----------
+    movie_id: int
+        The id of the movie
+    history_comment_count: int
+        The count of comments in the merged history, i.e., the serial number of the first new comment
+    daily_comment_count: int
+        The count of crawled comments, in pages of MOVIE_COMMENT_INCR_STEP comments
+    duplicate_ratio: float
+        The ratio of the crawled comments already in the merged history
+    output_mode: str
+        The raw output mode, 'page' or 'segment' (see COMMENT_CRAWLED_OUTPUT_MODE)
+    date_str: str
+        The crawl date, i.e., today (the segment files are named by the current date, see 'comment_crawler.CommentSegmentWriter')
+
+    Returns
+    -------
+    int
+        The bytes written
+    '''
+
+    duplicate_count = min(int(daily_comment_count * duplicate_ratio), history_comment_count)
+    new_count = daily_comment_count - duplicate_count
+    # the newest comments first, as on the comment pages: the new comments, then the latest comments of the history
+    serial_numbers = list(range(history_comment_count + new_count - 1, history_comment_count - duplicate_count - 1, -1))
+    crawl_time = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=config.TIME_ZONE)
+
+    written_files = []
+    segment_writer = comment_crawler.CommentSegmentWriter(movie_id) if output_mode == 'segment' else None
+    for page_index, page_start in enumerate(range(0, len(serial_numbers), config.MOVIE_COMMENT_INCR_STEP)):
+        page_time = crawl_time + timedelta(seconds=page_index)
+        comments = create_comments(movie_id, serial_numbers[page_start:page_start + config.MOVIE_COMMENT_INCR_STEP], page_time.isoformat(timespec='seconds'))
+        page_url = config.MOVIE_COMMENT_URL.format(movie_id=movie_id, comment_start_index=page_start)
+        if segment_writer is not None:
+            segment_writer.write_page(comments, page_url)
+            continue
+        # the same layout as 'comment_crawler.save_data_as_json'
+        comment_crawled_file = config.COMMENT_CRAWLED_FILE.format(movie_id=movie_id, date_str=date_str, timestamp_str=page_time.strftime('%H.%M.%S.%f'))
+        with open(comment_crawled_file, mode='w', encoding='utf-8') as file:
+            json.dump(comments, file, indent=4, ensure_ascii=False)
+        written_files.append(comment_crawled_file)
+
+    if segment_writer is not None and segment_writer.close() is not None:
+        written_files.append(segment_writer.segment_file)
+
+    return sum(os.path.getsize(file) for file in written_files)
+
+
+def generate(data_directory, movie_count=1, history_comment_count=10000, daily_comment_count=1000, duplicate_ratio=0.3, output_mode='segment'):
+    '''Generate the merged histories and the raw comment pages (crawled today) of 'movie_count' movies in 'data_directory'
+
+    Returns
+    -------
+    dict
+        A dict with keys: movie_ids, date_str, history_bytes, crawled_bytes, generate_seconds
+    '''
+
+    start = datetime.now()
+    configure_data_directory(data_directory)
+    date_str = datetime.now(config.TIME_ZONE).strftime('%Y-%m-%d')
+
+    movie_ids = list(range(FIRST_MOVIE_ID, FIRST_MOVIE_ID + movie_count))
+    history_bytes = crawled_bytes = 0
+    for movie_id in movie_ids:
+        history_bytes += write_merged_history(movie_id, history_comment_count)
+        crawled_bytes += write_crawled_pages(movie_id, history_comment_count, daily_comment_count, duplicate_ratio, output_mode, date_str)
+
+    return {
+        'movie_ids': movie_ids,
+        'date_str': date_str,
+        'history_bytes': history_bytes,
+        'crawled_bytes': crawled_bytes,
+        'generate_seconds': (datetime.now() - start).total_seconds()
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic merged histories and raw comment pages.')
+    parser.add_argument('data_directory')
+    parser.add_argument('--movie-count', type=int, default=1)
+    parser.add_argument('--history-comment-count', type=int, default=10000)
+    parser.add_argument('--daily-comment-count', type=int, default=1000)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.3)
+    parser.add_argument('--output-mode', choices=('page', 'segment'), default='segment')
+    args = parser.parse_args()
+
+    summary = generate(**vars(args))
+    print(json.dumps({key: value for key, value in summary.items() if key != 'movie_ids'}, indent=4))
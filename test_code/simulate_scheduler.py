@@ -0,0 +1,781 @@
+'''The SchedulerSimulator Script
+
+Summary
+-------
+This script simulates the jobs of the program over days of virtual time, to plan the capacity of a host
+(e.g., how many movies one host can crawl) without running the program for days: 30 simulated days finish in seconds.
+
+The real scheduling code runs under a virtual clock:
+-- the daily routine job ('daily_job_dispatcher.dispatch_daily_routine_jobs'), which updates the movie list, re-calculates
+    the cron schedule and re-schedules the comment crawl jobs ('scheduler.schedule_comment_crawl_jobs') every midnight
+-- the comment crawl jobs ('comment_crawl_dispatcher.dispatch_crawl_comment'), including the probe, the slices and
+    the crawl-interval update ('comment_crawl_dispatcher.update_comment_crawl_job_cron_schedule'),
+    with the overrun feedback of 'job_run_tracker' and the comment velocity of the crawl budget optimizer
+-- the movie info crawl job ('movie_info_crawl_dispatcher.dispatch_crawl_movie_info'), which feeds the rating counts to the probe
+while the fetch layer is a stub ('comment_crawler.crawl_comment' and 'movie_info_crawler.crawl_movie_info'):
+-- each fetch takes a random (lognormal) latency, and fails at a given rate
+-- the comments of each movie grow at a random (lognormal) rate per day, which decays by half every half-life
+
+The APScheduler BackgroundScheduler is replaced by VirtualScheduler, which fires the real APScheduler triggers (with jitter)
+at virtual time, and applies the rules of the scheduler: the threads of the 'default' executor, 'max_instances', 'coalesce'
+and 'misfire_grace_time' (see EXECUTORS and JOB_DEFAULTS), with the job events recorded by 'job_run_tracker'.
+In the 'cron' comment crawl run mode, a run only waits for a thread, not for other runs,
+so a run is executed at once when it starts, with the virtual clock advanced by its sleeps and fetches,
+and it ends at the virtual time it finishes (i.e., its effects, e.g., the updated cron schedule, are applied at its start).
+
+The report is written as JSON, and printed as a table of each day, including:
+-- concurrency: the peak and mean count of running jobs and of runs waiting for a thread, of each day and each hour of the day
+-- runs: the executed, error, missed (misfired), max_instances (dropped since the previous run is still running)
+    and coalesced runs of each job kind
+-- fetches: the comment pages and movie info pages fetched (and failed) each day
+-- freshness: the delay from the time a comment is posted until it is captured (by the first page of the next comment crawl job),
+    and the ratio of the comments posted in the simulation that are captured within one day (see 'comment_crawl_budget_optimizer.py')
+-- intervals: the comment crawl intervals in days (the 'day' in the cron schedule) at the end of each day
+
+Only the 'cron' comment crawl run mode is simulated, and the data pre-process jobs are not (see 'test_code/benchmark_preprocessing.py').
+Other program configurations can be set by '--config NAME=VALUE', e.g., '--config COMMENT_CRAWL_SCHEDULE_MODE=duration'.
+
+Usage
+-----
+python test_code/simulate_scheduler.py [--days 30] [--movie-count 100] [--new-movies-per-day 0] [--fetch-latency 5]
+    [--fetch-error-rate 0] [--comment-growth-median 50] [--max-workers 500] [--config NAME=VALUE ...] [--output report.json] [--keep-data]
+'''
+
+import os
+import sys
+import ast
+import json
+import math
+import time
+import heapq
+import random
+import shutil
+import argparse
+import tempfile
+import itertools
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from apscheduler.events import (
+    JobEvent, JobSubmissionEvent, JobExecutionEvent,
+    EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_ADDED, EVENT_JOB_REMOVED
+)
+from apscheduler.jobstores.base import ConflictingIdError
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+# Make the modules of the program importable when running this script from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import util
+import scheduler
+import daily_job_dispatcher
+import comment_crawler
+import comment_crawl_dispatcher
+import comment_crawl_budget_optimizer
+import movie_info_crawler
+import movie_info_crawl_dispatcher
+import movie_list_manager
+import job_run_tracker
+import job_profiler
+import generate_synthetic_comment_data
+
+
+# The modules whose 'time' module and 'datetime' class are replaced by the virtual clock
+SIMULATED_MODULES = [
+    util, scheduler, comment_crawl_dispatcher, comment_crawl_budget_optimizer, movie_info_crawl_dispatcher,
+    movie_list_manager, job_run_tracker, job_profiler
+]
+# The program configurations set by the simulator, which cannot be changed by '--config'
+# (the comment crawl jobs run in the APScheduler threads, and the stub fetch layer saves no data)
+SIMULATED_CONFIG = {
+    'COMMENT_CRAWL_RUN_MODE': 'cron',
+    'COMMENT_CRAWL_PIPELINE_ENABLED': False,
+    'COMMENT_BACKFILL_MODE': 'sequential',
+    'COMMENT_CRAWLED_OUTPUT_MODE': 'page',
+    'DATA_PREPROCESS_MODE': 'event'
+}
+# The virtual time the program starts, i.e., after the daily routine jobs of the first day
+START_TIME = datetime(2024, 1, 1, 1, 0, 0, tzinfo=config.TIME_ZONE)
+# The virtual time of each day to put the newly added movies into MOVIE_LIST_UPDATE_FILE (before the daily routine job at midnight)
+NEW_MOVIE_TIME = timedelta(hours=23, minutes=30)
+# The id of the first simulated movie, the movies are consecutive ids
+FIRST_MOVIE_ID = 1000000
+# The default settings of the stub fetch layer and the comment growth, see the module summary
+DEFAULT_SETTINGS = {
+    'days': 30,
+    'movie_count': 100,
+    'new_movies_per_day': 0,
+    'fetch_latency': config.COMMENT_CRAWL_ESTIMATED_SECOND_PER_PAGE, # the median seconds of a comment page fetch
+    'movie_info_latency': 2.0, # the median seconds of a movie info page fetch
+    'latency_sigma': 0.5, # the sigma of the lognormal latency
+    'fetch_error_rate': 0.0,
+    'initial_comment_median': 2000, # the median comment count of a movie when it is added
+    'initial_comment_sigma': 1.5,
+    'comment_growth_median': 50, # the median comment increment per day of a movie when it is added
+    'comment_growth_sigma': 1.5,
+    'comment_growth_half_life_days': 30, # 0 means the comment increment per day never decays
+    'ratings_per_comment': 4, # the rating count of a movie is its comment count multiplied by 'ratings_per_comment'
+    'max_workers': None, # the threads of the 'default' executor, None means the threads in EXECUTORS
+    'seed': 0
+}
+# The seconds of the buckets to integrate the comment growth in the freshness of captured comments
+FRESHNESS_BUCKET_SECONDS = 3600
+# The 'misfire_grace_time' of jobs if not set in JOB_DEFAULTS, i.e., the default of APScheduler
+DEFAULT_MISFIRE_GRACE_TIME = 1
+
+# The virtual clock of the simulated modules, see 'patch_simulated_modules'
+_clock = None
+
+
+class VirtualClock:
+    '''The virtual clock, in POSIX timestamp seconds'''
+
+    def __init__(self, start_time):
+        self.timestamp = start_time.timestamp()
+        # the date string of the current date, and the timestamps of its start and end
+        self.date = (None, 0.0, 0.0)
+
+    def time(self):
+        return self.timestamp
+
+    def sleep(self, seconds):
+        # in whole microseconds as 'datetime', so the timestamp of 'now' (e.g., the run date of a job) is the same as the clock
+        self.timestamp = (round(self.timestamp * 1e6) + round(max(seconds, 0) * 1e6)) / 1e6
+
+    def now(self):
+        return datetime.fromtimestamp(self.timestamp, config.TIME_ZONE)
+
+    def get_date_str(self):
+        date_str, date_start, date_end = self.date
+        if not date_start <= self.timestamp < date_end:
+            date_start = self.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            self.date = (date_start.strftime('%Y-%m-%d'), date_start.timestamp(), (date_start + timedelta(days=1)).timestamp())
+        return self.date[0]
+
+
+class VirtualTime:
+    '''The 'time' module of the simulated modules, whose clocks and 'sleep' are the virtual clock'''
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def time(self):
+        return _clock.time()
+
+    def monotonic(self):
+        return _clock.time()
+
+    def sleep(self, seconds):
+        _clock.sleep(seconds)
+
+
+class VirtualDatetime(datetime):
+    '''The 'datetime' class of the simulated modules, whose 'now' is the virtual clock'''
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.fromtimestamp(_clock.time(), tz)
+
+
+def patch_simulated_modules(clock):
+    '''Replace the 'time' module and the 'datetime' class of SIMULATED_MODULES by the virtual clock 'clock' '''
+
+    global _clock
+
+    _clock = clock
+    for module in SIMULATED_MODULES:
+        if getattr(module, 'time', None) is time:
+            module.time = VirtualTime()
+        if getattr(module, 'datetime', None) is datetime:
+            module.datetime = VirtualDatetime
+
+
+class SimulatedJob:
+    '''A job of VirtualScheduler, with the attributes of 'apscheduler.job.Job' read by the program (e.g., 'scheduler.save_jobs_to_csv')'''
+
+    def __init__(self, id, func, args, kwargs, trigger, executor, coalesce, misfire_grace_time, max_instances):
+        self.id = id
+        self.name = getattr(func, '__qualname__', repr(func))
+        self.func = func
+        self.args = tuple(args or ())
+        self.kwargs = dict(kwargs or {})
+        self.trigger = trigger
+        self.executor = executor
+        self.coalesce = coalesce
+        self.misfire_grace_time = misfire_grace_time
+        self.max_instances = max_instances
+        self.next_run_time = None
+
+    def get_run_times(self, now):
+        '''Get the due run times of the job until 'now' (see 'apscheduler.job.Job._get_run_times')'''
+
+        run_times = []
+        next_run_time = self.next_run_time
+        while next_run_time is not None and next_run_time <= now:
+            run_times.append(next_run_time)
+            next_run_time = self.trigger.get_next_fire_time(next_run_time, now)
+
+        return run_times
+
+
+class VirtualScheduler:
+    '''The stand-in of the APScheduler BackgroundScheduler (see 'scheduler.start_scheduler') at virtual time, see the module summary'''
+
+    def __init__(self, clock, max_workers, job_defaults):
+        self.clock = clock
+        self.max_workers = max_workers
+        self.job_defaults = job_defaults
+        self.jobs = {}
+        self.listeners = []
+        # the events of the simulation, each event is a tuple (timestamp, priority, sequence number, function, arguments)
+        # -- the runs ending at a timestamp end before the other events at the timestamp (priority 0), e.g., a comment crawl slice
+        #    re-enqueued (with the same job id) at the end of the previous slice is not dropped by 'max_instances'
+        self.events = []
+        self.sequence = itertools.count()
+        # the count of submitted (waiting or running) runs of each job id, and the runs waiting for a thread
+        self.instances = Counter()
+        self.waiting_runs = deque()
+        self.running_count = 0
+        # the changes of the count of running and waiting runs, each change is a tuple (timestamp, running count, waiting count)
+        self.concurrency_changes = [(clock.time(), 0, 0)]
+
+    def add_job(self, func, args=None, kwargs=None, id=None, executor='default', replace_existing=False, trigger=None, next_run_time=None, **trigger_args):
+        trigger_classes = {'cron': CronTrigger, 'interval': IntervalTrigger, 'date': DateTrigger}
+        trigger = trigger_classes[trigger](timezone=config.TIME_ZONE, **trigger_args)
+        if id in self.jobs and not replace_existing:
+            raise ConflictingIdError(id)
+
+        job = SimulatedJob(
+            id, func, args, kwargs, trigger, executor,
+            self.job_defaults.get('coalesce', True),
+            self.job_defaults.get('misfire_grace_time', DEFAULT_MISFIRE_GRACE_TIME),
+            self.job_defaults.get('max_instances', 1)
+        )
+        job.next_run_time = next_run_time or trigger.get_next_fire_time(None, self.clock.now())
+        self.jobs[id] = job
+        if job.next_run_time is not None:
+            self.add_event(job.next_run_time.timestamp(), self.process_job, job)
+        self.dispatch_event(JobEvent(EVENT_JOB_ADDED, id, 'default'))
+        return job
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def get_jobs(self):
+        return sorted(self.jobs.values(), key=lambda job: job.next_run_time)
+
+    def remove_job(self, job_id):
+        del self.jobs[job_id]
+        self.dispatch_event(JobEvent(EVENT_JOB_REMOVED, job_id, 'default'))
+
+    def add_listener(self, callback, mask):
+        self.listeners.append((callback, mask))
+
+    def dispatch_event(self, event):
+        for callback, mask in self.listeners:
+            if event.code & mask:
+                callback(event)
+
+    def add_event(self, timestamp, func, *args, priority=1):
+        heapq.heappush(self.events, (timestamp, priority, next(self.sequence), func, args))
+
+    def run_until(self, end_time):
+        '''Process the events until the virtual time 'end_time' '''
+
+        end_timestamp = end_time.timestamp()
+        while self.events and self.events[0][0] <= end_timestamp:
+            timestamp, _, _, func, args = heapq.heappop(self.events)
+            self.clock.timestamp = timestamp
+            func(*args)
+        self.clock.timestamp = end_timestamp
+
+    def record_concurrency(self):
+        self.concurrency_changes.append((self.clock.time(), self.running_count, len(self.waiting_runs)))
+
+    def process_job(self, job):
+        '''Submit the due runs of the job 'job' and schedule its next run (see 'apscheduler.schedulers.base.BaseScheduler._process_jobs')'''
+
+        # the job is removed or replaced (rescheduled) after the event is added
+        if self.jobs.get(job.id) is not job or job.next_run_time is None or job.next_run_time.timestamp() != self.clock.time():
+            return
+
+        now = self.clock.now()
+        run_times = job.get_run_times(now)
+        if job.coalesce:
+            run_times = run_times[-1:]
+
+        if self.instances[job.id] >= job.max_instances:
+            self.dispatch_event(JobSubmissionEvent(EVENT_JOB_MAX_INSTANCES, job.id, 'default', run_times))
+        else:
+            self.instances[job.id] += 1
+            self.dispatch_event(JobSubmissionEvent(EVENT_JOB_SUBMITTED, job.id, 'default', run_times))
+            self.waiting_runs.append((job, run_times))
+            self.start_waiting_runs()
+
+        job.next_run_time = job.trigger.get_next_fire_time(run_times[-1], now)
+        if job.next_run_time is None:
+            self.remove_job(job.id)
+        else:
+            self.add_event(job.next_run_time.timestamp(), self.process_job, job)
+
+    def start_waiting_runs(self):
+        '''Start the waiting runs on the free threads of the executor'''
+
+        while self.waiting_runs and self.running_count < self.max_workers:
+            job, run_times = self.waiting_runs.popleft()
+            self.running_count += 1
+            self.add_event(self.clock.time(), self.run_job, job, run_times, 0)
+        self.record_concurrency()
+
+    def run_job(self, job, run_times, index):
+        '''Run the 'index'-th run time of the job 'job' in a thread (see 'apscheduler.executors.base.run_job'),
+        the run ends at the virtual time it finishes
+        '''
+
+        run_time = run_times[index]
+        if job.misfire_grace_time is not None and self.clock.time() - run_time.timestamp() > job.misfire_grace_time:
+            self.dispatch_event(JobExecutionEvent(EVENT_JOB_MISSED, job.id, 'default', run_time))
+            self.end_job(job, run_times, index)
+            return
+
+        start_timestamp = self.clock.time()
+        try:
+            job.func(*job.args, **job.kwargs)
+            event = JobExecutionEvent(EVENT_JOB_EXECUTED, job.id, 'default', run_time)
+        except Exception as e:
+            event = JobExecutionEvent(EVENT_JOB_ERROR, job.id, 'default', run_time, exception=e)
+        end_timestamp = self.clock.time()
+        self.clock.timestamp = start_timestamp
+
+        self.add_event(end_timestamp, self.finish_job, job, run_times, index, event, priority=0)
+
+    def finish_job(self, job, run_times, index, event):
+        self.dispatch_event(event)
+        self.end_job(job, run_times, index)
+
+    def end_job(self, job, run_times, index):
+        '''Run the next run time of the job 'job' in the same thread, or release the thread'''
+
+        if index + 1 < len(run_times):
+            self.add_event(self.clock.time(), self.run_job, job, run_times, index + 1)
+            return
+
+        self.instances[job.id] -= 1
+        self.running_count -= 1
+        self.start_waiting_runs()
+
+
+class CommentGrowthModel:
+    '''The comments of the simulated movies, and the freshness of the captured comments, see the module summary'''
+
+    def __init__(self, settings, rng):
+        self.settings = settings
+        self.rng = rng
+        # the movies, movie_id as key, each value is a dict with keys: added_timestamp, initial_count, growth_per_day
+        self.movies = {}
+        # the timestamp of the latest capture of each movie, movie_id as key
+        self.capture_timestamps = {}
+        # the comment count captured with a delay of N hours (as the index)
+        self.delay_hours = np.zeros(int(settings['days'] * 24) + 2)
+
+    def add_movie(self, movie_id, timestamp):
+        self.movies[movie_id] = {
+            'added_timestamp': timestamp,
+            'initial_count': int(self.rng.lognormal(math.log(self.settings['initial_comment_median']), self.settings['initial_comment_sigma'])),
+            'growth_per_day': self.rng.lognormal(math.log(self.settings['comment_growth_median']), self.settings['comment_growth_sigma'])
+        }
+        self.capture_timestamps[movie_id] = timestamp
+
+    def get_growth(self, movie_id, timestamps):
+        '''Get the (fractional) count of comments of the movie 'movie_id' posted since it is added, until 'timestamps' (a float or a numpy array)'''
+
+        movie = self.movies[movie_id]
+        elapsed_days = (timestamps - movie['added_timestamp']) / 86400
+        half_life_days = self.settings['comment_growth_half_life_days']
+        if half_life_days <= 0:
+            return movie['growth_per_day'] * elapsed_days
+        return movie['growth_per_day'] * half_life_days / math.log(2) * (1 - 2.0 ** (-elapsed_days / half_life_days))
+
+    def get_total_comment_count(self, movie_id, timestamp):
+        return self.movies[movie_id]['initial_count'] + int(self.get_growth(movie_id, timestamp))
+
+    def capture(self, movie_id, timestamp):
+        '''Capture the comments of the movie 'movie_id' posted since its latest capture, at 'timestamp' '''
+
+        capture_timestamp = self.capture_timestamps[movie_id]
+        if timestamp <= capture_timestamp:
+            return
+
+        edges = np.append(np.arange(capture_timestamp, timestamp, FRESHNESS_BUCKET_SECONDS), timestamp)
+        counts = np.diff(self.get_growth(movie_id, edges))
+        delays = timestamp - (edges[:-1] + edges[1:]) / 2
+        np.add.at(self.delay_hours, np.minimum(delays // 3600, len(self.delay_hours) - 1).astype('int64'), counts)
+        self.capture_timestamps[movie_id] = timestamp
+
+    def summarize_freshness(self, end_timestamp):
+        '''Summarize the freshness of the comments posted in the simulation, until 'end_timestamp' '''
+
+        captured_count = self.delay_hours.sum()
+        uncaptured_count = sum(
+            float(self.get_growth(movie_id, end_timestamp) - self.get_growth(movie_id, capture_timestamp))
+            for movie_id, capture_timestamp in self.capture_timestamps.items()
+        )
+        # the uncaptured comments older than one day are not fresh either
+        stale_uncaptured_count = sum(
+            float(self.get_growth(movie_id, end_timestamp - 86400) - self.get_growth(movie_id, capture_timestamp))
+            for movie_id, capture_timestamp in self.capture_timestamps.items()
+            if capture_timestamp < end_timestamp - 86400
+        )
+
+        cumulative_counts = np.cumsum(self.delay_hours)
+        def get_delay_percentile(percentile):
+            if captured_count <= 0:
+                return float('nan')
+            return float(np.searchsorted(cumulative_counts, captured_count * percentile / 100) + 1)
+
+        hours = np.arange(len(self.delay_hours)) + 0.5
+        return {
+            'captured_comments': float(captured_count),
+            'uncaptured_comments': uncaptured_count,
+            'mean_delay_hours': float((self.delay_hours * hours).sum() / captured_count) if captured_count > 0 else float('nan'),
+            'p50_delay_hours': get_delay_percentile(50),
+            'p95_delay_hours': get_delay_percentile(95),
+            'fresh_ratio': float(self.delay_hours[:24].sum() / (captured_count + stale_uncaptured_count)) if captured_count > 0 else float('nan')
+        }
+
+
+class StubFetchLayer:
+    '''The stub of 'comment_crawler.crawl_comment' and 'movie_info_crawler.crawl_movie_info', see the module summary'''
+
+    def __init__(self, clock, growth_model, settings, rng):
+        self.clock = clock
+        self.growth_model = growth_model
+        self.settings = settings
+        self.rng = rng
+        # the fetches of each date, date string as key, each value is a Counter of the fetch kinds
+        self.fetches = {}
+
+    def fetch(self, kind, median_latency):
+        '''Wait for the latency of a fetch, and return whether the fetch succeeds'''
+
+        self.clock.sleep(self.rng.lognormvariate(math.log(median_latency), self.settings['latency_sigma']))
+        failed = self.rng.random() < self.settings['fetch_error_rate']
+        date_str = self.clock.get_date_str()
+        fetches = self.fetches.get(date_str)
+        if fetches is None:
+            fetches = self.fetches[date_str] = Counter()
+        fetches[kind] += 1
+        if failed:
+            fetches[f'failed_{kind}'] += 1
+        return not failed
+
+    def crawl_comment(self, movie_id, comment_start_index, crawl_total_comment_count, save_data=True, segment_writer=None):
+        # the initial values are returned if the fetch fails, as 'comment_crawler.crawl_comment'
+        results = {'total_comment_count': 0, 'current_page_comment_count': 0, 'comments': []}
+        if not self.fetch('comment_pages', self.settings['fetch_latency']):
+            return results
+
+        total_comment_count = self.growth_model.get_total_comment_count(movie_id, self.clock.time())
+        if crawl_total_comment_count:
+            results['total_comment_count'] = total_comment_count
+            self.growth_model.capture(movie_id, self.clock.time())
+        results['current_page_comment_count'] = max(0, min(config.MOVIE_COMMENT_INCR_STEP, total_comment_count - comment_start_index))
+        return results
+
+    def crawl_movie_info(self, movie_id, crawl_rating_only):
+        if not self.fetch('movie_info_pages', self.settings['movie_info_latency']):
+            return None
+
+        # the rating count used by the comment crawl probe, as 'movie_info_crawler.save_movie_rating'
+        total_comment_count = self.growth_model.get_total_comment_count(movie_id, self.clock.time())
+        config.movie_rating_counts[movie_id] = {
+            'date': self.clock.get_date_str(),
+            'rating_count': total_comment_count * self.settings['ratings_per_comment']
+        }
+        return None
+
+
+class RunRecorder:
+    '''The listener of the job events of VirtualScheduler, to count the runs of each job kind on each date'''
+
+    def __init__(self, clock):
+        self.clock = clock
+        # the runs of each date, date string as key, each value is a Counter of (job kind, outcome)
+        self.runs = {}
+
+    def handle_job_event(self, event):
+        outcomes = {
+            EVENT_JOB_EXECUTED: 'executed', EVENT_JOB_ERROR: 'error',
+            EVENT_JOB_MISSED: 'missed', EVENT_JOB_MAX_INSTANCES: 'max_instances'
+        }
+        job_kind = 'comment_crawl' if event.job_id.startswith('comment_crawl_') else event.job_id
+        self.runs.setdefault(self.clock.get_date_str(), Counter())[(job_kind, outcomes[event.code])] += 1
+
+
+def parse_config_overrides(overrides):
+    '''Parse the '--config NAME=VALUE' overrides into a dict, the value is a Python literal or a string'''
+
+    parsed_overrides = {}
+    for override in overrides:
+        name, _, value = override.partition('=')
+        if not hasattr(config, name):
+            sys.exit(f'Unknown configuration \'{name}\'.')
+        if name in SIMULATED_CONFIG:
+            sys.exit(f'The configuration \'{name}\' is set by the simulator to \'{SIMULATED_CONFIG[name]}\'.')
+        try:
+            parsed_overrides[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed_overrides[name] = value
+
+    return parsed_overrides
+
+
+def configure_simulation_directory(data_directory):
+    '''Point the data, log, scheduling and movie list directories and files of 'config' at 'data_directory' '''
+
+    generate_synthetic_comment_data.configure_data_directory(data_directory)
+    config.MOVIE_LIST_DIRECTORY = os.path.join(data_directory, 'movie_list')
+    config.MOVIE_LIST_FILE = os.path.join(config.MOVIE_LIST_DIRECTORY, 'movie_list.csv')
+    config.MOVIE_LIST_UPDATE_FILE = os.path.join(config.MOVIE_LIST_DIRECTORY, 'movie_list_to_update.csv')
+    config.COMMENT_VELOCITY_FILE = os.path.join(config.SCHEDULING_DIRECTORY, 'comment_velocity.csv')
+    config.JOB_PROFILE_DIRECTORY = os.path.join(config.LOG_DIRECTORY, 'profile')
+    config.JOB_PROFILE_CONTROL_FILE = os.path.join(config.LOG_DIRECTORY, 'job_profile_control.json')
+    config.METRICS_SNAPSHOT_FILE = os.path.join(config.LOG_DIRECTORY, 'metrics_snapshot.json')
+    os.makedirs(config.MOVIE_LIST_DIRECTORY, exist_ok=True)
+
+
+def write_movie_list(csv_file, movie_ids, last_crawl_total_comment_counts):
+    '''Write the movies 'movie_ids' as a movie list CSV file (see 'movie_list_manager.read_movie_list')'''
+
+    pd.DataFrame({
+        'movie_id': movie_ids,
+        'last_crawl_total_comment_count': last_crawl_total_comment_counts,
+        'rating_start_date': '2020-01-01',
+        'have_rates': 'yes',
+        'note': 'simulated'
+    }, index=movie_ids).to_csv(csv_file)
+
+
+def add_new_movies(growth_model, movie_ids):
+    '''Add the newly added movies 'movie_ids' to the growth model, and put them into MOVIE_LIST_UPDATE_FILE for the next daily routine job'''
+
+    for movie_id in movie_ids:
+        growth_model.add_movie(movie_id, _clock.time())
+    # the newly added movies are never crawled, i.e., the first comment crawl job crawls all comments
+    write_movie_list(config.MOVIE_LIST_UPDATE_FILE, movie_ids, 0)
+
+
+def record_comment_crawl_intervals(intervals):
+    '''Record the comment crawl intervals in days of the cron schedule on the current date into 'intervals' '''
+
+    days = config.comment_crawl_jobs_cron_schedule_df['day'].astype(str)
+    interval_in_days = days.str.extract(r'\*/(\d+)', expand=False).astype('float64').fillna(1).astype('int64')
+    intervals[_clock.get_date_str()] = {int(interval): int(count) for interval, count in interval_in_days.value_counts().sort_index().items()}
+
+
+def summarize_concurrency(concurrency_changes, start_timestamp, end_timestamp):
+    '''Summarize the peak and (time-weighted) mean count of running and waiting runs of each hour
+
+    Returns
+    -------
+    dict
+        A dict with keys: peak_running, mean_running, peak_waiting, mean_waiting, each value is a list of each hour from 'start_timestamp'
+    '''
+
+    hour_count = math.ceil((end_timestamp - start_timestamp) / 3600)
+    summary = {name: np.zeros(hour_count) for name in ('peak_running', 'mean_running', 'peak_waiting', 'mean_waiting')}
+
+    boundaries = [timestamp for timestamp, _, _ in concurrency_changes[1:]] + [end_timestamp]
+    for (timestamp, running_count, waiting_count), next_timestamp in zip(concurrency_changes, boundaries):
+        timestamp = max(timestamp, start_timestamp)
+        while timestamp < min(next_timestamp, end_timestamp):
+            hour = int((timestamp - start_timestamp) // 3600)
+            segment_end = min(next_timestamp, start_timestamp + (hour + 1) * 3600)
+            summary['peak_running'][hour] = max(summary['peak_running'][hour], running_count)
+            summary['peak_waiting'][hour] = max(summary['peak_waiting'][hour], waiting_count)
+            summary['mean_running'][hour] += running_count * (segment_end - timestamp) / 3600
+            summary['mean_waiting'][hour] += waiting_count * (segment_end - timestamp) / 3600
+            timestamp = segment_end
+
+    return {name: values.tolist() for name, values in summary.items()}
+
+
+def simulate(data_directory, config_overrides=None, **settings):
+    '''Simulate the jobs of the program with the settings 'settings' (see DEFAULT_SETTINGS) over 'days' days of virtual time
+
+    Returns
+    -------
+    dict
+        The report, see the module summary
+    '''
+
+    settings = {**DEFAULT_SETTINGS, **settings}
+    wall_start = time.perf_counter()
+
+    for name, value in {**(config_overrides or {}), **SIMULATED_CONFIG}.items():
+        setattr(config, name, value)
+    clock = VirtualClock(START_TIME)
+    patch_simulated_modules(clock)
+    # the jitter of the APScheduler triggers
+    random.seed(settings['seed'])
+    rng = np.random.default_rng(settings['seed'])
+
+    configure_simulation_directory(data_directory)
+    growth_model = CommentGrowthModel(settings, rng)
+    fetch_layer = StubFetchLayer(clock, growth_model, settings, random.Random(settings['seed']))
+    comment_crawler.crawl_comment = fetch_layer.crawl_comment
+    movie_info_crawler.crawl_movie_info = fetch_layer.crawl_movie_info
+
+    # the movies are crawled before the simulation starts
+    movie_ids = list(range(FIRST_MOVIE_ID, FIRST_MOVIE_ID + settings['movie_count']))
+    for movie_id in movie_ids:
+        growth_model.add_movie(movie_id, clock.time())
+    write_movie_list(config.MOVIE_LIST_FILE, movie_ids, [growth_model.get_total_comment_count(movie_id, clock.time()) for movie_id in movie_ids])
+
+    # the startup configuration and the jobs of 'main.main', in the 'cron' comment crawl run mode
+    max_workers = settings['max_workers'] or config.EXECUTORS['default']._pool._max_workers
+    bg_scheduler = VirtualScheduler(clock, max_workers, config.JOB_DEFAULTS)
+    config.bg_scheduler = bg_scheduler
+    job_run_tracker.add_job_run_listener(bg_scheduler)
+    run_recorder = RunRecorder(clock)
+    bg_scheduler.add_listener(run_recorder.handle_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+    daily_job_dispatcher.dispatch_daily_routine_jobs(None, True)
+    scheduler.schedule_daily_routine_jobs(bg_scheduler)
+    scheduler.schedule_movie_info_crawl_jobs(bg_scheduler)
+    scheduler.schedule_comment_crawl_jobs(bg_scheduler)
+
+    # the events of the simulator on each day
+    intervals = {}
+    next_movie_id = FIRST_MOVIE_ID + settings['movie_count']
+    day_start = START_TIME.replace(hour=0)
+    for day in range(settings['days']):
+        if settings['new_movies_per_day'] > 0:
+            new_movie_ids = list(range(next_movie_id, next_movie_id + settings['new_movies_per_day']))
+            next_movie_id += settings['new_movies_per_day']
+            bg_scheduler.add_event((day_start + timedelta(days=day) + NEW_MOVIE_TIME).timestamp(), add_new_movies, growth_model, new_movie_ids)
+        bg_scheduler.add_event((day_start + timedelta(days=day + 1) - timedelta(microseconds=1)).timestamp(), record_comment_crawl_intervals, intervals)
+
+    end_time = START_TIME + timedelta(days=settings['days'])
+    bg_scheduler.run_until(end_time)
+
+    # the report of each date
+    concurrency = summarize_concurrency(bg_scheduler.concurrency_changes, day_start.timestamp(), end_time.timestamp())
+    dates = [(day_start + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(settings['days'] + 1)]
+    days = []
+    for day, date in enumerate(dates):
+        hours = slice(day * 24, (day + 1) * 24)
+        runs = run_recorder.runs.get(date, Counter())
+        day_intervals = intervals.get(date, {})
+        days.append({
+            'date': date,
+            'comment_crawl_runs': {outcome: runs[('comment_crawl', outcome)] for outcome in ('executed', 'error', 'missed', 'max_instances')},
+            'fetches': dict(fetch_layer.fetches.get(date, {})),
+            'peak_running': max(concurrency['peak_running'][hours], default=0),
+            'mean_running': float(np.mean(concurrency['mean_running'][hours])) if concurrency['mean_running'][hours] else 0.0,
+            'peak_waiting': max(concurrency['peak_waiting'][hours], default=0),
+            'intervals': day_intervals,
+            'mean_interval_days': sum(interval * count for interval, count in day_intervals.items()) / sum(day_intervals.values()) if day_intervals else float('nan')
+        })
+
+    total_runs = Counter()
+    for runs in run_recorder.runs.values():
+        total_runs.update(runs)
+    job_run_summary_df = job_run_tracker.summarize_job_runs()
+
+    hourly_peaks = np.array(concurrency['peak_running'][:settings['days'] * 24]).reshape(-1, 24) if settings['days'] > 0 else np.zeros((0, 24))
+    return {
+        'settings': {**settings, 'max_workers': max_workers, 'config': config_overrides or {}},
+        'days': days,
+        'concurrency_by_hour_of_day': {
+            'mean_peak_running': hourly_peaks.mean(axis=0).tolist() if len(hourly_peaks) else [],
+            'max_peak_running': hourly_peaks.max(axis=0).tolist() if len(hourly_peaks) else []
+        },
+        'runs': {f'{job_kind}/{outcome}': count for (job_kind, outcome), count in sorted(total_runs.items())},
+        'coalesced_runs': int(job_run_summary_df['coalesced'].sum()) if not job_run_summary_df.empty else 0,
+        'fetches': dict(sum((Counter(fetches) for fetches in fetch_layer.fetches.values()), Counter())),
+        'freshness': growth_model.summarize_freshness(end_time.timestamp()),
+        'final_movie_count': len(config.movie_list_df.index),
+        'wall_seconds': time.perf_counter() - wall_start
+    }
+
+
+def format_report(report):
+    '''Format the report 'report' as a table of each day, followed by the totals'''
+
+    lines = [
+        f'{"date":<12} {"runs":>6} {"missed":>7} {"dropped":>8} {"errors":>7} {"pages":>8} {"failed":>7} '
+        f'{"info":>6} {"peak":>6} {"mean":>7} {"waiting":>8} {"interval":>9}'
+    ]
+    for day in report['days']:
+        runs = day['comment_crawl_runs']
+        fetches = day['fetches']
+        lines.append(
+            f'{day["date"]:<12} {runs["executed"]:>6} {runs["missed"]:>7} {runs["max_instances"]:>8} {runs["error"]:>7} '
+            f'{fetches.get("comment_pages", 0):>8} {fetches.get("failed_comment_pages", 0):>7} {fetches.get("movie_info_pages", 0):>6} '
+            f'{day["peak_running"]:>6.0f} {day["mean_running"]:>7.2f} {day["peak_waiting"]:>8.0f} {day["mean_interval_days"]:>9.2f}'
+        )
+
+    freshness = report['freshness']
+    lines.append(f'runs: {report["runs"]}, coalesced: {report["coalesced_runs"]}')
+    lines.append(f'fetches: {report["fetches"]}')
+    lines.append(
+        f'freshness: {freshness["captured_comments"]:.0f} comments captured, {freshness["uncaptured_comments"]:.0f} not captured, '
+        f'delay mean {freshness["mean_delay_hours"]:.1f} h, p50 {freshness["p50_delay_hours"]:.0f} h, p95 {freshness["p95_delay_hours"]:.0f} h, '
+        f'{freshness["fresh_ratio"]:.1%} captured within one day'
+    )
+    lines.append(f'{report["final_movie_count"]} movies, {len(report["days"]) - 1} days simulated in {report["wall_seconds"]:.1f} seconds')
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate the scheduling of the program over days of virtual time with a stub fetch layer.')
+    parser.add_argument('--days', type=int, default=DEFAULT_SETTINGS['days'])
+    parser.add_argument('--movie-count', type=int, default=DEFAULT_SETTINGS['movie_count'])
+    parser.add_argument('--new-movies-per-day', type=int, default=DEFAULT_SETTINGS['new_movies_per_day'])
+    parser.add_argument('--fetch-latency', type=float, default=DEFAULT_SETTINGS['fetch_latency'], help='the median seconds of a comment page fetch')
+    parser.add_argument('--movie-info-latency', type=float, default=DEFAULT_SETTINGS['movie_info_latency'], help='the median seconds of a movie info page fetch')
+    parser.add_argument('--latency-sigma', type=float, default=DEFAULT_SETTINGS['latency_sigma'])
+    parser.add_argument('--fetch-error-rate', type=float, default=DEFAULT_SETTINGS['fetch_error_rate'])
+    parser.add_argument('--initial-comment-median', type=float, default=DEFAULT_SETTINGS['initial_comment_median'])
+    parser.add_argument('--initial-comment-sigma', type=float, default=DEFAULT_SETTINGS['initial_comment_sigma'])
+    parser.add_argument('--comment-growth-median', type=float, default=DEFAULT_SETTINGS['comment_growth_median'], help='the median comment increment per day')
+    parser.add_argument('--comment-growth-sigma', type=float, default=DEFAULT_SETTINGS['comment_growth_sigma'])
+    parser.add_argument('--comment-growth-half-life-days', type=float, default=DEFAULT_SETTINGS['comment_growth_half_life_days'])
+    parser.add_argument('--ratings-per-comment', type=int, default=DEFAULT_SETTINGS['ratings_per_comment'])
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_SETTINGS['max_workers'], help='the threads of the \'default\' executor (default is EXECUTORS)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SETTINGS['seed'])
+    parser.add_argument('--config', nargs='*', default=[], metavar='NAME=VALUE', help='override a program configuration, e.g., COMMENT_CRAWL_INTERVAL_MODE=budget')
+    parser.add_argument('--output', help='write the report as a JSON file (default is printing it)')
+    parser.add_argument('--data-directory', help='the directory of the files written by the program (default is a temporary directory)')
+    parser.add_argument('--keep-data', action='store_true', help='keep the files written by the program after the simulation')
+    args = parser.parse_args()
+
+    settings = vars(args).copy()
+    config_overrides = parse_config_overrides(settings.pop('config'))
+    data_directory = settings.pop('data_directory') or tempfile.mkdtemp(prefix='simulate_scheduler_')
+    output = settings.pop('output')
+    keep_data = settings.pop('keep_data')
+    if os.path.exists(data_directory) and os.listdir(data_directory):
+        sys.exit(f'The data directory \'{data_directory}\' is not empty.')
+
+    try:
+        report = simulate(data_directory, config_overrides, **settings)
+    finally:
+        if not keep_data:
+            shutil.rmtree(data_directory, ignore_errors=True)
+
+    if output:
+        with open(output, mode='w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    print(format_report(report), file=sys.stderr)
@@ -0,0 +1,18 @@
+'''The shared fixtures of the unit tests, run 'python -m pytest -q' from the root directory of the program'''
+
+import os
+import sys
+
+import pytest
+
+# Make the modules of the program importable when running the tests from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util
+
+
+@pytest.fixture(autouse=True)
+def drop_log(monkeypatch):
+    '''Drop the log messages, since the log files are only set at startup, see 'util.update_log_and_daily_file' '''
+
+    monkeypatch.setattr(util, 'log', lambda msg, log_file, logger_name='root', log_level=None: None)
@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import config
+import comment_crawl_budget_optimizer
+
+
+@pytest.fixture
+def velocity_file(monkeypatch, tmp_path):
+    csv_file = str(tmp_path / 'comment_velocity.csv')
+    monkeypatch.setattr(config, 'COMMENT_VELOCITY_FILE', csv_file)
+    monkeypatch.setattr(config, 'comment_velocity_df', None)
+    monkeypatch.setattr(comment_crawl_budget_optimizer, '_comment_velocity_updated', False)
+    return csv_file
+
+
+def test_velocity_updates_are_saved_in_batch(velocity_file):
+    crawl_time = config.TIME_ZONE.localize(datetime(2026, 1, 1))
+    comment_crawl_budget_optimizer.update_comment_velocity(1, 100, crawl_time)
+    comment_crawl_budget_optimizer.update_comment_velocity(1, 300, crawl_time + timedelta(days=2))
+    comment_crawl_budget_optimizer.update_comment_velocity(2, 50, crawl_time)
+
+    # updated in memory only
+    assert not os.path.isfile(velocity_file)
+    assert config.comment_velocity_df.at[1, 'velocity'] == 100
+
+    assert comment_crawl_budget_optimizer.save_comment_velocity(velocity_file)
+    # nothing updated since the save
+    assert not comment_crawl_budget_optimizer.save_comment_velocity(velocity_file)
+
+    df = comment_crawl_budget_optimizer.read_comment_velocity(velocity_file)
+    assert df.at[1, 'last_total_comment_count'] == 300
+    assert df.at[1, 'velocity'] == 100
+    assert df.at[2, 'last_total_comment_count'] == 50
+
+
+@pytest.fixture
+def crawl_intervals(monkeypatch):
+    monkeypatch.setattr(config, 'MIN_COMMENT_CRAWL_INTERVAL', 1)
+    monkeypatch.setattr(config, 'MAX_COMMENT_CRAWL_INTERVAL', 10)
+    monkeypatch.setattr(config, 'MOVIE_COMMENT_INCR_STEP', 20)
+
+
+def get_movie_list_df(total_comment_counts):
+    return pd.DataFrame({'last_crawl_total_comment_count': total_comment_counts}, index=pd.Index([1, 2, 3], name='movie_id'))
+
+
+def test_budget_is_allocated_by_fresh_comments_per_page(crawl_intervals):
+    # pages per crawl: 1, 2, 1
+    movie_list_df = get_movie_list_df([19, 39, 0])
+    comment_velocity_df = pd.DataFrame({'velocity': [100.0, 100.0, 0.0]}, index=movie_list_df.index)
+
+    allocation_df = comment_crawl_budget_optimizer.optimize_comment_crawl_intervals(movie_list_df, comment_velocity_df, 2)
+
+    # movie 1 is upgraded to the min interval, movie 2 gets the rest of the budget
+    # -- 1 / (0.7 / 2 + 1 / 10) rounded up, and movie 3 without comment increment stays at the max interval
+    assert allocation_df['crawl_interval_in_days'].tolist() == [1, 3, 10]
+    assert allocation_df['pages_per_crawl'].tolist() == [1, 2, 1]
+    assert allocation_df['expected_pages_per_day'].sum() <= 2
+
+
+def test_budget_is_allocated_with_default_velocity(crawl_intervals):
+    movie_list_df = get_movie_list_df([0, 0, 0])
+
+    allocation_df = comment_crawl_budget_optimizer.optimize_comment_crawl_intervals(movie_list_df, None, 3)
+    assert (allocation_df['velocity'] == config.COMMENT_INCREMENT_CRAWL_PER_DAY).all()
+    assert allocation_df['crawl_interval_in_days'].tolist() == [1, 1, 1]
+
+    # movie 3 without a calculated velocity uses the median velocity
+    comment_velocity_df = pd.DataFrame({'velocity': [10.0, 30.0]}, index=pd.Index([1, 2], name='movie_id'))
+    allocation_df = comment_crawl_budget_optimizer.optimize_comment_crawl_intervals(movie_list_df, comment_velocity_df, 0)
+    assert allocation_df['velocity'].tolist() == [10.0, 30.0, 20.0]
+    assert allocation_df['crawl_interval_in_days'].tolist() == [10, 10, 10]
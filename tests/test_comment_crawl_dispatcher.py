@@ -0,0 +1,162 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import config
+import comment_crawl_dispatcher
+
+
+@pytest.fixture(autouse=True)
+def increment_mode(monkeypatch):
+    monkeypatch.setattr(config, 'COMMENT_CRAWL_INTERVAL_MODE', 'increment')
+    monkeypatch.setattr(config, 'JOB_OVERRUN_WIDEN_ENABLED', False)
+    monkeypatch.setattr(config, 'MIN_COMMENT_CRAWL_INTERVAL', 1)
+    monkeypatch.setattr(config, 'MAX_COMMENT_CRAWL_INTERVAL', 10)
+    monkeypatch.setattr(config, 'COMMENT_INCREMENT_CRAWL_PER_DAY', 100)
+
+
+def get_crawl_day(last_crawl_total_comment_count, total_comment_count):
+    cron_schedule_df = pd.DataFrame({'day': ['*'], 'hour': [0], 'minute': [0], 'second': [0]}, index=pd.Index([1], name='movie_id'))
+    cron_schedule_df = comment_crawl_dispatcher.update_comment_crawl_job_cron_schedule(1, last_crawl_total_comment_count, total_comment_count, cron_schedule_df)
+    return cron_schedule_df.at[1, 'day']
+
+
+@pytest.mark.parametrize('last_crawl_total_comment_count, total_comment_count, day', [
+    # a failed crawl job is retried at once, rather than parked at the maximum interval
+    (500, 0, '*/1'),
+    (0, 0, '*/1'),
+    # no comment increment
+    (500, 500, '*/10'),
+    # 100 // 30 + 1
+    (500, 530, '*/4'),
+    (500, 1000, '*/1'),
+])
+def test_comment_crawl_interval(last_crawl_total_comment_count, total_comment_count, day):
+    assert get_crawl_day(last_crawl_total_comment_count, total_comment_count) == day
+
+
+def test_failed_slice_closes_segment_file(monkeypatch):
+    closed = []
+    segment_writer = type('SegmentWriter', (), {'close': lambda self: closed.append(True)})()
+
+    def crawl_comment(*args, **kwargs):
+        raise RuntimeError('the webbrowser crashed')
+
+    monkeypatch.setattr(config, 'COMMENT_CRAWL_PIPELINE_ENABLED', False)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawler, 'create_comment_segment_writer', lambda movie_id: segment_writer)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawler, 'crawl_comment', crawl_comment)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawl_queue, 'acquire_comment_page_token', lambda: None)
+
+    progress = {'comment_start_index': 0, 'elapsed_seconds': 0.0}
+    with pytest.raises(RuntimeError):
+        comment_crawl_dispatcher.crawl_comment_slice(1, progress)
+    assert closed == [True]
+    assert progress['elapsed_seconds'] > 0
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def add_job(self, **kwargs):
+        self.jobs[kwargs['id']] = kwargs
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+
+@pytest.fixture
+def sliced_crawl(monkeypatch):
+    crawled_start_indexes = []
+
+    def crawl_comment_slice(movie_id, progress, max_pages=None, max_seconds=None):
+        crawled_start_indexes.append(progress['comment_start_index'])
+        progress['comment_start_index'] += config.MOVIE_COMMENT_INCR_STEP
+        return False
+
+    monkeypatch.setattr(config, 'COMMENT_CRAWL_RUN_MODE', 'cron')
+    monkeypatch.setattr(config, 'bg_scheduler', FakeScheduler())
+    monkeypatch.setattr(config, 'comment_crawl_progress', {1: {'last_crawl_total_comment_count': 500, 'comment_start_index': 40, 'elapsed_seconds': 0.0}})
+    monkeypatch.setattr(comment_crawl_dispatcher, '_comment_crawl_run_tokens', {})
+    monkeypatch.setattr(comment_crawl_dispatcher, 'crawl_comment_slice', crawl_comment_slice)
+    monkeypatch.setattr(comment_crawl_dispatcher.data_preprocess_worker, 'emit_comment_crawl_completed', lambda movie_id: None)
+    return crawled_start_indexes
+
+
+def test_scheduled_run_resumes_lost_slice(sliced_crawl):
+    # no slice job is pending, e.g., dropped by the scheduler
+    assert not comment_crawl_dispatcher.dispatch_crawl_comment(1, 500)
+    assert sliced_crawl == [40]
+
+    slice_job = config.bg_scheduler.get_job(config.COMMENT_CRAWL_SLICE_JOB_ID(1))
+    assert slice_job['max_instances'] == 2 and slice_job['misfire_grace_time'] is None
+    assert config.comment_crawl_progress[1]['comment_start_index'] == 60
+
+    # the slice job is pending
+    assert not comment_crawl_dispatcher.dispatch_crawl_comment(1, 500)
+    assert sliced_crawl == [40]
+    assert not comment_crawl_dispatcher.dispatch_crawl_comment(1, 500, resume=True)
+    assert sliced_crawl == [40, 60]
+
+
+def test_running_crawl_is_not_resumed_twice(sliced_crawl):
+    comment_crawl_dispatcher._comment_crawl_run_tokens[1] = object()
+
+    assert not comment_crawl_dispatcher.dispatch_crawl_comment(1, 500, resume=True)
+    assert not comment_crawl_dispatcher.dispatch_crawl_comment(1, 500)
+    assert sliced_crawl == []
+
+
+def test_failed_run_drops_progress(monkeypatch, sliced_crawl):
+    def crawl_comment_slice(movie_id, progress, max_pages=None, max_seconds=None):
+        raise RuntimeError('the webbrowser crashed')
+
+    monkeypatch.setattr(comment_crawl_dispatcher, 'crawl_comment_slice', crawl_comment_slice)
+
+    with pytest.raises(RuntimeError):
+        comment_crawl_dispatcher.dispatch_crawl_comment(1, 500, resume=True)
+    assert 1 not in config.comment_crawl_progress
+    assert 1 not in comment_crawl_dispatcher._comment_crawl_run_tokens
+
+
+@pytest.fixture
+def backfill(monkeypatch):
+    saved_comments = []
+    crawl_threads = set()
+
+    def crawl_comment(movie_id, comment_start_index, crawl_total_comment_count, save_data=True, segment_writer=None):
+        crawl_threads.add(threading.current_thread().name)
+        if comment_start_index == 60:
+            raise RuntimeError('the webbrowser crashed')
+        comments = [{'user_url': f'user_{comment_start_index + i}', 'comment_timestamp': '2024-01-01 00:00:00'} for i in range(20)] if comment_start_index < 160 else []
+        return {'total_comment_count': 160, 'current_page_comment_count': len(comments), 'comments': comments}
+
+    monkeypatch.setattr(config, 'COMMENT_BACKFILL_RANGE_COUNT', 4)
+    monkeypatch.setattr(config, 'COMMENT_BACKFILL_OVERLAP_PAGES', 0)
+    monkeypatch.setattr(config, 'SLEEP_SECOND_AFTER_COMMENT_CRAWL_SUBJOB', 0)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawl_queue, 'acquire_comment_page_token', lambda lane=None: None)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawler, 'crawl_comment', crawl_comment)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawler, 'create_comment_segment_writer', lambda movie_id: None)
+    monkeypatch.setattr(comment_crawl_dispatcher.comment_crawler, 'save_data_as_json', lambda movie_id, comments: saved_comments.extend(comments))
+    monkeypatch.setattr(comment_crawl_dispatcher.browser_supervisor, 'get_free_browser_slot_count', lambda: None)
+    return saved_comments, crawl_threads
+
+
+def test_backfill_keeps_pages_of_failed_range(backfill):
+    saved_comments, _ = backfill
+    progress = {'total_comment_count': 0, 'comment_start_index': 0, 'elapsed_seconds': 0.0}
+
+    assert comment_crawl_dispatcher.backfill_comment(1, progress)
+    # the page ranges start at 20, 60, 100, 140: only the range starting at the failed page 60 is lost
+    assert len(saved_comments) == 160 - 40
+
+
+def test_backfill_range_count_is_bounded_by_browser_slots(monkeypatch, backfill):
+    saved_comments, crawl_threads = backfill
+    monkeypatch.setattr(comment_crawl_dispatcher.browser_supervisor, 'get_free_browser_slot_count', lambda: 1)
+
+    comment_crawl_dispatcher.backfill_comment(1, {'total_comment_count': 0, 'comment_start_index': 0, 'elapsed_seconds': 0.0})
+    # the first page, then one page range, which keeps the pages 20 and 40 before the failed page 60
+    assert len(crawl_threads) == 2
+    assert len(saved_comments) == 60
@@ -0,0 +1,17 @@
+import time
+
+import config
+import comment_crawl_queue
+
+
+def test_page_fetch_without_lane_waits_for_global_rate_limit(monkeypatch):
+    monkeypatch.setattr(config, 'COMMENT_CRAWL_PAGES_PER_SECOND', 50)
+    monkeypatch.setattr(comment_crawl_queue, '_global_rate_limiter', None)
+
+    start_time = time.monotonic()
+    for _ in range(5):
+        comment_crawl_queue.acquire_comment_page_token()
+
+    # the 5 page fetches are spaced by 1 / 50 second
+    assert time.monotonic() - start_time >= 4 / 50 - 0.005
+    assert comment_crawl_queue._global_rate_limiter['pages_per_second'] == 50
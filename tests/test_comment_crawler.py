@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+import config
+import comment_crawler
+
+
+WEBPAGE_SAMPLE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'webpage_sample')
+
+
+def fetched_page(movie_id, comment_start_index, comment_list_html, fetched=True):
+    return {
+        'total_comment_count': 123 if comment_start_index == 0 else 0,
+        'current_page_comment_count': 0,
+        'url': config.MOVIE_COMMENT_URL.format(movie_id=movie_id, comment_start_index=comment_start_index),
+        'comment_list_html': comment_list_html,
+        'crawl_timestamp': '2024-04-18T08:00:00+08:00',
+        'fetched': fetched,
+        'cached': False
+    }
+
+
+@pytest.fixture
+def comment_page_html():
+    with open(os.path.join(WEBPAGE_SAMPLE_DIRECTORY, 'comments-page-sample-SIMPLIFIED.html'), mode='r', encoding='utf-8') as file:
+        return file.read()
+
+
+def test_crawl_comment_parses_and_saves_fetched_page(monkeypatch, comment_page_html):
+    saved_pages = []
+    monkeypatch.setattr(comment_crawler, 'fetch_comment', lambda movie_id, start, crawl_total: fetched_page(movie_id, start, comment_page_html))
+    monkeypatch.setattr(comment_crawler, 'save_data_as_json', lambda movie_id, comments: saved_pages.append(comments) or 'comment.json')
+
+    results = comment_crawler.crawl_comment(35633650, 0, True)
+
+    assert results['total_comment_count'] == 123
+    assert results['current_page_comment_count'] == len(results['comments']) > 0
+    assert saved_pages == [results['comments']]
+    assert all(comment['crawl_timestamp'] == '2024-04-18T08:00:00+08:00' for comment in results['comments'])
+
+
+def test_crawl_comment_of_failed_fetch_saves_nothing(monkeypatch):
+    monkeypatch.setattr(comment_crawler, 'fetch_comment', lambda movie_id, start, crawl_total: fetched_page(movie_id, start, None, fetched=False))
+    monkeypatch.setattr(comment_crawler, 'save_data_as_json', lambda movie_id, comments: pytest.fail('nothing to save'))
+
+    assert comment_crawler.crawl_comment(35633650, 20, False) == {'total_comment_count': 0, 'current_page_comment_count': 0, 'comments': []}
+
+
+def test_cached_page_without_comment_list_fails_the_fetch(monkeypatch):
+    # e.g., a cached captcha webpage, with the comment block but neither the comment list nor the title
+    captcha_html = '<html><body><div id="comment-list"><p>captcha</p></div></body></html>'
+    monkeypatch.setattr(config, 'HTTP_CACHE_MODE', 'on')
+    monkeypatch.setattr(comment_crawler.http_cache, 'get_fresh_response', lambda url, page_type: {'body': captcha_html})
+
+    results = comment_crawler.fetch_comment_from_cache(35633650, 0, True)
+
+    assert results['fetched'] is False
+    assert results['cached'] is True
+    assert results['comment_list_html'] is None
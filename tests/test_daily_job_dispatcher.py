@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import config
+import daily_job_dispatcher
+
+
+def convert_second_to_cron_schedule(schedule_in_second):
+    '''The per-job conversion of the baseline 'calculate_comment_crawl_job_cron_schedule' loop'''
+
+    seconds_per_hour = 3600
+    seconds_per_minute = 60
+    hour, remainning_minute = divmod(schedule_in_second, seconds_per_hour)
+    minute, second = divmod(remainning_minute, seconds_per_minute)
+    if hour == 0:
+        minute = max(minute, config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE)
+    if hour == 23:
+        minute = min(minute, seconds_per_minute - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE)
+    if hour == 24:
+        hour = 23
+        minute = max(minute, seconds_per_minute - config.COMMENT_CRAWL_SCHEDULE_GRACE_MINUTE)
+
+    return hour, minute, second
+
+
+def test_cron_schedule_matches_baseline():
+    schedule_in_second = np.arange(86400 + 1, dtype='int64')
+
+    cron_schedule_df = daily_job_dispatcher.convert_seconds_to_cron_schedule(schedule_in_second, pd.RangeIndex(len(schedule_in_second)))
+
+    expected = [convert_second_to_cron_schedule(int(second)) for second in schedule_in_second]
+    assert list(cron_schedule_df[['hour', 'minute', 'second']].itertuples(index=False, name=None)) == expected
+
+
+@pytest.mark.parametrize('job_count', [1, 7, 1000])
+def test_even_cron_schedule_matches_baseline(monkeypatch, job_count):
+    monkeypatch.setattr(config, 'COMMENT_CRAWL_SCHEDULE_MODE', 'even')
+    movie_list_df = pd.DataFrame(index=pd.Index(range(100, 100 + job_count), name='movie_id'))
+
+    cron_schedule_df = daily_job_dispatcher.calculate_comment_crawl_job_cron_schedule(movie_list_df, None)
+
+    job_interval = 86400 // job_count
+    expected = [convert_second_to_cron_schedule(i * job_interval) for i in range(job_count)]
+    assert cron_schedule_df.index.tolist() == movie_list_df.index.tolist()
+    assert (cron_schedule_df['day'] == '*').all()
+    assert list(cron_schedule_df[['hour', 'minute', 'second']].astype(int).itertuples(index=False, name=None)) == expected
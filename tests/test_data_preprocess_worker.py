@@ -0,0 +1,35 @@
+import queue
+from datetime import datetime
+
+import pytest
+
+import config
+import data_preprocess_worker
+
+
+@pytest.fixture(autouse=True)
+def event_mode(monkeypatch):
+    monkeypatch.setattr(config, 'DATA_PREPROCESS_MODE', 'event')
+    # the worker is not started, the tests pull the queue themselves
+    monkeypatch.setattr(data_preprocess_worker, '_data_preprocess_worker', object())
+    monkeypatch.setattr(data_preprocess_worker, '_data_preprocess_queue', queue.Queue())
+    monkeypatch.setattr(data_preprocess_worker, '_queued_movie_ids', set())
+    monkeypatch.setattr(data_preprocess_worker, '_last_merge_timestamps', {})
+
+
+def test_events_of_recently_merged_movie_are_coalesced(monkeypatch):
+    monkeypatch.setattr(config, 'DATA_PREPROCESS_COALESCE_SECONDS', 0.2)
+    data_preprocess_worker._last_merge_timestamps[1] = datetime.now(config.TIME_ZONE).timestamp()
+
+    assert data_preprocess_worker.emit_comment_crawl_completed(1)
+    assert not data_preprocess_worker.emit_comment_crawl_completed(1)
+    assert data_preprocess_worker._data_preprocess_queue.empty()
+
+    # queued once when the window ends
+    assert data_preprocess_worker._data_preprocess_queue.get(timeout=5) == 1
+    assert data_preprocess_worker._data_preprocess_queue.empty()
+
+
+def test_event_of_movie_not_merged_recently_is_queued_at_once():
+    assert data_preprocess_worker.emit_comment_crawl_completed(2)
+    assert data_preprocess_worker._data_preprocess_queue.get_nowait() == 2
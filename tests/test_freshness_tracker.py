@@ -0,0 +1,30 @@
+import pandas as pd
+
+import freshness_tracker
+
+
+KEYS = ['user_name', 'comment_timestamp']
+
+
+def comments(user_names, crawl_timestamp):
+    return pd.DataFrame({
+        'user_name': user_names,
+        'comment_timestamp': ['2024-04-18 08:00:00'] * len(user_names),
+        'crawl_timestamp': [crawl_timestamp] * len(user_names),
+        'merge_timestamp': [crawl_timestamp] * len(user_names)
+    })
+
+
+def test_only_records_of_new_comments_are_updated():
+    df_merged = comments(['a', 'b', 'c'], '2024-04-18T09:00:00+08:00')
+    df_new = comments(['b', 'd'], '2024-04-19T09:00:00+08:00')
+    merged_df = pd.concat([df_merged, df_new], ignore_index=True)
+
+    updated_df = freshness_tracker.keep_first_timestamps(merged_df.copy(), KEYS, df_new)
+    full_df = freshness_tracker.keep_first_timestamps(merged_df.copy(), KEYS)
+
+    # the records of 'a' and 'c' keep their stored timestamps, the copies of 'b' (and 'd') match the full update
+    is_new = merged_df['user_name'].isin(['b', 'd'])
+    assert updated_df[~is_new].equals(merged_df[~is_new])
+    assert updated_df[is_new].equals(full_df[is_new])
+    assert updated_df.loc[3, 'crawl_timestamp'] == updated_df.loc[1, 'crawl_timestamp']
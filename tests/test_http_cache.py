@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import config
+import http_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'HTTP_CACHE_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(config, 'HTTP_CACHE_MODE', 'on')
+    monkeypatch.setattr(config, 'HTTP_CACHE_RECORD_PAGE_TYPES', {'movie_info': True, 'comment': False})
+    monkeypatch.setattr(http_cache, '_cache_size_bytes', None)
+    monkeypatch.setattr(http_cache, '_eviction_thread', None)
+
+
+def test_comment_pages_are_not_recorded_by_default():
+    assert not http_cache.store_browser_page('https://m.douban.com/movie/subject/1/comments?start=0', 'comment', lambda: '<html></html>')
+    assert http_cache.get_cache_size_bytes() == 0
+
+
+def test_failed_record_does_not_raise():
+    def get_page_source():
+        raise RuntimeError('the webbrowser is gone')
+
+    assert not http_cache.store_browser_page('https://movie.douban.com/subject/1/', 'movie_info', get_page_source)
+
+
+def test_recorded_page_is_cached():
+    url = 'https://movie.douban.com/subject/1/'
+    assert http_cache.store_browser_page(url, 'movie_info', lambda: '<html>1</html>')
+
+    cached_response = http_cache.get_cached_response(url)
+    assert cached_response['body'] == '<html>1</html>'
+    assert cached_response['source'] == 'browser'
+
+
+def test_eviction_runs_in_background_down_to_ratio(monkeypatch):
+    monkeypatch.setattr(config, 'HTTP_CACHE_MAX_BYTES', 10 ** 9)
+    urls = [f'https://movie.douban.com/subject/{movie_id}/' for movie_id in range(10)]
+    for index, url in enumerate(urls):
+        http_cache.store_browser_page(url, 'movie_info', lambda: f'<html>{index}</html>' * 100)
+        # the least recently used entries are the first ones
+        entry_file = http_cache.glob(os.path.join(http_cache.get_entry_directory(url), '*.json'))[0]
+        os.utime(entry_file, (index, index))
+
+    monkeypatch.setattr(config, 'HTTP_CACHE_MAX_BYTES', http_cache.get_cache_size_bytes() // 2)
+    assert http_cache.start_http_cache_eviction()
+    http_cache._eviction_thread.join(timeout=10)
+
+    assert http_cache.get_cache_size_bytes() <= config.HTTP_CACHE_MAX_BYTES * config.HTTP_CACHE_EVICT_TO_RATIO
+    assert http_cache.get_cached_response(urls[0]) is None
+    assert http_cache.get_cached_response(urls[-1]) is not None
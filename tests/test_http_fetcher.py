@@ -0,0 +1,38 @@
+import pytest
+
+import http_fetcher
+
+
+CACHED_RESPONSE = {
+    'status': 200,
+    'url': 'https://movie.douban.com/subject/1/',
+    'headers': {'Content-Type': 'text/html'},
+    'body': '<html>1</html>',
+    'validators': {'etag': '"v1"', 'last_modified': 'Thu, 01 Jan 2026 00:00:00 GMT'}
+}
+
+
+@pytest.mark.parametrize('validators', [
+    {'etag': '"v1"'},
+    {'last_modified': 'Thu, 01 Jan 2026 00:00:00 GMT'},
+    {'etag': '"v0"', 'last_modified': 'Thu, 01 Jan 2026 00:00:00 GMT'}
+])
+def test_matched_validators_are_not_modified(validators):
+    response = http_fetcher.to_caller_response(CACHED_RESPONSE, validators)
+
+    assert response['status'] == 304
+    assert response['body'] is None
+    assert response['validators'] == CACHED_RESPONSE['validators']
+
+
+@pytest.mark.parametrize('validators', [
+    {},
+    {'etag': None, 'last_modified': None},
+    {'etag': '"v0"', 'last_modified': 'Wed, 31 Dec 2025 00:00:00 GMT'}
+])
+def test_unmatched_validators_get_cached_body(validators):
+    response = http_fetcher.to_caller_response(CACHED_RESPONSE, validators)
+
+    assert response['status'] == 200
+    assert response['body'] == CACHED_RESPONSE['body']
+    assert response['url'] == CACHED_RESPONSE['url']
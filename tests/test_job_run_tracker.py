@@ -0,0 +1,134 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from apscheduler.events import JobEvent, JobExecutionEvent, JobSubmissionEvent, EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ADDED
+from apscheduler.triggers.cron import CronTrigger
+
+import config
+import job_run_tracker
+
+
+@pytest.fixture(autouse=True)
+def clear_job_runs():
+    for store in (
+        job_run_tracker._job_runs, job_run_tracker._running_job_starts,
+        job_run_tracker._last_scheduled_run_times, job_run_tracker._interval_multipliers
+    ):
+        store.clear()
+
+
+def localize(*args):
+    return config.TIME_ZONE.localize(datetime(*args))
+
+
+def submit(bg_scheduler, job_id, run_time):
+    job_run_tracker.handle_job_event(bg_scheduler, JobSubmissionEvent(EVENT_JOB_SUBMITTED, job_id, 'default', [run_time]))
+
+
+def test_rescheduled_job_has_no_coalesced_run():
+    job = SimpleNamespace(trigger=CronTrigger(hour=1, timezone=config.TIME_ZONE))
+    bg_scheduler = SimpleNamespace(get_job=lambda job_id: job)
+    submit(bg_scheduler, 'comment_crawl_1', localize(2026, 1, 1, 1))
+
+    # rescheduled every 3 days at 2:00, whose fire time 2026-01-01 02:00 falls between the two submitted runs
+    job.trigger = CronTrigger(day='*/3', hour=2, timezone=config.TIME_ZONE)
+    job_run_tracker.handle_job_event(bg_scheduler, JobEvent(EVENT_JOB_ADDED, 'comment_crawl_1', 'default'))
+    submit(bg_scheduler, 'comment_crawl_1', localize(2026, 1, 4, 2))
+
+    assert job_run_tracker.get_job_runs('comment_crawl_1') == []
+
+
+def test_enqueue_call_is_not_recorded_in_queue_mode(monkeypatch):
+    monkeypatch.setattr(config, 'COMMENT_CRAWL_RUN_MODE', 'queue')
+    job = SimpleNamespace(trigger=CronTrigger(hour=1, timezone=config.TIME_ZONE))
+    bg_scheduler = SimpleNamespace(get_job=lambda job_id: job)
+    for job_id in ('comment_crawl_1', 'movie_info_crawl_1'):
+        run_time = localize(2026, 1, 1, 1)
+        submit(bg_scheduler, job_id, run_time)
+        job_run_tracker.handle_job_event(bg_scheduler, JobExecutionEvent(EVENT_JOB_EXECUTED, job_id, 'default', run_time))
+
+    # the crawler worker records the run of the comment crawl job
+    assert job_run_tracker.get_job_runs('comment_crawl_1') == []
+    assert [run[1] for run in job_run_tracker.get_job_runs('movie_info_crawl_1')] == ['executed']
+    assert job_run_tracker._running_job_starts == {}
+
+
+def record_runs(job_id, outcome, count):
+    for _ in range(count):
+        job_run_tracker.record_job_run(job_id, outcome, 1.0 if outcome == 'executed' else float('nan'))
+
+
+def test_interval_multiplier_is_capped_by_max_interval(monkeypatch):
+    monkeypatch.setattr(config, 'JOB_OVERRUN_WIDEN_ENABLED', True)
+    monkeypatch.setattr(config, 'MAX_COMMENT_CRAWL_INTERVAL', 10)
+    job_run_tracker._interval_multipliers['comment_crawl_1'] = (0, 4)
+    record_runs('comment_crawl_1', 'missed', config.JOB_OVERRUN_MIN_RUNS)
+
+    # the multiplier stays at ceiling(10 / 3) = 4
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 3) == 12
+    assert job_run_tracker._interval_multipliers['comment_crawl_1'] == (0, 4)
+
+
+def test_interval_multiplier_over_cap_narrows_from_cap(monkeypatch):
+    monkeypatch.setattr(config, 'JOB_OVERRUN_WIDEN_ENABLED', True)
+    monkeypatch.setattr(config, 'MAX_COMMENT_CRAWL_INTERVAL', 10)
+    job_run_tracker._interval_multipliers['comment_crawl_1'] = (0, 64)
+    record_runs('comment_crawl_1', 'executed', config.JOB_OVERRUN_MIN_RUNS)
+
+    # narrowed from the cap 4 (not from 64) by JOB_OVERRUN_WIDEN_FACTOR
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 3) == int(3 * 4 / config.JOB_OVERRUN_WIDEN_FACTOR)
+    assert job_run_tracker._interval_multipliers['comment_crawl_1'][1] == 4 / config.JOB_OVERRUN_WIDEN_FACTOR
+
+
+def test_coalesced_run_times_between_submitted_runs():
+    job = SimpleNamespace(trigger=CronTrigger(hour='*', timezone=config.TIME_ZONE))
+
+    assert job_run_tracker.count_coalesced_run_times(job, localize(2026, 1, 1, 1), localize(2026, 1, 1, 2)) == 0
+    assert job_run_tracker.count_coalesced_run_times(job, localize(2026, 1, 1, 1), localize(2026, 1, 1, 4)) == 2
+
+
+def test_coalesced_run_times_with_jitter():
+    job = SimpleNamespace(trigger=CronTrigger(hour='*', jitter=300, timezone=config.TIME_ZONE))
+
+    # the submitted runs are 3 and 2 minutes late by jitter, the runs at 2:00 and 3:00 are coalesced whatever their jitter
+    assert job_run_tracker.count_coalesced_run_times(job, localize(2026, 1, 1, 1, 3), localize(2026, 1, 1, 4, 2)) == 2
+    assert job_run_tracker.count_coalesced_run_times(job, localize(2026, 1, 1, 1, 3), localize(2026, 1, 1, 2, 4)) == 0
+
+
+def test_coalesced_run_times_are_capped_by_history_size():
+    job = SimpleNamespace(trigger=CronTrigger(minute='*', timezone=config.TIME_ZONE))
+
+    assert job_run_tracker.count_coalesced_run_times(job, localize(2026, 1, 1), localize(2026, 1, 2)) == config.JOB_RUN_HISTORY_SIZE
+
+
+def test_overrunning_interval_is_widened(monkeypatch):
+    monkeypatch.setattr(config, 'JOB_OVERRUN_WIDEN_ENABLED', True)
+    monkeypatch.setattr(config, 'MAX_COMMENT_CRAWL_INTERVAL', 10)
+    record_runs('comment_crawl_1', 'executed', config.JOB_OVERRUN_MIN_RUNS - 1)
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 2) == 2
+
+    record_runs('comment_crawl_1', 'coalesced', config.JOB_OVERRUN_MIN_RUNS)
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 2) == 2 * config.JOB_OVERRUN_WIDEN_FACTOR
+    # the runs before the adjustment are not counted again
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 2) == 2 * config.JOB_OVERRUN_WIDEN_FACTOR
+
+
+def test_interval_is_narrowed_when_job_keeps_up(monkeypatch):
+    monkeypatch.setattr(config, 'JOB_OVERRUN_WIDEN_ENABLED', True)
+    monkeypatch.setattr(config, 'MAX_COMMENT_CRAWL_INTERVAL', 10)
+    job_run_tracker._interval_multipliers['comment_crawl_1'] = (0, config.JOB_OVERRUN_WIDEN_FACTOR)
+    record_runs('comment_crawl_1', 'executed', config.JOB_OVERRUN_MIN_RUNS)
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 2) == 2
+
+    # never narrower than the crawl interval
+    record_runs('comment_crawl_1', 'executed', config.JOB_OVERRUN_MIN_RUNS)
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 2) == 2
+    assert job_run_tracker._interval_multipliers['comment_crawl_1'][1] == 1
+
+
+def test_interval_is_not_widened_when_disabled(monkeypatch):
+    monkeypatch.setattr(config, 'JOB_OVERRUN_WIDEN_ENABLED', False)
+    record_runs('comment_crawl_1', 'missed', config.JOB_OVERRUN_MIN_RUNS)
+
+    assert job_run_tracker.widen_overrunning_interval('comment_crawl_1', 2) == 2
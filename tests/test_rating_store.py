@@ -0,0 +1,130 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import config
+import rating_store
+
+
+@pytest.fixture(autouse=True)
+def store_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'MOVIE_RATING_STORE_DIRECTORY', str(tmp_path / '{movie_id}_movie_rating'))
+    monkeypatch.setattr(rating_store, 'LEGACY_MOVIE_RATING_FILE', str(tmp_path / '{movie_id}_movie_rating.json'))
+    return tmp_path
+
+
+def make_rating(avg, count, five_star='50.0%'):
+    rating = {'avg': avg, 'count': count}
+    if count != '0':
+        rating['rating_weight'] = {'1_star': '5.0%', '2_star': '5.0%', '3_star': '10.0%', '4_star': '30.0%', '5_star': five_star}
+    return rating
+
+
+def test_unchanged_rating_extends_last_run():
+    assert rating_store.append_movie_rating(1, '2024-01-01', make_rating('7.9', '100'))
+    assert rating_store.append_movie_rating(1, '2024-01-02', make_rating('7.9', '100'))
+    assert rating_store.append_movie_rating(1, '2024-01-03', make_rating('8.0', '120'))
+    # already stored
+    assert not rating_store.append_movie_rating(1, '2024-01-03', make_rating('8.0', '120'))
+
+    records = rating_store.read_rating_records(1)
+    assert len(records) == 2
+    assert list(records['last_date'] - records['date']) == [1, 0]
+    assert list(records['count']) == [100, 120]
+    # one fixed-width value per run in each column file
+    assert os.path.getsize(rating_store.get_column_file(1, 'count')) == 2 * 8
+
+
+def test_changed_rating_on_stored_date_wins():
+    rating_store.append_movie_rating(1, '2024-01-01', make_rating('7.9', '100'))
+    rating_store.append_movie_rating(1, '2024-01-02', make_rating('7.9', '100'))
+    rating_store.append_movie_rating(1, '2024-01-02', make_rating('8.0', '110'))
+
+    df = rating_store.read_movie_ratings(1)
+    assert list(df['count']) == [100, 110]
+    assert len(rating_store.read_rating_records(1)) == 2
+
+
+def test_partial_row_is_ignored_and_overwritten():
+    rating_store.append_movie_rating(1, '2024-01-01', make_rating('7.9', '100'))
+    # an interrupted append wrote only some columns
+    with open(rating_store.get_column_file(1, 'avg'), mode='ab') as file:
+        file.write(np.array([9.9], dtype='<f4').tobytes())
+    assert rating_store.get_record_count(1) == 1
+
+    rating_store.append_movie_rating(1, '2024-01-02', make_rating('8.0', '120'))
+    assert list(rating_store.read_movie_ratings(1)['avg']) == pytest.approx([7.9, 8.0])
+
+
+def test_range_query_reads_runs_in_range():
+    for day, (avg, count) in enumerate([('7.9', '100')] * 3 + [('8.0', '120')] * 3 + [('8.1', '150')] * 3, start=1):
+        rating_store.append_movie_rating(1, f'2024-01-{day:02d}', make_rating(avg, count))
+
+    df = rating_store.read_movie_ratings(1, '2024-01-03', '2024-01-07')
+    assert [str(date.date()) for date in df.index] == ['2024-01-03', '2024-01-04', '2024-01-05', '2024-01-06', '2024-01-07']
+    assert list(df['count']) == [100, 120, 120, 120, 150]
+    assert list(df.columns) == rating_store.RATING_VALUE_COLUMNS
+
+    # only the requested value columns
+    df = rating_store.read_movie_ratings(1, start_date='2024-01-08', columns=['count'])
+    assert list(df.columns) == ['count']
+    assert list(df['count']) == [150, 150]
+
+    assert rating_store.read_movie_ratings(1, '2024-02-01', '2024-02-28').empty
+    assert rating_store.read_movie_ratings(2).empty
+
+
+def test_read_all_movie_ratings():
+    rating_store.append_movie_rating(1, '2024-01-01', make_rating('7.9', '100'))
+    rating_store.append_movie_rating(1, '2024-01-02', make_rating('7.9', '100'))
+    rating_store.append_movie_rating(2, '2024-01-02', make_rating('', '0'))
+
+    df = rating_store.read_all_movie_ratings([1, 2], start_date='2024-01-02')
+    assert [(movie_id, str(date.date())) for movie_id, date in df.index] == [(1, '2024-01-02'), (2, '2024-01-02')]
+    assert np.isnan(df.loc[2, 'avg'].iloc[0])
+
+
+def write_legacy_rating_file(legacy_file, daily_ratings):
+    # the format of the baseline 'movie_info_crawler.crawl_movie_info': one pretty-printed {date: rating} object appended per crawl
+    for date_str, rating in daily_ratings:
+        with open(legacy_file, mode='a', encoding='utf-8') as file:
+            json.dump({date_str: rating}, file, indent=4, ensure_ascii=False)
+
+
+def test_migrate_legacy_rating_files(store_directory):
+    legacy_file = rating_store.LEGACY_MOVIE_RATING_FILE.format(movie_id=1)
+    write_legacy_rating_file(legacy_file, [
+        ('2024-01-01', make_rating('', '0')),
+        ('2024-01-02', make_rating('7.9', '100')),
+        ('2024-01-03', make_rating('7.9', '100')),
+        # crawled twice on a day, the last one wins
+        ('2024-01-04', make_rating('7.9', '100')),
+        ('2024-01-04', make_rating('8.0', '120')),
+        ('2024-01-05', make_rating('8.0', '130')),
+    ])
+    # appended to the store before the migration, the store wins
+    rating_store.append_movie_rating(1, '2024-01-05', make_rating('8.0', '140'))
+
+    assert rating_store.migrate_movie_rating_files() == 1
+    assert not os.path.isfile(legacy_file)
+    assert os.path.isfile(legacy_file + rating_store.MIGRATED_LEGACY_FILE_SUFFIX)
+
+    df = rating_store.read_movie_ratings(1)
+    assert list(df['count']) == [0, 100, 100, 120, 140]
+    assert np.isnan(df['avg'].iloc[0]) and np.isnan(df['5_star'].iloc[0])
+    assert df['5_star'].iloc[1] == 50.0
+    assert len(rating_store.read_rating_records(1)) == 4
+
+    # migrated once
+    assert rating_store.migrate_movie_rating_files() == 0
+
+
+def test_corrupt_legacy_rating_file_is_kept():
+    legacy_file = rating_store.LEGACY_MOVIE_RATING_FILE.format(movie_id=1)
+    with open(legacy_file, mode='w', encoding='utf-8') as file:
+        file.write('{"2024-01-01": {"avg": "7.9", ')
+
+    assert rating_store.migrate_movie_rating_files() == 0
+    assert os.path.isfile(legacy_file)
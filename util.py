@@ -113,6 +113,8 @@ def update_log_and_daily_file():
     The daily files include:
     -- the daily CSV file to store comment crawl job cron schedule information
     -- the daily CSV file to store scheduled jobs information
+    -- the daily CSV file to store the comment crawl budget allocation
+    -- the daily CSV file to store the transferred bytes and latency of each page fetch
 
     Parameters
     ----------
@@ -141,6 +143,10 @@ def update_log_and_daily_file():
 
     config.COMMENT_CRAWL_JOBS_CRON_SCHEDULE_FILE = os.path.join(config.SCHEDULING_DIRECTORY, log_file_prefix + 'comment_crawl_job_cron_schedule.csv')
     config.SCHEDULED_JOBS_FILE = os.path.join(config.SCHEDULING_DIRECTORY, log_file_prefix + 'scheduled_jobs.csv')
+    config.COMMENT_CRAWL_BUDGET_ALLOCATION_FILE = os.path.join(config.SCHEDULING_DIRECTORY, log_file_prefix + 'comment_crawl_budget_allocation.csv')
+    config.PAGE_LOAD_STATS_FILE = os.path.join(config.LOG_DIRECTORY, log_file_prefix + 'page_load_stats.csv')
+    config.COMMENT_FRESHNESS_REPORT_FILE = os.path.join(config.SCHEDULING_DIRECTORY, log_file_prefix + 'comment_freshness_report.csv')
+    config.JOB_RUN_SUMMARY_FILE = os.path.join(config.SCHEDULING_DIRECTORY, log_file_prefix + 'job_run_summary.csv')
 
     msg = 'The {log_type}log file is created successfully!'
     log(msg.format(log_type=''), config.LOG_FILE)
@@ -180,8 +186,11 @@ def startup_config():
     os.makedirs(config.COMMENT_MERGED_DIRECTORY, exist_ok=True)
     # Create the directory to store crawled movie info data (if not exist)
     os.makedirs(config.MOVIE_INFO_DIRECTORY, exist_ok=True)
+    # Create the directory of the HTTP cache (if not exist)
+    os.makedirs(config.HTTP_CACHE_DIRECTORY, exist_ok=True)
     # Create the directory to store log files (if not exist)
     os.makedirs(config.LOG_DIRECTORY, exist_ok=True)
+    os.makedirs(config.JOB_PROFILE_DIRECTORY, exist_ok=True)
     # Create the directory to store movie list files (if not exist)
     os.makedirs(config.MOVIE_LIST_DIRECTORY, exist_ok=True)
     # Create the directory to store job scheduling information files (if not exist)
@@ -0,0 +1,170 @@
+'''The WorkerAutoscaler Module
+
+Summary
+-------
+This module defines functions to adjust the crawl concurrency (i.e., the count of active crawl workers and webbrowsers)
+from the observed host CPU usage, memory usage and page fetch latency, within
+[WORKER_AUTOSCALE_MIN_CONCURRENCY, WORKER_AUTOSCALE_MAX_CONCURRENCY].
+
+The autoscaler job runs every WORKER_AUTOSCALE_INTERVAL_SECONDS seconds (AIMD, additive increase / multiplicative decrease):
+-- decrease the concurrency by WORKER_AUTOSCALE_DECREASE_FACTOR if the CPU usage, the memory usage or the median page fetch latency is high
+-- increase the concurrency by WORKER_AUTOSCALE_INCREASE_STEP if the CPU usage and the memory usage are low and the latency is not high
+-- otherwise hold the concurrency
+The concurrency is applied as:
+-- the browser limit of the browser supervisor, which bounds the webbrowsers launched by ALL crawl jobs (in any comment crawl run mode)
+-- the active worker count of each lane of the comment crawl queue (in the 'queue' comment crawl run mode), proportional to its 'worker_count'
+'''
+
+import sys
+
+import numpy as np
+import psutil
+
+import config
+import util
+import browser_supervisor
+import comment_crawl_queue
+import page_load_profile
+
+
+# The current crawl concurrency, None before the first autoscaler run
+_concurrency = None
+
+
+def get_initial_concurrency():
+    '''Get the initial crawl concurrency, i.e., the total 'worker_count' of the comment crawl lanes within the autoscale bounds
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The initial crawl concurrency
+    '''
+
+    concurrency = sum(lane_config['worker_count'] for lane_config in config.COMMENT_CRAWL_LANES.values())
+    return min(max(concurrency, config.WORKER_AUTOSCALE_MIN_CONCURRENCY), config.WORKER_AUTOSCALE_MAX_CONCURRENCY)
+
+
+def decide_concurrency(concurrency, cpu_percent, memory_percent, median_latency_seconds):
+    '''Decide the next crawl concurrency from the observed host load
+
+    Parameters
+    ----------
+    concurrency: int
+        The current crawl concurrency
+    cpu_percent: float
+        The host CPU usage in percent since the last autoscaler run
+    memory_percent: float
+        The host memory usage in percent
+    median_latency_seconds: float
+        The median page fetch latency since the last autoscaler run, NaN if no page is fetched
+
+    Returns
+    -------
+    tuple
+        (the next crawl concurrency, the reason of the decision)
+    '''
+
+    latency_high = median_latency_seconds > config.WORKER_AUTOSCALE_LATENCY_HIGH_SECONDS
+
+    if cpu_percent >= config.WORKER_AUTOSCALE_CPU_HIGH_PERCENT:
+        reason = f'CPU usage {cpu_percent:.0f}% is high'
+    elif memory_percent >= config.WORKER_AUTOSCALE_MEMORY_HIGH_PERCENT:
+        reason = f'memory usage {memory_percent:.0f}% is high'
+    elif latency_high:
+        reason = f'median page fetch latency {median_latency_seconds:.1f}s is high'
+    else:
+        reason = None
+
+    if reason is not None:
+        next_concurrency = int(concurrency * config.WORKER_AUTOSCALE_DECREASE_FACTOR)
+    elif cpu_percent < config.WORKER_AUTOSCALE_CPU_LOW_PERCENT and memory_percent < config.WORKER_AUTOSCALE_MEMORY_LOW_PERCENT:
+        next_concurrency = concurrency + config.WORKER_AUTOSCALE_INCREASE_STEP
+        reason = f'CPU usage {cpu_percent:.0f}% and memory usage {memory_percent:.0f}% are low'
+    else:
+        next_concurrency = concurrency
+        reason = f'CPU usage {cpu_percent:.0f}% and memory usage {memory_percent:.0f}% are moderate'
+
+    next_concurrency = min(max(next_concurrency, config.WORKER_AUTOSCALE_MIN_CONCURRENCY), config.WORKER_AUTOSCALE_MAX_CONCURRENCY)
+
+    return next_concurrency, reason
+
+
+def apply_concurrency(concurrency):
+    '''Apply the crawl concurrency to the browser supervisor and the comment crawl queue
+
+    Parameters
+    ----------
+    concurrency: int
+        The crawl concurrency
+
+    Returns
+    -------
+    dict
+        The active worker count of each lane, lane name as key (empty if not in the 'queue' comment crawl run mode)
+    '''
+
+    browser_supervisor.set_browser_limit(concurrency)
+
+    active_worker_counts = {}
+    if config.COMMENT_CRAWL_RUN_MODE == 'queue':
+        for lane in config.COMMENT_CRAWL_LANES:
+            lane_worker_count = comment_crawl_queue.get_lane_worker_count(lane, concurrency)
+            active_worker_counts[lane] = comment_crawl_queue.set_active_worker_count(lane, lane_worker_count)
+
+    return active_worker_counts
+
+
+def autoscale_workers():
+    '''Observe the host load, decide the next crawl concurrency and apply it, and log the decision.
+    This function is scheduled as the worker autoscaler job, see 'scheduler.schedule_worker_autoscaler_job'.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    int
+        The crawl concurrency
+    '''
+
+    global _concurrency
+
+    if _concurrency is None:
+        _concurrency = get_initial_concurrency()
+        # the first call of 'cpu_percent' starts the measurement
+        psutil.cpu_percent(interval=None)
+
+    # The host load since the last autoscaler run
+    cpu_percent = psutil.cpu_percent(interval=None)
+    memory_percent = psutil.virtual_memory().percent
+    latencies = page_load_profile.pop_recent_page_load_latencies()
+    median_latency_seconds = float(np.median(latencies)) if latencies else float('nan')
+
+    concurrency, reason = decide_concurrency(_concurrency, cpu_percent, memory_percent, median_latency_seconds)
+    active_worker_counts = apply_concurrency(concurrency)
+
+    if concurrency > _concurrency:
+        decision = 'Increase'
+    elif concurrency < _concurrency:
+        decision = 'Decrease'
+    else:
+        decision = 'Hold'
+    msg = (
+        f'{decision} the crawl concurrency from {_concurrency} to {concurrency}: {reason} '
+        f'({len(latencies)} page fetches, median latency {median_latency_seconds:.1f}s, '
+        f'{browser_supervisor.get_browser_status()["browser_count"]} webbrowsers running, active workers {active_worker_counts}).'
+    )
+    _concurrency = concurrency
+
+    log_level = config.LOG_LEVEL_DEBUG if decision == 'Hold' else config.LOG_LEVEL_INFO
+    current_frame = sys._getframe()
+    logger_name = f'{__name__}.{current_frame.f_code.co_name} at line {current_frame.f_lineno}'
+    util.log(msg, config.LOG_FILE, logger_name=logger_name, log_level=log_level)
+    util.log(msg, config.SCHEDULER_LOG_FILE, logger_name=logger_name, log_level=log_level)
+
+    return concurrency